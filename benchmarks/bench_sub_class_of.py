@@ -0,0 +1,130 @@
+"""
+Benchmarks /sub-class-of on a generated ontology: the former per-request implementation (parse the Turtle, run SPARQL,
+explode rdf:type) against the edges collected once per dataset load and served from the response cache.
+
+Usage (from the repository root): python -m benchmarks.bench_sub_class_of [--classes 20000] [--rows 50000] [--repeat 5]
+"""
+# bench_sub_class_of.py
+import argparse
+import ast
+import random
+import statistics
+import time
+
+import pandas as pd
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from rdflib import RDF, Graph, Namespace
+
+from bikg_app.routers.dataset import Dataset, build_type_index, compute_subclass_edges
+from bikg_app.routers.namespace_shortener import NamespaceShortener
+from bikg_app.routers.routes import get_dataset, router
+from bikg_app.routers.term_dictionary import TermDictionary
+from bikg_app.routers.triple_store import TripleStore
+
+OWL = Namespace("http://www.w3.org/2002/07/owl#")
+
+
+def generate_ontology(n_classes, seed=0) -> str:
+    """Returns the Turtle of a random class tree with n_classes owl:Classes."""
+    rng = random.Random(seed)
+    lines = [
+        "@prefix ex: <http://example.org/onto#> .",
+        "@prefix owl: <http://www.w3.org/2002/07/owl#> .",
+        "@prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#> .",
+        "ex:C0 a owl:Class .",
+    ]
+    for i in range(1, n_classes):
+        lines.append(f"ex:C{i} a owl:Class ; rdfs:subClassOf ex:C{rng.randrange(i)} .")
+    return "\n".join(lines)
+
+
+def generate_study_table(n_rows, n_classes, seed=0) -> pd.DataFrame:
+    """Returns a study table whose rdf:type cells reference the generated classes and, for 1% of the rows, unknown types."""
+    rng = random.Random(seed)
+    types = [f"['ex:C{rng.randrange(n_classes)}']" if rng.random() > 0.01 else f"['ex:Unknown{rng.randrange(100)}']" for _ in range(n_rows)]
+    return pd.DataFrame({"rdf:type": types}, index=[f"ex:node{i}" for i in range(n_rows)])
+
+
+def legacy_sub_class_of(ttl_data, df):
+    """The handler body before the edges were collected at load time, on a copy of df since it used to overwrite rdf:type."""
+    df = df.copy()
+    g = Graph()
+    g.parse(data=ttl_data, format="turtle")
+    result = []
+    for row in g.query("SELECT ?s ?o WHERE { ?s rdfs:subClassOf ?o . }"):
+        result.append({"s": g.namespace_manager.qname(row.s), "p": "rdfs:subClassOf", "o": g.namespace_manager.qname(row.o)})  # type: ignore
+    classes = {str(g.namespace_manager.qname(c)) for c in g.subjects(predicate=RDF.type, object=OWL.Class)}  # type: ignore
+    df["rdf:type"] = df["rdf:type"].apply(lambda x: ast.literal_eval(x) if isinstance(x, str) else x)
+    df_types = set(df.explode("rdf:type")["rdf:type"].unique().tolist())
+    for type_ in df_types - classes:
+        result.append({"s": type_, "p": "rdfs:subClassOf", "o": "missing"})
+    return result
+
+
+def served_edges(dataset):
+    """The edges /sub-class-of serves for dataset, in a canonical order."""
+    missing = [{"s": type_, "p": "rdfs:subClassOf", "o": "missing"} for type_ in dataset.types_only_in_csv]
+    return sorted((str(edge["s"]), edge["p"], str(edge["o"])) for edge in dataset.subclass_edges + missing)
+
+
+def timed(fn, repeat):
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - start)
+    return statistics.median(durations)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--classes", type=int, default=20000)
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    ttl_data = generate_ontology(args.classes)
+    df = generate_study_table(args.rows, args.classes)
+
+    # the parts of the load stages /sub-class-of depends on: the type index of the study table and the served TripleStore
+    dataset = Dataset()
+    dataset.version = "benchmark"
+    dataset.df = df
+    build_type_index(dataset)
+    graph = Graph()
+    graph.parse(data=ttl_data, format="turtle")
+    dataset.ttl_data = ttl_data
+    dataset.terms = TermDictionary()
+    dataset.g = TripleStore.from_graph(graph, dataset.terms)
+    dataset.shortener = NamespaceShortener.from_graph(dataset.g)
+    dataset.terms.shortener = dataset.shortener
+
+    # both paths have to compute the same edges, or the timings compare different results
+    compute_subclass_edges(dataset)
+    expected = sorted((str(edge["s"]), edge["p"], str(edge["o"])) for edge in legacy_sub_class_of(ttl_data, df))
+    if served_edges(dataset) != expected:
+        raise RuntimeError("The edges collected at load time differ from those of the former per-request implementation")
+
+    app = FastAPI()
+    app.include_router(router, prefix="/api/bikg")
+    app.dependency_overrides[get_dataset] = lambda: dataset
+    client = TestClient(app)
+
+    before = timed(lambda: legacy_sub_class_of(ttl_data, df), args.repeat)
+    load = timed(lambda: compute_subclass_edges(dataset), 1)
+    first = timed(lambda: client.get("/api/bikg/sub-class-of"), 1)
+    after = timed(lambda: client.get("/api/bikg/sub-class-of"), args.repeat)
+    etag = client.get("/api/bikg/sub-class-of").headers["etag"]
+    not_modified = timed(lambda: client.get("/api/bikg/sub-class-of", headers={"If-None-Match": etag}), args.repeat)
+
+    print(f"{args.classes} classes, {args.rows} rows, median of {args.repeat}")
+    print(f"  before, per request:           {before * 1000:10.1f} ms")
+    print(f"  after, once per dataset load:  {load * 1000:10.1f} ms")
+    print(f"  after, first request:          {first * 1000:10.1f} ms")
+    print(f"  after, per request:            {after * 1000:10.1f} ms")
+    print(f"  after, revalidation (304):     {not_modified * 1000:10.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,7 @@ from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 from visyn_core.plugin.model import AVisynPlugin, RegHelper
 
+from .routers.dataset import dataset_manager
 from .routers.routes import router as rdf_router
 from .settings import AppSettings, get_settings
 
@@ -13,6 +14,9 @@ class VisynPlugin(AVisynPlugin):
 
         @app.on_event("startup")
         async def startup():
+            # Load the dataset in the background so the server accepts requests (e.g. /api/bikg/dataset/status) right away
+            dataset_manager.start_background_load()
+
             # Add the / path at the very end to match all other routes before
             bundles_dir = get_settings().bundles_dir
             if bundles_dir:
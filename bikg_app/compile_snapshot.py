@@ -0,0 +1,17 @@
+import argparse
+import logging
+import time
+
+from bikg_app.routers.dataset import DATASET_SNAPSHOT_PATH, compile_snapshot
+
+# Compiles the dataset snapshot that the server maps at startup instead of recomputing everything from the source files.
+# Run it from the repository root after the preprocessing has written new files: `python -m bikg_app.compile_snapshot`
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compile the precomputed dataset snapshot.")
+    parser.add_argument("--output", default=DATASET_SNAPSHOT_PATH, help="Where to write the snapshot.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    start = time.perf_counter()
+    compile_snapshot(args.output)
+    print(f"Wrote {args.output} in {time.perf_counter() - start:.2f}s")
@@ -0,0 +1,5 @@
+"""The preprocessing of preprocess.ipynb as a pipeline of stages whose outputs are cached on a hash of their inputs."""
+from .pipeline import Pipeline, Stage, StageCache
+from .stages import DEFAULT_PARAMS, STAGES, input_paths, run_preprocessing
+
+__all__ = ["DEFAULT_PARAMS", "STAGES", "Pipeline", "Stage", "StageCache", "input_paths", "run_preprocessing"]
@@ -0,0 +1,38 @@
+import argparse
+import json
+import logging
+import os
+import time
+
+from bikg_app.preprocess.stages import DEFAULT_PARAMS, STAGES, input_paths, run_preprocessing
+
+# Runs the preprocessing of preprocess.ipynb, only the stages whose inputs or parameters changed since the last run are run again.
+# Run it from the repository root: `python -m bikg_app.preprocess --data-dir ./data/ex51 --output-dir bikg_app`
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Preprocess a study, its ontology and its violation report for the app.")
+    parser.add_argument("--data-dir", help="A directory with input/instances.ttl, input/violations.ttl and input/omics_model.ttl.")
+    parser.add_argument("--study", help="The instance data, overrides the one in --data-dir.")
+    parser.add_argument("--violations", help="The SHACL violation report, overrides the one in --data-dir.")
+    parser.add_argument("--ontology", help="The ontology and shapes, overrides the one in --data-dir.")
+    parser.add_argument("--output-dir", help="Where the artifacts are written, --data-dir/output by default.")
+    parser.add_argument("--cache-dir", help="Where the stage outputs are cached, --output-dir/.preprocess_cache by default.")
+    parser.add_argument("--targets", nargs="+", choices=[stage.name for stage in STAGES], help="The stages to bring up to date.")
+    parser.add_argument("--workers", type=int, help="The number of stages that run at the same time.")
+    parser.add_argument("--processes", type=int, default=DEFAULT_PARAMS["processes"], help="The processes that group the exemplars.")
+    parser.add_argument("--all-columns", action="store_true", help="Embed all columns of the study table, not only the violations.")
+    args = parser.parse_args()
+
+    sources = input_paths(args.data_dir) if args.data_dir else {}
+    sources.update({name: getattr(args, name) for name in ("study", "violations", "ontology") if getattr(args, name)})
+    if set(sources) != {"study", "violations", "ontology"}:
+        parser.error("give --data-dir or all of --study, --violations and --ontology")
+    output_dir = args.output_dir or (os.path.join(args.data_dir, "output") if args.data_dir else None)
+    if output_dir is None:
+        parser.error("give --output-dir or --data-dir")
+
+    logging.basicConfig(level=logging.INFO)
+    start = time.perf_counter()
+    params = {"processes": args.processes, "use_violation_columns": not args.all_columns}
+    summary = run_preprocessing(sources, output_dir, args.cache_dir, params, args.targets, args.workers)
+    print(json.dumps(summary, indent=2))
+    print(f"Preprocessed into {output_dir} in {time.perf_counter() - start:.2f}s")
@@ -0,0 +1,62 @@
+"""This module implements the 2D embedding of the study table the scatterplot of the focus nodes shows."""
+# embedding.py
+import logging
+
+import numpy as np
+import pandas as pd
+
+_log = logging.getLogger(__name__)
+
+
+def embedding_view(study_df, violation_columns, use_violation_columns=True):
+    """
+    Returns the matrix the embedding is computed from, the one-hot encoding of the violation columns or of all columns.
+    List cells are encoded by their string form, as in the stored study table.
+
+    Raises:
+        ValueError: If none of the violation columns is a column of the table.
+    """
+    if use_violation_columns:
+        # safely intersect with existing columns to avoid KeyErrors
+        selected_columns = [column for column in violation_columns if column in study_df.columns]
+        if not selected_columns:
+            raise ValueError("violation_columns has no overlap with study_df.columns. Check earlier renaming/label steps so names match.")
+        view_df = study_df.loc[:, selected_columns]
+    else:
+        view_df = study_df
+    view_df = view_df.apply(lambda column: column.map(lambda value: str(value) if isinstance(value, list) else value))
+    return pd.get_dummies(view_df, columns=list(view_df.columns), dtype=int)
+
+
+def compute_embedding(study_df, violation_columns, use_violation_columns=True, random_state=0):
+    """
+    Embeds the rows of the study table in 2D with UMAP, normalized to [0, 1].
+
+    Args:
+        study_df (pd.DataFrame): The study table.
+        violation_columns (List[str]): The violation count columns.
+        use_violation_columns (bool): Whether to embed only the violation columns or all columns.
+        random_state (int): The seed of UMAP.
+
+    Returns:
+        np.ndarray: The x, y of the rows.
+    """
+    view_df = embedding_view(study_df, violation_columns, use_violation_columns)
+    if len(view_df) > 1:
+        import umap
+
+        _log.info("Creating UMAP embedding of %d rows", len(view_df))
+        try:
+            reducer = umap.UMAP(n_neighbors=max(2, int(np.sqrt(len(view_df)))), min_dist=0.1, n_components=2, random_state=random_state)
+            result = np.asarray(reducer.fit_transform(view_df))
+        except (ValueError, TypeError) as err:
+            _log.warning("Error encountered during UMAP embedding: %s. Using fallback mechanism.", err)
+            result = np.column_stack((np.zeros(len(view_df)), np.linspace(0, 1, len(view_df))))
+    else:
+        # default for the single data point
+        result = np.zeros((len(view_df), 2))
+
+    min_values = result.min(axis=0, initial=np.inf)
+    max_values = result.max(axis=0, initial=-np.inf)
+    denominator = np.where((max_values - min_values) == 0, 1, max_values - min_values)
+    return (result - min_values) / denominator
@@ -0,0 +1,263 @@
+"""This module implements the stage graph of the preprocessing, with outputs cached on a hash of their inputs and parameters."""
+# pipeline.py
+import hashlib
+import json
+import logging
+import os
+import pickle
+import tempfile
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from bikg_app.routers.incremental import artifact_paths
+from bikg_app.routers.snapshot import file_sha256
+
+_log = logging.getLogger(__name__)
+
+MANIFEST_FILE_NAME = "preprocess_manifest.json"
+
+
+class Stage:
+    """
+    One step of the preprocessing, a function of the outputs of other stages, of source files and of parameters.
+
+    The key of a stage hashes its name, its version, the contents of its source files, its parameters and the keys of
+    the stages it reads, so it changes whenever anything its output depends on changes, and only then. Bump the version
+    when the function changes what it computes.
+    """
+
+    def __init__(
+        self, name, function, inputs=None, sources=None, params=(), options=(), version=1, export=None, artifacts=(), exclusive=False
+    ):
+        """
+        Args:
+            name (str): The name of the stage.
+            function (Callable): Computes the output from keyword arguments, the inputs, sources and params.
+            inputs (Dict[str, str], optional): Maps argument names to the stages whose outputs they receive.
+            sources (Dict[str, str], optional): Maps argument names to the names of the source files they receive the paths of.
+            params (Iterable[str]): The names of the parameters the function receives.
+            options (Iterable[str]): The names of the parameters the function receives that do not change its output,
+                like a number of processes, which are not part of the key.
+            version (int): The version of the function.
+            export (Callable[[Any, Dict[str, str]], None], optional): Writes the output to the artifact paths.
+            artifacts (Iterable[str]): The names of the artifacts export writes, see incremental.artifact_paths.
+            exclusive (bool): Whether the stage must run on the main thread while no other stage runs, for stages that
+                fork worker processes, which could deadlock on a lock held by another thread at the time of the fork.
+        """
+        self.name = name
+        self.function = function
+        self.inputs = dict(inputs or {})
+        self.sources = dict(sources or {})
+        self.params = tuple(params)
+        self.options = tuple(options)
+        self.version = version
+        self.export = export
+        self.artifacts = tuple(artifacts)
+        self.exclusive = exclusive
+
+
+class StageCache:
+    """The outputs of the stages, pickled to one file per stage and key."""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, name, key):
+        return os.path.join(self.directory, f"{name}-{key}.pickle")
+
+    def __contains__(self, name_key):
+        return os.path.exists(self.path(*name_key))
+
+    def load(self, name, key):
+        with open(self.path(name, key), "rb") as f:
+            return pickle.load(f)
+
+    def store(self, name, key, value):
+        """Writes the output to a temporary file first, so an interrupted run never leaves a truncated entry behind."""
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.path(name, key))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+
+class Pipeline:
+    """
+    Runs the stages a set of targets depends on, skipping every stage whose output is cached under its current key and
+    running the others concurrently as soon as the stages they read are done. Exclusive stages run on the main thread
+    once the other stages have finished and the thread pool has been shut down, so no other thread exists when they fork.
+
+    The outputs of cached stages are only loaded if a stage that has to run reads them, and a target whose artifacts
+    were already exported under its current key is neither run nor loaded.
+    """
+
+    def __init__(self, stages, sources, params, cache_dir, output_dir=None, max_workers=None):
+        """
+        Args:
+            stages (Iterable[Stage]): The stages, each after the stages it reads.
+            sources (Dict[str, str]): Maps the names of the source files to their paths.
+            params (dict): The parameters of the stages.
+            cache_dir (str): The directory of the StageCache.
+            output_dir (str, optional): The directory the stages export their artifacts to, laid out as incremental.artifact_paths.
+            max_workers (int, optional): The number of stages that run at the same time.
+        """
+        self.stages = {stage.name: stage for stage in stages}
+        self.sources = sources
+        self.params = params
+        self.cache = StageCache(cache_dir)
+        self.output_dir = output_dir
+        self.artifact_paths = artifact_paths(output_dir) if output_dir is not None else None
+        self.max_workers = max_workers
+        self._keys = {}
+        self._source_digests = {}
+
+    def key(self, name):
+        """Returns the hex digest of everything the output of the stage depends on."""
+        key = self._keys.get(name)
+        if key is not None:
+            return key
+        stage = self.stages[name]
+        description = {
+            "stage": name,
+            "version": stage.version,
+            "sources": {argument: self._source_digest(source) for argument, source in stage.sources.items()},
+            "params": {param: self.params[param] for param in stage.params},
+            "inputs": {argument: self.key(upstream) for argument, upstream in stage.inputs.items()},
+        }
+        key = self._keys[name] = hashlib.sha256(json.dumps(description, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+        return key
+
+    def _source_digest(self, source):
+        if source not in self._source_digests:
+            self._source_digests[source] = file_sha256(self.sources[source])
+        return self._source_digests[source]
+
+    def _manifest_path(self):
+        if self.output_dir is None:
+            raise ValueError("The pipeline has no output directory to keep its manifest in")
+        return os.path.join(self.output_dir, MANIFEST_FILE_NAME)
+
+    def _read_manifest(self):
+        if self.output_dir is None or not os.path.exists(self._manifest_path()):
+            return {}
+        with open(self._manifest_path(), encoding="utf-8") as f:
+            return json.load(f)
+
+    def _exported(self, manifest, name):
+        stage = self.stages[name]
+        paths = self.artifact_paths
+        if stage.export is None or paths is None:
+            return False
+        return manifest.get(name) == self.key(name) and all(os.path.exists(paths[artifact]) for artifact in stage.artifacts)
+
+    def load(self, name):
+        """
+        Returns the cached output of the stage under its current key.
+
+        Raises:
+            KeyError: If the output is not cached.
+        """
+        if (name, self.key(name)) not in self.cache:
+            raise KeyError(name)
+        return self.cache.load(name, self.key(name))
+
+    def _run_stage(self, name, values):
+        stage = self.stages[name]
+        kwargs = {argument: values[upstream] for argument, upstream in stage.inputs.items()}
+        kwargs.update({argument: self.sources[source] for argument, source in stage.sources.items()})
+        kwargs.update({param: self.params[param] for param in stage.params + stage.options})
+        _log.info("Running stage %s", name)
+        value = stage.function(**kwargs)
+        self.cache.store(name, self.key(name), value)
+        return value
+
+    def _load_stage(self, name):
+        _log.info("Loading stage %s from the cache", name)
+        return self.cache.load(name, self.key(name))
+
+    def run(self, targets=None):
+        """
+        Brings the targets up to date and exports their artifacts.
+
+        Args:
+            targets (Iterable[str], optional): The stages to bring up to date, all stages with an export by default.
+
+        Returns:
+            dict: The names of the stages that were run, loaded from the cache and exported, and of the targets that were up to date.
+        """
+        targets = list(targets) if targets is not None else [name for name, stage in self.stages.items() if stage.export]
+        manifest = self._read_manifest()
+        summary = {"ran": [], "loaded": [], "exported": [], "up_to_date": []}
+
+        # the stages whose outputs are needed, and whether they run or are loaded
+        actions = {}
+
+        def need(name):
+            if name in actions:
+                return
+            if (name, self.key(name)) in self.cache:
+                actions[name] = "load"
+                return
+            actions[name] = "run"
+            for upstream in self.stages[name].inputs.values():
+                need(upstream)
+
+        for name in targets:
+            if self._exported(manifest, name):
+                summary["up_to_date"].append(name)
+            else:
+                need(name)
+
+        values = {}
+        futures = {}
+        executor = None
+        try:
+            while len(values) < len(actions):
+                exclusive = None
+                for name, action in actions.items():
+                    if name in futures or name in values:
+                        continue
+                    if action == "run" and not all(upstream in values for upstream in self.stages[name].inputs.values()):
+                        continue
+                    if action == "run" and self.stages[name].exclusive:
+                        exclusive = exclusive or name
+                        continue
+                    if executor is None:
+                        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+                    if action == "load":
+                        futures[name] = executor.submit(self._load_stage, name)
+                    else:
+                        futures[name] = executor.submit(self._run_stage, name, values)
+                pending = [future for name, future in futures.items() if name not in values]
+                if pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for name, future in list(futures.items()):
+                        if future in done:
+                            values[name] = future.result()
+                            summary["ran" if actions[name] == "run" else "loaded"].append(name)
+                    continue
+                # nothing else runs, shut the pool down so the exclusive stage is the only thread when it forks
+                if executor is not None:
+                    executor.shutdown()
+                    executor = None
+                values[exclusive] = self._run_stage(exclusive, values)
+                summary["ran"].append(exclusive)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        for name in targets:
+            stage = self.stages[name]
+            if name in values and stage.export is not None and self.artifact_paths is not None:
+                for artifact in stage.artifacts:
+                    os.makedirs(os.path.dirname(self.artifact_paths[artifact]), exist_ok=True)
+                stage.export(values[name], self.artifact_paths)
+                manifest[name] = self.key(name)
+                summary["exported"].append(name)
+        if summary["exported"]:
+            with open(self._manifest_path(), "w", encoding="utf-8") as f:
+                json.dump(manifest, f, indent=2)
+        return summary
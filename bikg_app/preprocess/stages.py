@@ -0,0 +1,299 @@
+"""This module implements the stages of the preprocessing of preprocess.ipynb and the pipeline that connects them."""
+# stages.py
+import json
+import os
+from collections import defaultdict
+
+from rdflib import OWL, RDF, RDFS, BNode, Graph, Literal, URIRef
+
+from bikg_app.preprocess.embedding import compute_embedding
+from bikg_app.preprocess.pipeline import Pipeline, Stage
+from bikg_app.preprocess.tabularize import create_study_dataframe
+from bikg_app.routers.incremental import qname_label
+from bikg_app.routers.report_stream import count_violations as stream_count_violations
+from bikg_app.routers.snapshot import file_sha256
+from bikg_app.routers.study_table import write_study_table
+from bikg_app.routers.utils import SH, copy_namespaces, get_violation_report_exemplars, save_lists_dict, save_nested_counts_dict_json
+
+SKOS_PREF_LABEL = URIRef("http://www.w3.org/2004/02/skos/core#prefLabel")
+BLANK_NODE_NAMESPACE = "http://customnamespace.com/validationResult/"
+
+DEFAULT_PARAMS = {
+    # prefixes bound in every input graph, they decide the QNames of the study table
+    "prefixes": {
+        "sh": "http://www.w3.org/ns/shacl#",
+        "omics": "http://data.boehringer.com/ontology/omics#",
+        "lotr": "http://example.org/lotr#",
+        "owl": "http://www.w3.org/2002/07/owl#",
+        "cns": "http://customnamespace.com/n#",
+    },
+    "name_blank_nodes": True,
+    # label predicates in ascending order of priority
+    "label_predicates": [str(SKOS_PREF_LABEL)],
+    "use_violation_columns": True,
+    "random_state": 0,
+    "processes": 1,
+}
+
+
+def input_paths(data_dir):
+    """Returns the paths of the source files in data_dir, laid out like the input directory of preprocess.ipynb."""
+    return {
+        "study": os.path.join(data_dir, "input", "instances.ttl"),
+        "violations": os.path.join(data_dir, "input", "violations.ttl"),
+        "ontology": os.path.join(data_dir, "input", "omics_model.ttl"),
+    }
+
+
+def skolemize_blank_nodes(g: Graph, namespace):
+    """Returns a copy of g in which every blank node is an IRI in namespace, numbered in the order the triples are stored."""
+    named_g = Graph()
+    copy_namespaces(g, named_g)
+    names = {}
+
+    def name(term):
+        if not isinstance(term, BNode):
+            return term
+        if term not in names:
+            names[term] = URIRef(f"{namespace}{len(names) + 1}")
+        return names[term]
+
+    for s, p, o in g:
+        named_g.add((name(s), p, name(o)))
+    return named_g
+
+
+def parse_graph(path, prefixes, name_blank_nodes=True):
+    """
+    Parses a Turtle source file and binds prefixes in it. With name_blank_nodes, blank nodes become IRIs under
+    BLANK_NODE_NAMESPACE and the digest of the file, so they are named the same way on every run.
+    """
+    g = Graph()
+    g.parse(path, format="ttl")
+    for prefix, namespace in prefixes.items():
+        g.namespace_manager.bind(prefix, namespace, override=True, replace=True)
+    if name_blank_nodes:
+        g = skolemize_blank_nodes(g, f"{BLANK_NODE_NAMESPACE}{file_sha256(path)[:12]}-")
+    return g
+
+
+def count_violations(violations_g: Graph):
+    """
+    Counts the validation results per focus node and source shape, see report_stream.count_violations, in the order of
+    the focus nodes in the graph, which is the row order of the study table.
+
+    Returns:
+        tuple: ({focus node: {source shape: count}}, list of the source shapes).
+    """
+    subjects = dict.fromkeys(s for s, p, _ in violations_g if p == SH.focusNode)
+    subjects.update(dict.fromkeys(violations_g.subjects(SH.sourceShape)))
+    counts, violation_list = stream_count_violations((s, list(violations_g.predicate_objects(s))) for s in subjects)
+    return {focus_node: dict(shape_counts) for focus_node, shape_counts in counts.items()}, violation_list
+
+
+def aggregate_edges(ontology_g: Graph):
+    """
+    Collects the predicates the instances of each class may have: those on the paths of the property shapes of the
+    node shapes that target the class or one of its superclasses, starting from the classes without a superclass.
+
+    Returns:
+        dict: {class: set of predicates}, all as strings.
+    """
+    children = defaultdict(list)
+    for child, parent in ontology_g.subject_objects(RDFS.subClassOf):
+        children[parent].append(child)
+    roots = [class_ for class_ in ontology_g.subjects(RDF.type, OWL.Class) if (class_, RDFS.subClassOf, None) not in ontology_g]
+
+    def direct_edges(class_):
+        edges = set()
+        for node_shape in ontology_g.subjects(SH.targetClass, class_):
+            if (node_shape, RDF.type, SH.NodeShape) not in ontology_g:
+                continue
+            for property_shape in ontology_g.objects(node_shape, SH.property):
+                if (property_shape, RDF.type, SH.PropertyShape) in ontology_g:
+                    edges.update(str(edge) for edge in ontology_g.objects(property_shape, SH.path))
+        return edges
+
+    agg_edges_dict = {}
+    queue = [(root, set()) for root in roots]
+    while queue:
+        class_, inherited_edges = queue.pop(0)
+        edges = inherited_edges | direct_edges(class_)
+        if str(class_) in agg_edges_dict and edges <= agg_edges_dict[str(class_)]:
+            continue
+        agg_edges_dict[str(class_)] = agg_edges_dict.get(str(class_), set()) | edges
+        queue.extend((child, edges) for child in children[class_])
+    return agg_edges_dict
+
+
+def tabularize(study_g: Graph, violation_counts, agg_edges_dict):
+    """Creates the study table, see tabularize.create_study_dataframe."""
+    counts, violation_list = violation_counts
+    return create_study_dataframe(study_g, counts, agg_edges_dict), violation_list
+
+
+def build_label_dict(study_g: Graph, label_predicates):
+    """Returns {node: label} of the study graph, later label predicates overwrite earlier ones."""
+    label_dict = {}
+    for label_predicate in label_predicates:
+        label_dict.update({str(s): str(o) for s, o in study_g.subject_objects(URIRef(label_predicate))})
+    return label_dict
+
+
+def combined_label(study_g: Graph, violations_g: Graph):
+    """Returns qname_label under the namespaces of both graphs, the QNames preprocess.ipynb abbreviates with."""
+    combined_g = Graph()
+    copy_namespaces(study_g, combined_g)
+    copy_namespaces(violations_g, combined_g)
+    return qname_label(combined_g.namespaces())
+
+
+def abbreviate(study_table, study_g: Graph, violations_g: Graph, label_predicates):
+    """
+    Abbreviates the IRIs of the study table and the violation list to QNames, then replaces the QNames of labelled nodes
+    by their labels in the columns, the index, the violation list and the cells that are not lists.
+
+    Returns:
+        tuple: The study table and the violation list.
+    """
+    study_df, violation_list = study_table
+    label = combined_label(study_g, violations_g)
+    labels = {label(node): node_label for node, node_label in build_label_dict(study_g, label_predicates).items()}
+
+    def relabel(value):
+        qname = label(value)
+        return labels.get(qname, qname)
+
+    def relabel_cell(value):
+        if isinstance(value, list):
+            return [label(item) for item in value]
+        return relabel(value) if isinstance(value, str) else value
+
+    study_df = study_df.copy()
+    for column in study_df.columns:
+        if study_df[column].dtype == object:
+            study_df[column] = study_df[column].map(relabel_cell)
+    study_df.columns = [relabel(column) for column in study_df.columns]
+    study_df.index = [relabel(row) for row in study_df.index]
+    return study_df, [relabel(violation) for violation in violation_list]
+
+
+def build_exemplars(ontology_g: Graph, violations_g: Graph, study_g: Graph, label_predicates, processes=1):
+    """
+    Creates the union of the ontology and the exemplars of the violation report, with the labels of the labelled study
+    nodes, see utils.get_violation_report_exemplars.
+
+    Returns:
+        tuple: The union graph, the edge count dictionary, the focus node and exemplar dictionaries as lists and the
+        violation exemplar dictionary, as plain dictionaries.
+    """
+    union_g = Graph()
+    copy_namespaces(ontology_g, union_g)
+    for triple in ontology_g:
+        union_g.add(triple)
+    union_g, edge_count_dict, focus_node_exemplar_dict, exemplar_focus_node_dict, violation_exemplar_dict = get_violation_report_exemplars(
+        union_g, violations_g, study_g, processes=processes
+    )
+    for node, node_label in build_label_dict(study_g, label_predicates).items():
+        union_g.add((URIRef(node), SKOS_PREF_LABEL, Literal(node_label)))
+    return (
+        union_g,
+        {str(exemplar): dict(counts) for exemplar, counts in edge_count_dict.items()},
+        {str(focus_node): [str(exemplar) for exemplar in exemplars] for focus_node, exemplars in focus_node_exemplar_dict.items()},
+        {str(exemplar): [str(focus_node) for focus_node in focus_nodes] for exemplar, focus_nodes in exemplar_focus_node_dict.items()},
+        {str(shape): {str(exemplar): count for exemplar, count in counts.items()} for shape, counts in violation_exemplar_dict.items()},
+    )
+
+
+def embed(study_table, use_violation_columns=True, random_state=0):
+    """Adds the x, y columns of the embedding to the study table, see embedding.compute_embedding."""
+    study_df, violation_list = study_table
+    study_df = study_df.copy()
+    embedding = compute_embedding(study_df, violation_list, use_violation_columns, random_state)
+    study_df["x"] = embedding[:, 0]
+    study_df["y"] = embedding[:, 1]
+    return study_df, violation_list
+
+
+def export_study_table(study_table, paths):
+    study_df, violation_list = study_table
+    write_study_table(study_df, violation_list, paths["study_parquet"])
+    study_df.to_csv(paths["study_csv"])
+    with open(paths["violation_list"], "w", encoding="utf-8") as f:
+        json.dump(violation_list, f)
+
+
+def export_exemplars(exemplars, paths):
+    union_g, edge_count_dict, focus_node_exemplar_dict, exemplar_focus_node_dict, violation_exemplar_dict = exemplars
+    union_g.serialize(destination=paths["ontology_ttl"], format="ttl")
+    save_nested_counts_dict_json(edge_count_dict, paths["edge_count_dict"])
+    save_lists_dict(focus_node_exemplar_dict, paths["focus_node_exemplar_dict"])
+    save_lists_dict(exemplar_focus_node_dict, paths["exemplar_focus_node_dict"])
+    save_nested_counts_dict_json(violation_exemplar_dict, paths["violation_exemplar_dict"])
+
+
+STAGES = [
+    Stage("parse_study", parse_graph, sources={"path": "study"}, params=("prefixes", "name_blank_nodes")),
+    Stage("parse_violations", parse_graph, sources={"path": "violations"}, params=("prefixes", "name_blank_nodes")),
+    Stage("parse_ontology", parse_graph, sources={"path": "ontology"}, params=("prefixes", "name_blank_nodes")),
+    Stage("count_violations", count_violations, inputs={"violations_g": "parse_violations"}),
+    Stage("aggregate_edges", aggregate_edges, inputs={"ontology_g": "parse_ontology"}),
+    Stage(
+        "tabularize",
+        tabularize,
+        inputs={"study_g": "parse_study", "violation_counts": "count_violations", "agg_edges_dict": "aggregate_edges"},
+        version=2,
+    ),
+    Stage(
+        "abbreviate",
+        abbreviate,
+        inputs={"study_table": "tabularize", "study_g": "parse_study", "violations_g": "parse_violations"},
+        params=("label_predicates",),
+    ),
+    Stage(
+        "exemplars",
+        build_exemplars,
+        inputs={"ontology_g": "parse_ontology", "violations_g": "parse_violations", "study_g": "parse_study"},
+        params=("label_predicates",),
+        options=("processes",),
+        export=export_exemplars,
+        # forks the processes that group the exemplars
+        exclusive=True,
+        artifacts=("ontology_ttl", "edge_count_dict", "focus_node_exemplar_dict", "exemplar_focus_node_dict", "violation_exemplar_dict"),
+    ),
+    Stage(
+        "embedding",
+        embed,
+        inputs={"study_table": "abbreviate"},
+        params=("use_violation_columns", "random_state"),
+        export=export_study_table,
+        artifacts=("study_parquet", "study_csv", "violation_list"),
+    ),
+]
+
+
+def run_preprocessing(sources, output_dir, cache_dir=None, params=None, targets=None, max_workers=None):
+    """
+    Runs the preprocessing of preprocess.ipynb, skipping the stages whose inputs and parameters did not change since
+    an earlier run with the same cache directory.
+
+    Args:
+        sources (Dict[str, str]): The paths of the "study", "violations" and "ontology" Turtle files, see input_paths.
+        output_dir (str): The directory the artifacts are written to, laid out as incremental.artifact_paths.
+        cache_dir (str, optional): The directory of the stage outputs, output_dir/.preprocess_cache by default.
+        params (dict, optional): Overrides of DEFAULT_PARAMS.
+        targets (Iterable[str], optional): The stages to bring up to date, the exporting stages by default.
+        max_workers (int, optional): The number of stages that run at the same time.
+
+    Returns:
+        dict: See Pipeline.run.
+    """
+    pipeline = Pipeline(
+        STAGES,
+        sources,
+        {**DEFAULT_PARAMS, **(params or {})},
+        cache_dir or os.path.join(output_dir, ".preprocess_cache"),
+        output_dir,
+        max_workers,
+    )
+    return pipeline.run(targets)
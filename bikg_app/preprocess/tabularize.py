@@ -0,0 +1,118 @@
+"""This module implements the tabularization of the study graph into one row per focus node, next to its violation counts."""
+# tabularize.py
+import logging
+
+import numpy as np
+import pandas as pd
+from rdflib import RDF, Graph
+
+from bikg_app.routers.incremental import EMPTY_EDGE_STRING
+
+_log = logging.getLogger(__name__)
+
+
+def focus_node_classes(study_g: Graph):
+    """Returns {node: class} of the typed nodes of the study graph, the last type of a node wins."""
+    return {str(node): str(class_) for node, class_ in study_g.subject_objects(RDF.type)}
+
+
+def violation_count_dataframe(violation_counts):
+    """Returns the violation counts as a table, one row per focus node and one column per source shape, 0 where a focus node has none."""
+    focus_nodes = pd.Index(list(violation_counts), dtype=object)
+    flat_rows = np.repeat(np.arange(len(focus_nodes)), [len(counts) for counts in violation_counts.values()])
+    shapes, shape_columns = pd.factorize(np.array([shape for counts in violation_counts.values() for shape in counts], dtype=object))
+    values = np.zeros((len(focus_nodes), len(shape_columns)))
+    values[flat_rows, shapes] = [count for counts in violation_counts.values() for count in counts.values()]
+    return pd.DataFrame(values, index=focus_nodes, columns=pd.Index(shape_columns, dtype=object))
+
+
+def _object_cells(objects, group_starts, group_sizes, list_groups):
+    """Returns the cells of the groups of objects, the single object or a list of all objects in list_groups."""
+    cells = np.empty(len(group_starts), dtype=object)
+    single_groups = ~list_groups
+    cells[single_groups] = objects[group_starts[single_groups]]
+    for group in np.flatnonzero(list_groups):
+        cells[group] = objects[group_starts[group] : group_starts[group] + group_sizes[group]].tolist()
+    return cells
+
+
+def create_study_dataframe(study_g: Graph, violation_counts, agg_edges_dict):
+    """
+    Creates the study table: one row per focus node with its violation counts, then one column per predicate of the
+    study graph, holding the object of the focus node's edge, a list of the objects if it has several, or
+    EMPTY_EDGE_STRING if it has none.
+
+    The triples are encoded to arrays of row, column and object codes once and grouped by cell with a stable sort, so
+    the table is built in one piece instead of cell by cell. The objects of a cell keep the order of the triples.
+
+    Args:
+        study_g (Graph): The instance data graph.
+        violation_counts (dict): {focus node: {source shape: number of validation results}}, see count_violations.
+        agg_edges_dict (dict): {class: set of the predicates its instances may have}, see aggregate_edges.
+
+    Returns:
+        pd.DataFrame: The study table indexed by the focus nodes, with the focus_node column first.
+
+    Raises:
+        ValueError: If a focus node has no class or an edge of a focus node has an empty object.
+    """
+    classes = focus_node_classes(study_g)
+    study_df = violation_count_dataframe(violation_counts)
+    focus_nodes = study_df.index
+
+    triples = np.array([(str(s), str(p), str(o)) for s, p, o in study_g], dtype=object).reshape(-1, 3)
+    # only the focus nodes have rows
+    rows = focus_nodes.get_indexer(triples[:, 0])
+    focus_triples = rows >= 0
+    count_skipped = int((~focus_triples).sum())
+    rows, triples = rows[focus_triples], triples[focus_triples]
+    predicates, objects = triples[:, 1], triples[:, 2]
+
+    empty_objects = objects == ""
+    if empty_objects.any():
+        first = np.flatnonzero(empty_objects)[0]
+        raise ValueError(f"Empty object for {triples[first, 0]} {predicates[first]}")
+    row_classes = np.array([classes.get(focus_node) for focus_node in focus_nodes], dtype=object)
+    untyped_rows = pd.isna(row_classes[rows])
+    if untyped_rows.any():
+        raise ValueError(f"The focus node {triples[np.flatnonzero(untyped_rows)[0], 0]} has no class")
+
+    # the columns in the order their predicates first appear
+    columns, predicate_columns = pd.factorize(predicates)
+
+    # edges the class does not allow are written as well, they are only counted separately
+    class_codes, row_class_values = pd.factorize(row_classes)
+    allowed_edges = np.zeros((len(row_class_values), len(predicate_columns)), dtype=bool)
+    for class_code, class_ in enumerate(row_class_values):
+        allowed_columns = pd.Index(predicate_columns).get_indexer(list(agg_edges_dict.get(class_, ())))
+        allowed_edges[class_code, allowed_columns[allowed_columns >= 0]] = True
+    allowed = allowed_edges[class_codes[rows], columns]
+    count_allowed = int(allowed.sum())
+    _log.info(
+        "Tabularized %d allowed and %d not allowed edges, skipped %d triples", count_allowed, len(allowed) - count_allowed, count_skipped
+    )
+
+    # the cells grouped in the order of their triples
+    cells = rows.astype(np.int64) * len(predicate_columns) + columns
+    order = np.argsort(cells, kind="stable")
+    cells, objects = cells[order], objects[order]
+    group_starts = np.flatnonzero(np.diff(cells, prepend=-1))
+    group_sizes = np.diff(group_starts, append=len(cells))
+    group_rows, group_columns = np.divmod(cells[group_starts], max(len(predicate_columns), 1))
+
+    # columns with a list anywhere hold lists in every row, rdf:type always does
+    list_columns = np.zeros(len(predicate_columns), dtype=bool)
+    list_columns[group_columns[group_sizes > 1]] = True
+    list_columns[predicate_columns == str(RDF.type)] = True
+
+    values = np.full((len(focus_nodes), len(predicate_columns)), EMPTY_EDGE_STRING, dtype=object)
+    values[group_rows, group_columns] = _object_cells(objects, group_starts, group_sizes, list_columns[group_columns])
+    edge_not_present = np.ones(values.shape, dtype=bool)
+    edge_not_present[group_rows, group_columns] = False
+    for row, column in zip(*np.nonzero(edge_not_present & list_columns), strict=True):
+        values[row, column] = [EMPTY_EDGE_STRING]
+
+    edges_df = pd.DataFrame(values, index=focus_nodes, columns=pd.Index(predicate_columns, dtype=object))
+    study_df = pd.concat([study_df, edges_df], axis=1)
+    study_df.insert(0, "focus_node", study_df.index)
+    return study_df
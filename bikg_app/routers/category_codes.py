@@ -0,0 +1,120 @@
+"""This module implements the integer-coded view of the study table used to count categories of row selections."""
+# category_codes.py
+import numpy as np
+import pandas as pd
+
+from bikg_app.routers.study_schema import category_labels
+
+
+def row_positions(index: pd.Index, labels) -> np.ndarray:
+    """
+    Returns the positions of labels in index, in the given order, like the row order of df.loc[labels].
+
+    Raises:
+        KeyError: If one of the labels is not in index.
+    """
+    positions = index.get_indexer(labels)
+    if (positions < 0).any():
+        missing = [label for label, position in zip(labels, positions.tolist(), strict=True) if position < 0]
+        raise KeyError(f"{missing} not in index")
+    return positions
+
+
+class CategoryCodes:
+    """
+    The feature columns of the study table encoded once as integer codes into one global category space,
+    column j owning the codes offsets[j] to offsets[j + 1] - 1.
+    The category counts of a selection of rows are then a single np.bincount over the gathered codes instead of hashing
+    the object values of every column on every request.
+    """
+
+    def __init__(self, columns, categories, offsets, codes, overall_counts):
+        """
+        Args:
+            columns (List[str]): The encoded feature columns.
+            categories (List[Sequence]): The categories of every column, as reported by the endpoints, in code order.
+            offsets (np.ndarray): len(columns) + 1 offsets of the codes of each column.
+            codes (np.ndarray): The code of every (row, column), n_codes for missing values.
+            overall_counts (np.ndarray): The number of rows of every code.
+        """
+        self.columns = list(columns)
+        self.categories = categories
+        self.offsets = offsets
+        self.n_codes = int(offsets[-1])
+        self.codes = codes
+        self.overall_counts = overall_counts
+
+    @classmethod
+    def from_df(cls, df: pd.DataFrame, columns) -> "CategoryCodes":
+        """
+        Encodes the columns of the study table.
+
+        Args:
+            df (pd.DataFrame): The study table.
+            columns (List[str]): The feature columns to encode.
+        """
+        columns = list(columns)
+        categories = []
+        offsets = np.zeros(len(columns) + 1, dtype=np.int64)
+        column_codes = []
+        for j, column in enumerate(columns):
+            codes, column_categories = pd.factorize(df[column])
+            categories.append(category_labels(column_categories.tolist(), df[column].dtype))
+            offsets[j + 1] = offsets[j] + len(column_categories)
+            column_codes.append(codes)
+        # missing values (code -1) all go to one trailing bucket that is never reported, as value_counts drops them
+        n_codes = int(offsets[-1])
+        codes = np.empty((len(df), len(columns)), dtype=np.int32)
+        for j, column_code in enumerate(column_codes):
+            codes[:, j] = np.where(column_code < 0, n_codes, column_code + offsets[j])
+        overall_counts = np.bincount(codes.ravel(), minlength=n_codes + 1)[:n_codes]
+        return cls(columns, categories, offsets, codes, overall_counts)
+
+    def count(self, positions):
+        """
+        Counts the categories of every column over the rows at positions.
+
+        Args:
+            positions (np.ndarray): Row positions, duplicates are counted as often as they occur.
+
+        Returns:
+            tuple: (np.ndarray of the counts per code, np.ndarray of the first selected row each code was seen in)
+        """
+        selected = self.codes[positions].ravel()
+        counts = np.bincount(selected, minlength=self.n_codes + 1)[: self.n_codes]
+        # pandas lists the categories in order of first appearance before sorting them by count
+        first_seen = np.full(self.n_codes + 1, len(selected), dtype=np.int64)
+        np.minimum.at(first_seen, selected, np.arange(len(selected)))
+        return counts, first_seen[: self.n_codes]
+
+    def value_counts(self, positions) -> dict:
+        """
+        Counts the categories of every column over the rows at positions.
+
+        The result matches {column: df.iloc[positions][column].value_counts().to_dict()}, including the order of the
+        categories: by count descending, ties resolved the way pandas sorts them.
+
+        Args:
+            positions (np.ndarray): Row positions, duplicates are counted as often as they occur.
+
+        Returns:
+            dict: Maps each column to a dictionary of the form {category: count}.
+        """
+        return self.to_value_counts(*self.count(positions))
+
+    def to_value_counts(self, counts, first_seen) -> dict:
+        """Turns the result of count into {column: {category: count}}, ordered like value_counts."""
+        value_counts = {}
+        for j, column in enumerate(self.columns):
+            start, stop = self.offsets[j], self.offsets[j + 1]
+            present = np.flatnonzero(counts[start:stop])
+            present = present[np.argsort(first_seen[start:stop][present], kind="stable")]
+            column_counts = counts[start:stop][present]
+            # the same descending sort as Series.sort_values(ascending=False), so ties come out in the same order
+            reversed_order = np.arange(len(present))[::-1]
+            order = reversed_order[column_counts[::-1].argsort(kind="quicksort")][::-1]
+            categories = self.categories[j]
+            value_counts[column] = {
+                categories[code]: count for code, count in zip(present[order].tolist(), column_counts[order].tolist(), strict=True)
+            }
+        return value_counts
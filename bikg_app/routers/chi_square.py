@@ -0,0 +1,66 @@
+"""This module implements the chi square scores of many 2 x C contingency tables at once."""
+# chi_square.py
+import numpy as np
+
+# Counts of 0 are replaced by this value so that no expected frequency is 0
+SMOOTHING = 1e-7
+
+
+def chi_square_scores(selected, overall, offsets) -> np.ndarray:
+    """
+    Computes the chi square score of the table [selected, overall] of every column in one vectorized pass.
+
+    Column j owns the categories offsets[j] to offsets[j + 1] - 1 of the aligned count arrays.
+    The scores are those of scipy.stats.chi2_contingency on the smoothed counts, including Yates' correction for
+    columns with 2 categories; columns with fewer than 2 categories score 0.
+
+    Args:
+        selected (np.ndarray): The counts of the categories in the selection.
+        overall (np.ndarray): The counts of the categories in the whole data.
+        offsets (np.ndarray): len(columns) + 1 category offsets.
+
+    Returns:
+        np.ndarray: One chi square score per column.
+    """
+    selected = np.asarray(selected, dtype=np.float64)
+    overall = np.asarray(overall, dtype=np.float64)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    n_categories = np.diff(offsets)
+    if len(selected) == 0:
+        return np.zeros(len(n_categories))
+
+    observed = np.stack([np.where(selected == 0, SMOOTHING, selected), np.where(overall == 0, SMOOTHING, overall)])
+    column = np.repeat(np.arange(len(n_categories)), n_categories)
+    starts = offsets[:-1]
+    # reduceat needs start indices inside the array, so a padding category is appended; empty columns are masked out below
+    row_sums = np.add.reduceat(np.pad(observed, ((0, 0), (0, 1))), starts, axis=1)
+    category_sums = observed.sum(axis=0)
+    total = row_sums.sum(axis=0)
+    expected = row_sums[:, column] * category_sums / total[column]
+
+    difference = expected - observed
+    # Yates' correction, applied by chi2_contingency when the table has 1 degree of freedom
+    yates = (n_categories == 2)[column]
+    observed = np.where(yates, observed + np.sign(difference) * np.minimum(0.5, np.abs(difference)), observed)
+
+    terms = ((observed - expected) ** 2 / expected).sum(axis=0)
+    scores = np.add.reduceat(np.append(terms, 0.0), starts)
+    scores[n_categories < 2] = 0.0
+    return scores
+
+
+def chi_square_score(selection_data, overall_data):
+    """
+    Computes the chi square score of one feature from the category counts of a selection and of the whole data.
+
+    Args:
+        selection_data (dict): {category: count} of the selection.
+        overall_data (dict): {category: count} of the whole data.
+
+    Returns:
+        float: The chi square score.
+    """
+    categories = list(overall_data) + [category for category in selection_data if category not in overall_data]
+    selected = np.array([selection_data.get(category, 0) for category in categories], dtype=np.float64)
+    overall = np.array([overall_data.get(category, 0) for category in categories], dtype=np.float64)
+    return chi_square_scores(selected, overall, [0, len(categories)])[0]
@@ -0,0 +1,937 @@
+"""This module loads the dataset served by the API endpoints and manages its lifecycle."""
+# dataset.py
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+from rdflib import OWL, RDF, RDFS, Graph, Literal, URIRef
+
+from bikg_app.routers.category_codes import CategoryCodes
+from bikg_app.routers.label_index import LabelIndex
+from bikg_app.routers.namespace_shortener import NamespaceShortener
+from bikg_app.routers.namespace_stats import NamespaceStats
+from bikg_app.routers.selection_index import BitmapIndex
+from bikg_app.routers.selection_store import SelectionStore
+from bikg_app.routers.snapshot import (
+    SnapshotMismatchError,
+    StringTable,
+    decode_string_table,
+    describe_sources,
+    encode_json_table,
+    encode_string_table,
+    read_snapshot,
+    sources_digest,
+    write_snapshot,
+)
+from bikg_app.routers.study_records import StudyRecords
+from bikg_app.routers.study_schema import EMBEDDING, FOCUS_NODE_COLUMN, apply_schema, category_labels, column_roles
+from bikg_app.routers.study_table import read_study_table
+from bikg_app.routers.term_dictionary import TermDictionary, TermList, TermMap, search_order
+from bikg_app.routers.triple_store import TripleStore
+from bikg_app.routers.type_index import TypeIndex
+from bikg_app.routers.utils import load_lists_dict, load_nested_counts_dict_json
+from bikg_app.routers.violation_paths import ViolationPathIndex
+
+_log = logging.getLogger(__name__)
+
+# File paths
+# input files, original RDF for ontology and shacl, instance data, and violation report
+ORIGINAL_ONTOLOGY_FILE_PATH = "bikg_app/ttl/omics_model.ttl"
+ORIGINAL_INSTANCE_DATA_FILE_PATH = "bikg_app/ttl/study.ttl"
+ORIGINAL_VIOLATION_REPORT_FILE_PATH = "bikg_app/ttl/violation_report.ttl"
+
+
+JSON_DIR = "bikg_app/json"
+VIOLATIONS_FILE_PATH = os.path.join(JSON_DIR, "violation_list.json")
+STUDY_CSV_FILE_PATH = "bikg_app/csv/study.csv"
+# the typed form of the study table, preferred over the CSV when preprocessing wrote it
+STUDY_PARQUET_FILE_PATH = "bikg_app/parquet/study.parquet"
+ONTOLOGY_TTL_FILE_PATH = "bikg_app/ttl/omics_model_union_violation_exemplar.ttl"
+EXEMPLAR_EDGE_COUNT_JSON_PATH = "bikg_app/json/exemplar_edge_count_dict.json"
+FOCUS_NODE_EXEMPLAR_DICT_JSON_PATH = "bikg_app/json/focus_node_exemplar_dict.json"
+EXEMPLAR_FOCUS_NODE_DICT_JSON_PATH = "bikg_app/json/exemplar_focus_node_dict.json"
+VIOLATION_EXEMPLAR_DICT_PATH = "bikg_app/json/violation_exemplar_dict.json"
+
+# precompiled snapshot of everything below, see compile_snapshot
+DATASET_SNAPSHOT_PATH = "bikg_app/snapshot/dataset.bikgsnap"
+
+
+def study_table_path():
+    """Returns the file the study table is loaded from, study.parquet unless it is missing or older than study.csv."""
+    if not os.path.exists(STUDY_PARQUET_FILE_PATH):
+        return STUDY_CSV_FILE_PATH
+    if os.path.exists(STUDY_CSV_FILE_PATH) and os.path.getmtime(STUDY_CSV_FILE_PATH) > os.path.getmtime(STUDY_PARQUET_FILE_PATH):
+        _log.warning("%s is newer than %s, loading the CSV", STUDY_CSV_FILE_PATH, STUDY_PARQUET_FILE_PATH)
+        return STUDY_CSV_FILE_PATH
+    return STUDY_PARQUET_FILE_PATH
+
+
+def snapshot_source_paths():
+    """Returns the files the snapshot is compiled from, it is rejected as soon as one of them changes."""
+    return [
+        VIOLATIONS_FILE_PATH,
+        study_table_path(),
+        ONTOLOGY_TTL_FILE_PATH,
+        EXEMPLAR_EDGE_COUNT_JSON_PATH,
+        FOCUS_NODE_EXEMPLAR_DICT_JSON_PATH,
+        EXEMPLAR_FOCUS_NODE_DICT_JSON_PATH,
+        VIOLATION_EXEMPLAR_DICT_PATH,
+    ]
+
+
+class Dataset:
+    """
+    Holds the tabularized study data, the ontology graph and everything the endpoints derive from them.
+    Instances are filled by the stages in LOAD_STAGES (or from a snapshot) and are treated as read-only afterwards.
+    """
+
+    # the ontology graph, a TripleStore over the ids of terms
+    g: TripleStore
+    df: pd.DataFrame
+    ttl_data: str
+    shortener: NamespaceShortener
+    namespace_stats: NamespaceStats
+    node_labels: LabelIndex
+    edge_labels: LabelIndex
+    violation_paths: ViolationPathIndex
+    # one id per term for the graph, the focus nodes and the exemplar maps, decoded to labels only for responses
+    terms: TermDictionary
+    focus_node_ids: np.ndarray
+    # TermMaps of the exemplar dictionaries, {exemplar: {"predicate__object": count}}, {focus node: [exemplar, ...]},
+    # {exemplar: [focus node, ...]} and {source shape: {exemplar: count}}
+    exemplar_edge_counts: TermMap
+    focus_node_exemplars: TermMap
+    exemplar_focus_nodes: TermMap
+    violation_exemplars: TermMap
+    selection_index: BitmapIndex
+    category_codes: CategoryCodes
+    study_records: StudyRecords
+
+    def __init__(self):
+        # the attributes annotated above are set by the load stages, the ones below may stay unset
+        self._cache = {}
+        self._cache_lock = threading.Lock()
+        # identifies the contents of the source files, derived responses are cached and validated against it
+        self.version: str | None = None
+        self.violations_list = []
+        # {column: role} of the study table, see study_schema
+        self.column_roles = {}
+        self.filtered_columns = []
+        self.overall_value_counts = {}
+        self.overall_violation_value_dict = {}
+        self.overall_violation_value_counts = {}
+        self.types_list = []
+        # None if the study table has no rdf:type column
+        self.type_index: TypeIndex | None = None
+        self.type_count_dict = {}
+        self.type_violation_dict = {}
+        self.subclass_edges = []
+        self.ontology_classes = []
+        self.types_only_in_csv = []
+        self.ontology_tree: Node | None = None
+        self.node_count_dict: dict | None = None
+        # row positions are only meaningful for this dataset, so every load starts with an empty store
+        self.selection_store = SelectionStore()
+
+    def cached(self, key, factory):
+        """
+        Returns the value cached under key, computing it with factory() on first use.
+        Meant for derived artifacts such as encoded responses, which stay valid as long as this dataset does.
+        """
+        if key not in self._cache:
+            with self._cache_lock:
+                if key not in self._cache:
+                    self._cache[key] = factory()
+        return self._cache[key]
+
+
+def build_type_node_count_dict(type_index):
+    """
+    Counts the rows of each type in the 'rdf:type' column, ordered like the value counts of the exploded column.
+    """
+    if type_index is None:
+        _log.warning("'rdf:type' column not found in the DataFrame. Returning an empty dictionary.")
+        return {}
+
+    return type_index.type_count_dict()
+
+
+def build_type_violation_dict(type_index, df, violations_list):
+    """
+    Sums the counts of each violation over the rows of each type in the 'rdf:type' column.
+    :param type_index: TypeIndex of the "rdf:type" column of df
+    :param df: DataFrame with a column v for each v in violations_list
+    :param violations_list: List of columns that represent different types of violations
+    :return: A dictionary with types as keys and (violation, violation_count) as values
+    """
+    if type_index is None:
+        _log.warning("'rdf:type' column not found in the DataFrame. Returning an empty dictionary.")
+        return {}
+
+    violation_columns = [violation for violation in violations_list if violation in df.columns]
+    # one pass over the rows of all types instead of a boolean mask per (type, violation) pair
+    violation_sums = type_index.column_sums(df[violation_columns].to_numpy(dtype=np.float64))
+
+    type_violation_dict = {}
+    for rdf_type, sums in zip(type_index.types, violation_sums.tolist(), strict=True):
+        # Keep the violations that occur for this type, truncated to int like the per-type sums used to be
+        violation_counts = {violation: int(total) for violation, total in zip(violation_columns, sums, strict=True) if int(total) > 0}
+        if violation_counts:
+            type_violation_dict[rdf_type] = violation_counts
+
+    return type_violation_dict
+
+
+class Node:
+    def __init__(self, id):
+        self.id = id
+        self.children = []
+        self.count = 0
+        self.cumulative_count = 0
+
+    def __str__(self, level=0):
+        ret = "\t" * level + repr(self.id) + f" (Count: {self.count}, Cumulative Count: {self.cumulative_count})\n"
+        for child in self.children:
+            ret += child.__str__(level + 1)
+        return ret
+
+    def to_dict(self):
+        return {
+            "id": self.id.item() if isinstance(self.id, np.integer) else self.id,
+            "count": self.count.item() if isinstance(self.count, np.integer) else self.count,
+            "cumulative_count": self.cumulative_count.item() if isinstance(self.cumulative_count, np.integer) else self.cumulative_count,
+            "children": [child.to_dict() for child in self.children],
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        """Inverse of to_dict."""
+        node = cls(d["id"])
+        node.count = d["count"]
+        node.cumulative_count = d["cumulative_count"]
+        node.children = [cls.from_dict(child) for child in d["children"]]
+        return node
+
+
+def build_ontology_tree(type_index, type_violation_dict, type_count_dict, violation_exemplar_dict, g, shortener: NamespaceShortener):
+    parent_child_map = defaultdict(list)
+    ontology_type_nodes = set()
+    parents = set()
+    children = set()
+
+    for s, o in g.subject_objects(RDFS.subClassOf):
+        parent = shortener.qname(o)
+        child = shortener.qname(s)
+        parent_child_map[parent].append(child)
+        ontology_type_nodes.add(parent)
+        ontology_type_nodes.add(child)
+        parents.add(parent)
+        children.add(child)
+
+    # Identify 'not in ontology' classes/types from the types of the study table
+    df_types = set(type_index.types) if type_index is not None else set()
+    types_only_in_csv = df_types - ontology_type_nodes
+    all_type_nodes = ontology_type_nodes.union(types_only_in_csv)
+    all_type_nodes_and_missing = all_type_nodes.union({"missing"})
+
+    roots = parents - children
+
+    for node in ontology_type_nodes:
+        if node not in type_count_dict:
+            type_count_dict[node] = 0
+
+    node_count_dict = {}
+    root = Node("VirtualRoot")
+
+    def build_sub_class_tree(current_node):
+        for child_id in parent_child_map[current_node.id]:
+            child_node = Node(child_id)
+            if child_id in type_count_dict:
+                child_node.count = type_count_dict[child_id]
+            current_node.children.append(child_node)
+            build_sub_class_tree(child_node)
+
+    def add_violations(current_node):
+        for child in current_node.children:
+            add_violations(child)
+        if current_node.id in type_violation_dict:
+            for violation, count in type_violation_dict[current_node.id].items():
+                violation_node = Node(violation)
+                violation_node.count = count
+                current_node.children.append(violation_node)
+
+    def add_exemplars(current_node):
+        for child in current_node.children:
+            add_exemplars(child)
+        if current_node.id in violation_exemplar_dict:
+            for exemplar, exemplar_count in violation_exemplar_dict[current_node.id].items():
+                exemplar_node = Node(exemplar)
+                exemplar_node.count = exemplar_count
+                current_node.children.append(exemplar_node)
+
+    def compute_cumulative_counts(current_node):
+        for child in current_node.children:
+            compute_cumulative_counts(child)
+
+        current_node.cumulative_count = current_node.count
+        if current_node.id in all_type_nodes_and_missing:
+            for child in current_node.children:
+                if child.id in all_type_nodes_and_missing:
+                    current_node.cumulative_count += child.cumulative_count
+
+        node_count_dict[current_node.id] = {
+            "count": current_node.count,
+            "cumulative_count": current_node.cumulative_count,  # Store both count and cumulative_count
+        }
+
+    for actual_root in roots:
+        root_node = Node(actual_root)
+        root.children.append(root_node)
+        build_sub_class_tree(root_node)
+
+    for node in root.children:
+        add_violations(node)
+        for violation_node in node.children:
+            add_exemplars(violation_node)
+
+    compute_cumulative_counts(root)
+
+    # Count the number of nodes in the CSV with a type not in the ontology
+    type_counts_in_csv = type_index.type_count_dict() if type_index is not None else {}
+    not_in_ontology_counts = {type_: type_counts_in_csv[type_] for type_ in types_only_in_csv if type_ in type_counts_in_csv}
+
+    # Add a child to root called "missing"
+    not_in_ontology_node = Node("missing")
+    root.children.append(not_in_ontology_node)
+
+    # For each type not in the ontology, add a child to "missing"
+    for type_, count in not_in_ontology_counts.items():
+        type_node = Node(type_)
+        type_node.cumulative_count = count
+        type_node.count = count
+        not_in_ontology_node.children.append(type_node)
+
+    # Compute cumulative counts for "missing" node and its children
+    # iterate through the children of "missing" and sum up their counts
+    not_in_ontology_node.cumulative_count = sum(child.count for child in not_in_ontology_node.children)
+    # write this to the not_in_ontology node in the node_count_dict for cumulative_count
+    node_count_dict["missing"] = {
+        "count": 0,
+        "cumulative_count": sum(child.count for child in not_in_ontology_node.children),
+    }
+
+    compute_cumulative_counts(not_in_ontology_node)
+
+    return root, node_count_dict
+
+
+def compute_version(dataset: Dataset):
+    dataset.version = sources_digest(describe_sources(snapshot_source_paths()))
+
+
+def load_violations(dataset: Dataset):
+    assert os.path.exists(VIOLATIONS_FILE_PATH)
+    with open(VIOLATIONS_FILE_PATH, "rb") as violations_f:
+        dataset.violations_list = json.load(violations_f)
+
+
+def load_study_table(dataset: Dataset):
+    path = study_table_path()
+    # the indexes below parse the list cells from the strings of study.csv, converted once per distinct cell
+    df = read_study_table(path, list_strings=True) if path == STUDY_PARQUET_FILE_PATH else pd.read_csv(path, index_col=0)
+    dataset.column_roles = column_roles(df.columns, dataset.violations_list)
+    dataset.df = apply_schema(df, dataset.column_roles)
+    dataset.filtered_columns = [column for column in dataset.df.columns if dataset.column_roles[column] != EMBEDDING]
+
+
+def value_counts(values) -> dict:
+    """Returns values.value_counts() of a Series as a dictionary keyed by the categories the way the endpoints report them."""
+    counts = values.value_counts()
+    return dict(zip(category_labels(counts.index, values.dtype), counts.tolist(), strict=True))
+
+
+def compute_value_counts(dataset: Dataset):
+    df = dataset.df
+    # compute the overall value counts
+    for column in dataset.filtered_columns:
+        dataset.overall_value_counts[column] = value_counts(df[column])
+
+    # compute the overall violation value counts
+    for column in dataset.violations_list:
+        dataset.overall_violation_value_dict[column] = value_counts(df[column])
+
+    dataset.overall_violation_value_counts = {
+        violation: sum(key * value for key, value in counts.items()) for violation, counts in dataset.overall_violation_value_dict.items()
+    }
+
+    try:
+        dataset.types_list = df["rdf:type"].unique().tolist()
+    except KeyError:
+        dataset.types_list = []
+        _log.warning("Column 'rdf:type' not found.")
+
+
+def build_type_index(dataset: Dataset):
+    # parse the 'rdf:type' lists once, handlers and the derived dicts read types from the index and never touch df["rdf:type"]
+    dataset.type_index = TypeIndex.from_column(dataset.df["rdf:type"]) if "rdf:type" in dataset.df.columns else None
+
+
+def load_ontology(dataset: Dataset):
+    g = Graph()
+    g.parse(ONTOLOGY_TTL_FILE_PATH, format="ttl")
+    dataset.ttl_data = g.serialize(format="turtle")
+    # the parsed graph is only kept as the id triples of a TripleStore, its terms are the first ones of the dictionary
+    dataset.terms = TermDictionary()
+    dataset.g = TripleStore.from_graph(g, dataset.terms)
+    dataset.shortener = NamespaceShortener.from_graph(dataset.g)
+    dataset.terms.shortener = dataset.shortener
+
+
+def uri_to_qname(shortener: NamespaceShortener, uri):
+    """
+    Convert a URI to its QName representation if possible.
+    If the input is not a URI or cannot be converted, return it as a string.
+
+    Args:
+        shortener (NamespaceShortener): The shortener of the dataset, built from the namespaces of the ontology graph.
+        uri (rdflib.term.URIRef or rdflib.term.Literal or str): The URI or literal to convert.
+
+    Returns:
+        str: The QName representation or the original URI/literal as a string.
+    """
+    if isinstance(uri, URIRef):
+        try:
+            qname = shortener.qname(uri)
+            return qname
+        except ValueError:
+            return str(uri)
+    elif isinstance(uri, Literal):
+        return str(uri)
+    else:
+        return uri
+
+
+def build_node_label_set(g: Graph | TripleStore, shortener: NamespaceShortener):
+    # use qname to shorten the URIs of the distinct subjects and objects, each one only once
+    nodes = set(g.subjects()) | set(g.objects())
+    return {str(uri_to_qname(shortener, node)) for node in nodes}
+
+
+def build_edge_label_set(g: Graph | TripleStore, shortener: NamespaceShortener):
+    # use qname to shorten the URIs of the distinct predicates
+    return {str(uri_to_qname(shortener, predicate)) for predicate in set(g.predicates())}
+
+
+def build_label_indexes(dataset: Dataset):
+    dataset.node_labels = LabelIndex(build_node_label_set(dataset.g, dataset.shortener))
+    dataset.edge_labels = LabelIndex(build_edge_label_set(dataset.g, dataset.shortener))
+
+
+def compute_violation_paths(dataset: Dataset):
+    # the shapes graph only changes with the dataset, so the SPARQL join of the former per-request handler runs once as direct lookups
+    dataset.violation_paths = ViolationPathIndex.from_graph(dataset.g, lambda term: str(uri_to_qname(dataset.shortener, term)))
+
+
+def compute_namespace_stats(dataset: Dataset):
+    dataset.namespace_stats = NamespaceStats.from_triples(graph_iris(dataset.terms, dataset.g.spo), dataset.g.spo.T)
+
+
+def _qname(shortener: NamespaceShortener, term) -> str:
+    return shortener.qname(term) if isinstance(term, URIRef) else str(term)
+
+
+def compute_subclass_edges(dataset: Dataset):
+    g, shortener = dataset.g, dataset.shortener
+    # the rdfs:subClassOf edges and the owl:Class set only depend on the ontology, so they are collected once per load
+    dataset.subclass_edges = [
+        {"s": _qname(shortener, s), "p": "rdfs:subClassOf", "o": _qname(shortener, o)} for s, o in g.subject_objects(RDFS.subClassOf)
+    ]
+    dataset.ontology_classes = [_qname(shortener, c) for c in g.subjects(predicate=RDF.type, object=OWL.Class)]
+    df_types = dataset.type_index.types if dataset.type_index is not None else []
+    dataset.types_only_in_csv = sorted(set(df_types) - set(dataset.ontology_classes))
+
+
+def share_focus_nodes(df: pd.DataFrame, focus_nodes) -> pd.DataFrame:
+    """Indexes df by focus_nodes, the QNames cached by the term dictionary, and lets its focus_node column hold the same strings."""
+    index = pd.Index(focus_nodes, name=df.index.name, dtype=object)
+    if FOCUS_NODE_COLUMN in df.columns and (df[FOCUS_NODE_COLUMN].to_numpy(dtype=object) == index.to_numpy()).all():
+        df[FOCUS_NODE_COLUMN] = index.to_numpy()
+    df.index = index
+    return df
+
+
+def encode_focus_nodes(dataset: Dataset):
+    # the study table keeps its QNames, but as the strings the dictionary caches for the ids instead of two copies per row
+    dataset.focus_node_ids = dataset.terms.add_qnames(dataset.df.index.tolist())
+    dataset.df = share_focus_nodes(dataset.df, dataset.terms.qnames(dataset.focus_node_ids))
+
+
+def load_exemplar_dicts(dataset: Dataset):
+    terms = dataset.terms
+    # the edge counts within each exemplar
+    dataset.exemplar_edge_counts = TermMap.from_dict(load_nested_counts_dict_json(EXEMPLAR_EDGE_COUNT_JSON_PATH), terms)
+    # the exemplars of each focus node
+    dataset.focus_node_exemplars = TermMap.from_dict(load_lists_dict(FOCUS_NODE_EXEMPLAR_DICT_JSON_PATH), terms)
+    # the focus nodes of each exemplar
+    dataset.exemplar_focus_nodes = TermMap.from_dict(load_lists_dict(EXEMPLAR_FOCUS_NODE_DICT_JSON_PATH), terms)
+    # the exemplars and their counts for each violation
+    dataset.violation_exemplars = TermMap.from_dict(load_nested_counts_dict_json(VIOLATION_EXEMPLAR_DICT_PATH), terms)
+
+
+def compute_type_dicts(dataset: Dataset):
+    dataset.type_count_dict = build_type_node_count_dict(dataset.type_index)
+    dataset.type_violation_dict = build_type_violation_dict(dataset.type_index, dataset.df, dataset.violations_list)
+
+
+def compute_ontology_tree(dataset: Dataset):
+    dataset.ontology_tree, dataset.node_count_dict = build_ontology_tree(
+        dataset.type_index,
+        dataset.type_violation_dict,
+        dataset.type_count_dict,
+        dataset.violation_exemplars.to_dict(dataset.terms.qname),
+        dataset.g,
+        dataset.shortener,
+    )
+
+
+# The stages are executed in order, each one may use everything the previous stages have filled in.
+LOAD_STAGES = [
+    ("version", compute_version),
+    ("violations", load_violations),
+    ("study table", load_study_table),
+    ("value counts", compute_value_counts),
+    ("type index", build_type_index),
+    ("ontology", load_ontology),
+    ("focus nodes", encode_focus_nodes),
+    ("namespace stats", compute_namespace_stats),
+    ("label index", build_label_indexes),
+    ("violation paths", compute_violation_paths),
+    ("subclass edges", compute_subclass_edges),
+    ("exemplar dicts", load_exemplar_dicts),
+    ("type dicts", compute_type_dicts),
+    ("ontology tree", compute_ontology_tree),
+]
+
+
+def build_selection_index(dataset: Dataset):
+    dataset.selection_index = BitmapIndex.from_df(dataset.df, dataset.filtered_columns, dataset.violations_list)
+
+
+def encode_categories(dataset: Dataset):
+    dataset.category_codes = CategoryCodes.from_df(dataset.df, dataset.filtered_columns)
+
+
+def prepare_study_records(dataset: Dataset):
+    dataset.study_records = StudyRecords.from_df(dataset.df)
+
+
+# In-memory indexes derived from the loaded data, built after LOAD_STAGES, a snapshot stores them with the rest.
+INDEX_STAGES = [
+    ("selection index", build_selection_index),
+    ("category codes", encode_categories),
+    ("study records", prepare_study_records),
+]
+
+
+# the TermMap attributes of a dataset, stored in a snapshot as their arrays
+EXEMPLAR_MAPS = ("exemplar_edge_counts", "focus_node_exemplars", "exemplar_focus_nodes", "violation_exemplars")
+
+
+def graph_iris(terms: TermDictionary, triples) -> list:
+    """Returns the IRI of every term id that occurs in triples, None for the other ids, as NamespaceStats.from_triples takes them."""
+    iris: list[str | None] = [None] * len(terms)
+    for term_id in np.unique(triples).tolist():
+        term = terms.rdf_term(term_id)
+        if isinstance(term, URIRef):
+            iris[term_id] = str(term)
+    return iris
+
+
+def _pairs(d):
+    # value count dicts have float keys for numeric columns, which JSON objects would turn into strings
+    return [[key, value] for key, value in d.items()]
+
+
+def indexes_to_snapshot(dataset: Dataset) -> dict:
+    """
+    Returns the arrays of the indexes derived from the study table and the graph, so a snapshot maps them instead of
+    rebuilding them: the search order of the term dictionary, the namespace statistics as term ids and counts, the
+    category codes, the bitmap index and the encoded study records. Categories are stored as a table of their JSON
+    encodings, which keeps the float labels of the count columns floats.
+    """
+    arrays = {}
+    arrays["terms/order"] = search_order(*dataset.terms.to_strings()[:2])
+    iris, node_counts, edge_counts = dataset.namespace_stats.to_arrays()
+    iri_ids = np.array([term_id for term_id, iri in enumerate(graph_iris(dataset.terms, dataset.g.spo)) if iri is not None], dtype=np.int32)
+    if len(iri_ids) != len(iris):
+        raise ValueError("The namespace statistics count IRIs outside the ontology graph and cannot be stored in a snapshot")
+    arrays["namespace_stats/iri_ids"], arrays["namespace_stats/node_counts"], arrays["namespace_stats/edge_counts"] = (
+        iri_ids,
+        node_counts,
+        edge_counts,
+    )
+
+    category_codes = dataset.category_codes
+    arrays["category_codes/codes"] = category_codes.codes
+    arrays["category_codes/offsets"] = category_codes.offsets
+    arrays["category_codes/overall_counts"] = category_codes.overall_counts
+    arrays["category_codes/categories"], arrays["category_codes/category_offsets"] = encode_json_table(
+        [category for categories in category_codes.categories for category in categories]
+    )
+
+    index = dataset.selection_index
+    arrays["selection_index/categories"], arrays["selection_index/category_offsets"] = encode_json_table(list(index.categories))
+    for name in ("offsets", "row_sets", "bitmaps", "positions", "position_offsets", "violation_bitmaps"):
+        arrays[f"selection_index/{name}"] = getattr(index, name)
+
+    records = dataset.study_records
+    arrays["study_records/codes"] = np.array(records.codes, dtype=np.int32).reshape(len(records.columns), records.n_rows)
+    fragments = [list(column_fragments) for column_fragments in records.fragments]
+    arrays["study_records/fragments"], arrays["study_records/fragment_offsets"] = encode_string_table(
+        [fragment for column_fragments in fragments for fragment in column_fragments]
+    )
+    arrays["study_records/column_offsets"] = np.cumsum([0] + [len(column_fragments) for column_fragments in fragments], dtype=np.int64)
+    return arrays
+
+
+def indexes_from_snapshot(dataset: Dataset, arrays, objects):
+    """Restores the indexes stored by indexes_to_snapshot, their arrays stay memory-mapped and their strings are decoded on use."""
+    terms = dataset.terms
+    dataset.namespace_stats = NamespaceStats(
+        TermList(terms, arrays["namespace_stats/iri_ids"]), arrays["namespace_stats/node_counts"], arrays["namespace_stats/edge_counts"]
+    )
+
+    offsets = arrays["category_codes/offsets"]
+    categories = StringTable(arrays["category_codes/categories"], arrays["category_codes/category_offsets"], json.loads)
+    dataset.category_codes = CategoryCodes(
+        dataset.filtered_columns,
+        [categories[int(offsets[j]) : int(offsets[j + 1])] for j in range(len(offsets) - 1)],
+        offsets,
+        arrays["category_codes/codes"],
+        arrays["category_codes/overall_counts"],
+    )
+
+    dataset.selection_index = BitmapIndex(
+        len(dataset.df),
+        dataset.filtered_columns,
+        StringTable(arrays["selection_index/categories"], arrays["selection_index/category_offsets"], json.loads),
+        arrays["selection_index/offsets"],
+        arrays["selection_index/row_sets"],
+        arrays["selection_index/bitmaps"],
+        arrays["selection_index/positions"],
+        arrays["selection_index/position_offsets"],
+        dataset.violations_list,
+        arrays["selection_index/violation_bitmaps"],
+    )
+
+    column_offsets = arrays["study_records/column_offsets"].tolist()
+    fragments = StringTable(arrays["study_records/fragments"], arrays["study_records/fragment_offsets"])
+    dataset.study_records = StudyRecords(
+        len(dataset.df),
+        dataset.df.columns,
+        arrays["study_records/codes"],
+        [fragments[start:stop] for start, stop in itertools.pairwise(column_offsets)],
+        objects["study_list_columns"],
+    )
+
+
+def dataset_to_snapshot(dataset: Dataset):
+    """
+    Converts a loaded dataset into the arrays and JSON objects stored in a snapshot.
+    Object and categorical columns of the study table are stored as int32 codes into a per-column string table, numeric
+    columns as they are. The focus nodes, the ontology graph and the exemplar maps are stored as ids into the term
+    dictionary, the focus nodes as the index and the graph as the sorted permutations of its TripleStore.
+
+    Returns:
+        tuple: (dict of arrays, dict of JSON-serializable objects)
+    """
+    df = dataset.df
+    arrays = {}
+    columns = []
+    for position, column in enumerate(df.columns):
+        values = df[column]
+        if column == FOCUS_NODE_COLUMN and (values.to_numpy(dtype=object) == df.index.to_numpy()).all():
+            columns.append({"name": column, "kind": "index"})
+        elif isinstance(values.dtype, pd.CategoricalDtype):
+            categories = values.cat.categories
+            if not all(isinstance(category, str) for category in categories):
+                raise ValueError(f"Column {column} of the study table has non-string categories and cannot be stored in a snapshot")
+            arrays[f"df/{position}/codes"] = values.cat.codes.to_numpy().astype(np.int32)
+            arrays[f"df/{position}/categories"], arrays[f"df/{position}/category_offsets"] = encode_string_table(categories.tolist())
+            columns.append({"name": column, "kind": "category"})
+        elif values.dtype == object:
+            if not all(isinstance(value, str) for value in values):
+                raise ValueError(f"Column {column} of the study table holds non-string objects and cannot be stored in a snapshot")
+            codes, categories = pd.factorize(values)
+            arrays[f"df/{position}/codes"] = codes.astype(np.int32)
+            arrays[f"df/{position}/categories"], arrays[f"df/{position}/category_offsets"] = encode_string_table(categories.tolist())
+            columns.append({"name": column, "kind": "categorical"})
+        else:
+            arrays[f"df/{position}/values"] = values.to_numpy()
+            columns.append({"name": column, "kind": "numeric"})
+    arrays["df/focus_node_ids"] = dataset.focus_node_ids
+
+    kinds, strings, qnames = dataset.terms.to_strings()
+    arrays["terms/kinds"] = kinds
+    arrays["terms/strings"], arrays["terms/string_offsets"] = encode_string_table(strings)
+    # the QNames computed so far, among them those of the focus nodes, so the index is restored without the shortener
+    arrays["terms/has_qname"] = np.array([qname is not None for qname in qnames], dtype=bool)
+    arrays["terms/qnames"], arrays["terms/qname_offsets"] = encode_string_table([qname or "" for qname in qnames])
+    arrays["graph/spo"], arrays["graph/pos"], arrays["graph/osp"] = dataset.g.spo, dataset.g.pos, dataset.g.osp
+    for name in EXEMPLAR_MAPS:
+        term_map = getattr(dataset, name)
+        arrays[f"{name}/keys"], arrays[f"{name}/offsets"], arrays[f"{name}/values"] = term_map.keys, term_map.offsets, term_map.values
+        if term_map.counts is not None:
+            arrays[f"{name}/counts"] = term_map.counts
+    arrays["ttl_data"] = np.frombuffer(dataset.ttl_data.encode("utf-8"), dtype=np.uint8)
+    arrays.update(indexes_to_snapshot(dataset))
+    if dataset.type_index is not None:
+        if not all(isinstance(type_, str) for type_ in dataset.type_index.types):
+            raise ValueError("The rdf:type column lists non-string types and cannot be stored in a snapshot")
+        arrays["types/names"], arrays["types/name_offsets"] = encode_string_table(dataset.type_index.types)
+        arrays["types/offsets"] = dataset.type_index.offsets
+        arrays["types/rows"] = dataset.type_index.rows
+
+    objects = {
+        "version": dataset.version,
+        "violations_list": dataset.violations_list,
+        "df_columns": columns,
+        "df_index_name": df.index.name,
+        "filtered_columns": dataset.filtered_columns,
+        "overall_value_counts": {column: _pairs(counts) for column, counts in dataset.overall_value_counts.items()},
+        "overall_violation_value_dict": {column: _pairs(counts) for column, counts in dataset.overall_violation_value_dict.items()},
+        "overall_violation_value_counts": dataset.overall_violation_value_counts,
+        "types_list": dataset.types_list,
+        "namespaces": [[prefix, str(namespace)] for prefix, namespace in dataset.g.namespaces()],
+        "type_count_dict": dataset.type_count_dict,
+        "type_violation_dict": dataset.type_violation_dict,
+        "node_labels": dataset.node_labels.labels,
+        "edge_labels": dataset.edge_labels.labels,
+        "violation_paths": dataset.violation_paths.paths,
+        "subclass_edges": dataset.subclass_edges,
+        "ontology_classes": dataset.ontology_classes,
+        "types_only_in_csv": dataset.types_only_in_csv,
+        "ontology_tree": dataset.ontology_tree.to_dict() if dataset.ontology_tree is not None else None,
+        "node_count_dict": dataset.node_count_dict,
+        "study_list_columns": dataset.study_records.list_column_names,
+    }
+    return arrays, objects
+
+
+def dataset_from_snapshot(dataset: Dataset, arrays, objects):
+    """Fills a dataset from the contents of a snapshot, the permutations of the ontology graph and the indexes stay memory-mapped."""
+    dataset.terms = TermDictionary.from_tables(
+        arrays["terms/kinds"],
+        StringTable(arrays["terms/strings"], arrays["terms/string_offsets"]),
+        StringTable(arrays["terms/qnames"], arrays["terms/qname_offsets"]),
+        arrays["terms/has_qname"],
+        arrays["terms/order"],
+    )
+    dataset.g = TripleStore(dataset.terms, arrays["graph/spo"], arrays["graph/pos"], arrays["graph/osp"], objects["namespaces"])
+    dataset.shortener = NamespaceShortener.from_graph(dataset.g)
+    dataset.terms.shortener = dataset.shortener
+    dataset.focus_node_ids = np.array(arrays["df/focus_node_ids"])
+    index = pd.Index(dataset.terms.qnames(dataset.focus_node_ids), name=objects["df_index_name"], dtype=object)
+
+    columns = {}
+    for position, column in enumerate(objects["df_columns"]):
+        if column["kind"] == "index":
+            columns[column["name"]] = index.to_numpy()
+        elif column["kind"] == "categorical":
+            categories = np.array(
+                decode_string_table(arrays[f"df/{position}/categories"], arrays[f"df/{position}/category_offsets"]), dtype=object
+            )
+            columns[column["name"]] = categories[arrays[f"df/{position}/codes"]]
+        elif column["kind"] == "category":
+            categories = decode_string_table(arrays[f"df/{position}/categories"], arrays[f"df/{position}/category_offsets"])
+            columns[column["name"]] = pd.Categorical.from_codes(arrays[f"df/{position}/codes"], categories)
+        else:
+            columns[column["name"]] = np.array(arrays[f"df/{position}/values"])
+    dataset.df = pd.DataFrame(columns, index=index, columns=[column["name"] for column in objects["df_columns"]])
+
+    dataset.version = objects["version"]
+    if "types/offsets" in arrays:
+        types = decode_string_table(arrays["types/names"], arrays["types/name_offsets"])
+        dataset.type_index = TypeIndex(types, arrays["types/offsets"], arrays["types/rows"], len(dataset.df))
+    dataset.violations_list = objects["violations_list"]
+    dataset.column_roles = column_roles(dataset.df.columns, dataset.violations_list)
+    dataset.filtered_columns = objects["filtered_columns"]
+    dataset.overall_value_counts = {column: dict(pairs) for column, pairs in objects["overall_value_counts"].items()}
+    dataset.overall_violation_value_dict = {column: dict(pairs) for column, pairs in objects["overall_violation_value_dict"].items()}
+    dataset.overall_violation_value_counts = objects["overall_violation_value_counts"]
+    dataset.types_list = objects["types_list"]
+    dataset.ttl_data = arrays["ttl_data"].tobytes().decode("utf-8")
+    for name in EXEMPLAR_MAPS:
+        counts = arrays.get(f"{name}/counts")
+        setattr(dataset, name, TermMap(arrays[f"{name}/keys"], arrays[f"{name}/offsets"], arrays[f"{name}/values"], counts))
+    dataset.type_count_dict = objects["type_count_dict"]
+    dataset.type_violation_dict = objects["type_violation_dict"]
+    dataset.node_labels = LabelIndex(objects["node_labels"])
+    dataset.edge_labels = LabelIndex(objects["edge_labels"])
+    dataset.violation_paths = ViolationPathIndex(objects["violation_paths"])
+    dataset.subclass_edges = objects["subclass_edges"]
+    dataset.ontology_classes = objects["ontology_classes"]
+    dataset.types_only_in_csv = objects["types_only_in_csv"]
+    dataset.ontology_tree = Node.from_dict(objects["ontology_tree"]) if objects["ontology_tree"] is not None else None
+    dataset.node_count_dict = objects["node_count_dict"]
+    indexes_from_snapshot(dataset, arrays, objects)
+
+
+def compile_snapshot(path=DATASET_SNAPSHOT_PATH):
+    """
+    Loads the dataset from its source files and writes the snapshot that later loads map instead of recomputing.
+
+    Args:
+        path (str): Where to write the snapshot.
+    """
+    # fingerprint the sources before reading them, so a file changing while we compile invalidates the snapshot
+    sources = describe_sources(snapshot_source_paths())
+    dataset = load_dataset(use_snapshot=False)
+    arrays, objects = dataset_to_snapshot(dataset)
+    write_snapshot(path, arrays, objects, sources)
+
+
+def _run_stages(dataset: Dataset, stages, on_stage):
+    for index, (name, stage) in enumerate(stages):
+        if on_stage is not None:
+            on_stage(name, index, len(stages))
+        start = time.perf_counter()
+        stage(dataset)
+        _log.info("Dataset stage '%s' took %.3fs", name, time.perf_counter() - start)
+
+
+def load_dataset(on_stage=None, use_snapshot=True) -> Dataset:
+    """
+    Loads the dataset, from the compiled snapshot if there is an up-to-date one, otherwise from the source files.
+
+    Args:
+        on_stage (Callable[[str, int, int], None], optional): Called with the name, index and total number of stages before each stage starts.
+        use_snapshot (bool): Whether to try the snapshot at DATASET_SNAPSHOT_PATH first.
+
+    Returns:
+        Dataset: The fully loaded dataset.
+    """
+    dataset = Dataset()
+    stages = LOAD_STAGES + INDEX_STAGES
+    if use_snapshot and os.path.exists(DATASET_SNAPSHOT_PATH):
+        try:
+            arrays, objects = read_snapshot(DATASET_SNAPSHOT_PATH, snapshot_source_paths())
+        except SnapshotMismatchError as e:
+            _log.warning("Ignoring the dataset snapshot, loading from the source files instead: %s", e)
+        else:
+            # the snapshot holds the INDEX_STAGES indexes as well
+            stages = [("snapshot", lambda dataset: dataset_from_snapshot(dataset, arrays, objects))]
+    _run_stages(dataset, stages, on_stage)
+    _log.info("Namespace shortener after loading: %s", dataset.shortener.stats())
+    return dataset
+
+
+class DatasetManager:
+    """
+    Owns the single Dataset of the process.
+    The dataset is loaded either in a background thread (started from the startup event) or by the first caller of get(),
+    so importing the routes never touches the data files.
+    """
+
+    NOT_LOADED = "not_loaded"
+    LOADING = "loading"
+    READY = "ready"
+    FAILED = "failed"
+
+    def __init__(self, loader=load_dataset):
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._state = self.NOT_LOADED
+        self._dataset: Dataset | None = None
+        self._error = None
+        self._stage = None
+        self._progress = 0.0
+        self._started_at = None
+        self._finished_at = None
+
+    def _begin(self) -> bool:
+        """Marks the load as started, returns False if another caller already started it."""
+        with self._lock:
+            if self._state in (self.LOADING, self.READY):
+                return False
+            self._state = self.LOADING
+            self._error = None
+            self._stage = None
+            self._progress = 0.0
+            self._started_at = time.time()
+            self._finished_at = None
+            self._done.clear()
+            return True
+
+    def _set_stage(self, name, index, total):
+        self._stage = name
+        self._progress = index / total
+
+    def _run(self):
+        try:
+            dataset = self._loader(on_stage=self._set_stage)
+        except Exception as e:
+            _log.exception("Loading the dataset failed")
+            with self._lock:
+                self._state = self.FAILED
+                self._error = f"{type(e).__name__}: {e}"
+        else:
+            with self._lock:
+                self._dataset = dataset
+                self._state = self.READY
+        finally:
+            self._finished_at = time.time()
+            self._done.set()
+
+    def start_background_load(self):
+        """Starts loading the dataset in a daemon thread unless it is already loading or loaded."""
+        if self._begin():
+            threading.Thread(target=self._run, name="dataset-loader", daemon=True).start()
+
+    def get(self) -> Dataset:
+        """
+        Returns the loaded dataset, loading it in the calling thread if nobody has started yet
+        and waiting for the load to finish if it is running elsewhere.
+        """
+        if self._state == self.READY:
+            return self._dataset  # type: ignore
+        if self._begin():
+            self._run()
+        self._done.wait()
+        if self._state != self.READY:
+            raise RuntimeError(f"Dataset could not be loaded: {self._error}")
+        return self._dataset  # type: ignore
+
+    @property
+    def is_ready(self) -> bool:
+        return self._state == self.READY
+
+    def status(self) -> dict:
+        """Returns the load state, the current stage and the fraction of stages that are done."""
+        state = self._state
+        dataset = self._dataset
+        progress = 1.0 if state == self.READY else self._progress
+        elapsed = None
+        if self._started_at is not None:
+            elapsed = (self._finished_at or time.time()) - self._started_at
+        return {
+            "state": state,
+            "stage": self._stage if state == self.LOADING else None,
+            "progress": progress,
+            "elapsed_seconds": elapsed,
+            "error": self._error,
+            "version": dataset.version if dataset is not None and state == self.READY else None,
+            "namespace_shortener": dataset.shortener.stats()
+            if dataset is not None and state == self.READY and hasattr(dataset, "shortener")
+            else None,
+        }
+
+
+dataset_manager = DatasetManager()
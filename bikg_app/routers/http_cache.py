@@ -0,0 +1,73 @@
+"""This module implements the dataset-versioned HTTP caching of responses that only change when the dataset changes."""
+# http_cache.py
+import hashlib
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+# Sent when the request names the current dataset version with ?v=, the URL then never refers to other content
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Sent otherwise: clients may keep the response but revalidate it, which costs a 304 as long as the dataset is unchanged
+REVALIDATE_CACHE_CONTROL = "public, max-age=0, must-revalidate"
+
+
+class EncodedBody:
+    """
+    The encoded bytes of a response together with their strong ETag. The ETag is a hash of the bytes, so responses must
+    be encoded deterministically (no set or hash-seed dependent order) for every worker to issue the same one.
+    """
+
+    __slots__ = ("content", "media_type", "etag")
+
+    def __init__(self, content: bytes, media_type: str):
+        self.content = content
+        self.media_type = media_type
+        self.etag = '"' + hashlib.sha256(content).hexdigest()[:32] + '"'
+
+
+def encode_json(value) -> bytes:
+    """Encodes a value exactly like FastAPI encodes the return value of an endpoint."""
+    return JSONResponse(content=jsonable_encoder(value)).body
+
+
+def etag_matches(if_none_match, etag) -> bool:
+    """Evaluates an If-None-Match header against an ETag, weak validators compare equal to strong ones as RFC 9110 requires."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return any(candidate.removeprefix("W/") == etag for candidate in candidates)
+
+
+def cached_response(request: Request, dataset, key, build, media_type="application/json", headers=None) -> Response:
+    """
+    Returns the response of a dataset-static endpoint from the encoded bytes cached on the dataset.
+
+    build() is only called the first time key is requested for this dataset. It returns either the encoded bytes, a value that is
+    encoded as JSON or, for other media types, a str. Responds with 304 Not Modified if the client already has the bytes.
+
+    Args:
+        request (Request): The incoming request, for If-None-Match and the ?v= dataset version.
+        dataset (Dataset): The dataset the response is derived from.
+        key (str): Identifies the response among the cached ones of the dataset.
+        build (Callable[[], Any]): Computes the response content.
+        media_type (str): The media type of the response.
+        headers (dict, optional): Additional response headers.
+    """
+
+    def encode():
+        content = build()
+        if not isinstance(content, bytes):
+            content = encode_json(content) if media_type == "application/json" else content.encode("utf-8")
+        return EncodedBody(content, media_type)
+
+    body = dataset.cached(("http", key), encode)
+    versioned = dataset.version is not None and request.query_params.get("v") == dataset.version
+    cache_control = IMMUTABLE_CACHE_CONTROL if versioned else REVALIDATE_CACHE_CONTROL
+    response_headers = {"ETag": body.etag, "Cache-Control": cache_control}
+    if etag_matches(request.headers.get("if-none-match"), body.etag):
+        return Response(status_code=304, headers=response_headers)
+    response_headers.update(headers or {})
+    return Response(content=body.content, media_type=body.media_type, headers=response_headers)
@@ -0,0 +1,485 @@
+"""This module implements the incremental update of the preprocessing artifacts from a new run of the SHACL validation."""
+# incremental.py
+import json
+import logging
+import os
+import re
+from collections import Counter, defaultdict
+
+import numpy as np
+import pandas as pd
+from rdflib import RDF, Graph, URIRef
+
+from bikg_app.routers.namespace_shortener import NamespaceShortener
+from bikg_app.routers.report_stream import is_validation_result
+from bikg_app.routers.study_table import write_study_table
+from bikg_app.routers.utils import (
+    SH,
+    bind_exemplar_namespaces,
+    exemplar_name,
+    load_lists_dict,
+    load_nested_counts_dict_json,
+    process_edge_object_pairs,
+    save_lists_dict,
+    save_nested_counts_dict_json,
+    validation_result_from_pairs,
+)
+
+_log = logging.getLogger(__name__)
+
+# the value of the study table cells of edges a focus node does not have
+EMPTY_EDGE_STRING = "EdgeNotPresent"
+HAS_EXEMPLAR = URIRef("http://customnamespace.com/hasExemplar")
+
+_EXEMPLAR_NUMBER = re.compile(r"_exemplar_(\d+)$")
+
+
+def artifact_paths(output_dir):
+    """
+    Returns the paths of the preprocessing artifacts in output_dir, laid out like the output directory of preprocess.ipynb
+    and like bikg_app itself, so artifact_paths("bikg_app") are the files the server loads.
+    """
+    return {
+        "violation_list": os.path.join(output_dir, "json", "violation_list.json"),
+        "study_csv": os.path.join(output_dir, "csv", "study.csv"),
+        "study_parquet": os.path.join(output_dir, "parquet", "study.parquet"),
+        "ontology_ttl": os.path.join(output_dir, "ttl", "omics_model_union_violation_exemplar.ttl"),
+        "edge_count_dict": os.path.join(output_dir, "json", "exemplar_edge_count_dict.json"),
+        "focus_node_exemplar_dict": os.path.join(output_dir, "json", "focus_node_exemplar_dict.json"),
+        "exemplar_focus_node_dict": os.path.join(output_dir, "json", "exemplar_focus_node_dict.json"),
+        "violation_exemplar_dict": os.path.join(output_dir, "json", "violation_exemplar_dict.json"),
+    }
+
+
+def pair_key(edge_object_pairs):
+    """Returns the key of an exemplar as the edge count artifact stores it, the set of its "predicate__object" strings."""
+    return frozenset(f"{p}__{o}" for p, o in edge_object_pairs)
+
+
+def qname_label(namespaces):
+    """
+    Returns the function preprocess.ipynb labels the study table with, the QName of an IRI under namespaces and
+    anything else unchanged.
+
+    Args:
+        namespaces (Iterable[Tuple[str, str]]): The (prefix, namespace) bindings.
+    """
+    shortener = NamespaceShortener(namespaces)
+
+    def label(uri):
+        try:
+            return shortener.qname(uri)
+        except ValueError:
+            return uri
+
+    return label
+
+
+class ReportResults:
+    """
+    The validation results of a report as a multiset of (focus node, source shape, exemplar key), all as strings.
+
+    Results with the same focus node and the same edge-object pairs are interchangeable for every artifact whatever
+    their own IRIs are, which most SHACL engines generate anew on each run, so two reports are compared by content.
+    """
+
+    def __init__(self, subject_groups):
+        """
+        Args:
+            subject_groups (Iterable[tuple]): (subject, predicate-object pairs) of the report, see iter_subject_groups.
+        """
+        self.results = Counter()
+        # the edge-object pairs of the first result of each key, the exemplar triples are made from them
+        self.pairs = {}
+        # the focus node and source shape counts of count_violations, which also counts subjects not typed as results
+        self.violations = Counter()
+        self.shapes = {}
+        for _, pairs in subject_groups:
+            focus_node = None
+            shape = ""
+            for p, o in pairs:
+                if p == SH.sourceShape:
+                    shape = str(o)
+                    self.shapes[shape] = None
+                elif p == SH.focusNode:
+                    focus_node = str(o)
+            if focus_node is not None:
+                self.violations[(focus_node, shape)] += 1
+            if is_validation_result(pairs):
+                _, _, edge_object_pairs = validation_result_from_pairs(pairs)
+                key = pair_key(edge_object_pairs)
+                self.pairs.setdefault(key, edge_object_pairs)
+                self.results[(str(focus_node), shape, key)] += 1
+
+    def focus_node_keys(self):
+        """Returns the number of results per (focus node, exemplar key)."""
+        counts = Counter()
+        for (focus_node, _, key), n in self.results.items():
+            counts[(focus_node, key)] += n
+        return counts
+
+
+def _discard(d, key, member):
+    members = d.get(key)
+    if members is not None:
+        members.pop(member, None)
+        if not members:
+            del d[key]
+
+
+class ExemplarArtifacts:
+    """
+    The exemplar graph and dictionaries of get_violation_report_exemplars as preprocess.ipynb stores them, updated by
+    adding and removing validation results instead of grouping the whole report again.
+
+    Exemplars are identified by their edge-object pairs, so results with the pairs of an existing exemplar keep its
+    name, new exemplars are numbered after the highest existing number and exemplars without results are removed.
+    """
+
+    def __init__(
+        self, ontology_g, edge_count_dict, focus_node_exemplar_dict, exemplar_focus_node_dict, violation_exemplar_dict, study_g=None
+    ):
+        """
+        Args:
+            ontology_g (rdflib.Graph): The union of the ontology and the exemplars.
+            edge_count_dict (dict): {exemplar: {"predicate__object": count}}.
+            focus_node_exemplar_dict (dict): {focus node: list of exemplars}.
+            exemplar_focus_node_dict (dict): {exemplar: list of focus nodes}.
+            violation_exemplar_dict (dict): {source shape: {exemplar: count}}.
+            study_g (rdflib.Graph, optional): The instance data graph, used to add the one hop location of the sh:value objects of new exemplars.
+        """
+        self.ontology_g = ontology_g
+        self.study_g = study_g
+        self.edge_count_dict = defaultdict(lambda: defaultdict(int))
+        for exemplar, counts in edge_count_dict.items():
+            self.edge_count_dict[exemplar].update(counts)
+        # dictionaries keep the order of the stored lists and of the members added later
+        self.focus_node_exemplar_dict = {focus_node: dict.fromkeys(exemplars) for focus_node, exemplars in focus_node_exemplar_dict.items()}
+        self.exemplar_focus_node_dict = {exemplar: dict.fromkeys(focus_nodes) for exemplar, focus_nodes in exemplar_focus_node_dict.items()}
+        self.violation_exemplar_dict = {shape: dict(counts) for shape, counts in violation_exemplar_dict.items()}
+        self.exemplars = {frozenset(counts): exemplar for exemplar, counts in edge_count_dict.items()}
+        numbers = [int(match.group(1)) for match in map(_EXEMPLAR_NUMBER.search, edge_count_dict) if match]
+        self.next_number = max(numbers, default=0) + 1
+        self.created = []
+        self.deleted = []
+
+    @classmethod
+    def load(cls, paths, study_g=None):
+        """Loads the artifacts from the paths of artifact_paths."""
+        ontology_g = Graph()
+        ontology_g.parse(paths["ontology_ttl"], format="ttl")
+        return cls(
+            ontology_g,
+            load_nested_counts_dict_json(paths["edge_count_dict"]),
+            load_lists_dict(paths["focus_node_exemplar_dict"]),
+            load_lists_dict(paths["exemplar_focus_node_dict"]),
+            load_nested_counts_dict_json(paths["violation_exemplar_dict"]),
+            study_g,
+        )
+
+    def save(self, paths):
+        """Stores the artifacts at the paths of artifact_paths, in the formats preprocess.ipynb writes."""
+        bind_exemplar_namespaces(self.ontology_g)
+        self.ontology_g.serialize(destination=paths["ontology_ttl"], format="ttl")
+        save_nested_counts_dict_json(
+            {exemplar: dict(counts) for exemplar, counts in self.edge_count_dict.items()}, paths["edge_count_dict"]
+        )
+        save_lists_dict(self.focus_node_exemplar_dict, paths["focus_node_exemplar_dict"])
+        save_lists_dict(self.exemplar_focus_node_dict, paths["exemplar_focus_node_dict"])
+        save_nested_counts_dict_json(self.violation_exemplar_dict, paths["violation_exemplar_dict"])
+
+    def add(self, shape, key, edge_object_pairs, n=1):
+        """Adds n validation results of shape with the edge-object pairs of key, creating their exemplar if there is none."""
+        exemplar = self.exemplars.get(key)
+        if exemplar is None:
+            exemplar = self.exemplars[key] = str(exemplar_name(shape, self.next_number))
+            self.next_number += 1
+            self.created.append(exemplar)
+        # process_edge_object_pairs looks the counts up by the exemplar's term, the loaded dictionaries are keyed by strings
+        term = URIRef(exemplar)
+        counts = {term: self.edge_count_dict[exemplar]}
+        for _ in range(n):
+            process_edge_object_pairs(self.ontology_g, self.study_g, SH, counts, edge_object_pairs, term)
+        shape_counts = self.violation_exemplar_dict.setdefault(shape, {})
+        shape_counts[exemplar] = shape_counts.get(exemplar, 0) + n
+
+    def remove(self, shape, key, edge_object_pairs, n=1):
+        """
+        Removes n validation results of shape with the edge-object pairs of key, and their exemplar with the last of them.
+
+        Raises:
+            ValueError: If the artifacts do not have n such results, i.e., they were not made from the previous report.
+        """
+        exemplar = self.exemplars.get(key)
+        shape_counts = self.violation_exemplar_dict.get(shape, {})
+        if exemplar is None or shape_counts.get(exemplar, 0) < n:
+            raise ValueError(f"The artifacts have no {n} validation results of {shape or 'no shape'} with the pairs {sorted(key)}")
+        counts = self.edge_count_dict[exemplar]
+        for p, o in edge_object_pairs:
+            counts[f"{p}__{o}"] -= n
+        shape_counts[exemplar] -= n
+        if shape_counts[exemplar] == 0:
+            del shape_counts[exemplar]
+            if not shape_counts:
+                del self.violation_exemplar_dict[shape]
+        if not any(counts.values()):
+            self._delete(exemplar, key)
+
+    def _delete(self, exemplar, key):
+        del self.exemplars[key]
+        del self.edge_count_dict[exemplar]
+        for focus_node in self.exemplar_focus_node_dict.pop(exemplar, {}):
+            _discard(self.focus_node_exemplar_dict, focus_node, exemplar)
+        term = URIRef(exemplar)
+        for triple in list(self.ontology_g.triples((term, None, None))) + list(self.ontology_g.triples((None, HAS_EXEMPLAR, term))):
+            self.ontology_g.remove(triple)
+        self.deleted.append(exemplar)
+
+    def set_member(self, focus_node, key, member):
+        """Records whether focus_node has a validation result with the exemplar of key, if that exemplar still exists."""
+        exemplar = self.exemplars.get(key)
+        if exemplar is None:
+            return
+        if member:
+            self.focus_node_exemplar_dict.setdefault(focus_node, {})[exemplar] = None
+            self.exemplar_focus_node_dict.setdefault(exemplar, {})[focus_node] = None
+        else:
+            _discard(self.focus_node_exemplar_dict, focus_node, exemplar)
+            _discard(self.exemplar_focus_node_dict, exemplar, focus_node)
+
+    def apply(self, previous, new):
+        """
+        Applies the difference between the validation results of two reports.
+
+        Args:
+            previous (ReportResults): The results of the report the artifacts were made from.
+            new (ReportResults): The results of the new report.
+
+        Returns:
+            tuple: The number of added and of removed validation results.
+        """
+        added = new.results - previous.results
+        removed = previous.results - new.results
+        # additions first, so an exemplar that loses some results and gains others is never deleted in between
+        for (_, shape, key), n in added.items():
+            self.add(shape, key, new.pairs[key], n)
+        for (_, shape, key), n in removed.items():
+            self.remove(shape, key, previous.pairs[key], n)
+        focus_node_keys = new.focus_node_keys()
+        for focus_node, _, key in dict.fromkeys(list(added) + list(removed)):
+            self.set_member(focus_node, key, focus_node_keys[(focus_node, key)] > 0)
+        return sum(added.values()), sum(removed.values())
+
+
+def _is_list_column(values):
+    return any(isinstance(value, str) and value.startswith("[") for value in values)
+
+
+def _list_cell(value):
+    return value if isinstance(value, str) and value.startswith("[") else str([value])
+
+
+def tabularize_rows(study_g, focus_nodes, study_df, skip_columns, label):
+    """
+    Makes the study table rows of focus_nodes the way preprocess.ipynb tabularizes, abbreviates and labels the study
+    graph: one column per predicate, holding the labels of the objects as a list in list columns and as a single value
+    otherwise, EMPTY_EDGE_STRING where a focus node has no such edge. Predicates the table has no column for are added
+    as new columns, and columns that get a second value for a new row become list columns.
+
+    Args:
+        study_g (rdflib.Graph): The instance data graph.
+        focus_nodes (List[str]): The focus nodes.
+        study_df (pd.DataFrame): The study table, changed in place when columns are added or turned into list columns.
+        skip_columns (Set[str]): The columns that are not made from predicates, like the violation counts and x, y.
+        label (Callable[[str], str]): Turns the IRIs into the labels of the table.
+
+    Returns:
+        pd.DataFrame: The new rows, indexed by the labels of the focus nodes, with the feature columns and focus_node.
+    """
+    rdf_type = label(str(RDF.type))
+    values = {}
+    for focus_node in focus_nodes:
+        objects = defaultdict(list)
+        for p, o in study_g.predicate_objects(URIRef(focus_node)):
+            objects[label(str(p))].append(label(str(o)))
+        values[label(focus_node)] = objects
+    for column in dict.fromkeys(column for objects in values.values() for column in objects):
+        if column not in study_df.columns:
+            position = study_df.columns.get_loc("x") if "x" in study_df.columns else len(study_df.columns)
+            study_df.insert(position, column, EMPTY_EDGE_STRING)
+    feature_columns = [column for column in study_df.columns if column not in skip_columns and column != "focus_node"]
+    list_columns = set()
+    for column in feature_columns:
+        if column == rdf_type or _is_list_column(study_df[column]) or any(len(objects.get(column, ())) > 1 for objects in values.values()):
+            study_df[column] = study_df[column].map(_list_cell)
+            list_columns.add(column)
+    rows = {}
+    for row, objects in values.items():
+        cells = {"focus_node": row}
+        for column in feature_columns:
+            column_objects = objects.get(column)
+            if column in list_columns:
+                cells[column] = str(column_objects or [EMPTY_EDGE_STRING])
+            else:
+                cells[column] = column_objects[0] if column_objects else EMPTY_EDGE_STRING
+        rows[row] = cells
+    return pd.DataFrame.from_dict(rows, orient="index")
+
+
+def update_study_table(study_df, violation_list, previous, new, label, study_g=None):
+    """
+    Updates the violation counts of the study table and the violation list for a new report, touching only the rows of
+    focus nodes whose counts changed. Rows of focus nodes without violations are dropped and rows of new focus nodes are
+    tabularized from study_g, as a full run would; the x, y of new rows are NaN until embed_rows places them.
+
+    Args:
+        study_df (pd.DataFrame): The study table as read from study.csv.
+        violation_list (List[str]): The labels of the source shapes, the violation count columns.
+        previous (ReportResults): The results of the report the table was made from.
+        new (ReportResults): The results of the new report.
+        label (Callable[[str], str]): Turns the IRIs into the labels of the table.
+        study_g (rdflib.Graph, optional): The instance data graph, needed if the new report has focus nodes the table has no row for.
+
+    Returns:
+        tuple: (study table, violation list, {"touched": rows whose counts changed or that were added, "added": new rows,
+        "removed": dropped rows}).
+
+    Raises:
+        ValueError: If there are new focus nodes but no study_g, before anything is changed.
+    """
+    deltas = defaultdict(dict)
+    for focus_node, shape in set(previous.violations) | set(new.violations):
+        delta = new.violations[(focus_node, shape)] - previous.violations[(focus_node, shape)]
+        if delta:
+            deltas[focus_node][label(shape)] = delta
+    missing = [focus_node for focus_node in deltas if label(focus_node) not in study_df.index]
+    if missing and study_g is None:
+        raise ValueError(f"The study table has no rows for the focus nodes {missing[:5]}..., tabularizing them needs the study graph")
+
+    shapes = [label(shape) for shape in new.shapes]
+    new_violation_list = [column for column in violation_list if column in set(shapes)]
+    new_violation_list += [column for column in shapes if column not in set(violation_list)]
+    positions = [study_df.columns.get_loc(column) for column in violation_list if column in study_df.columns]
+    position = max(positions) + 1 if positions else int("focus_node" in study_df.columns)
+    for column in new_violation_list:
+        if column not in study_df.columns:
+            study_df.insert(position, column, 0.0)
+            position += 1
+    study_df = study_df.drop(columns=[column for column in violation_list if column not in set(new_violation_list)])
+
+    skip_columns = set(violation_list) | set(new_violation_list) | {"x", "y"}
+    if missing:
+        new_rows = tabularize_rows(study_g, missing, study_df, skip_columns, label)
+        study_df = pd.concat([study_df, new_rows.reindex(columns=study_df.columns)])
+        study_df.loc[new_rows.index, new_violation_list] = 0.0
+    touched = []
+    for focus_node, shape_deltas in deltas.items():
+        row = label(focus_node)
+        for column, delta in shape_deltas.items():
+            if column in study_df.columns:
+                study_df.at[row, column] += delta
+        touched.append(row)
+    empty = [row for row in touched if not study_df.loc[row, new_violation_list].any()]
+    study_df = study_df.drop(index=empty)
+    added = [label(focus_node) for focus_node in missing]
+    return study_df, new_violation_list, {"touched": [row for row in touched if row not in set(empty)], "added": added, "removed": empty}
+
+
+def embed_rows(study_df, violation_columns, rows, n_neighbors=5):
+    """
+    Places rows in the embedding without computing it again: each of them moves to the mean x, y of the n_neighbors
+    other rows with the most similar violation counts. The distance is the one of the one-hot encoding create_embedding
+    feeds to UMAP, the number of violation columns in which two rows differ; ties go to the earlier rows. Distances are
+    computed between the distinct count vectors, of which there are far fewer than rows.
+
+    Args:
+        study_df (pd.DataFrame): The study table, its x and y are changed in place.
+        violation_columns (List[str]): The violation count columns.
+        rows (List[str]): The rows to place.
+        n_neighbors (int): The number of rows whose positions are averaged.
+
+    Returns:
+        bool: False if there are no other rows to place them by, then the embedding has to be computed again.
+    """
+    placed = study_df.index.isin(rows)
+    if not placed.any():
+        return True
+    if placed.all():
+        return False
+    counts = study_df[violation_columns].to_numpy(dtype=float)
+    positions = study_df.loc[~placed, ["x", "y"]].to_numpy(dtype=float)
+    patterns, pattern_of_row = np.unique(counts[~placed], axis=0, return_inverse=True)
+    targets, target_of_row = np.unique(counts[placed], axis=0, return_inverse=True)
+    distances = (targets[:, None, :] != patterns[None, :, :]).sum(axis=2)
+    means = np.empty((len(targets), 2))
+    for target, target_distances in enumerate(distances):
+        nearest = np.argsort(target_distances[pattern_of_row], kind="stable")[:n_neighbors]
+        means[target] = positions[nearest].mean(axis=0)
+    study_df.loc[placed, "x"] = means[target_of_row, 0]
+    study_df.loc[placed, "y"] = means[target_of_row, 1]
+    return True
+
+
+def update_artifacts(paths, previous_report, new_report, study_g=None, label=None, n_neighbors=5):
+    """
+    Updates the artifacts of preprocess.ipynb that were made from previous_report to new_report: the validation results
+    are compared by content, the exemplars, their dictionaries and the violation counts change by the difference, the
+    existing exemplars keep their names, and only the rows of the study table whose counts changed are placed again in the
+    embedding. Labels that preprocess.ipynb replaced by skos:prefLabel have to be replaced again, like after a full run.
+
+    Args:
+        paths (dict): The paths of the artifacts, see artifact_paths.
+        previous_report (ViolationReportStream): The report the artifacts were made from.
+        new_report (ViolationReportStream): The new report.
+        study_g (rdflib.Graph, optional): The instance data graph, for the rows of new focus nodes and the one hop location
+            of the sh:value objects of new exemplars.
+        label (Callable[[str], str], optional): Turns the IRIs into the labels of the study table, by default their QNames
+            under the namespaces of the reports and study_g, as preprocess.ipynb abbreviates them.
+        n_neighbors (int): See embed_rows.
+
+    Returns:
+        dict: What changed, the numbers of added and removed validation results, the created and deleted exemplars, the
+        touched, added and removed rows, and whether the embedding has to be computed again.
+
+    Raises:
+        ValueError: If the artifacts were not made from previous_report, or new focus nodes need study_g, before any file is written.
+    """
+    previous = ReportResults(previous_report.subject_groups())
+    new = ReportResults(new_report.subject_groups())
+    if label is None:
+        combined_g = Graph()
+        for namespaces in (
+            study_g.namespaces() if study_g is not None else (),
+            previous_report.namespaces.items(),
+            new_report.namespaces.items(),
+        ):
+            for prefix, namespace in namespaces:
+                combined_g.namespace_manager.bind(prefix, namespace)
+        label = qname_label(combined_g.namespaces())
+
+    artifacts = ExemplarArtifacts.load(paths, study_g)
+    added, removed = artifacts.apply(previous, new)
+    with open(paths["violation_list"], encoding="utf-8") as f:
+        violation_list = json.load(f)
+    # round_trip is a valid float_precision, the annotation of pandas 1.5 leaves it out
+    study_df = pd.read_csv(paths["study_csv"], index_col=0, float_precision="round_trip")  # type: ignore
+    study_df, violation_list, rows = update_study_table(study_df, violation_list, previous, new, label, study_g)
+    reembedded = embed_rows(study_df, violation_list, rows["touched"], n_neighbors)
+    if not reembedded:
+        _log.warning("Every row of the study table changed, compute the embedding again")
+
+    artifacts.save(paths)
+    os.makedirs(os.path.dirname(paths["study_parquet"]), exist_ok=True)
+    write_study_table(study_df, violation_list, paths["study_parquet"])
+    study_df.to_csv(paths["study_csv"])
+    with open(paths["violation_list"], "w", encoding="utf-8") as f:
+        json.dump(violation_list, f)
+    _log.info("Added %d and removed %d validation results, %d rows touched", added, removed, len(rows["touched"]))
+    return {
+        "added_results": added,
+        "removed_results": removed,
+        "created_exemplars": artifacts.created,
+        "deleted_exemplars": artifacts.deleted,
+        **rows,
+        "embedding_outdated": not reembedded,
+    }
@@ -0,0 +1,81 @@
+"""This module implements the sorted, searchable index of the node and edge labels of the ontology graph."""
+# label_index.py
+import bisect
+
+# joins the case-folded labels into one string that substring search scans with str.find
+_SEPARATOR = "\x00"
+
+
+def _sort_key(label):
+    return (label.casefold(), label)
+
+
+class LabelIndex:
+    """
+    The distinct labels of a graph, sorted case-insensitively, for prefix and substring search with keyset pagination.
+
+    A page ends with the last label it returned, which is also the cursor of the next page, so cursors stay valid without
+    any state on the server. Prefix search is a binary search; substring search is str.find over the case-folded labels
+    joined into one string, so neither touches the labels that do not match.
+    """
+
+    def __init__(self, labels):
+        """
+        Args:
+            labels (Iterable[str]): The labels, duplicates are dropped.
+        """
+        self.labels = sorted(set(labels), key=_sort_key)
+        self._keys = [_sort_key(label) for label in self.labels]
+        folded = [key[0] for key in self._keys]
+        self._starts = []
+        position = 0
+        for label in folded:
+            self._starts.append(position)
+            position += len(label) + len(_SEPARATOR)
+        self._blob = _SEPARATOR.join(folded)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def _matches(self, start, prefix, contains):
+        """Yields the positions of the labels from start on that start with prefix and contain contains, both case-folded."""
+        end = len(self.labels)
+        if prefix:
+            start = max(start, bisect.bisect_left(self._keys, (prefix,)))
+            # every case-folded label that starts with prefix sorts before prefix followed by the largest code point
+            end = bisect.bisect_left(self._keys, (prefix + "\U0010ffff",), lo=start)
+        if not contains:
+            yield from range(start, end)
+            return
+        offset = self._starts[start] if start < len(self._starts) else len(self._blob)
+        stop = self._starts[end] if end < len(self._starts) else len(self._blob)
+        while True:
+            found = self._blob.find(contains, offset, stop)
+            if found < 0:
+                return
+            position = bisect.bisect_right(self._starts, found) - 1
+            yield position
+            offset = self._starts[position + 1] if position + 1 < len(self._starts) else stop
+
+    def search(self, prefix="", contains="", limit=None, cursor=None):
+        """
+        Returns the labels that start with prefix and contain contains, ignoring case, in index order.
+
+        Args:
+            prefix (str): Required start of the labels.
+            contains (str): Required substring of the labels.
+            limit (int, optional): The maximum number of labels to return, all of them if None.
+            cursor (str, optional): The cursor of the previous page, the search continues after this label.
+
+        Returns:
+            tuple: (list of the labels, the cursor of the next page or None if this is the last page)
+        """
+        if _SEPARATOR in contains:
+            return [], None
+        start = bisect.bisect_right(self._keys, _sort_key(cursor)) if cursor is not None else 0
+        labels = []
+        for position in self._matches(start, prefix.casefold(), contains.casefold()):
+            if limit is not None and len(labels) == limit:
+                return labels, labels[-1]
+            labels.append(self.labels[position])
+        return labels, None
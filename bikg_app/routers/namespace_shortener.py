@@ -0,0 +1,176 @@
+"""This module implements the shortening of IRIs to QNames (and their expansion) shared by the endpoints and the preprocessing."""
+# namespace_shortener.py
+import threading
+
+from rdflib.namespace import split_uri
+from rdflib.term import _is_valid_uri
+
+# marks the trie node at which a namespace ends, no character of an IRI can equal it
+_END = None
+
+
+class NamespaceShortener:
+    """
+    Shortens IRIs with a set of prefix bindings, using a character trie of the namespaces for the longest-prefix match
+    and a memo of every IRI it has seen, so each distinct IRI is only matched once per dataset.
+
+    shorten() replaces the longest bound namespace an IRI starts with by its prefix and leaves IRIs without one unchanged.
+    qname() produces exactly what rdflib's NamespaceManager.qname produces: the namespace must end where rdflib splits
+    the local name, and IRIs the bindings cannot shorten are handed to fallback, which may bind a generated ns1-style prefix.
+    Lookups that the memo answers count as hits, the others as misses; hits are counted without the lock, so under
+    concurrent requests the counts are approximate.
+    """
+
+    def __init__(self, namespaces, fallback=None):
+        """
+        Args:
+            namespaces (Iterable[Tuple[str, str]]): The (prefix, namespace) bindings, the first prefix of a namespace wins.
+            fallback (Callable[[str], Tuple[str, str, str]], optional): Computes (prefix, namespace, local name) for IRIs
+                qname() cannot shorten with the bindings, usually NamespaceManager.compute_qname. Without one such IRIs raise ValueError.
+        """
+        self._trie = {}
+        self._prefixes = {}
+        self._namespaces = {}
+        self._fallback = fallback
+        self._shortened = {}
+        self._qnames = {}
+        self._expanded = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        for prefix, namespace in namespaces:
+            self._bind(str(prefix), str(namespace))
+
+    @classmethod
+    def from_graph(cls, graph):
+        """Returns a shortener for the bindings of graph that falls back to its namespace manager."""
+        return cls(graph.namespaces(), fallback=graph.namespace_manager.compute_qname)
+
+    def _bind(self, prefix, namespace):
+        if namespace in self._prefixes:
+            return
+        self._prefixes[namespace] = prefix
+        self._namespaces.setdefault(prefix, namespace)
+        node = self._trie
+        for char in namespace:
+            node = node.setdefault(char, {})
+        node[_END] = namespace
+
+    def longest_namespace(self, iri):
+        """Returns the longest bound namespace iri starts with, None if there is none."""
+        longest = None
+        node = self._trie
+        for char in iri:
+            node = node.get(char)
+            if node is None:
+                break
+            longest = node.get(_END, longest)
+        return longest
+
+    def shorten(self, iri, memoize=True):
+        """
+        Returns iri with its longest bound namespace replaced by "prefix:", or iri itself if no namespace matches.
+        Later occurrences of that namespace are replaced as well, which shortens both halves of "p__o" keys whose p and o share it.
+        With memoize=False the result is not memoized, for callers that cache it themselves such as the TermDictionary.
+        """
+        shortened = self._shortened.get(iri)
+        if shortened is not None:
+            self.hits += 1
+            return shortened
+        with self._lock:
+            self.misses += 1
+            namespace = self.longest_namespace(iri)
+            shortened = iri if namespace is None else iri.replace(namespace, f"{self._prefixes[namespace]}:")
+            if memoize:
+                self._shortened[iri] = shortened
+                if namespace is not None:
+                    self._expanded.setdefault(shortened, str(iri))
+        return shortened
+
+    def qname(self, iri, memoize=True):
+        """
+        Returns the QName of iri as rdflib's NamespaceManager.qname would, memoized unless memoize is False (see shorten).
+
+        Raises:
+            ValueError: If iri is not a valid IRI or cannot be split into a namespace and a local name.
+        """
+        qname = self._qnames.get(iri)
+        if qname is not None:
+            self.hits += 1
+            return qname
+        with self._lock:
+            self.misses += 1
+            qname = self._compute_qname(str(iri))
+            if memoize:
+                self._qnames[iri] = qname
+                self._expanded.setdefault(qname, str(iri))
+        return qname
+
+    def namespace_of(self, iri):
+        """Returns the bound namespace qname() shortens iri with, None if it would need the fallback."""
+        if not _is_valid_uri(iri):
+            return None
+        try:
+            split_namespace, _ = split_uri(iri)
+        except ValueError:
+            return None
+        # rdflib never moves the split towards the start of the IRI, only to a longer bound namespace
+        namespace = self.longest_namespace(iri)
+        if namespace is not None and len(namespace) < len(split_namespace):
+            return None
+        return namespace
+
+    def namespaces(self):
+        """Returns the (prefix, namespace) bindings in the order they were bound, one per namespace."""
+        return [(prefix, namespace) for namespace, prefix in self._prefixes.items()]
+
+    def bound_qname(self, iri):
+        """Returns the QName qname() gives iri if the bound namespaces suffice, None if it would need the fallback."""
+        namespace = self.namespace_of(iri)
+        if namespace is None:
+            return None
+        prefix, name = self._prefixes[namespace], iri[len(namespace) :]
+        return name if prefix == "" else f"{prefix}:{name}"
+
+    def _compute_qname(self, iri):
+        qname = self.bound_qname(iri)
+        if qname is None:
+            if self._fallback is None:
+                raise ValueError(f"Can't shorten '{iri}' with the bound namespaces")
+            prefix, namespace, name = self._fallback(iri)
+            self._bind(prefix, str(namespace))
+            qname = name if prefix == "" else f"{prefix}:{name}"
+        return qname
+
+    def expand(self, qname, memoize=True):
+        """
+        Returns the IRI a QName (or a shortened IRI) stands for, memoized unless memoize is False (see shorten).
+
+        Raises:
+            ValueError: If the prefix of qname is not bound.
+        """
+        iri = self._expanded.get(qname)
+        if iri is not None:
+            self.hits += 1
+            return iri
+        with self._lock:
+            self.misses += 1
+            prefix, separator, name = qname.partition(":")
+            namespace = self._namespaces.get(prefix) if separator else None
+            if namespace is None:
+                raise ValueError(f'Prefix "{prefix}" of "{qname}" is not bound to any namespace')
+            iri = namespace + name
+            if memoize:
+                self._expanded[qname] = iri
+        return iri
+
+    def stats(self) -> dict:
+        """Reports the number of memoized lookups, the lookups served from the memo and their fraction."""
+        lookups = self.hits + self.misses
+        return {
+            "namespaces": len(self._prefixes),
+            "memoized": len(self._shortened) + len(self._qnames),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,218 @@
+"""This module implements the per-namespace statistics of the ontology graph, the study table and the violation report."""
+# namespace_stats.py
+import numpy as np
+import pandas as pd
+from rdflib import URIRef
+
+from bikg_app.routers.study_records import parse_list_cell
+
+
+def _grown(array, size):
+    if size <= len(array):
+        # the counts of a snapshot are memory-mapped read-only, they are copied before the first update
+        return array if array.flags.writeable else array.copy()
+    grown = np.zeros(max(size, 2 * len(array)), dtype=array.dtype)
+    grown[: len(array)] = array
+    return grown
+
+
+class NamespaceStats:
+    """
+    Counts how often every IRI of a graph occurs as a node (subject or object) and as an edge (predicate) of its triples.
+    The per-namespace counts of /namespaces then follow from one np.bincount over the term ids per count, and adding
+    triples to the graph only updates the counts of their three terms instead of requiring another pass over the graph.
+    Literals and blank nodes belong to no namespace and are not counted.
+    """
+
+    def __init__(self, iris, node_counts, edge_counts):
+        """
+        Args:
+            iris (Sequence[str]): The distinct IRIs, their positions are the term ids. Any sequence, such as the lazily
+                decoded terms of a snapshot, it is only copied into a list when add() counts a new IRI.
+            node_counts (np.ndarray): How often each IRI is the subject or object of a triple.
+            edge_counts (np.ndarray): How often each IRI is the predicate of a triple.
+        """
+        self._iris = iris
+        # IRI -> term id, built by the first add()
+        self._term_ids = None
+        self._node_counts = np.asarray(node_counts, dtype=np.int64)
+        self._edge_counts = np.asarray(edge_counts, dtype=np.int64)
+        # namespace of each term id as of the last counts() call, recomputed when the bindings change
+        self._namespace_ids = np.zeros(0, dtype=np.int64)
+        self._attributed_bindings = None
+
+    @classmethod
+    def from_triples(cls, iris, triples):
+        """
+        Builds the statistics from an integer-coded triple table.
+
+        Args:
+            iris (List[Optional[str]]): The IRI of every term id, None for literals and blank nodes.
+            triples (np.ndarray): The (subject, predicate, object) term ids of the distinct triples, shape (n, 3).
+        """
+        is_iri = np.array([iri is not None for iri in iris], dtype=bool)
+        # renumber the IRIs densely, the other terms map to -1 and are dropped
+        iri_ids = np.full(len(iris), -1, dtype=np.int64)
+        iri_ids[is_iri] = np.arange(int(is_iri.sum()))
+        triples = np.asarray(triples, dtype=np.int64).reshape(-1, 3)
+        nodes = iri_ids[triples[:, [0, 2]].ravel()]
+        edges = iri_ids[triples[:, 1]]
+        n_iris = int(is_iri.sum())
+        node_counts = np.bincount(nodes[nodes >= 0], minlength=n_iris)
+        edge_counts = np.bincount(edges[edges >= 0], minlength=n_iris)
+        return cls([iri for iri in iris if iri is not None], node_counts, edge_counts)
+
+    def to_arrays(self):
+        """Returns the IRIs and the node and edge counts, the arguments of __init__."""
+        n_terms = len(self._iris)
+        return self._iris, self._node_counts[:n_terms], self._edge_counts[:n_terms]
+
+    @classmethod
+    def from_graph(cls, graph):
+        """Builds the statistics of the triples of an rdflib graph."""
+        term_ids = {}
+        triples = [[term_ids.setdefault(term, len(term_ids)) for term in triple] for triple in graph]
+        iris = [str(term) if isinstance(term, URIRef) else None for term in term_ids]
+        return cls.from_triples(iris, np.array(triples, dtype=np.int64).reshape(-1, 3))
+
+    def _term_id(self, term):
+        if self._term_ids is None:
+            self._iris = list(self._iris)
+            self._term_ids = {iri: term_id for term_id, iri in enumerate(self._iris)}
+        iri = str(term)
+        term_id = self._term_ids.get(iri)
+        if term_id is None:
+            term_id = len(self._iris)
+            self._term_ids[iri] = term_id
+            self._iris.append(iri)
+        self._node_counts = _grown(self._node_counts, term_id + 1)
+        self._edge_counts = _grown(self._edge_counts, term_id + 1)
+        return term_id
+
+    def add(self, triple):
+        """Counts a triple that was just added to the graph. Triples the graph already held must not be counted again."""
+        s, p, o = triple
+        # _term_id may replace the count arrays with larger ones, so it has to run before they are indexed
+        for node in (s, o):
+            if isinstance(node, URIRef):
+                term_id = self._term_id(node)
+                self._node_counts[term_id] += 1
+        if isinstance(p, URIRef):
+            term_id = self._term_id(p)
+            self._edge_counts[term_id] += 1
+
+    def counts(self, shortener) -> dict:
+        """
+        Returns the node and edge counts of every namespace bound in shortener, each IRI counting for the namespace
+        its QName uses.
+
+        Returns:
+            dict: {prefix: {"namespace": namespace, "node_count": int, "edge_count": int}}, in the order of the bindings.
+        """
+        bindings = shortener.namespaces()
+        namespace_index = {namespace: position for position, (_, namespace) in enumerate(bindings)}
+        if self._attributed_bindings != bindings:
+            self._namespace_ids = np.zeros(0, dtype=np.int64)
+            self._attributed_bindings = bindings
+        # only the IRIs added since the last call are looked up
+        new_ids = [
+            namespace_index.get(shortener.namespace_of(self._iris[term_id]), -1)
+            for term_id in range(len(self._namespace_ids), len(self._iris))
+        ]
+        self._namespace_ids = np.concatenate([self._namespace_ids, np.array(new_ids, dtype=np.int64)])
+
+        n_terms = len(self._iris)
+        attributed = self._namespace_ids >= 0
+        namespace_ids = self._namespace_ids[attributed]
+        node_counts = np.bincount(namespace_ids, weights=self._node_counts[:n_terms][attributed], minlength=len(bindings))
+        edge_counts = np.bincount(namespace_ids, weights=self._edge_counts[:n_terms][attributed], minlength=len(bindings))
+        return {
+            prefix: {"namespace": namespace, "node_count": int(node_count), "edge_count": int(edge_count)}
+            for (prefix, namespace), node_count, edge_count in zip(bindings, node_counts.tolist(), edge_counts.tolist(), strict=True)
+        }
+
+
+def add_triple(graph, triple, namespace_stats=None):
+    """Adds triple to graph and counts it in namespace_stats (if given) unless the graph already held it."""
+    if namespace_stats is not None and triple not in graph:
+        namespace_stats.add(triple)
+    graph.add(triple)
+
+
+def qname_prefix_ids(values, prefixes) -> np.ndarray:
+    """
+    Returns the position in prefixes of the prefix of every QName in values, -1 for values that are not QNames with one of them.
+
+    Args:
+        values (Sequence): Strings such as "lotr:Frodo", other values are allowed and never match.
+        prefixes (List[str]): The bound prefixes.
+    """
+    series = pd.Series(values, dtype=object)
+    prefix_index = {prefix: position for position, prefix in enumerate(prefixes)}
+    has_prefix = series.str.contains(":", regex=False).fillna(False).astype(bool)
+    prefix_ids = np.full(len(series), -1, dtype=np.int64)
+    if has_prefix.any():
+        matched = series.loc[has_prefix].str.split(":", n=1).str[0].map(prefix_index)
+        prefix_ids[has_prefix.to_numpy()] = matched.fillna(-1).to_numpy(dtype=np.int64)
+    return prefix_ids
+
+
+def _count_by_prefix(prefix_ids, n_prefixes, weights=None) -> list:
+    matched = prefix_ids >= 0
+    weights = None if weights is None else np.asarray(weights, dtype=np.float64)[matched]
+    return [int(count) for count in np.bincount(prefix_ids[matched], weights=weights, minlength=n_prefixes).tolist()]
+
+
+def study_namespace_counts(df, category_codes, violations_list, prefixes) -> dict:
+    """
+    Breaks the study table down by the namespaces of its QNames.
+
+    Every distinct cell value is inspected once, cells listing several QNames count once for each of them.
+
+    Args:
+        df (pd.DataFrame): The study table, indexed by focus node.
+        category_codes (CategoryCodes): The integer-coded feature columns of df with their overall counts.
+        violations_list (List[str]): The violation columns, counted by violation_namespace_counts instead.
+        prefixes (List[str]): The bound prefixes.
+
+    Returns:
+        dict: {prefix: {"focus_node_count": int, "property_count": int, "value_count": int}}
+    """
+    violations = set(violations_list)
+    properties = [column for column in category_codes.columns if column not in violations]
+    values, weights = [], []
+    for j, column in enumerate(category_codes.columns):
+        if column in violations:
+            continue
+        column_counts = category_codes.overall_counts[category_codes.offsets[j] : category_codes.offsets[j + 1]].tolist()
+        for category, count in zip(category_codes.categories[j], column_counts, strict=True):
+            parsed = parse_list_cell(category)
+            items = parsed if isinstance(parsed, list) else [category]
+            values.extend(items)
+            weights.extend([count] * len(items))
+
+    focus_nodes = _count_by_prefix(qname_prefix_ids(df.index.tolist(), prefixes), len(prefixes))
+    property_counts = _count_by_prefix(qname_prefix_ids(properties, prefixes), len(prefixes))
+    value_counts = _count_by_prefix(qname_prefix_ids(values, prefixes), len(prefixes), weights)
+    return {
+        prefix: {"focus_node_count": focus_nodes[i], "property_count": property_counts[i], "value_count": value_counts[i]}
+        for i, prefix in enumerate(prefixes)
+    }
+
+
+def violation_namespace_counts(violations_list, violation_counts, prefixes) -> dict:
+    """
+    Breaks the violation report down by the namespaces of the violated shapes.
+
+    Args:
+        violations_list (List[str]): The QNames of the violated shapes.
+        violation_counts (dict): The number of violations of every shape.
+        prefixes (List[str]): The bound prefixes.
+
+    Returns:
+        dict: {prefix: {"shape_count": int, "violation_count": int}}
+    """
+    prefix_ids = qname_prefix_ids(violations_list, prefixes)
+    shapes = _count_by_prefix(prefix_ids, len(prefixes))
+    violations = _count_by_prefix(prefix_ids, len(prefixes), [violation_counts.get(shape, 0) for shape in violations_list])
+    return {prefix: {"shape_count": shapes[i], "violation_count": violations[i]} for i, prefix in enumerate(prefixes)}
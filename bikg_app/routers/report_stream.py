@@ -0,0 +1,365 @@
+"""This module implements the streaming ingestion of SHACL violation reports, one validation result at a time."""
+# report_stream.py
+import re
+from collections import defaultdict
+
+from rdflib import RDF, XSD, BNode, Literal, URIRef
+from rdflib.exceptions import ParserError
+from rdflib.plugins.parsers.ntriples import DummySink, W3CNTriplesParser, unquote
+
+from bikg_app.routers.utils import (
+    SH,
+    ExemplarBuilder,
+    TQDMInstance,
+    bind_exemplar_namespaces,
+    validation_result_from_pairs,
+)
+
+REPORT_FORMATS = {"nt": "nt", "ntriples": "nt", "ttl": "turtle", "turtle": "turtle"}
+
+_IRI = r"<[^<>\"{}|^`\\\s]*>"
+_PNAME = r"(?:[A-Za-z][\w\-]*(?:\.[\w\-]+)*)?:(?:[\w\-:%]+(?:\.[\w\-:%]+)*)?"
+_TURTLE_TOKEN = re.compile(
+    rf"""\s*(?:
+    (?P<directive>@prefix|@base|(?i:PREFIX|BASE)(?=\s))
+    |(?P<iri>{_IRI})
+    |(?P<literal>"(?:[^"\\\n]|\\.)*"|'(?:[^'\\\n]|\\.)*')(?:@(?P<lang>[A-Za-z]+(?:-[A-Za-z0-9]+)*)|\^\^(?P<datatype>{_IRI}|{_PNAME}))?
+    |(?P<bnode>_:[\w\-]+(?:\.[\w\-]+)*)
+    |(?P<number>[+-]?(?:\d+\.\d+(?:[eE][+-]?\d+)?|\.\d+(?:[eE][+-]?\d+)?|\d+[eE][+-]?\d+|\d+))
+    |(?P<boolean>(?:true|false)(?![\w:\-]))
+    |(?P<a>a(?![\w:\-]))
+    |(?P<pname>{_PNAME})
+    |(?P<punctuation>[;,.])
+    |(?P<comment>\#.*)
+    )""",
+    re.VERBOSE,
+)
+
+
+class _BNodeLabels:
+    """
+    Maps the blank node labels of one document to blank nodes of their own, the way the bnode_context of rdflib's
+    N-Triples parser does, but without remembering the labels it has seen.
+    """
+
+    def __init__(self):
+        self._prefix = str(BNode())
+
+    def get(self, label, default=None):
+        return f"{self._prefix}{label}"
+
+    def bnode(self, label):
+        return BNode(self.get(label))
+
+
+class _TripleSink(DummySink):
+    def __init__(self):
+        super().__init__()
+        self.triple_ = None
+
+    def triple(self, s, p, o):
+        self.triple_ = (s, p, o)
+
+
+def iter_ntriples(lines):
+    """
+    Parses N-Triples line by line.
+
+    Args:
+        lines (Iterable[str]): The lines of an N-Triples document, such as an open file.
+
+    Yields:
+        tuple: The (subject, predicate, object) triples as rdflib terms.
+
+    Raises:
+        ValueError: If a line is not a valid triple.
+    """
+    sink = _TripleSink()
+    parser = W3CNTriplesParser(sink)
+    bnode_labels = _BNodeLabels()
+    for number, line in enumerate(lines, start=1):
+        sink.triple_ = None
+        parser.line = line.strip()
+        try:
+            parser.parseline(bnode_context=bnode_labels)
+        except ParserError as err:
+            raise ValueError(f"Invalid N-Triples on line {number}: {line.strip()}") from err
+        if sink.triple_ is not None:
+            yield sink.triple_
+
+
+def _turtle_tokens(lines):
+    for number, line in enumerate(lines, start=1):
+        position = 0
+        line = line.rstrip("\n")
+        while position < len(line):
+            rest = line[position:].lstrip()
+            if not rest:
+                break
+            if rest.startswith(('"""', "'''")):
+                raise ValueError(f"Multi-line strings are not supported by the line-oriented Turtle reader, line {number}")
+            match = _TURTLE_TOKEN.match(line, position)
+            if match is None:
+                raise ValueError(f"Unsupported Turtle syntax on line {number}: {rest[:40]}")
+            position = match.end()
+            if match.lastgroup != "comment":
+                yield match, number
+
+
+def _expand_pname(pname, namespaces, number):
+    prefix, local = pname.split(":", 1)
+    if prefix not in namespaces:
+        raise ValueError(f"Undeclared prefix {prefix}: on line {number}")
+    return URIRef(namespaces[prefix] + local)
+
+
+def _turtle_term(match, namespaces, bnode_labels, number):
+    kind = match.lastgroup if match.lastgroup not in ("lang", "datatype") else "literal"
+    token = match.group(kind)
+    if kind == "iri":
+        return URIRef(unquote(token[1:-1]))
+    if kind == "pname":
+        return _expand_pname(token, namespaces, number)
+    if kind == "bnode":
+        return bnode_labels.bnode(token[2:])
+    if kind == "literal":
+        datatype = match.group("datatype")
+        if datatype is not None:
+            datatype = URIRef(datatype[1:-1]) if datatype.startswith("<") else _expand_pname(datatype, namespaces, number)
+        return Literal(unquote(token[1:-1]), lang=match.group("lang"), datatype=datatype)
+    if kind == "number":
+        if "e" in token or "E" in token:
+            return Literal(token, datatype=XSD.double)
+        return Literal(token, datatype=XSD.decimal if "." in token else XSD.integer)
+    if kind == "boolean":
+        return Literal(token, datatype=XSD.boolean)
+    return None
+
+
+def iter_turtle_lines(lines, namespaces=None):
+    """
+    Parses the line-oriented subset of Turtle that serializers such as rdflib's write for violation reports: @prefix and
+    PREFIX declarations, statements with ";" and "," lists, IRIs, prefixed names, labelled blank nodes and literals on a
+    single line. Statements may span several lines, but "[...]" blank nodes, collections, @base and multi-line strings
+    are not supported.
+
+    Args:
+        lines (Iterable[str]): The lines of the document, such as an open file.
+        namespaces (dict, optional): Filled with the prefixes the document declares, prefix -> namespace.
+
+    Yields:
+        tuple: The (subject, predicate, object) triples as rdflib terms.
+
+    Raises:
+        ValueError: If the document uses syntax outside of the subset or is not valid Turtle.
+    """
+    namespaces = {} if namespaces is None else namespaces
+    bnode_labels = _BNodeLabels()
+    # subject -> predicate -> object -> punctuation, or one of the directive states
+    state = "subject"
+    subject = predicate = prefix = None
+    number = 0
+    for match, number in _turtle_tokens(lines):
+        # every alternative of the token pattern is a named group
+        kind = match.lastgroup or ""
+        if kind in ("lang", "datatype"):
+            kind = "literal"
+        token = match.group(kind)
+        if state == "subject" and kind == "directive":
+            if token.lower() in ("@base", "base"):
+                raise ValueError(f"@base is not supported by the line-oriented Turtle reader, line {number}")
+            state = "prefix name" if token == "@prefix" else "sparql prefix name"
+        elif state in ("prefix name", "sparql prefix name") and kind == "pname" and token.endswith(":"):
+            prefix = token[:-1]
+            state = state.replace("name", "namespace")
+        elif state in ("prefix namespace", "sparql prefix namespace") and kind == "iri":
+            namespaces[prefix] = unquote(token[1:-1])
+            state = "prefix end" if state == "prefix namespace" else "subject"
+        elif state == "prefix end" and token == ".":
+            state = "subject"
+        elif state == "subject" and kind in ("iri", "pname", "bnode"):
+            subject = _turtle_term(match, namespaces, bnode_labels, number)
+            state = "predicate"
+        elif state in ("predicate", "predicate or end") and kind in ("a", "iri", "pname"):
+            predicate = RDF.type if kind == "a" else _turtle_term(match, namespaces, bnode_labels, number)
+            state = "object"
+        elif state == "object" and kind not in ("a", "punctuation", "directive"):
+            yield subject, predicate, _turtle_term(match, namespaces, bnode_labels, number)
+            state = "punctuation"
+        elif state == "punctuation" and token == ",":
+            state = "object"
+        elif state in ("punctuation", "predicate or end") and token == ";":
+            state = "predicate or end"
+        elif state in ("punctuation", "predicate or end") and token == ".":
+            state = "subject"
+        else:
+            raise ValueError(f"Unexpected {token!r} on line {number}, expected the {state} of a statement")
+    if state != "subject":
+        raise ValueError(f"The document ends within a statement on line {number}")
+
+
+def iter_subject_groups(triples, sorted_subjects=False):
+    """
+    Groups consecutive triples with the same subject, as Turtle serializations and sorted N-Triples files list them.
+
+    Args:
+        triples (Iterable[tuple]): The (subject, predicate, object) triples.
+        sorted_subjects (bool): Whether the triples come from an N-Triples file sorted by line (`LC_ALL=C sort`), whose
+            subjects are then in the byte order of their N3. A subject that sorts before the previous one raises, which
+            catches unsorted files with constant memory instead of splitting a subject into several groups.
+
+    Yields:
+        tuple: (subject, list of its distinct (predicate, object) pairs), ordered by predicate the way rdflib's memory
+        store returns them, so the pairs are the same as Graph.predicate_objects of the parsed document.
+
+    Raises:
+        ValueError: If sorted_subjects is set and the subjects are not sorted.
+    """
+    subject = None
+    subject_key = b""
+    pairs = {}
+    for s, p, o in triples:
+        if s != subject:
+            # checked before the previous group is yielded, so an unsorted file is reported as such when it can be
+            if sorted_subjects:
+                # the N3 of a subject is the start of its lines and is followed by a space or a tab, which sort before
+                # every character of a term, so the lines and the N3 of their subjects are in the same order
+                key = s.n3().encode()
+                if key < subject_key:
+                    raise ValueError(
+                        f"The N-Triples report is not sorted, {s.n3()} follows {subject_key.decode()}: sort it by line (e.g. `LC_ALL=C sort report.nt`) first"
+                    )
+                subject_key = key
+            if subject is not None:
+                yield subject, [(predicate, o_) for predicate, objects in pairs.items() for o_ in objects]
+            subject = s
+            pairs = {}
+        pairs.setdefault(p, {})[o] = None
+    if subject is not None:
+        yield subject, [(predicate, o_) for predicate, objects in pairs.items() for o_ in objects]
+
+
+def check_validation_result(subject, pairs):
+    """
+    Checks that a sh:ValidationResult has the sh:focusNode and sh:sourceShape its exemplar is made from.
+
+    Raises:
+        ValueError: If one of them is missing.
+    """
+    predicates = {p for p, _ in pairs}
+    for predicate in (SH.focusNode, SH.sourceShape):
+        if predicate not in predicates:
+            raise ValueError(
+                f"The validation result {subject.n3()} has no {predicate.n3()}, or its triples are not consecutive in the report"
+            )
+
+
+class ViolationReportStream:
+    """
+    A violation report file that is read one subject at a time instead of being parsed into an rdflib Graph, so the
+    memory needed does not grow with the size of the report. The triples of each validation result must be consecutive,
+    which is the case for Turtle files and for N-Triples files sorted by line, but not for N-Triples in general: sort them
+    with `LC_ALL=C sort report.nt` first. Unsorted N-Triples files, or validation results without a sh:focusNode or a
+    sh:sourceShape, raise ValueError while they are read.
+    """
+
+    def __init__(self, path, format=None):
+        """
+        Args:
+            path (str): The path of the report.
+            format (str, optional): One of REPORT_FORMATS, by default derived from the file extension (.nt or Turtle).
+
+        Raises:
+            ValueError: If the format is not supported.
+        """
+        self.path = path
+        if format is None:
+            format = "nt" if path.endswith(".nt") else "turtle"
+        if format not in REPORT_FORMATS:
+            raise ValueError(f"Unsupported violation report format {format}, expected one of {sorted(REPORT_FORMATS)}")
+        self.format = REPORT_FORMATS[format]
+        # the prefixes declared by the report, complete once it has been read
+        self.namespaces = {}
+
+    def triples(self):
+        """Yields the triples of the report."""
+        with open(self.path, encoding="utf-8") as f:
+            if self.format == "nt":
+                yield from iter_ntriples(f)
+            else:
+                yield from iter_turtle_lines(f, self.namespaces)
+
+    def subject_groups(self):
+        """
+        Yields (subject, predicate-object pairs) for every subject of the report, see iter_subject_groups.
+
+        Raises:
+            ValueError: If an N-Triples report is not sorted or a validation result is incomplete.
+        """
+        for subject, pairs in iter_subject_groups(self.triples(), sorted_subjects=self.format == "nt"):
+            if is_validation_result(pairs):
+                check_validation_result(subject, pairs)
+            yield subject, pairs
+
+
+def count_violations(subject_groups):
+    """
+    Counts the validation results per focus node and source shape.
+
+    Args:
+        subject_groups (Iterable[tuple]): (subject, predicate-object pairs) of the report, see iter_subject_groups.
+
+    Returns:
+        tuple: {focus node: {source shape: number of validation results}} and the list of the distinct source shapes,
+        all as strings. Results without a source shape count for the shape "".
+    """
+    d_focus_node_d_source_shape_counts = defaultdict(lambda: defaultdict(int))
+    violation_list = {}
+    for _, pairs in subject_groups:
+        focus_node = None
+        shape = ""
+        for p, o in pairs:
+            if p == SH.sourceShape:
+                shape = str(o)
+                violation_list[shape] = None
+            elif p == SH.focusNode:
+                focus_node = str(o)
+        if focus_node is not None:
+            d_focus_node_d_source_shape_counts[focus_node][shape] += 1
+    return d_focus_node_d_source_shape_counts, list(violation_list)
+
+
+def is_validation_result(pairs):
+    """Whether the predicate-object pairs of a subject type it as a sh:ValidationResult."""
+    return any(p == RDF.type and o == SH.ValidationResult for p, o in pairs)
+
+
+def stream_violation_report(report, ontology_g, study_g=None, namespace_stats=None, progress=False):
+    """
+    Reads a violation report once, counting the violations and building the exemplars of get_violation_report_exemplars
+    at the same time, without loading the report into a graph.
+
+    Args:
+        report (ViolationReportStream): The report.
+        ontology_g (rdflib.Graph): The ontology graph the exemplars are added to.
+        study_g (rdflib.Graph, optional): The instance data graph, used to add the one hop location of all sh:value objects.
+        namespace_stats (NamespaceStats, optional): Statistics of ontology_g, kept up to date with the exemplar triples added to it.
+        progress (bool): Whether to show a progress bar over the subjects of the report.
+
+    Returns:
+        tuple: The 5-tuple of get_violation_report_exemplars, followed by the focus node counts and the violation list
+        of count_violations.
+    """
+    bind_exemplar_namespaces(ontology_g)
+    builder = ExemplarBuilder(ontology_g, study_g, namespace_stats)
+
+    def validation_results():
+        for subject, pairs in TQDMInstance(report.subject_groups(), desc="Processing violations", disable=not progress):
+            yield subject, pairs
+            if is_validation_result(pairs):
+                builder.add(*validation_result_from_pairs(pairs))
+
+    focus_node_counts, violation_list = count_violations(validation_results())
+    for prefix, namespace in report.namespaces.items():
+        ontology_g.namespace_manager.bind(prefix, namespace)
+    return (*builder.result(), focus_node_counts, violation_list)
@@ -1,21 +1,28 @@
 # routes.py
-import ast
 import json
 import os
 import time
-from collections import defaultdict
-
-import numpy as np
-import pandas as pd
-from fastapi import APIRouter, Request, Response
-from rdflib import RDF, Graph, Namespace
-from rdflib.term import URIRef, Literal
-from rdflib.namespace import split_uri
-from scipy.stats import chi2_contingency
 
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
+from rdflib import Namespace
+
+from bikg_app.routers.category_codes import row_positions
+from bikg_app.routers.chi_square import chi_square_score, chi_square_scores
+from bikg_app.routers.dataset import (
+    JSON_DIR,
+    ORIGINAL_INSTANCE_DATA_FILE_PATH,
+    ORIGINAL_VIOLATION_REPORT_FILE_PATH,
+    Dataset,
+    dataset_manager,
+)
+from bikg_app.routers.http_cache import cached_response
+from bikg_app.routers.namespace_shortener import NamespaceShortener
+from bikg_app.routers.namespace_stats import study_namespace_counts, violation_namespace_counts
+from bikg_app.routers.selection_store import decode_selected_rows
+from bikg_app.routers.study_arrow import ARROW_STREAM_MEDIA_TYPE, study_table_to_arrow
 from bikg_app.routers.utils import (
-    load_lists_dict,
-    load_nested_counts_dict_json,
     serialize_dict_keys_and_values,
     serialize_nested_count_dict,
 )
@@ -24,237 +31,73 @@ SH = Namespace("http://www.w3.org/ns/shacl#")
 OWL = Namespace("http://www.w3.org/2002/07/owl#")
 RDFS = Namespace("http://www.w3.org/2000/01/rdf-schema#")
 
-# File paths
-# input files, original RDF for ontology and shacl, instance data, and violation report
-ORIGINAL_ONTOLOGY_FILE_PATH = "bikg_app/ttl/omics_model.ttl"
-ORIGINAL_INSTANCE_DATA_FILE_PATH = "bikg_app/ttl/study.ttl"
-ORIGINAL_VIOLATION_REPORT_FILE_PATH = "bikg_app/ttl/violation_report.ttl"
-
-
-VIOLATIONS_FILE_PATH = os.path.join("bikg_app/json", "violation_list.json")
-STUDY_CSV_FILE_PATH = "bikg_app/csv/study.csv"
-ONTOLOGY_TTL_FILE_PATH = "bikg_app/ttl/omics_model_union_violation_exemplar.ttl"
-EXEMPLAR_EDGE_COUNT_JSON_PATH = "bikg_app/json/exemplar_edge_count_dict.json"
-FOCUS_NODE_EXEMPLAR_DICT_JSON_PATH = "bikg_app/json/focus_node_exemplar_dict.json"
-EXEMPLAR_FOCUS_NODE_DICT_JSON_PATH = "bikg_app/json/exemplar_focus_node_dict.json"
-VIOLATION_EXEMPLAR_DICT_PATH = "bikg_app/json/violation_exemplar_dict.json"
-
-# load the violations
-assert os.path.exists(VIOLATIONS_FILE_PATH)
-with open(VIOLATIONS_FILE_PATH, "rb") as violations_f:
-    violations_list = json.load(violations_f)
-
-# load the tabularized data
-df = pd.read_csv(STUDY_CSV_FILE_PATH, index_col=0)
-df = df.replace(np.nan, "nan", regex=True)
-filtered_columns = [column for column in df.columns if column not in ["x", "y"]]
-
-# compute the overall value counts
-overall_value_counts = {}
-for column in filtered_columns:
-    overall_value_counts[column] = df[column].value_counts().to_dict()
-
-# compute the overall violation value counts
-overall_violation_value_dict = {}
-for column in violations_list:
-    overall_violation_value_dict[column] = df[column].value_counts().to_dict()
-
-# load the ontology
-g = Graph()
-g.parse(ONTOLOGY_TTL_FILE_PATH, format="ttl")
-ttl_data = g.serialize(format="turtle")
-
-overall_violation_value_counts = {
-    violation: sum(key * value for key, value in counts.items()) for violation, counts in overall_violation_value_dict.items()
-}
-
-try:
-    types_list = df["rdf:type"].unique().tolist()
-except KeyError:
-    types_list = []
-    print("Column 'rdf:type' not found.")
-
-
-def shorten_uris_in_nested_dict(nested_dict, g: Graph):
-    new_dict = {}
-    for outer_key, inner_dict in nested_dict.items():
-        # Shorten the outer key URI
-        new_outer_key = str(g.namespace_manager.qname(outer_key))
-
-        new_inner_dict = {}
-        for inner_key, value in inner_dict.items():
-            # Shorten the inner key URI
-            new_inner_key = str(g.namespace_manager.qname(inner_key))
-
-            # Shorten the inner value URI if it's a URI
-            new_value = str(g.namespace_manager.qname(value)) if isinstance(value, str) else value
-
-            new_inner_dict[new_inner_key] = new_value
-
-        new_dict[new_outer_key] = new_inner_dict
-
-    return new_dict
-
-
-# load the edge_count_dict that gives edge counts within each exemplar
-edge_count_dict = load_nested_counts_dict_json(EXEMPLAR_EDGE_COUNT_JSON_PATH)
-# load the focus_node_exemplar_dict that gives the exemplars for each focus node
-focus_node_exemplar_dict = load_lists_dict(FOCUS_NODE_EXEMPLAR_DICT_JSON_PATH)
-# exemplar_focus_node_dict that gives the focus node for each exemplar
-exemplar_focus_node_dict = load_lists_dict(EXEMPLAR_FOCUS_NODE_DICT_JSON_PATH)
-# violation_exemplar_dict that gives the exemplars and their counts for each violation
-violation_exemplar_dict = shorten_uris_in_nested_dict(load_nested_counts_dict_json(VIOLATION_EXEMPLAR_DICT_PATH), g)
-
 router = APIRouter()
 
 
-def build_type_node_count_dict(df):
+async def get_dataset() -> Dataset:
     """
-    Adjusted to handle string representations of lists in the 'rdf:type' column.
-    Converts string representations of lists to actual lists, then counts occurrences of each type.
+    Dependency that resolves the loaded dataset.
+    Runs in the threadpool so a request arriving during the initial load waits without blocking the event loop.
     """
-    if "rdf:type" not in df.columns:
-        print("Warning: 'rdf:type' column not found in the DataFrame. Returning an empty dictionary.")
-        return {}
-
-    # Convert string representations of lists to actual lists in a temporary way
-    # Using .apply() with ast.literal_eval to safely evaluate the string representation
-    temp_series = df["rdf:type"].apply(lambda x: ast.literal_eval(x) if isinstance(x, str) else x)
-
-    # Now that we have a series with actual lists, we can explode and then count occurrences
-    flattened_types = temp_series.explode()
-    type_counts = flattened_types.value_counts()
-
-    # Convert to dictionary
-    type_count_dict = type_counts.to_dict()
-
-    return type_count_dict
+    return await run_in_threadpool(dataset_manager.get)
 
 
-type_count_dict = build_type_node_count_dict(df)
-
-
-def build_type_violation_dict(df, violations_list):
+@router.get("/example")
+def get_example():
     """
-    Adjusts to handle string representations of lists in the 'rdf:type' column by converting them to actual lists,
-    then counts occurrences of each violation per type.
-    :param df: DataFrame with columns "rdf:type" and v for each v in violations_list
-    :param violations_list: List of columns that represent different types of violations
-    :return: A dictionary with types as keys and (violation, violation_count) as values
+    A simple example endpoint that returns a message.
     """
-    if "rdf:type" not in df.columns:
-        print("Warning: 'rdf:type' column not found in the DataFrame. Returning an empty dictionary.")
-        return {}
-
-    # Convert string representations of lists in 'rdf:type' to actual lists temporarily
-    df_temp = df.copy()
-    df_temp["rdf:type"] = df_temp["rdf:type"].apply(lambda x: ast.literal_eval(x) if isinstance(x, str) else x)
-
-    # Explode the 'rdf:type' column to work with individual types
-    df_exploded = df_temp.explode("rdf:type")
-
-    # Initialize an empty dictionary to store the results
-    type_violation_dict = {}
-
-    # Loop through each RDF type in the exploded DataFrame
-    for rdf_type in df_exploded["rdf:type"].unique():
-        # Initialize a dictionary to hold violation counts for this type
-        violation_counts = {}
-
-        # Loop through each violation type in violations_list
-        for violation in violations_list:
-            if violation in df_exploded.columns:
-                # Count the number of occurrences of the current violation for the current RDF type
-                violation_count = int(df_exploded[df_exploded["rdf:type"] == rdf_type][violation].sum())
-                if violation_count > 0:
-                    # Add the violation count for this type to the dictionary
-                    violation_counts[violation] = violation_count
-
-        # Add the dictionary of violation counts for the current RDF type to the main dictionary
-        if violation_counts:
-            type_violation_dict[rdf_type] = violation_counts
-
-    return type_violation_dict
-
-
-type_violation_dict = build_type_violation_dict(df, violations_list)
-
+    return {"message": "example"}
 
-def get_prefixes(graph: Graph):
-    return {prefix: str(namespace) for prefix, namespace in graph.namespaces()}
 
+@router.get("/dataset/status")
+def get_dataset_status():
+    """
+    Reports whether the dataset is loaded, which load stage is running and the fraction of stages done.
+    Responds with 503 until the dataset is ready so it can be used as a readiness probe.
+    """
+    status = dataset_manager.status()
+    return JSONResponse(content=status, status_code=200 if status["state"] == dataset_manager.READY else 503)
 
-def has_namespace(uri):
-    return uri.startswith("http://") or uri.startswith("https://")
 
+NAMESPACE_BREAKDOWNS = ("study", "violations")
 
-def safe_split_uri(uri, ns_dict):
-    try:
-        ns, _ = split_uri(uri)
-        return ns_dict.get(ns, ns)
-    except ValueError:
-        return str(uri)
-
-
-def get_prefix_ns_node_edge_counts(graph: Graph):
-    # Initialize the dictionary to hold namespace information
-    ns_info = {}
-
-    # Initialize counters
-    node_count = {}
-    edge_count = {}
-
-    # Collect namespaces from the graph
-    ns_dict = {str(ns): prefix for prefix, ns in graph.namespaces()}
-
-    for subject, predicate, obj in graph:
-        # Extract or fall back to full URIs if split_uri fails
-        subject_ns = safe_split_uri(subject, ns_dict)
-        predicate_ns = safe_split_uri(predicate, ns_dict)
-        object_ns = safe_split_uri(obj, ns_dict)
-
-        # Increment counters
-        node_count[subject_ns] = node_count.get(subject_ns, 0) + 1
-        node_count[object_ns] = node_count.get(object_ns, 0) + 1
-        edge_count[predicate_ns] = edge_count.get(predicate_ns, 0) + 1
-
-    # Populate ns_info based on graph namespaces
-    for ns, prefix in ns_dict.items():
-        ns_info[prefix] = {
-            "namespace": ns,
-            "node_count": node_count.get(ns, 0),
-            "edge_count": edge_count.get(ns, 0),
-        }
 
-    return ns_info
-
-
-@router.get("/example")
-def get_example():
-    """
-    A simple example endpoint that returns a message.
-    """
-    return {"message": "example"}
+def build_namespace_dict(dataset: Dataset, breakdowns=()):
+    namespace_dict = dataset.namespace_stats.counts(dataset.shortener)
+    prefixes = list(namespace_dict)
+    if "study" in breakdowns:
+        study_counts = study_namespace_counts(dataset.df, dataset.category_codes, dataset.violations_list, prefixes)
+        for prefix, counts in study_counts.items():
+            namespace_dict[prefix]["study"] = counts
+    if "violations" in breakdowns:
+        violation_counts = violation_namespace_counts(dataset.violations_list, dataset.overall_violation_value_counts, prefixes)
+        for prefix, counts in violation_counts.items():
+            namespace_dict[prefix]["violations"] = counts
+    return namespace_dict
 
 
 @router.get("/namespaces")
-def send_namespace_dict():
+def send_namespace_dict(request: Request, breakdown: list[str] = Query([]), dataset: Dataset = Depends(get_dataset)):
     """
     Retrieves all the namespace prefixes used in the ontology
     along with the count of nodes and edges using each namespace.
+    With ?breakdown=study and/or ?breakdown=violations every namespace also gets its counts in the study table
+    and in the violation report.
     """
-    return get_prefix_ns_node_edge_counts(g)
+    unknown = sorted(set(breakdown) - set(NAMESPACE_BREAKDOWNS))
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown breakdowns {unknown}, expected some of {list(NAMESPACE_BREAKDOWNS)}")
+    breakdowns = tuple(sorted(set(breakdown)))
+    return cached_response(request, dataset, ("namespaces", *breakdowns), lambda: build_namespace_dict(dataset, breakdowns))
 
 
-def shorten_dict_uris(d, prefixes):
+def shorten_dict_uris(d, shortener: NamespaceShortener):
     def shorten(uri):
         # Check if the uri is a tuple and shorten each element of the tuple
         if isinstance(uri, tuple):
             return tuple(shorten(elem) for elem in uri)
-        for prefix, namespace in prefixes.items():
-            if uri.startswith(namespace):
-                return uri.replace(namespace, f"{prefix}:")
-        return uri
+        return shortener.shorten(uri)
 
     def process_item(item):
         if isinstance(item, dict):
@@ -269,71 +112,128 @@ def shorten_dict_uris(d, prefixes):
     return process_item(d)
 
 
+# the exemplar maps hold term ids, they are decoded with the shortened forms the term dictionary caches
 @router.get("/file/edge_count_dict")
-async def get_edge_count_dict():
-    prefixes = get_prefixes(g)  # Get the prefixes from the graph
-    return serialize_nested_count_dict(shorten_dict_uris(edge_count_dict, prefixes))
+def get_edge_count_dict(request: Request, dataset: Dataset = Depends(get_dataset)):
+    def build():
+        return serialize_nested_count_dict(dataset.exemplar_edge_counts.to_dict(dataset.terms.shortened))
+
+    return cached_response(request, dataset, "edge_count_dict", build)
 
 
 @router.get("/file/focus_node_exemplar_dict")
-async def get_focus_node_exemplar_dict():
-    # TODO shorten uris with shorten_dict_uris then return serialized shortened dict
-    prefixes = get_prefixes(g)  # Get the prefixes from the graph
-    return serialize_dict_keys_and_values(shorten_dict_uris(focus_node_exemplar_dict, prefixes))
+def get_focus_node_exemplar_dict(request: Request, dataset: Dataset = Depends(get_dataset)):
+    def build():
+        return serialize_dict_keys_and_values(dataset.focus_node_exemplars.to_dict(dataset.terms.shortened))
 
+    return cached_response(request, dataset, "focus_node_exemplar_dict", build)
 
-@router.get("/file/exemplar_focus_node_dict")
-async def get_exemplar_focus_node_dict():
-    prefixes = get_prefixes(g)  # Get the prefixes from the graph
-    return serialize_dict_keys_and_values(shorten_dict_uris(exemplar_focus_node_dict, prefixes))
 
+@router.get("/file/exemplar_focus_node_dict")
+def get_exemplar_focus_node_dict(request: Request, dataset: Dataset = Depends(get_dataset)):
+    def build():
+        return serialize_dict_keys_and_values(dataset.exemplar_focus_nodes.to_dict(dataset.terms.shortened))
 
-def dynamically_parse_array_columns(df):
-    """
-    Dynamically parses columns of a DataFrame, converting string representations
-    of lists into actual lists wherever possible.
+    return cached_response(request, dataset, "exemplar_focus_node_dict", build)
 
-    Parameters:
-    df (pd.DataFrame): The DataFrame to process.
 
-    Returns:
-    pd.DataFrame: A copy of the DataFrame with string representations of lists converted to lists.
+@router.get("/file/study")
+def read_csv_file(request: Request, format: str = "json", dataset: Dataset = Depends(get_dataset)):
+    """
+    Returns the study table as JSON records with list-valued cells as arrays.
+    With format=ndjson the records are streamed as newline-delimited JSON, one record per line.
     """
-    df_copy = df.copy()
-    for column in df_copy.columns:
-        # Attempt to parse each cell in the column if it looks like a string representation of a list
-        df_copy[column] = df_copy[column].apply(
-            lambda x: (ast.literal_eval(x) if isinstance(x, str) and x.startswith("[") and x.endswith("]") else x)
-        )
-    return df_copy
+    if format == "ndjson":
+        return StreamingResponse(dataset.study_records.iter_ndjson(), media_type="application/x-ndjson")
+    if format != "json":
+        raise HTTPException(status_code=400, detail=f"Unknown format {format}, expected json or ndjson")
+    return cached_response(request, dataset, "study", dataset.study_records.to_json, media_type="application/json")
 
 
-@router.get("/file/study")
-async def read_csv_file():
-    parsed_df = dynamically_parse_array_columns(df)
-    return parsed_df.to_json(orient="records")
+@router.get("/file/study.arrow")
+def read_study_arrow(request: Request, dataset: Dataset = Depends(get_dataset)):
+    """
+    Returns the study table as an Arrow IPC stream with dictionary encoded string columns and list columns.
+    The stream is built once per dataset and cached.
+    """
+    return cached_response(
+        request,
+        dataset,
+        "study.arrow",
+        lambda: study_table_to_arrow(dataset.df, dataset.study_records.list_columns),
+        media_type=ARROW_STREAM_MEDIA_TYPE,
+    )
 
 
 @router.get("/owl:Class")
-async def get_classes():
+def get_classes(request: Request, dataset: Dataset = Depends(get_dataset)):
     """
     Retrieves all the classes in the ontology
     """
-    # Convert string representations of lists to actual lists
-    df["rdf:type"] = df["rdf:type"].apply(lambda x: ast.literal_eval(x) if isinstance(x, str) else x)
 
-    # Now that 'rdf:type' contains actual lists, explode can be used
-    unique_types = df.explode("rdf:type")["rdf:type"].unique().tolist()
+    def build():
+        # the types of the study table come from the type index, so df["rdf:type"] is never parsed or written here
+        unique_types = dataset.type_index.types if dataset.type_index is not None else []
+        # sorted, so every worker encodes the same bytes and issues the same ETag
+        return sorted(set(unique_types + dataset.ontology_classes + ["missing"]))
 
-    classes_from_ontology_graph_list = [str(g.namespace_manager.qname(c)) for c in g.subjects(predicate=RDF.type, object=OWL.Class)]  # type: ignore
+    return cached_response(request, dataset, "owl:Class", build)
 
-    final_set = set(unique_types + classes_from_ontology_graph_list + ["missing"])
 
-    return final_set
+def resolve_selection(body: dict, dataset: Dataset):
+    """
+    Resolves the rows a request refers to. A request body names its selection by one of:
+    - "selectionId": the handle of a selection stored on the server, as returned by the selection endpoints.
+    - "selectedRows": row positions as {"encoding": "rle", "runs": [start, length, ...]} or {"encoding": "bitset", "data": base64}.
+    - "selectedNodes": a list of focus nodes.
+    Selections given as rows or nodes are stored, so follow-up requests can refer to them by the returned id.
+
+    Returns:
+        tuple: (the selection id, np.ndarray of row positions)
+    """
+    if "selectionId" in body:
+        try:
+            return body["selectionId"], dataset.selection_store.get(body["selectionId"])
+        except KeyError as err:
+            raise HTTPException(status_code=404, detail=f"Unknown or expired selection {body['selectionId']}") from err
+    try:
+        if "selectedRows" in body:
+            selected_rows = decode_selected_rows(body["selectedRows"], len(dataset.df))
+        else:
+            selected_rows = row_positions(dataset.df.index, body.get("selectedNodes", []))
+    except ValueError as err:
+        raise HTTPException(status_code=400, detail=str(err)) from err
+    except KeyError as err:
+        raise HTTPException(status_code=404, detail=f"Unknown nodes: {err}") from err
+    return dataset.selection_store.put(selected_rows), selected_rows
+
+
+def selection_response(body: dict, dataset: Dataset, selected_rows, content: dict) -> dict:
+    """
+    Stores a selection and returns content extended by its "selectionId" and "selectionSize".
+    The "selectedNodes" list is included unless the request asked for the handle only with "includeNodes": false.
+    """
+    response = {"selectionId": dataset.selection_store.put(selected_rows), "selectionSize": len(selected_rows)}
+    if body.get("includeNodes", True):
+        response["selectedNodes"] = dataset.df.index[selected_rows].tolist()
+    response.update(content)
+    return response
+
+
+@router.get("/selection/{selection_id}")
+async def get_selection(selection_id: str, dataset: Dataset = Depends(get_dataset)):
+    """
+    Returns the focus nodes of a stored selection.
+    """
+    try:
+        selected_rows = dataset.selection_store.get(selection_id)
+    except KeyError as err:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired selection {selection_id}") from err
+    return {"selectionId": selection_id, "selectedNodes": dataset.df.index[selected_rows].tolist()}
 
 
 @router.post("/FeatureCategorySelection")
-async def get_nodes_violations_types_from_feature_categories(request: Request):
+async def get_nodes_violations_types_from_feature_categories(request: Request, dataset: Dataset = Depends(get_dataset)):
     """
     Uses the existing "df" variable of the tabulraized data to efficiently under all best practices of pandas extract:
     - The nodes (indices) that have the selected feature categories, where feature is a column of the df and category is a value of that column.
@@ -343,24 +243,18 @@ async def get_nodes_violations_types_from_feature_categories(request: Request):
     feature = selected_feature_categories.get("feature", [])
     categories = selected_feature_categories.get("categories", [])
 
-    # Use pandas best practices to efficiently extract the nodes that have the selected feature categories
-    selected_nodes = df[df[feature].isin(categories)].index.tolist()
+    # Resolve the selected rows from the bitmap index instead of scanning the feature column
+    selected_rows = dataset.selection_index.rows_with_categories(feature, categories)
 
-    # Use pandas best practices to efficiently extract the value counts of this view of the df
-    selected_df = df.loc[selected_nodes]
-    selected_value_counts = {}
-    for col in filtered_columns:
-        selected_value_counts[col] = selected_df[col].value_counts().to_dict()
+    # Count the categories of this view of the df from the integer-coded columns
+    selected_value_counts = dataset.category_codes.value_counts(selected_rows)
 
-    # Return the nodes and the value counts as a dictionary
-    return {
-        "selectedNodes": selected_nodes,
-        "valueCounts": selected_value_counts,
-    }
+    # Return the selection handle, the nodes and the value counts as a dictionary
+    return selection_response(selected_feature_categories, dataset, selected_rows, {"valueCounts": selected_value_counts})
 
 
 @router.post("/ViolationSelection")
-async def get_nodes_violations_types_from_violations(request: Request):
+async def get_nodes_violations_types_from_violations(request: Request, dataset: Dataset = Depends(get_dataset)):
     """
     Uses the existing "df" variable of the tabulraized data to efficiently under all best practices of pandas extract:
     - The nodes (indices) that have the selected violation feature categories, where categories are a columns of the df and we want to find those with values > 0
@@ -370,79 +264,64 @@ async def get_nodes_violations_types_from_violations(request: Request):
     selected_feature_categories.get("feature", [])
     categories = selected_feature_categories.get("categories", [])
 
-    selected_nodes = df[df[categories].gt(0).any(axis=1)].index.tolist()
-    selected_df = df.loc[selected_nodes]
+    # Union of the "count > 0" bitmaps of the selected violation columns
+    selected_rows = dataset.selection_index.rows_with_any_violation(categories)
 
-    selected_value_counts = {}
-    for col in filtered_columns:
-        selected_value_counts[col] = selected_df[col].value_counts().to_dict()
+    selected_value_counts = dataset.category_codes.value_counts(selected_rows)
 
-    # Return the nodes and the value counts as a dictionary
-    return {
-        "selectedNodes": selected_nodes,
-        "valueCounts": selected_value_counts,
-    }
+    # Return the selection handle, the nodes and the value counts as a dictionary
+    return selection_response(selected_feature_categories, dataset, selected_rows, {"valueCounts": selected_value_counts})
 
 
 @router.post("/plot/bar/violations")
-async def get_violations_bar_plot_data_given_selected_nodes(request: Request):
-    selected_nodes = await request.json()  # selected_nodes is a dictionary here
-    selected_nodes = selected_nodes.get("selectedNodes", [])  # Extracting the list from the dictionary
-
-    # Select rows from df using selected_nodes as indices
-    selected_df = df.loc[selected_nodes]
-
-    # Process the selected data: for each column, count the occurrences of each category
-    selection_violation_value_counts = {}
-    for col in violations_list:
-        selection_violation_value_counts[col] = selected_df[col].value_counts().to_dict()
-
-    # Convert selection_value_counts into a dictionary where the key is the violation
-    # and the value is the number of times (weighted sum of counts) that the violation has occurred.
-    selection_violation_counts = {
-        violation: sum(key * value for key, value in counts.items()) for violation, counts in selection_violation_value_counts.items()
-    }
+async def get_violations_bar_plot_data_given_selected_nodes(request: Request, dataset: Dataset = Depends(get_dataset)):
+    body = await request.json()  # a selectionId, compact selectedRows or a selectedNodes list
+    selection_id, selected_rows = resolve_selection(body, dataset)
+
+    # The number of times each violation has occurred in the selection, i.e. the sum of its count column over the selected rows
+    violation_totals = dataset.df[dataset.violations_list].iloc[selected_rows].sum(axis=0)
+    selection_violation_counts = dict(zip(dataset.violations_list, violation_totals.tolist(), strict=True))
 
     # Compute chi square score per column
     chi_scores = {}
-    chi_scores["violations"] = chi_square_score(selection_violation_counts, overall_violation_value_counts)
+    chi_scores["violations"] = chi_square_score(selection_violation_counts, dataset.overall_violation_value_counts)
 
     # Transform the result into a format that can be used by plotly.
     plotly_data = {}
     plotly_data = {
         "selected": value_counts_to_plotly_data(selection_violation_counts, "Selected Nodes", "steelblue"),
-        "overall": value_counts_to_plotly_data(overall_violation_value_counts, "Overall Distribution", "lightgrey"),
+        "overall": value_counts_to_plotly_data(dataset.overall_violation_value_counts, "Overall Distribution", "lightgrey"),
     }
     # Send the processed data to the client
     return {
         "plotlyData": {"violations": plotly_data},
         "chiScores": {"violations": chi_scores},
+        "selectionId": selection_id,
     }
 
 
 @router.post("/plot/bar")
-async def get_bar_plot_data_given_selected_nodes(request: Request):
+async def get_bar_plot_data_given_selected_nodes(request: Request, dataset: Dataset = Depends(get_dataset)):
     """
     Uses pandas best practices to process all columns of the df. each column is a predicate in the graph / a feature.
     Computes the number of occurrences of each category of each feature.
     returns: A dictionary where each key is a feature and each value is a dictionary of the form {category: count}
     """
     time.time()
-    selected_nodes = await request.json()  # selected_nodes is a dictionary here
-    selected_nodes = selected_nodes.get("selectedNodes", [])  # Extracting the list from the dictionary
+    body = await request.json()  # a selectionId, compact selectedRows or a selectedNodes list
+    selection_id, selected_rows = resolve_selection(body, dataset)
 
-    # Select rows from df using selected_nodes as indices
-    selected_df = df.loc[selected_nodes]
+    filtered_columns = dataset.filtered_columns
+    overall_value_counts = dataset.overall_value_counts
 
-    # Process the selected data: for each column, count the occurrences of each category
-    selection_value_counts = {}
-    for col in filtered_columns:
-        selection_value_counts[col] = selected_df[col].value_counts().to_dict()
+    # Process the selected data: count the occurrences of each category of every column in one pass over the coded columns
+    category_codes = dataset.category_codes
+    selection_counts, first_seen = category_codes.count(selected_rows)
+    selection_value_counts = category_codes.to_value_counts(selection_counts, first_seen)
 
-    # Compute chi square score per column
-    chi_scores = {}
-    for col in filtered_columns:
-        chi_scores[col] = chi_square_score(selection_value_counts[col], overall_value_counts[col])
+    # Compute the chi square scores of all columns at once from the aligned selection and overall counts
+    scores = chi_square_scores(selection_counts, category_codes.overall_counts, category_codes.offsets)
+    chi_scores = dict(zip(category_codes.columns, scores.tolist(), strict=True))
 
     # Transform the result into a format that can be used by plotly.
     plotly_data = {}
@@ -454,29 +333,7 @@ async def get_bar_plot_data_given_selected_nodes(request: Request):
 
     time.time()
     # Send the processed data to the client
-    return {"plotlyData": plotly_data, "chiScores": chi_scores}
-
-
-def chi_square_score(selection_data, overall_data):
-    """
-    Computes chi square score from relative frequencies
-    0 values have to be smoothed using a tiny value (e.g. 1e-7) to avoid division by 0
-    Uses scipy.stats.chi2_contingency to compute the chi square score
-    The first parameter of the chi2_contingency function expects:
-    observedarray_like - The contingency table. The table contains the observed frequencies (i.e. number of occurrences) in each category. In the two-dimensional case, the table is often described as an “R x C table”.
-    returns: the chi square score
-    """
-    # create observed frequency table
-    categories = set(list(selection_data.keys()) + list(overall_data.keys()))
-    observed = np.array(
-        [(selection_data.get(category, 1e-7) if selection_data.get(category, 1e-7) != 0 else 1e-7) for category in categories]
-    )
-    expected = np.array([(overall_data.get(category, 1e-7) if overall_data.get(category, 1e-7) != 0 else 1e-7) for category in categories])
-
-    # Compute chi-square scores
-    chi2, _, _, _ = chi2_contingency([observed, expected])
-
-    return chi2
+    return {"plotlyData": plotly_data, "chiScores": chi_scores, "selectionId": selection_id}
 
 
 def value_counts_to_plotly_data(value_counts, distribution_name, marker_color):
@@ -503,245 +360,106 @@ def value_counts_to_plotly_data(value_counts, distribution_name, marker_color):
     }
 
 
+def label_response(request: Request, dataset: Dataset, key, label_index, prefix, contains, limit, cursor):
+    if not (prefix or contains or limit is not None or cursor is not None):
+        return cached_response(request, dataset, key, lambda: label_index.labels)
+    labels, next_cursor = label_index.search(prefix=prefix, contains=contains, limit=limit, cursor=cursor)
+    return {"labels": labels, "nextCursor": next_cursor}
+
+
 @router.get("/get_node_label_set")
-async def get_node_label_set(g=g):
+def get_node_label_set(
+    request: Request,
+    prefix: str = "",
+    contains: str = "",
+    limit: int | None = Query(None, ge=1),
+    cursor: str | None = None,
+    dataset: Dataset = Depends(get_dataset),
+):
     """
-    Retrieves all the node labels in the ontology
+    Retrieves all the node labels in the ontology, sorted ignoring case.
+    With prefix, contains, limit or cursor, returns one page {"labels": [...], "nextCursor": ...} of the labels that start
+    with prefix and contain contains (ignoring case); pass nextCursor as cursor to get the next page, it is null on the last one.
     """
-    subjects = list(g.subjects())
-    objects = list(g.objects())
-    # use qname to shorten the URIs and send set of concatenated subjects and objects
-    all_uris = subjects + objects
-    return {uri_to_qname(g, uri) for uri in all_uris}  # type: ignore
+    return label_response(request, dataset, "node_label_set", dataset.node_labels, prefix, contains, limit, cursor)
 
 
 @router.get("/get_edge_label_set")
-async def get_edge_label_set(g=g):
+def get_edge_label_set(
+    request: Request,
+    prefix: str = "",
+    contains: str = "",
+    limit: int | None = Query(None, ge=1),
+    cursor: str | None = None,
+    dataset: Dataset = Depends(get_dataset),
+):
     """
-    Retrieves all the edge labels in the ontology
+    Retrieves all the edge labels in the ontology, searchable and paginated like /get_node_label_set.
     """
-    predicates = list(g.predicates())
-    # use qname to shorten the URIs and send set of predicates
-    return {uri_to_qname(g, uri) for uri in predicates}  # type: ignore
+    return label_response(request, dataset, "edge_label_set", dataset.edge_labels, prefix, contains, limit, cursor)
 
 
 @router.get("/sub-class-of")
-async def get_sub_class_of():
+def get_sub_class_of(request: Request, dataset: Dataset = Depends(get_dataset)):
     """
-    Retrieves all tuples with the rdfs:SubClassOf predicate using SPARQL and converts them to QNames.
-    """
-    g = Graph()
-    g.parse(data=ttl_data, format="turtle")  # Assuming ttl_data is the turtle file content
-
-    query = """
-    SELECT ?s ?o WHERE {
-        ?s rdfs:subClassOf ?o .
-    }
+    Retrieves all tuples with the rdfs:SubClassOf predicate as QNames.
+    Every type that only occurs in the study table, not as an owl:Class of the ontology, is added as a subclass of "missing".
+    The edges are collected once per dataset load.
     """
 
-    result = []
-    for row in g.query(query):
-        result.append(
-            {
-                "s": g.namespace_manager.qname(row.s),  # type: ignore
-                "p": "rdfs:subClassOf",
-                "o": g.namespace_manager.qname(row.o),  # type: ignore
-            }
-        )
-
-    classes_from_ontology_graph_list = {str(g.namespace_manager.qname(c)) for c in g.subjects(predicate=RDF.type, object=OWL.Class)}  # type: ignore
-
-    # Identify 'not in ontology' classes/types from DataFrame
-    df["rdf:type"] = df["rdf:type"].apply(lambda x: ast.literal_eval(x) if isinstance(x, str) else x)
-    df_types = set(df.explode("rdf:type")["rdf:type"].unique().tolist())
-    only_in_csv = df_types - classes_from_ontology_graph_list
-
-    # for all classes/types in only_in_csv add an s p o triple where s is the class/type, p is rdfs:subClassOf, and o is "missing"
-    for type_ in only_in_csv:
-        result.append({"s": type_, "p": "rdfs:subClassOf", "o": "missing"})
-
-    return result
-
-
-class Node:
-    def __init__(self, id):
-        self.id = id
-        self.children = []
-        self.count = 0
-        self.cumulative_count = 0
-
-    def __str__(self, level=0):
-        ret = "\t" * level + repr(self.id) + f" (Count: {self.count}, Cumulative Count: {self.cumulative_count})\n"
-        for child in self.children:
-            ret += child.__str__(level + 1)
-        return ret
-
-    def to_dict(self):
-        return {
-            "id": self.id.item() if isinstance(self.id, np.integer) else self.id,
-            "count": self.count.item() if isinstance(self.count, np.integer) else self.count,
-            "cumulative_count": self.cumulative_count.item() if isinstance(self.cumulative_count, np.integer) else self.cumulative_count,
-            "children": [child.to_dict() for child in self.children],
-        }
-
-
-def build_ontology_tree(type_violation_dict, type_count_dict, violation_exemplar_dict, g):
-    query = """SELECT ?s ?o WHERE { ?s rdfs:subClassOf ?o . }"""
-    parent_child_map = defaultdict(list)
-    ontology_type_nodes = set()
-    parents = set()
-    children = set()
-
-    for row in g.query(query):
-        parent = str(g.namespace_manager.qname(row.o))
-        child = str(g.namespace_manager.qname(row.s))
-        parent_child_map[parent].append(child)
-        ontology_type_nodes.add(parent)
-        ontology_type_nodes.add(child)
-        parents.add(parent)
-        children.add(child)
-
-    # Identify 'not in ontology' classes/types from DataFrame
-    df["rdf:type"] = df["rdf:type"].apply(lambda x: ast.literal_eval(x) if isinstance(x, str) else x)
-    df_types = set(df.explode("rdf:type")["rdf:type"].unique().tolist())
-    types_only_in_csv = df_types - ontology_type_nodes
-    all_type_nodes = ontology_type_nodes.union(types_only_in_csv)
-    all_type_nodes_and_missing = all_type_nodes.union({"missing"})
-
-    roots = parents - children
-
-    for node in ontology_type_nodes:
-        if node not in type_count_dict:
-            type_count_dict[node] = 0
-
-    node_count_dict = {}
-    root = Node("VirtualRoot")
-
-    def build_sub_class_tree(current_node):
-        for child_id in parent_child_map[current_node.id]:
-            child_node = Node(child_id)
-            if child_id in type_count_dict:
-                child_node.count = type_count_dict[child_id]
-            current_node.children.append(child_node)
-            build_sub_class_tree(child_node)
-
-    def add_violations(current_node):
-        for child in current_node.children:
-            add_violations(child)
-        if current_node.id in type_violation_dict:
-            for violation, count in type_violation_dict[current_node.id].items():
-                violation_node = Node(violation)
-                violation_node.count = count
-                current_node.children.append(violation_node)
-
-    def add_exemplars(current_node):
-        for child in current_node.children:
-            add_exemplars(child)
-        if current_node.id in violation_exemplar_dict:
-            for exemplar, exemplar_count in violation_exemplar_dict[current_node.id].items():
-                exemplar_node = Node(exemplar)
-                exemplar_node.count = exemplar_count
-                current_node.children.append(exemplar_node)
-
-    def compute_cumulative_counts(current_node):
-        for child in current_node.children:
-            compute_cumulative_counts(child)
-
-        current_node.cumulative_count = current_node.count
-        if current_node.id in all_type_nodes_and_missing:
-            for child in current_node.children:
-                if child.id in all_type_nodes_and_missing:
-                    current_node.cumulative_count += child.cumulative_count
-
-        node_count_dict[current_node.id] = {
-            "count": current_node.count,
-            "cumulative_count": current_node.cumulative_count,  # Store both count and cumulative_count
-        }
-
-    for actual_root in roots:
-        root_node = Node(actual_root)
-        root.children.append(root_node)
-        build_sub_class_tree(root_node)
-
-    for node in root.children:
-        add_violations(node)
-        for violation_node in node.children:
-            add_exemplars(violation_node)
-
-    compute_cumulative_counts(root)
-
-    # Count the number of nodes in the CSV with a type not in the ontology
-    type_counts_in_csv = df.explode("rdf:type")["rdf:type"].value_counts().to_dict()
-    not_in_ontology_counts = {type_: type_counts_in_csv[type_] for type_ in types_only_in_csv if type_ in type_counts_in_csv}
-
-    # Add a child to root called "missing"
-    not_in_ontology_node = Node("missing")
-    root.children.append(not_in_ontology_node)
-
-    # For each type not in the ontology, add a child to "missing"
-    for type_, count in not_in_ontology_counts.items():
-        type_node = Node(type_)
-        type_node.cumulative_count = count
-        type_node.count = count
-        not_in_ontology_node.children.append(type_node)
-
-    # Compute cumulative counts for "missing" node and its children
-    # iterate through the children of "missing" and sum up their counts
-    not_in_ontology_node.cumulative_count = sum(child.count for child in not_in_ontology_node.children)
-    # write this to the not_in_ontology node in the node_count_dict for cumulative_count
-    node_count_dict["missing"] = {
-        "count": 0,
-        "cumulative_count": sum(child.count for child in not_in_ontology_node.children),
-    }
-
-    compute_cumulative_counts(not_in_ontology_node)
+    def build():
+        # for all classes/types in only_in_csv add an s p o triple where s is the class/type, p is rdfs:subClassOf, and o is "missing"
+        missing = [{"s": type_, "p": "rdfs:subClassOf", "o": "missing"} for type_ in dataset.types_only_in_csv]
+        return dataset.subclass_edges + missing
 
-    return root, node_count_dict
-
-
-ontology_tree, node_count_dict = build_ontology_tree(type_violation_dict, type_count_dict, violation_exemplar_dict, g)
+    return cached_response(request, dataset, "sub-class-of", build)
 
 
 @router.get("/get_ontology_tree")
-async def get_ontology_tree():
-    if ontology_tree is None:
+def get_ontology_tree(request: Request, dataset: Dataset = Depends(get_dataset)):
+    if dataset.ontology_tree is None:
         return {"error": "Ontology tree not built yet"}
 
-    serializable_tree = ontology_tree.to_dict()
-    return serializable_tree
+    return cached_response(request, dataset, "ontology_tree", dataset.ontology_tree.to_dict)
 
 
 @router.get("/get_node_count_dict")
-async def get_type_node_count_dict():
-    if node_count_dict is None:
+def get_type_node_count_dict(request: Request, dataset: Dataset = Depends(get_dataset)):
+    if dataset.node_count_dict is None:
         return {"error": "node count dict not built yet"}
-    return node_count_dict
+    return cached_response(request, dataset, "node_count_dict", lambda: dataset.node_count_dict)
 
 
 @router.get("/get_violation_exemplar_dict")
-async def get_violation_exemplar_dict():
-    if violation_exemplar_dict is None:
+def get_violation_exemplar_dict(request: Request, dataset: Dataset = Depends(get_dataset)):
+    if dataset.violation_exemplars is None:
         return {"error": "Violation exemplar dict not built yet"}
 
-    return violation_exemplar_dict
+    return cached_response(request, dataset, "violation_exemplar_dict", lambda: dataset.violation_exemplars.to_dict(dataset.terms.qname))
 
 
 @router.get("/get_type_violation_dict")
-async def get_type_violation_dict():
-    if violation_exemplar_dict is None:
+async def get_type_violation_dict(dataset: Dataset = Depends(get_dataset)):
+    if dataset.violation_exemplars is None:
         return {"error": "Type violation dict not built yet"}
 
-    return type_violation_dict
+    return dataset.type_violation_dict
 
 
 # TODO: execute this in preprocessing already
 @router.get("/file/ontology")
-def get_ttl_file(response: Response):
+def get_ttl_file(request: Request, dataset: Dataset = Depends(get_dataset)):
     """
     sends the contents of the ttl file serialized to the client
     """
-    response.headers["Content-Disposition"] = "attachment; filename=omics_model.ttl"
-    return Response(content=ttl_data, media_type="text/turtle")
+    return cached_response(
+        request,
+        dataset,
+        "ontology",
+        lambda: dataset.ttl_data,
+        media_type="text/turtle",
+        headers={"Content-Disposition": "attachment; filename=omics_model.ttl"},
+    )
 
 
 @router.get("/file/original_instance_data")
@@ -762,85 +480,46 @@ def get_original_violation_report(response: Response):
     return Response(content=data, media_type="text/turtle")
 
 
-def uri_to_qname(graph, uri):
+@router.get("/violation_path_nodes_dict")
+def get_violation_path_nodes_dict(request: Request, dataset: Dataset = Depends(get_dataset)):
     """
-    Convert a URI to its QName representation if possible.
-    If the input is not a URI or cannot be converted, return it as a string.
-    
-    Args:
-        graph (rdflib.Graph): The RDF graph containing namespace definitions.
-        uri (rdflib.term.URIRef or rdflib.term.Literal or str): The URI or literal to convert.
-    
-    Returns:
-        str: The QName representation or the original URI/literal as a string.
+    Returns the dictionaries of ViolationPathIndex.to_dict, computed once per dataset.
     """
-    if isinstance(uri, URIRef):
-        try:
-            qname = graph.namespace_manager.qname(uri)
-            return qname
-        except ValueError:
-            return str(uri)
-    elif isinstance(uri, Literal):
-        return str(uri)
-    else:
-        return uri
+    return cached_response(request, dataset, "violation_path_nodes_dict", lambda: dataset.violation_paths.to_dict())
 
 
-@router.get("/violation_path_nodes_dict")
-def get_violation_path_nodes_dict():
+@router.get("/violation_path_nodes_dict/class/{class_name}")
+def get_violation_path_nodes_of_class(class_name: str, dataset: Dataset = Depends(get_dataset)):
     """
-    Uses the graph object to compute 2 dictionaries and returns them:
-    1. A dictionary with types (o2) as keys and the nodes (s1 and o1) as values that need to be visible to show the path to the violating violations.
-    2. A dictionary with violations (o1) as keys and the nodes (s1 and o2) as values that need to be visible to show the path to the types.
-
-    Returns:
-        dict: A dictionary with either types or violations as keys and corresponding nodes as values.
-    """
-
-    qres = g.query(
-        """
-        SELECT ?s1 ?o1 ?o2
-        WHERE {
-            ?s1 a sh:NodeShape .
-            ?s1 sh:property ?o1 .
-            ?s1 sh:targetClass ?o2 .
-            ?o1 a sh:PropertyShape .
-            ?o2 a owl:Class .
-        }
-        """
-    )
-
-    class_prop_d = defaultdict(set)
-    prop_class_d = defaultdict(set)
-
-    for row in qres:
-        ns, ps, c = row  # type: ignore
-        ns_q = uri_to_qname(g, ns)
-        ps_q = uri_to_qname(g, ps)
-        c_q = uri_to_qname(g, c)
-
-        # Add elements to sets
-        class_prop_d[c_q].add(ns_q)  # type: ignore
-        class_prop_d[c_q].add(ps_q)  # type: ignore
-
-        prop_class_d[ps_q].add(ns_q)  # type: ignore
-        prop_class_d[ps_q].add(c_q)  # type: ignore
+    Returns the nodes on the paths from one class to its property shapes, the entry of class_property_d for class_name
+    as "nodes", split into "nodeShapes" and "propertyShapes".
+    """
+    try:
+        return dataset.violation_paths.nodes_of_class(class_name)
+    except KeyError as err:
+        raise HTTPException(status_code=404, detail=f"No violation path starts at class {class_name}") from err
 
-    # Convert sets back to lists
-    class_prop_d = {key: list(val) for key, val in class_prop_d.items()}
-    prop_class_d = {key: list(val) for key, val in prop_class_d.items()}
 
-    return {"class_property_d": class_prop_d, "property_class_d": prop_class_d}
+@router.get("/violation_path_nodes_dict/property_shape/{property_shape}")
+def get_violation_path_nodes_of_property_shape(property_shape: str, dataset: Dataset = Depends(get_dataset)):
+    """
+    Returns the nodes on the paths from one property shape to its classes, the entry of property_class_d for property_shape
+    as "nodes", split into "nodeShapes" and "classes".
+    """
+    try:
+        return dataset.violation_paths.nodes_of_property_shape(property_shape)
+    except KeyError as err:
+        raise HTTPException(status_code=404, detail=f"No violation path ends at property shape {property_shape}") from err
 
 
 @router.get("/violation_list")
-async def get_violation_list():
-    return violations_list
+def get_violation_list(request: Request, dataset: Dataset = Depends(get_dataset)):
+    return cached_response(request, dataset, "violation_list", lambda: dataset.violations_list)
 
 
 @router.get("/file/json/{file_path}")
 async def read_file(file_path: str):
-    file_path = os.path.join("bikg_app/json", file_path)
+    file_path = os.path.join(JSON_DIR, file_path)
 
     # check whether file path exists
     if not os.path.exists(file_path):
@@ -0,0 +1,144 @@
+"""This module implements the bitmap index used to resolve feature and violation selections on the study table."""
+# selection_index.py
+import numpy as np
+import pandas as pd
+
+# A category whose rows take fewer bytes as int32 positions than as a packed bitmap is stored as positions,
+# this keeps high-cardinality columns such as focus_node linear in the number of rows.
+_POSITION_BYTES = np.dtype(np.int32).itemsize
+
+
+class BitmapIndex:
+    """
+    Per-column, per-category row sets of the study table plus a "count > 0" bitmap per violation column.
+    Built once per dataset load; a selection is then the union of a few row sets instead of a scan over the table.
+
+    The row sets are held in flat arrays, so an index mapped from a snapshot is used as it is: row_sets[code] >= 0 is
+    the row of bitmaps that holds the packed rows of a category, row_sets[code] < 0 the slice ~row_sets[code] of
+    position_offsets into positions. The categories of column j are those of the codes offsets[j] to offsets[j + 1] - 1.
+    """
+
+    def __init__(
+        self, n_rows, columns, categories, offsets, row_sets, bitmaps, positions, position_offsets, violation_columns, violation_bitmaps
+    ):
+        """
+        Args:
+            n_rows (int): The number of rows of the study table.
+            columns (List[str]): The feature columns indexed by category.
+            categories (Sequence): The category of every code, the codes of one column are contiguous.
+            offsets (np.ndarray): len(columns) + 1 offsets of the codes of each column.
+            row_sets (np.ndarray): The row set of every code, see above.
+            bitmaps (np.ndarray): The packed rows of the dense categories, one bitmap per array row.
+            positions (np.ndarray): The sorted row positions of the sparse categories, concatenated.
+            position_offsets (np.ndarray): The offsets of each category's positions.
+            violation_columns (List[str]): The violation count columns indexed by "count > 0".
+            violation_bitmaps (np.ndarray): The packed "count > 0" rows of every violation column, one bitmap per array row.
+        """
+        self.n_rows = n_rows
+        self.columns = list(columns)
+        self.categories = categories
+        self.offsets = offsets
+        self.row_sets = row_sets
+        self.bitmaps = bitmaps
+        self.positions = positions
+        self.position_offsets = position_offsets
+        self.violation_columns = list(violation_columns)
+        self.violation_bitmaps = violation_bitmaps
+        self._column_positions = {column: j for j, column in enumerate(self.columns)}
+        self._violation_positions = {column: j for j, column in enumerate(self.violation_columns)}
+        # category -> code of every column, built by its first selection
+        self._codes = {}
+
+    @classmethod
+    def from_df(cls, df: pd.DataFrame, columns, violation_columns) -> "BitmapIndex":
+        """
+        Builds the index of the study table.
+
+        Args:
+            df (pd.DataFrame): The study table.
+            columns (List[str]): The feature columns to index by category.
+            violation_columns (List[str]): The violation count columns to index by "count > 0".
+        """
+        n_rows = len(df)
+        n_bytes = (n_rows + 7) // 8
+        categories = []
+        offsets = [0]
+        row_sets = []
+        bitmaps = []
+        positions = []
+        position_offsets = [0]
+        for column in columns:
+            codes, column_categories = pd.factorize(df[column])
+            # group the row positions by category code in one pass, stable so positions stay sorted
+            order = np.argsort(codes, kind="stable")
+            bounds = np.searchsorted(codes[order], np.arange(len(column_categories) + 1))
+            for code in range(len(column_categories)):
+                rows = order[bounds[code] : bounds[code + 1]]
+                if len(rows) * _POSITION_BYTES < n_bytes:
+                    row_sets.append(~(len(position_offsets) - 1))
+                    positions.append(rows.astype(np.int32))
+                    position_offsets.append(position_offsets[-1] + len(rows))
+                else:
+                    mask = np.zeros(n_rows, dtype=bool)
+                    mask[rows] = True
+                    row_sets.append(len(bitmaps))
+                    bitmaps.append(np.packbits(mask))
+            categories.extend(column_categories.tolist())
+            offsets.append(len(categories))
+        violation_bitmaps = [np.packbits(df[column].to_numpy() > 0) for column in violation_columns]
+        return cls(
+            n_rows,
+            columns,
+            categories,
+            np.array(offsets, dtype=np.int64),
+            np.array(row_sets, dtype=np.int64),
+            np.array(bitmaps, dtype=np.uint8).reshape(len(bitmaps), n_bytes),
+            np.concatenate(positions) if positions else np.zeros(0, dtype=np.int32),
+            np.array(position_offsets, dtype=np.int64),
+            violation_columns,
+            np.array(violation_bitmaps, dtype=np.uint8).reshape(len(violation_bitmaps), n_bytes),
+        )
+
+    def _union(self, bitmaps, position_arrays) -> np.ndarray:
+        if not bitmaps:
+            if not position_arrays:
+                return np.zeros(0, dtype=np.int64)
+            return np.unique(np.concatenate(position_arrays)).astype(np.int64)
+        packed = bitmaps[0].copy()
+        for bitmap in bitmaps[1:]:
+            np.bitwise_or(packed, bitmap, out=packed)
+        mask = np.unpackbits(packed, count=self.n_rows).view(bool)
+        for positions in position_arrays:
+            mask[positions] = True
+        return np.flatnonzero(mask)
+
+    def _column_codes(self, column) -> dict:
+        codes = self._codes.get(column)
+        if codes is None:
+            j = self._column_positions[column]
+            start, stop = int(self.offsets[j]), int(self.offsets[j + 1])
+            codes = self._codes[column] = {category: code for code, category in enumerate(self.categories[start:stop], start=start)}
+        return codes
+
+    def rows_with_categories(self, column, categories) -> np.ndarray:
+        """
+        Returns the sorted positions of the rows whose value in column is one of categories, like df[column].isin(categories).
+
+        Raises:
+            KeyError: If the column is not indexed.
+        """
+        codes = self._column_codes(column)
+        row_sets = [int(self.row_sets[codes[category]]) for category in categories if category in codes]
+        return self._union(
+            [self.bitmaps[row_set] for row_set in row_sets if row_set >= 0],
+            [self.positions[self.position_offsets[~row_set] : self.position_offsets[~row_set + 1]] for row_set in row_sets if row_set < 0],
+        )
+
+    def rows_with_any_violation(self, violation_columns) -> np.ndarray:
+        """
+        Returns the sorted positions of the rows with a count > 0 in any of the violation columns, like df[columns].gt(0).any(axis=1).
+
+        Raises:
+            KeyError: If one of the columns is not indexed.
+        """
+        return self._union([self.violation_bitmaps[self._violation_positions[column]] for column in violation_columns], [])
@@ -0,0 +1,139 @@
+"""This module implements server-side selection handles and the compact row encodings accepted in their place."""
+# selection_store.py
+import base64
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+
+SELECTION_STORE_MAX_ENTRIES = 64
+SELECTION_STORE_TTL_SECONDS = 30 * 60
+
+
+class SelectionStore:
+    """
+    Bounded LRU of selections (row positions, stored as int32) keyed by an opaque id.
+    Entries expire ttl_seconds after they were last used, the least recently used entry is evicted once max_entries is reached.
+    """
+
+    def __init__(self, max_entries=SELECTION_STORE_MAX_ENTRIES, ttl_seconds=SELECTION_STORE_TTL_SECONDS, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            self._expire(self._clock())
+            return len(self._entries)
+
+    def _expire(self, now):
+        # entries are kept in order of last use, so the expired ones are at the front
+        while self._entries:
+            selection_id, (_, last_used) = next(iter(self._entries.items()))
+            if now - last_used < self.ttl_seconds:
+                break
+            del self._entries[selection_id]
+
+    def put(self, positions) -> str:
+        """Stores the row positions of a selection and returns its id."""
+        positions = np.array(positions, dtype=np.int32)
+        positions.setflags(write=False)
+        selection_id = uuid.uuid4().hex
+        with self._lock:
+            now = self._clock()
+            self._expire(now)
+            self._entries[selection_id] = (positions, now)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return selection_id
+
+    def get(self, selection_id) -> np.ndarray:
+        """
+        Returns the row positions of a stored selection and marks it as recently used.
+
+        Raises:
+            KeyError: If the id is unknown or the selection expired or was evicted.
+        """
+        with self._lock:
+            now = self._clock()
+            self._expire(now)
+            positions, _ = self._entries[selection_id]
+            self._entries[selection_id] = (positions, now)
+            self._entries.move_to_end(selection_id)
+            return positions
+
+
+def encode_rle(positions) -> list:
+    """
+    Run-length encodes row positions as a flat [start, length, start, length, ...] list.
+    The positions are sorted and deduplicated first, so the encoding describes a set of rows.
+    """
+    positions = np.unique(np.asarray(positions, dtype=np.int64))
+    if len(positions) == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(positions) != 1) + 1
+    starts = positions[np.concatenate([[0], breaks])]
+    lengths = np.diff(np.concatenate([[0], breaks, [len(positions)]]))
+    return np.column_stack([starts, lengths]).ravel().tolist()
+
+
+def decode_rle(runs, n_rows) -> np.ndarray:
+    """
+    Returns the sorted row positions of a [start, length, ...] run list as created by encode_rle.
+
+    Raises:
+        ValueError: If the run list is malformed or a run lies outside of the n_rows rows.
+    """
+    runs = np.asarray(runs, dtype=np.int64)
+    if runs.ndim != 1 or len(runs) % 2:
+        raise ValueError("A run-length encoded selection must be a flat list of [start, length] pairs")
+    starts, lengths = runs[0::2], runs[1::2]
+    if (starts < 0).any() or (lengths < 0).any() or (starts + lengths > n_rows).any():
+        raise ValueError(f"The runs of the selection must lie within the {n_rows} rows")
+    # expand all runs at once: a running index, shifted by each run's start
+    run_offsets = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+    return np.unique(np.arange(int(lengths.sum())) + run_offsets)
+
+
+def encode_bitset(positions, n_rows) -> str:
+    """Encodes row positions as a base64 string of the np.packbits bitmap of n_rows bits (most significant bit first)."""
+    mask = np.zeros(n_rows, dtype=bool)
+    mask[np.asarray(positions, dtype=np.int64)] = True
+    return base64.b64encode(np.packbits(mask).tobytes()).decode("ascii")
+
+
+def decode_bitset(data, n_rows) -> np.ndarray:
+    """
+    Returns the sorted row positions of a bitset created by encode_bitset.
+
+    Raises:
+        ValueError: If the data is not base64 or does not hold exactly n_rows bits.
+    """
+    try:
+        packed = np.frombuffer(base64.b64decode(data, validate=True), dtype=np.uint8)
+    except (TypeError, ValueError) as err:
+        raise ValueError("A bitset selection must be a base64 string") from err
+    if len(packed) != (n_rows + 7) // 8:
+        raise ValueError(f"A bitset selection must hold {n_rows} bits")
+    return np.flatnonzero(np.unpackbits(packed, count=n_rows))
+
+
+def decode_selected_rows(selected_rows, n_rows) -> np.ndarray:
+    """
+    Decodes a compact selection of the form {"encoding": "rle", "runs": [...]} or {"encoding": "bitset", "data": "..."}.
+
+    Raises:
+        ValueError: If the encoding is unknown or malformed.
+    """
+    if not isinstance(selected_rows, dict):
+        raise ValueError("selectedRows must be an object with an encoding")
+    encoding = selected_rows.get("encoding")
+    if encoding == "rle":
+        return decode_rle(selected_rows.get("runs", []), n_rows)
+    if encoding == "bitset":
+        return decode_bitset(selected_rows.get("data", ""), n_rows)
+    raise ValueError(f"Unknown selection encoding {encoding!r}, expected 'rle' or 'bitset'")
@@ -0,0 +1,255 @@
+"""This module implements the binary snapshot container used to store a precompiled dataset."""
+# snapshot.py
+import hashlib
+import itertools
+import json
+import os
+import struct
+from typing import Any, overload
+
+import numpy as np
+
+SNAPSHOT_MAGIC = b"BIKGSNAP"
+# Bump whenever the layout of the container or the set of stored structures changes, old snapshots are then rejected.
+SNAPSHOT_FORMAT_VERSION = 10
+# Arrays are aligned so every one of them can be memory-mapped with its natural alignment
+ARRAY_ALIGNMENT = 64
+
+_PREAMBLE = struct.Struct("<8sIQ")  # magic, format version, header length
+
+
+class SnapshotMismatchError(Exception):
+    """Raised when a snapshot is unreadable, has another format version or was built from other source files."""
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    """Returns the hex sha256 digest of a file."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def describe_sources(paths):
+    """
+    Fingerprints the files a snapshot is compiled from.
+
+    Args:
+        paths (Iterable[str]): The source file paths.
+
+    Returns:
+        dict: Maps each path to its size, modification time and sha256 digest.
+    """
+    sources = {}
+    for path in paths:
+        stat = os.stat(path)
+        sources[path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": file_sha256(path)}
+    return sources
+
+
+def sources_digest(sources):
+    """Returns one hex digest identifying the contents of the files described by describe_sources."""
+    digest = hashlib.sha256()
+    for path in sorted(sources):
+        digest.update(f"{path}\0{sources[path]['sha256']}\n".encode())
+    return digest.hexdigest()
+
+
+def sources_match(recorded_sources, paths):
+    """
+    Checks whether the source files are still the ones a snapshot was compiled from.
+    Files whose size and modification time are unchanged are trusted without being read, all others are re-hashed.
+    """
+    if set(recorded_sources) != set(paths):
+        return False
+    for path in paths:
+        recorded = recorded_sources[path]
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        if stat.st_size != recorded["size"]:
+            return False
+        if stat.st_mtime_ns != recorded["mtime_ns"] and file_sha256(path) != recorded["sha256"]:
+            return False
+    return True
+
+
+def encode_string_table(strings):
+    """
+    Packs a list of strings into one utf-8 byte array and an offsets array.
+
+    Returns:
+        tuple: (np.ndarray of uint8 holding the concatenated strings, np.ndarray of int64 offsets with len(strings) + 1 entries)
+    """
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    if encoded:
+        np.cumsum([len(e) for e in encoded], out=offsets[1:])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+def decode_string_table(data, offsets, indices=None):
+    """
+    Returns the strings of a table created by encode_string_table, or only those at the given indices. Only the bytes
+    of the requested strings are read, so picking a few strings of a memory-mapped table touches a few pages of it.
+    """
+    if indices is None:
+        raw = data.tobytes()
+        bounds = offsets.tolist()
+        return [raw[bounds[i] : bounds[i + 1]].decode("utf-8") for i in range(len(bounds) - 1)]
+    return [data[int(offsets[i]) : int(offsets[i + 1])].tobytes().decode("utf-8") for i in indices]
+
+
+def encode_json_table(values):
+    """Packs JSON-serializable values, e.g. the categories of a column, into a string table of their JSON encodings."""
+    return encode_string_table([json.dumps(value, ensure_ascii=False, default=_json_default) for value in values])
+
+
+class StringTable:
+    """
+    The strings of a table created by encode_string_table as a read-only sequence that decodes a string (with decode,
+    e.g. json.loads for encode_json_table) every time it is accessed, so a table mapped from a snapshot costs nothing
+    until its strings are used. Slices are tables of the same data.
+    """
+
+    __slots__ = ("data", "offsets", "decode")
+
+    def __init__(self, data, offsets, decode=None):
+        self.data = data
+        self.offsets = offsets
+        self.decode = decode
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def raw(self, index) -> bytes:
+        """Returns the utf-8 bytes of the string at index."""
+        return self.data[int(self.offsets[index]) : int(self.offsets[index + 1])].tobytes()
+
+    @overload
+    def __getitem__(self, index: int) -> Any:
+        ...
+
+    @overload
+    def __getitem__(self, index: slice) -> "StringTable":
+        ...
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                raise ValueError("StringTable slices must be contiguous")
+            # the offsets point into the whole data, so the table of a range only needs the offsets of the range
+            return StringTable(self.data, self.offsets[start : max(start, stop) + 1], self.decode)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        (string,) = decode_string_table(self.data, self.offsets, [index])
+        return string if self.decode is None else self.decode(string)
+
+    def __iter__(self):
+        return iter(self.tolist())
+
+    def tolist(self) -> list:
+        """Returns all strings decoded, reading the bytes of the table in one go."""
+        bounds = self.offsets.tolist()
+        if len(bounds) < 2:
+            return []
+        raw = self.data[bounds[0] : bounds[-1]].tobytes()
+        strings = [raw[start - bounds[0] : stop - bounds[0]].decode("utf-8") for start, stop in itertools.pairwise(bounds)]
+        return strings if self.decode is None else [self.decode(string) for string in strings]
+
+
+def _json_default(value):
+    # numpy scalars end up in the stored structures, e.g. counts computed by pandas
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _aligned(offset):
+    return (offset + ARRAY_ALIGNMENT - 1) // ARRAY_ALIGNMENT * ARRAY_ALIGNMENT
+
+
+def write_snapshot(path, arrays, objects, sources):
+    """
+    Writes a snapshot file.
+
+    The file starts with a fixed preamble and a JSON header that describes the JSON-serializable objects, the source file
+    fingerprints and the dtype, shape and offset of every array. The array data follows, each array aligned to ARRAY_ALIGNMENT.
+    The file is written to a temporary path first and renamed, so readers never see a partially written snapshot.
+
+    Args:
+        path (str): Where to write the snapshot.
+        arrays (dict): Maps names to numpy arrays.
+        objects (dict): JSON-serializable structures stored in the header.
+        sources (dict): Source file fingerprints as returned by describe_sources.
+    """
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+    layout = {}
+    offset = 0
+    for name, array in arrays.items():
+        offset = _aligned(offset)
+        layout[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset += array.nbytes
+
+    header = json.dumps(
+        {"format_version": SNAPSHOT_FORMAT_VERSION, "sources": sources, "arrays": layout, "objects": objects},
+        ensure_ascii=False,
+        default=_json_default,
+    ).encode("utf-8")
+    data_start = _aligned(_PREAMBLE.size + len(header))
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_PREAMBLE.pack(SNAPSHOT_MAGIC, SNAPSHOT_FORMAT_VERSION, len(header)))
+        f.write(header)
+        for name, array in arrays.items():
+            f.seek(data_start + layout[name]["offset"])
+            f.write(array.tobytes())
+    os.replace(tmp_path, path)
+
+
+def read_snapshot(path, source_paths):
+    """
+    Opens a snapshot and memory-maps its arrays, nothing but the header is read eagerly.
+
+    Args:
+        path (str): The snapshot file.
+        source_paths (Iterable[str]): The files the snapshot must have been compiled from.
+
+    Returns:
+        tuple: (dict of name -> read-only np.ndarray, dict of stored objects)
+
+    Raises:
+        SnapshotMismatchError: If the file is not a snapshot, has another format version or its sources changed.
+    """
+    with open(path, "rb") as f:
+        preamble = f.read(_PREAMBLE.size)
+        if len(preamble) != _PREAMBLE.size:
+            raise SnapshotMismatchError(f"{path} is truncated")
+        magic, version, header_length = _PREAMBLE.unpack(preamble)
+        if magic != SNAPSHOT_MAGIC:
+            raise SnapshotMismatchError(f"{path} is not a dataset snapshot")
+        if version != SNAPSHOT_FORMAT_VERSION:
+            raise SnapshotMismatchError(f"{path} has format version {version}, expected {SNAPSHOT_FORMAT_VERSION}")
+        header = json.loads(f.read(header_length).decode("utf-8"))
+
+    if not sources_match(header["sources"], list(source_paths)):
+        raise SnapshotMismatchError(f"The source files of {path} have changed")
+
+    data_start = _aligned(_PREAMBLE.size + header_length)
+    # one read-only mapping of the whole file, every array is a view into it
+    mapped = np.memmap(path, dtype=np.uint8, mode="r")
+    arrays = {}
+    for name, spec in header["arrays"].items():
+        dtype = np.dtype(spec["dtype"])
+        shape = tuple(spec["shape"])
+        start = data_start + spec["offset"]
+        nbytes = int(np.prod(shape)) * dtype.itemsize
+        arrays[name] = mapped[start : start + nbytes].view(dtype).reshape(shape)
+    return arrays, header["objects"]
@@ -0,0 +1,56 @@
+"""This module implements the Arrow IPC serialization of the study table."""
+# study_arrow.py
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+
+def dictionary_array(values) -> pa.DictionaryArray:
+    """Returns the strings as a dictionary array with int32 indices, missing values become nulls."""
+    codes, categories = pd.factorize(values, use_na_sentinel=True)
+    mask = codes < 0
+    return pa.DictionaryArray.from_arrays(
+        pa.array(codes.astype(np.int32), mask=mask if mask.any() else None), pa.array(categories, type=pa.string())
+    )
+
+
+def list_array(list_column) -> pa.ListArray:
+    """Returns a ListColumn, see StudyRecords, as a list<dictionary<string>> array."""
+    return pa.ListArray.from_arrays(pa.array(list_column.offsets.astype(np.int32)), dictionary_array(list_column.values))
+
+
+def _column_array(series: pd.Series, list_column=None) -> pa.Array:
+    if list_column is not None:
+        return list_array(list_column)
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        # the codes of a categorical column already are the indices of its dictionary
+        codes = series.cat.codes.to_numpy().astype(np.int32)
+        return pa.DictionaryArray.from_arrays(pa.array(codes, mask=codes < 0), pa.array(series.cat.categories.tolist(), type=pa.string()))
+    if series.dtype == object:
+        if not series.map(lambda value: isinstance(value, str)).to_numpy().all():
+            raise ValueError(f"Column {series.name} of the study table holds non-string objects and cannot be dictionary encoded")
+        return dictionary_array(series.to_numpy())
+    return pa.array(series.to_numpy())
+
+
+def study_table_to_arrow(df: pd.DataFrame, list_columns) -> bytes:
+    """
+    Serializes the study table as an Arrow IPC stream.
+    String and categorical columns are dictionary encoded, the columns in list_columns become list<dictionary<string>>
+    columns and numeric columns such as the violation counts and the x/y embedding coordinates keep their dtype.
+
+    Args:
+        df (pd.DataFrame): The study table.
+        list_columns (dict): Maps list-valued columns to their ListColumn, see StudyRecords.
+
+    Returns:
+        bytes: The IPC stream, one record batch holding the whole table.
+    """
+    arrays = [_column_array(values, list_columns.get(column)) for column, values in df.items()]
+    table = pa.Table.from_arrays(arrays, names=[str(column) for column in df.columns])
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
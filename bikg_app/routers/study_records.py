@@ -0,0 +1,137 @@
+"""This module implements the parsed list-valued columns of the study table and its serialization to JSON records."""
+# study_records.py
+import ast
+import json
+import math
+
+import numpy as np
+import pandas as pd
+
+
+def parse_list_cell(value):
+    """Returns the list a cell such as "['lotr:Character']" represents, any other value is returned unchanged."""
+    if isinstance(value, str) and value.startswith("[") and value.endswith("]"):
+        return ast.literal_eval(value)
+    return value
+
+
+def _json_value(value) -> str:
+    # like DataFrame.to_json, missing and non-finite numbers are written as null
+    if isinstance(value, float) and not math.isfinite(value):
+        return "null"
+    return json.dumps(value, ensure_ascii=False)
+
+
+class ListColumn:
+    """
+    A list-valued column in offset-array form: the items of row i are values[offsets[i] : offsets[i + 1]].
+    """
+
+    __slots__ = ("values", "offsets")
+
+    def __init__(self, values: np.ndarray, offsets: np.ndarray):
+        self.values = values
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def row(self, i) -> list:
+        return self.values[self.offsets[i] : self.offsets[i + 1]].tolist()
+
+    @classmethod
+    def from_codes(cls, codes, parsed) -> "ListColumn":
+        """Builds the column from the code of every row's cell and the lists of the distinct cells."""
+        lengths = np.array([len(value) for value in parsed], dtype=np.int64)[codes]
+        offsets = np.zeros(len(codes) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        values = np.fromiter((value for code in codes.tolist() for value in parsed[code]), dtype=object, count=int(offsets[-1]))
+        return cls(values, offsets)
+
+
+class StudyRecords:
+    """
+    The study table prepared for serialization as JSON records, the format of DataFrame.to_json(orient="records") with
+    list-valued cells written as JSON arrays.
+
+    Every distinct value of a column is parsed and JSON-encoded once when the dataset is loaded, a row is then only the
+    concatenation of precomputed fragments. list_columns holds the columns whose cells are all lists in offset-array form,
+    parsed from their fragments when first used.
+    """
+
+    def __init__(self, n_rows, columns, codes, fragments, list_column_names=()):
+        """
+        Args:
+            n_rows (int): The number of rows of the study table.
+            columns (List[str]): The columns of the study table.
+            codes (Sequence[np.ndarray]): The code of every row's cell, one array per column.
+            fragments (Sequence[Sequence[str]]): The JSON encoding of every distinct cell, one sequence per column.
+            list_column_names (List[str]): The columns whose cells are all lists.
+        """
+        self.n_rows = n_rows
+        self.columns = list(columns)
+        self.list_column_names = list(list_column_names)
+        self._keys = [json.dumps(column, ensure_ascii=False) + ":" for column in self.columns]
+        self.codes = codes
+        self.fragments = fragments
+        self._fragment_lists = None
+        self._list_columns = None
+
+    @classmethod
+    def from_df(cls, df: pd.DataFrame) -> "StudyRecords":
+        """
+        Encodes the study table.
+
+        Args:
+            df (pd.DataFrame): The study table.
+        """
+        codes = []
+        fragments = []
+        list_column_names = []
+        for column in df.columns:
+            column_codes, categories = pd.factorize(df[column], use_na_sentinel=False)
+            if df[column].dtype == np.float32:
+                # written with the shortest digits that identify the float32, not those of its float64 widening
+                parsed = [float(str(np.float32(category))) for category in categories.tolist()]
+            else:
+                parsed = [parse_list_cell(category) for category in categories.tolist()]
+            codes.append(column_codes)
+            fragments.append([_json_value(value) for value in parsed])
+            if parsed and all(isinstance(value, list) for value in parsed):
+                list_column_names.append(column)
+        return cls(len(df), df.columns, codes, fragments, list_column_names)
+
+    @property
+    def list_columns(self) -> dict:
+        """Maps the list-valued columns to their ListColumn, parsed from the fragments on first use."""
+        if self._list_columns is None:
+            positions = {column: j for j, column in enumerate(self.columns)}
+            self._list_columns = {
+                column: ListColumn.from_codes(
+                    np.asarray(self.codes[positions[column]]), [json.loads(fragment) for fragment in self.fragments[positions[column]]]
+                )
+                for column in self.list_column_names
+            }
+        return self._list_columns
+
+    def rows(self, start=0, stop=None):
+        """Yields the JSON objects of the rows start to stop - 1 as strings."""
+        stop = self.n_rows if stop is None else min(stop, self.n_rows)
+        if self._fragment_lists is None:
+            # fragments mapped from a snapshot are decoded once, not per chunk
+            self._fragment_lists = [list(fragments) for fragments in self.fragments]
+        columns = [
+            [key + fragments[code] for code in codes[start:stop].tolist()]
+            for key, codes, fragments in zip(self._keys, self.codes, self._fragment_lists, strict=True)
+        ]
+        for cells in zip(*columns, strict=True):
+            yield "{" + ",".join(cells) + "}"
+
+    def to_json(self) -> bytes:
+        """Returns all records as one JSON array."""
+        return ("[" + ",".join(self.rows()) + "]").encode("utf-8")
+
+    def iter_ndjson(self, chunk_rows=1000):
+        """Yields the records as newline-delimited JSON, chunk_rows rows per chunk, so no more than a chunk is held in memory."""
+        for start in range(0, self.n_rows, chunk_rows):
+            yield ("\n".join(self.rows(start, start + chunk_rows)) + "\n").encode("utf-8")
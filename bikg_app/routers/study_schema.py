@@ -0,0 +1,99 @@
+"""This module implements the schema of the study table, the role of every column and the compact dtype it is held in."""
+# study_schema.py
+import numpy as np
+import pandas as pd
+
+# the roles of the columns of the study table
+FOCUS_NODE = "focus_node"
+VIOLATION_COUNT = "violation_count"
+TYPE_LIST = "type_list"
+EMBEDDING = "embedding"
+PREDICATE = "predicate"
+
+FOCUS_NODE_COLUMN = "focus_node"
+TYPE_COLUMN = "rdf:type"
+EMBEDDING_COLUMNS = ("x", "y")
+# the category missing cells of the string columns are coded as, the label the endpoints have always shown for them
+MISSING_VALUE = "nan"
+
+_COUNT_TYPES = [np.uint8, np.uint16, np.uint32, np.uint64]
+
+
+def count_dtype(max_count):
+    """Returns the smallest unsigned integer type that holds every count up to max_count."""
+    for dtype in _COUNT_TYPES:
+        if max_count <= np.iinfo(dtype).max:
+            return dtype
+    raise ValueError(f"The count {max_count} does not fit into an unsigned 64-bit integer")
+
+
+def compact_counts(column: pd.Series) -> np.ndarray:
+    """
+    Returns the counts of a violation column as the smallest unsigned integer type that holds them.
+
+    Raises:
+        ValueError: If a count is missing, negative or not an integer.
+    """
+    values = column.to_numpy(dtype=np.float64)
+    if not np.isfinite(values).all() or (values < 0).any() or (values != np.floor(values)).any():
+        raise ValueError(f"The violation column {column.name} has counts that are not non-negative integers")
+    return values.astype(count_dtype(values.max(initial=0)))
+
+
+def category_labels(categories, dtype) -> list:
+    """
+    Returns the categories of a column the way the endpoints report them. Counts are reported as floats, the dtype the
+    violation columns had before they were held as unsigned integers, so their value count keys stay "0.0", "1.0", ...
+    """
+    labels = list(categories)
+    if pd.api.types.is_unsigned_integer_dtype(dtype):
+        return [float(label) for label in labels]
+    return labels
+
+
+def column_roles(columns, violations_list) -> dict:
+    """Returns {column: role} of the columns of the study table, the columns in violations_list count violations."""
+    violations = set(violations_list)
+    roles = {}
+    for column in columns:
+        if column == FOCUS_NODE_COLUMN:
+            roles[column] = FOCUS_NODE
+        elif column in violations:
+            roles[column] = VIOLATION_COUNT
+        elif column == TYPE_COLUMN:
+            roles[column] = TYPE_LIST
+        elif column in EMBEDDING_COLUMNS:
+            roles[column] = EMBEDDING
+        else:
+            roles[column] = PREDICATE
+    return roles
+
+
+def _categorical(values: pd.Series) -> pd.Series:
+    if not isinstance(values.dtype, pd.CategoricalDtype):
+        # the categories in the order they first appear, as value_counts breaks ties of the object column they replace
+        codes, categories = pd.factorize(values)
+        values = pd.Series(pd.Categorical.from_codes(codes, categories), index=values.index, name=values.name)
+    if values.isna().any():
+        values = values.cat.add_categories([MISSING_VALUE]).fillna(MISSING_VALUE)
+    return values
+
+
+def compact_column(values: pd.Series, role) -> pd.Series:
+    """
+    Returns the column in the dtype of its role: violation counts as the smallest unsigned integer type, the embedding
+    coordinates as float32, the type lists and the string predicate columns as categoricals in which missing cells are
+    the MISSING_VALUE category. Focus nodes and numeric predicate columns are returned unchanged.
+    """
+    if role == VIOLATION_COUNT:
+        return pd.Series(compact_counts(values), index=values.index, name=values.name)
+    if role == EMBEDDING:
+        return values.astype(np.float32)
+    if role in (TYPE_LIST, PREDICATE) and (values.dtype == object or isinstance(values.dtype, pd.CategoricalDtype)):
+        return _categorical(values)
+    return values
+
+
+def apply_schema(df: pd.DataFrame, roles) -> pd.DataFrame:
+    """Returns the study table with every column in the dtype of its role, see compact_column."""
+    return pd.DataFrame({column: compact_column(values, roles[column]) for column, values in df.items()}, index=df.index)
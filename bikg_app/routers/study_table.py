@@ -0,0 +1,139 @@
+"""This module implements the Parquet form of the study table, with typed violation counts and real list columns."""
+# study_table.py
+import itertools
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from bikg_app.routers.study_arrow import dictionary_array, list_array
+from bikg_app.routers.study_records import ListColumn, parse_list_cell
+from bikg_app.routers.study_schema import FOCUS_NODE_COLUMN, compact_counts
+
+# the schema metadata keys of the violation count columns and the list columns, newline separated
+VIOLATION_COLUMNS_KEY = b"bikg_app.violation_columns"
+LIST_COLUMNS_KEY = b"bikg_app.list_columns"
+
+
+def _count_array(column: pd.Series):
+    return pa.array(compact_counts(column))
+
+
+def _hashable_cell(value):
+    return str(value) if isinstance(value, list) else value
+
+
+def _object_array(column: pd.Series):
+    """Returns the cells as list<dictionary<string>> and True if they all are lists, as dictionary<string> and False otherwise."""
+    codes, categories = pd.factorize(column.map(_hashable_cell), use_na_sentinel=False)
+    parsed = [parse_list_cell(category) for category in categories.tolist()]
+    if parsed and all(isinstance(value, list) for value in parsed):
+        return list_array(ListColumn.from_codes(codes, [[str(item) for item in value] for value in parsed])), True
+    return dictionary_array(column.map(lambda value: value if isinstance(value, str) or pd.isna(value) else str(value)).to_numpy()), False
+
+
+def study_table_to_parquet(study_df: pd.DataFrame, violation_list) -> pa.Table:
+    """
+    Converts the study table to the Arrow table write_study_table stores: the violation counts as the smallest unsigned
+    integer type that holds them, columns whose cells are all lists (native or the strings study.csv stores) as
+    list<dictionary<string>>, every other object column as dictionary<string> and numeric columns unchanged. focus_node
+    is stored once, it becomes the index again when the table is read.
+
+    Raises:
+        ValueError: If a violation column holds a count that is not a non-negative integer.
+    """
+    violation_columns = set(violation_list)
+    focus_nodes = study_df[FOCUS_NODE_COLUMN] if FOCUS_NODE_COLUMN in study_df.columns else study_df.index.to_series()
+    names = [FOCUS_NODE_COLUMN]
+    arrays = [pa.array(focus_nodes.astype(str).to_numpy(), pa.string())]
+    list_columns = []
+    for column, values in study_df.items():
+        if column == FOCUS_NODE_COLUMN:
+            continue
+        if column in violation_columns:
+            array = _count_array(values)
+        elif values.dtype == object or isinstance(values.dtype, pd.CategoricalDtype):
+            array, is_list = _object_array(values.astype(object))
+            if is_list:
+                list_columns.append(column)
+        else:
+            array = pa.array(values.to_numpy())
+        names.append(str(column))
+        arrays.append(array)
+    metadata = {
+        VIOLATION_COLUMNS_KEY: "\n".join(column for column in violation_list if column in study_df.columns).encode("utf-8"),
+        LIST_COLUMNS_KEY: "\n".join(list_columns).encode("utf-8"),
+    }
+    return pa.Table.from_arrays(arrays, names=names).replace_schema_metadata(metadata)
+
+
+def write_study_table(study_df: pd.DataFrame, violation_list, path):
+    """Writes the study table as Parquet, see study_table_to_parquet."""
+    pq.write_table(study_table_to_parquet(study_df, violation_list), path, compression="zstd")
+
+
+def _metadata_columns(schema: pa.Schema, key):
+    value = (schema.metadata or {}).get(key, b"").decode("utf-8")
+    return value.split("\n") if value else []
+
+
+def _list_cell_codes(array: pa.ListArray):
+    """Returns the code of the distinct cell of every row, -1 for missing cells, and the distinct cells as lists of strings."""
+    items = array.values
+    if pa.types.is_dictionary(items.type):
+        item_codes = items.indices.to_numpy(zero_copy_only=False)
+        item_values = items.dictionary.to_numpy(zero_copy_only=False)
+    else:
+        item_codes, item_values = pd.factorize(items.to_numpy(zero_copy_only=False))
+    # the bytes of the item codes of a row identify its cell, so the rows are grouped without making a list per row
+    code_bytes = np.asarray(item_codes, dtype=np.int32).tobytes()
+    offsets = array.offsets.to_numpy().astype(np.int64) * 4
+    keys = np.array([code_bytes[start:stop] for start, stop in itertools.pairwise(offsets.tolist())], dtype=object)
+    keys[array.is_null().to_numpy(zero_copy_only=False)] = None
+    row_codes, distinct_keys = pd.factorize(keys)
+    return row_codes, [item_values[np.frombuffer(key, dtype=np.int32)].tolist() for key in distinct_keys]
+
+
+def _take_cells(cells, row_codes, missing):
+    distinct_cells = np.empty(len(cells) + 1, dtype=object)
+    for code, cell in enumerate(cells):
+        distinct_cells[code] = cell
+    distinct_cells[-1] = missing
+    return distinct_cells[row_codes]
+
+
+def read_study_table(path, columns=None, list_strings=False) -> pd.DataFrame:
+    """
+    Reads the study table indexed by the focus nodes, with the violation counts as unsigned integers, the list columns
+    as lists of strings and the other string columns as categoricals. Rows with the same list share one list object, so
+    copy a list before changing it.
+
+    Args:
+        path (str): The Parquet file written by write_study_table.
+        columns (List[str], optional): The columns to read, all by default. Only these are read from the file, besides
+            focus_node for the index, which is only a column of the result if it is asked for.
+        list_strings (bool): Whether to return the list cells in the string form study.csv stores them in, for code
+            that parses them from there.
+
+    Returns:
+        pd.DataFrame: The study table.
+    """
+    read_columns = None if columns is None else list(dict.fromkeys([FOCUS_NODE_COLUMN, *columns]))
+    table = pq.read_table(path, columns=read_columns)
+    list_columns = set(_metadata_columns(table.schema, LIST_COLUMNS_KEY))
+    index = pd.Index(table.column(FOCUS_NODE_COLUMN).to_numpy(), dtype=object)
+    data = {}
+    for name in table.column_names:
+        if name == FOCUS_NODE_COLUMN and columns is not None and FOCUS_NODE_COLUMN not in columns:
+            continue
+        if name in list_columns:
+            row_codes, cells = _list_cell_codes(table.column(name).combine_chunks())
+            # every distinct cell is converted once, the rows take them by their codes
+            if list_strings:
+                data[name] = pd.Series(_take_cells([str(cell) for cell in cells], row_codes, np.nan), index=index)
+            else:
+                data[name] = pd.Series(_take_cells(cells, row_codes, None), index=index)
+            continue
+        data[name] = table.column(name).to_pandas().set_axis(index)
+    return pd.DataFrame(data, index=index)
@@ -0,0 +1,341 @@
+"""This module implements the term dictionary that gives every IRI of a dataset one integer id, and the maps stored as ids."""
+# term_dictionary.py
+import bisect
+
+import numpy as np
+from rdflib.term import Identifier, URIRef
+from rdflib.util import from_n3
+
+from bikg_app.routers.namespace_shortener import NamespaceShortener
+from bikg_app.routers.snapshot import StringTable
+
+# the kinds of terms: strings (IRIs and other keys such as "predicate__object"), rdflib literals and blank nodes, and
+# names, strings that are their own QName such as focus nodes whose IRI the bound namespaces cannot restore
+STRING = 0
+RDF_TERM = 1
+NAME = 2
+
+
+def _key(term):
+    # a URIRef is not equal to its str, so IRIs are kept as str to get one id whether they come from a graph or a JSON file
+    if isinstance(term, URIRef):
+        return str(term)
+    return term
+
+
+def _kind(key):
+    return RDF_TERM if isinstance(key, Identifier) else STRING
+
+
+def _from_stored(kind, string):
+    # the inverse of the strings of to_strings
+    if kind != RDF_TERM:
+        return string
+    term = from_n3(string)
+    if term is None:
+        raise ValueError(f"{string!r} is not the N3 of an rdflib term")
+    return term
+
+
+def _stored_key(kind, key) -> tuple:
+    # the order of search_order: by kind, then by the utf-8 bytes of the stored string
+    return kind, (key.n3() if kind == RDF_TERM else key).encode("utf-8")
+
+
+def search_order(kinds, strings) -> np.ndarray:
+    """Returns the ids of the terms of to_strings sorted by kind and string, the order from_tables binary-searches."""
+    keys = [(kind, string.encode("utf-8")) for kind, string in zip(np.asarray(kinds).tolist(), strings, strict=True)]
+    return np.array(sorted(range(len(keys)), key=keys.__getitem__), dtype=np.int32)
+
+
+class TermDictionary:
+    """
+    Assigns every distinct term of a dataset a dense int32 id, so the exemplar maps, the focus nodes of the study table
+    and the ontology graph refer to one copy of each IRI instead of holding their own strings. The QName and the
+    shortened form of a term are computed once, the first time they are needed, and cached alongside it, so endpoints
+    decode ids to labels with list lookups.
+
+    Terms are only added while the dataset is loaded, afterwards the dictionary is read-only except for these caches.
+    A dictionary restored with from_tables decodes its terms one at a time when they are first used.
+    """
+
+    def __init__(self, shortener: NamespaceShortener | None = None):
+        """
+        Args:
+            shortener (NamespaceShortener, optional): Computes the QNames and the shortened forms of the IRIs.
+        """
+        self.shortener = shortener
+        self._terms: list = []
+        self._kinds = bytearray()
+        self._ids = {}
+        # names are looked up apart from the other terms, a name may equal the string of an unrelated term
+        self._name_ids = {}
+        self._qnames: list = []
+        self._shortened: list = []
+        # the string tables and the search order of from_tables, None if every term is held in the lists
+        self._tables: tuple[StringTable, StringTable, np.ndarray, np.ndarray] | None = None
+
+    def __len__(self):
+        return len(self._terms)
+
+    def __contains__(self, term):
+        key = _key(term)
+        return self._find(key, _kind(key)) is not None
+
+    def _find(self, key, kind):
+        term_id = (self._name_ids if kind == NAME else self._ids).get(key)
+        if term_id is None and self._tables is not None:
+            term_id = self._stored_id(self._tables, kind, key)
+        return term_id
+
+    def _stored_id(self, tables, kind, key):
+        strings, _, _, order = tables
+        target = _stored_key(kind, key)
+        position = bisect.bisect_left(order, target, key=lambda term_id: (self._kinds[term_id], strings.raw(term_id)))
+        if position == len(order):
+            return None
+        term_id = int(order[position])
+        if (self._kinds[term_id], strings.raw(term_id)) != target:
+            return None
+        (self._name_ids if kind == NAME else self._ids)[key] = term_id
+        return term_id
+
+    def _add(self, key, kind):
+        term_id = len(self._terms)
+        if kind == NAME:
+            self._name_ids[key] = term_id
+        else:
+            self._ids[key] = term_id
+        if not isinstance(self._kinds, bytearray):
+            self._kinds = bytearray(np.asarray(self._kinds, dtype=np.uint8).tobytes())
+        self._terms.append(key)
+        self._kinds.append(kind)
+        self._qnames.append(key if kind == NAME else None)
+        self._shortened.append(None)
+        return term_id
+
+    def add(self, term) -> int:
+        """Returns the id of term, the next free id if it is new."""
+        key = _key(term)
+        kind = _kind(key)
+        term_id = self._find(key, kind)
+        if term_id is None:
+            term_id = self._add(key, kind)
+        return term_id
+
+    def add_many(self, terms) -> np.ndarray:
+        """Returns the ids of terms as an int32 array, see add."""
+        return np.fromiter((self.add(term) for term in terms), dtype=np.int32)
+
+    def add_qnames(self, qnames) -> np.ndarray:
+        """
+        Returns the ids of the IRIs that QNames such as the focus nodes of the study table stand for, and caches the given
+        strings as their QNames. A QName that the shortener cannot expand into an IRI whose QName it is gets an id of its
+        own, as a name.
+        """
+        return np.fromiter((self._qname_id(qname) for qname in qnames), dtype=np.int32, count=len(qnames))
+
+    def _require_shortener(self) -> NamespaceShortener:
+        if self.shortener is None:
+            raise ValueError("The term dictionary has no shortener to compute QNames with")
+        return self.shortener
+
+    def _qname_id(self, qname):
+        term_id = self._find(qname, NAME)
+        if term_id is not None:
+            return term_id
+        shortener = self._require_shortener()
+        try:
+            iri = shortener.expand(qname, memoize=False)
+        except ValueError:
+            iri = None
+        if iri is not None:
+            term_id = self._find(iri, STRING)
+            if term_id is not None and self.qname(term_id) == qname:
+                return term_id
+            if term_id is None and shortener.bound_qname(iri) == qname:
+                term_id = self.add(iri)
+                self._qnames[term_id] = qname
+                return term_id
+        return self._add(qname, NAME)
+
+    def id(self, term) -> int:
+        """
+        Returns the id of term.
+
+        Raises:
+            KeyError: If term is not in the dictionary.
+        """
+        key = _key(term)
+        term_id = self._find(key, _kind(key))
+        if term_id is None:
+            raise KeyError(term)
+        return term_id
+
+    def term(self, term_id):
+        """Returns the term of an id, a str for IRIs and an rdflib term for literals and blank nodes."""
+        term = self._terms[term_id]
+        if term is None:
+            # only the terms of from_tables are missing from the list, they are decoded on first use
+            if self._tables is None:
+                raise KeyError(term_id)
+            term = self._terms[term_id] = _from_stored(self._kinds[term_id], self._tables[0][term_id])
+        return term
+
+    def terms(self, ids) -> list:
+        """Returns the terms of ids."""
+        return [self.term(term_id) for term_id in np.asarray(ids).tolist()]
+
+    def rdf_term(self, term_id):
+        """Returns the term of an id as an rdflib term, IRIs as URIRef."""
+        term = self.term(term_id)
+        return term if self._kinds[term_id] == RDF_TERM else URIRef(str(term))
+
+    def _cached_qname(self, term_id):
+        qname = self._qnames[term_id]
+        if qname is None and self._tables is not None:
+            _, qnames, has_qname, _ = self._tables
+            # terms added after the restore are not in the tables
+            if term_id < len(has_qname) and has_qname[term_id]:
+                qname = self._qnames[term_id] = qnames[term_id]
+        return qname
+
+    def qname(self, term_id) -> str:
+        """
+        Returns the QName of the term as uri_to_qname would: IRIs the shortener cannot split stay unchanged, literals and
+        blank nodes are returned as their string, names as they are.
+        """
+        qname = self._cached_qname(term_id)
+        if qname is None:
+            term = self.term(term_id)
+            if self._kinds[term_id] == RDF_TERM:
+                qname = str(term)
+            else:
+                shortener = self._require_shortener()
+                try:
+                    qname = shortener.qname(term, memoize=False)
+                except ValueError:
+                    qname = str(term)
+            self._qnames[term_id] = qname
+        return qname
+
+    def qnames(self, ids) -> list:
+        """Returns the QNames of ids, see qname."""
+        return [self.qname(term_id) for term_id in np.asarray(ids).tolist()]
+
+    def shortened(self, term_id) -> str:
+        """Returns the term with its bound namespaces replaced by their prefixes, see NamespaceShortener.shorten."""
+        shortened = self._shortened[term_id]
+        if shortened is None:
+            term = self.term(term_id)
+            shortened = str(term) if self._kinds[term_id] == RDF_TERM else self._require_shortener().shorten(str(term), memoize=False)
+            self._shortened[term_id] = shortened
+        return shortened
+
+    def shortened_terms(self, ids) -> list:
+        """Returns the shortened forms of ids, see shortened."""
+        return [self.shortened(term_id) for term_id in np.asarray(ids).tolist()]
+
+    def to_strings(self):
+        """
+        Returns the kind of every term as a uint8 array, the terms as strings (N3 for the rdflib terms) and the cached
+        QNames, None for the terms whose QName was not needed yet.
+        """
+        terms = [self.term(term_id) for term_id in range(len(self))]
+        strings = [term.n3() if kind == RDF_TERM else term for term, kind in zip(terms, self._kinds, strict=True)]
+        qnames = [self._cached_qname(term_id) for term_id in range(len(self))]
+        return np.frombuffer(bytes(self._kinds), dtype=np.uint8), strings, qnames
+
+    @classmethod
+    def from_strings(cls, kinds, strings, qnames=None, shortener=None) -> "TermDictionary":
+        """Inverse of to_strings, the ids and the cached QNames stay the same."""
+        terms = cls(shortener)
+        for kind, string in zip(np.asarray(kinds).tolist(), strings, strict=True):
+            terms._add(_from_stored(kind, string), kind)
+        if qnames is not None:
+            terms._qnames = list(qnames)
+        return terms
+
+    @classmethod
+    def from_tables(cls, kinds, strings, qnames, has_qname, order, shortener=None) -> "TermDictionary":
+        """
+        Inverse of to_strings without decoding anything up front, for the arrays of a memory-mapped snapshot. A term and
+        its cached QName are decoded when they are first used, and ids are found by binary search in order.
+
+        Args:
+            kinds (np.ndarray): The kinds of to_strings.
+            strings (StringTable): The strings of to_strings.
+            qnames (StringTable): The cached QNames of to_strings, any string for the terms without one.
+            has_qname (np.ndarray): Whether the term has a cached QName.
+            order (np.ndarray): The search_order of kinds and strings.
+            shortener (NamespaceShortener, optional): See __init__.
+        """
+        terms = cls(shortener)
+        terms._terms = [None] * len(kinds)
+        terms._kinds = kinds
+        terms._qnames = [None] * len(kinds)
+        terms._shortened = [None] * len(kinds)
+        terms._tables = (strings, qnames, has_qname, order)
+        return terms
+
+
+class TermList:
+    """The terms of an array of ids as a read-only sequence, each one looked up in the dictionary when it is accessed."""
+
+    __slots__ = ("terms", "ids")
+
+    def __init__(self, terms: TermDictionary, ids):
+        self.terms = terms
+        self.ids = ids
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, index):
+        return self.terms.term(int(self.ids[index]))
+
+
+class TermMap:
+    """
+    A {term: [term, ...]} or {term: {term: count}} dictionary as arrays of term ids in offset-array form: the values of
+    keys[i] are values[offsets[i] : offsets[i + 1]] and, for counted maps, their counts the same slice of counts.
+    Keys keep the order of the dictionary the map was built from.
+    """
+
+    __slots__ = ("keys", "offsets", "values", "counts")
+
+    def __init__(self, keys, offsets, values, counts=None):
+        self.keys = np.asarray(keys, dtype=np.int32)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.values = np.asarray(values, dtype=np.int32)
+        self.counts = None if counts is None else np.asarray(counts, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.keys)
+
+    @classmethod
+    def from_dict(cls, d, terms: TermDictionary) -> "TermMap":
+        """Adds the terms of d to terms and returns d as ids, d's inner values are either lists or {term: count} dicts."""
+        offsets = np.zeros(len(d) + 1, dtype=np.int64)
+        np.cumsum([len(inner) for inner in d.values()], out=offsets[1:])
+        keys = terms.add_many(d)
+        values = terms.add_many(value for inner in d.values() for value in inner)
+        counted = any(isinstance(inner, dict) for inner in d.values())
+        counts = np.fromiter((count for inner in d.values() for count in inner.values()), dtype=np.int64) if counted else None
+        return cls(keys, offsets, values, counts)
+
+    def to_dict(self, label) -> dict:
+        """
+        Decodes the map with label(term id) for its keys and values, e.g. TermDictionary.qname, into the dictionary it was
+        built from. Keys with the same label are merged like dict assignment does, the last one wins.
+        """
+        keys = [label(key) for key in self.keys.tolist()]
+        values = [label(value) for value in self.values.tolist()]
+        bounds = self.offsets.tolist()
+        if self.counts is None:
+            return {key: values[start:stop] for key, start, stop in zip(keys, bounds[:-1], bounds[1:], strict=True)}
+        counts = self.counts.tolist()
+        return {
+            key: dict(zip(values[start:stop], counts[start:stop], strict=True))
+            for key, start, stop in zip(keys, bounds[:-1], bounds[1:], strict=True)
+        }
@@ -0,0 +1,145 @@
+"""This module implements the read-only triple store the ontology graph is served from, sorted arrays of term ids."""
+# triple_store.py
+import numpy as np
+from rdflib import Graph
+
+from bikg_app.routers.term_dictionary import TermDictionary
+
+# the (subject, predicate, object) positions of the columns of each permutation
+SPO = (0, 1, 2)
+POS = (1, 2, 0)
+OSP = (2, 0, 1)
+
+
+def _sorted_permutation(triples: np.ndarray, columns) -> np.ndarray:
+    permuted = triples[:, list(columns)]
+    order = np.lexsort((permuted[:, 2], permuted[:, 1], permuted[:, 0]))
+    # one contiguous row per column, so the binary searches run on the column itself and not on a strided copy of it
+    return np.ascontiguousarray(permuted[order].T)
+
+
+def _unique(values):
+    return list(dict.fromkeys(values))
+
+
+class TripleStore:
+    """
+    A read-only graph of (subject, predicate, object) term ids of a TermDictionary, held in three sorted permutations
+    (SPO, POS and OSP) of 3 x n int32 arrays. Every triple pattern is answered from the permutation whose leading
+    columns are the bound terms, with one binary search per bound term, and costs 36 bytes per triple instead of the
+    dict entries of an rdflib Memory store.
+
+    It has the part of the rdflib Graph API the dataset uses: triples() and the subjects(), predicates(), objects() and
+    subject_objects() patterns, membership tests, iteration and the namespace bindings. Matches are returned in the
+    order of the term ids.
+    """
+
+    def __init__(self, terms: TermDictionary, spo, pos, osp, namespaces=()):
+        """
+        Args:
+            terms (TermDictionary): The dictionary of the term ids.
+            spo, pos, osp (np.ndarray): The permutations of from_triples, their rows are the columns of the permutation.
+            namespaces (Iterable[Tuple[str, str]]): The (prefix, namespace) bindings of the graph.
+        """
+        self.terms = terms
+        self.spo = spo
+        self.pos = pos
+        self.osp = osp
+        self._namespaces = [(str(prefix), str(namespace)) for prefix, namespace in namespaces]
+        # a graph without triples holds the bindings, its namespace manager computes the QNames of unbound IRIs
+        self.namespace_manager = Graph().namespace_manager
+        for prefix, namespace in self._namespaces:
+            self.namespace_manager.bind(prefix, namespace, override=True, replace=True)
+
+    @classmethod
+    def from_triples(cls, terms: TermDictionary, triples, namespaces=()) -> "TripleStore":
+        """Builds the store from an (n, 3) array of term ids, duplicate triples are stored once."""
+        triples = np.unique(np.asarray(triples, dtype=np.int32).reshape(-1, 3), axis=0)
+        return cls(terms, *(_sorted_permutation(triples, columns) for columns in (SPO, POS, OSP)), namespaces=namespaces)
+
+    @classmethod
+    def from_graph(cls, graph: Graph, terms: TermDictionary) -> "TripleStore":
+        """
+        Adds the terms of an rdflib graph to terms and returns the store of its triples and bindings. The new terms are
+        added in the order of their N3 form, so their ids, and with them the order of the matches, do not depend on the
+        order rdflib happens to store the triples in, which varies with the hash seed.
+        """
+        graph_triples: list = list(graph)
+        terms.add_many(sorted({term for triple in graph_triples for term in triple}, key=lambda term: term.n3()))
+        triples = terms.add_many(term for triple in graph_triples for term in triple).reshape(-1, 3)
+        return cls.from_triples(terms, triples, graph.namespaces())
+
+    def __len__(self):
+        return self.spo.shape[1]
+
+    def _term_id(self, term):
+        if term is None:
+            return None
+        try:
+            return self.terms.id(term)
+        except KeyError:
+            # no triple has the id -1, so the pattern matches nothing
+            return -1
+
+    def match(self, s=None, p=None, o=None) -> np.ndarray:
+        """
+        Returns the (subject, predicate, object) ids of the triples that match a pattern of term ids, None matching any
+        id, as a 3 x k array.
+        """
+        if s is not None:
+            index, keys = (self.osp, (o, s)) if p is None and o is not None else (self.spo, (s, p, o))
+        elif p is not None:
+            index, keys = self.pos, (p, o)
+        elif o is not None:
+            index, keys = self.osp, (o,)
+        else:
+            index, keys = self.spo, ()
+        columns = SPO if index is self.spo else POS if index is self.pos else OSP
+        start, stop = 0, index.shape[1]
+        for row, key in enumerate(keys):
+            if key is None:
+                break
+            values = index[row, start:stop]
+            start, stop = start + int(np.searchsorted(values, key, "left")), start + int(np.searchsorted(values, key, "right"))
+        matches = index[:, start:stop]
+        return matches[[columns.index(position) for position in range(3)]]
+
+    def triples(self, pattern):
+        """Yields the (subject, predicate, object) rdflib terms of the triples that match a pattern, None matching any term."""
+        rdf_term = self.terms.rdf_term
+        for s, p, o in self.match(*(self._term_id(term) for term in pattern)).T.tolist():
+            yield rdf_term(s), rdf_term(p), rdf_term(o)
+
+    def __iter__(self):
+        return self.triples((None, None, None))
+
+    def __contains__(self, triple):
+        return self.match(*(self._term_id(term) for term in triple)).shape[1] > 0
+
+    def _terms_at(self, position, pattern, unique):
+        ids = self.match(*(self._term_id(term) for term in pattern))[position].tolist()
+        return map(self.terms.rdf_term, _unique(ids) if unique else ids)
+
+    def subjects(self, predicate=None, object=None, unique=False):
+        return self._terms_at(0, (None, predicate, object), unique)
+
+    def predicates(self, subject=None, object=None, unique=False):
+        return self._terms_at(1, (subject, None, object), unique)
+
+    def objects(self, subject=None, predicate=None, unique=False):
+        return self._terms_at(2, (subject, predicate, None), unique)
+
+    def subject_objects(self, predicate=None, unique=False):
+        matches = self.match(p=self._term_id(predicate))[[0, 2]].T.tolist()
+        pairs = _unique(map(tuple, matches)) if unique else matches
+        rdf_term = self.terms.rdf_term
+        return ((rdf_term(s), rdf_term(o)) for s, o in pairs)
+
+    def namespaces(self):
+        """Returns the (prefix, namespace) bindings the store was built with, then those compute_qname bound since."""
+        bindings = list(self._namespaces)
+        known = set(bindings)
+        bindings += [
+            (prefix, str(namespace)) for prefix, namespace in self.namespace_manager.namespaces() if (prefix, str(namespace)) not in known
+        ]
+        return bindings
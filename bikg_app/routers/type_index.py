@@ -0,0 +1,98 @@
+"""This module implements the read-only index from the types in the rdf:type column of the study table to their rows."""
+# type_index.py
+import numpy as np
+import pandas as pd
+
+from bikg_app.routers.study_records import parse_list_cell
+
+
+def _read_only(array) -> np.ndarray:
+    array = np.asarray(array)
+    if array.flags.writeable:
+        array = array.view()
+        array.setflags(write=False)
+    return array
+
+
+class TypeIndex:
+    """
+    Compressed sparse row index of the rdf:type column: the rows that list types[t] are rows[offsets[t] : offsets[t + 1]].
+    Types are numbered in order of their first appearance, the order of df["rdf:type"].explode().unique().
+    A row that lists a type twice occurs twice in its row list, so the counts match those of the exploded column.
+    The arrays are read-only, the index is shared by all requests.
+    """
+
+    def __init__(self, types, offsets, rows, n_rows):
+        """
+        Args:
+            types (List[str]): The distinct types.
+            offsets (np.ndarray): len(types) + 1 offsets into rows.
+            rows (np.ndarray): The row positions of each type, sorted per type.
+            n_rows (int): The number of rows of the study table.
+        """
+        self.types = list(types)
+        self.offsets = _read_only(offsets)
+        self.rows = _read_only(rows)
+        self.n_rows = n_rows
+        self._codes = {type_: code for code, type_ in enumerate(self.types)}
+
+    @classmethod
+    def from_column(cls, column):
+        """
+        Builds the index from the rdf:type column, whose cells are string representations of lists such as "['lotr:Character']".
+        Every distinct cell is parsed once; cells that are not lists count as a single type, missing cells as no type.
+        """
+        cell_codes, cells = pd.factorize(column)
+        type_codes = {}
+        cell_types = []
+        for cell in cells.tolist():
+            parsed = parse_list_cell(cell)
+            items = parsed if isinstance(parsed, list) else [parsed]
+            cell_types.append([type_codes.setdefault(item, len(type_codes)) for item in items])
+
+        # expand the type codes of every row's cell into (row, type code) pairs without a Python loop over the rows
+        cell_lengths = np.array([len(items) for items in cell_types] + [0], dtype=np.int64)
+        cell_offsets = np.zeros(len(cell_lengths) + 1, dtype=np.int64)
+        np.cumsum(cell_lengths, out=cell_offsets[1:])
+        flat_cell_types = np.array([code for items in cell_types for code in items], dtype=np.int64)
+        cell_codes = np.where(cell_codes < 0, len(cell_types), cell_codes)  # missing cells point to the empty sentinel cell
+        lengths = cell_lengths[cell_codes]
+        item_rows = np.repeat(np.arange(len(column), dtype=np.int64), lengths)
+        row_starts = np.cumsum(lengths) - lengths
+        item_types = flat_cell_types[np.repeat(cell_offsets[cell_codes] - row_starts, lengths) + np.arange(int(lengths.sum()))]
+
+        order = np.argsort(item_types, kind="stable")
+        offsets = np.zeros(len(type_codes) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(item_types, minlength=len(type_codes)), out=offsets[1:])
+        return cls(list(type_codes), offsets, item_rows[order].astype(np.int32), len(column))
+
+    def __contains__(self, type_):
+        return type_ in self._codes
+
+    def rows_of(self, type_) -> np.ndarray:
+        """Returns the positions of the rows that list type_, empty for unknown types."""
+        code = self._codes.get(type_)
+        if code is None:
+            return self.rows[:0]
+        return self.rows[self.offsets[code] : self.offsets[code + 1]]
+
+    def counts(self) -> np.ndarray:
+        """Returns the number of rows of each type, aligned with types."""
+        return np.diff(self.offsets)
+
+    def type_count_dict(self) -> dict:
+        """Returns {type: count} ordered like df["rdf:type"].explode().value_counts()."""
+        return pd.Series(self.counts(), index=pd.Index(self.types, dtype=object)).sort_values(ascending=False).to_dict()
+
+    def column_sums(self, values: np.ndarray) -> np.ndarray:
+        """
+        Sums a (rows x columns) array over the rows of every type.
+
+        Returns:
+            np.ndarray: A (types x columns) array.
+        """
+        sums = np.zeros((len(self.types), values.shape[1]), dtype=values.dtype)
+        non_empty = np.flatnonzero(np.diff(self.offsets))
+        if len(non_empty):
+            sums[non_empty] = np.add.reduceat(values[self.rows], self.offsets[non_empty], axis=0)
+        return sums
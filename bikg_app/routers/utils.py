@@ -1,14 +1,21 @@
 """This module is a collection of utility functions used by the API endpoints."""
 # utils.py
+import heapq
 import json
+import logging
+import multiprocessing
 import sys
-from collections import defaultdict
+import threading
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
 
 import numpy as np
 from rdflib import RDF, Namespace, URIRef
 from rdflib.namespace import split_uri
 from tqdm.auto import tqdm
 
+from bikg_app.routers.namespace_stats import add_triple
+
 if "ipykernel" in sys.modules:
     from tqdm.notebook import tqdm as tqdm_notebook
 
@@ -16,6 +23,22 @@ if "ipykernel" in sys.modules:
 else:
     TQDMInstance = tqdm
 
+_log = logging.getLogger(__name__)
+
+# TODO define these in a constants file or have them be defined at the top of the preprocessing notebook
+SH = Namespace("http://www.w3.org/ns/shacl#")
+DCTERMS = Namespace("http://purl.org/dc/terms/")
+EX = Namespace("http://example.com/exemplar#")
+
+# predicates of the validation results that are not part of their exemplars
+EXEMPLAR_IGNORED_EDGES = frozenset(
+    {
+        DCTERMS.date,
+        SH.focusNode,
+        URIRef("http://rdfunit.aksw.org/ns/core#testCase"),
+    }
+)
+
 
 def get_symmetric_graph_matrix(graph):
     """Returns a symmetric adjacency matrix for a given rdflib graph.
@@ -172,133 +195,323 @@ def copy_namespaces(source_g, target_g):
         target_g.namespace_manager.bind(prefix, ns)
 
 
-def get_violation_report_exemplars(ontology_g, violation_report_g, study_g):
+def bind_exemplar_namespaces(g):
+    """Binds the prefixes of the exemplar graph, dcterms, sh and ex, in g."""
+    g.namespace_manager.bind("dcterms", DCTERMS)
+    g.namespace_manager.bind("sh", SH)
+    g.namespace_manager.bind("ex", EX)
+
+
+def exemplar_name(shape, number):
     """
-    Generates and returns violation report exemplars based on ontology and violation graphs.
+    Returns the URI of the number-th exemplar, named after the local name of the shape of its first validation result.
+
+    Raises:
+        ValueError: If the shape is not a URI with a local name.
+    """
+    # Use rdflib's split_uri to extract localname
+    try:
+        namespace, localname = split_uri(str(shape))
+    except ValueError as err:
+        raise ValueError(f"Could not split URI {shape}") from err
+    return URIRef(f"{EX}{localname}_exemplar_{number}")
 
-    This function generates exemplars for the ontology graph based on the violations
-    found in the violation report graph. It also counts edge-object pairs and keeps
-    track of focus nodes and their related exemplars.
+
+def validation_result_from_pairs(predicate_objects, ignored_edges=EXEMPLAR_IGNORED_EDGES):
+    """
+    Splits the predicate-object pairs of one validation result into its focus node, its source shape and the pairs
+    that make up its exemplar.
 
     Args:
-        ontology_g (rdflib.Graph): The ontology graph.
-        violation_report_g (rdflib.Graph): The graph containing violation reports.
-        study_g (rdflib.Graph): The instance data graph, used to add the one hop locatoin of all sh_value objects.
+        predicate_objects (Iterable[Tuple[Node, Node]]): The predicate-object pairs of the validation result.
+        ignored_edges (Set[URIRef]): Predicates that are not part of the exemplars, such as sh:focusNode.
 
     Returns:
-        tuple: A 4-tuple containing the updated ontology graph, a dictionary of
-        edge counts, a dictionary mapping focus nodes to exemplars, and a dictionary
-        mapping exemplars to focus nodes.
+        tuple: (focus node, source shape, list of the (predicate, object) pairs that are not ignored), the source shape
+        is "" if the result has none.
+    """
+    edge_object_pairs = []
+    shape = ""
+    focus_node = None
+    for p, o in predicate_objects:
+        if p == SH.focusNode:
+            focus_node = o
+        if p == SH.sourceShape:
+            shape = o
+        elif p in ignored_edges:
+            continue
+        edge_object_pairs.append((p, o))
+    return focus_node, shape, edge_object_pairs
+
+
+def read_validation_result(violation_report_g, validation_result, ignored_edges=EXEMPLAR_IGNORED_EDGES):
+    """Reads the predicate-object pairs of one validation result from the graph's subject index, see validation_result_from_pairs."""
+    return validation_result_from_pairs(violation_report_g.predicate_objects(validation_result), ignored_edges)
+
+
+def iter_validation_results(violation_report_g, ignored_edges=EXEMPLAR_IGNORED_EDGES):
+    """
+    Yields the validation results of a violation report in one pass over its triples, reading each result's
+    predicate-object pairs from the graph's subject index instead of running a query per result.
 
-    TODO:
-        - Instead of counting the edge-object pairs, consider counting the exemplar occurrences.
-        - Keep track of ignored edges as well.
+    Yields:
+        tuple: (focus node, source shape, list of the (predicate, object) pairs that are not ignored), see validation_result_from_pairs.
     """
-    # TODO define these in a constants file or have them be defined at the top of the preprocessing notebook
-    sh = Namespace("http://www.w3.org/ns/shacl#")
-    dcterms = Namespace("http://purl.org/dc/terms/")
-    ex = Namespace("http://example.com/exemplar#")
-    ontology_g.namespace_manager.bind("dcterms", dcterms)
-    ontology_g.namespace_manager.bind("sh", sh)
-    ontology_g.namespace_manager.bind("ex", ex)
-    violation_report_g.namespace_manager.bind("dcterms", dcterms)
-    violation_report_g.namespace_manager.bind("sh", sh)
-    violation_report_g.namespace_manager.bind("ex", ex)
+    for validation_result in violation_report_g.subjects(RDF.type, SH.ValidationResult):
+        yield read_validation_result(violation_report_g, validation_result, ignored_edges)
 
-    copy_namespaces(violation_report_g, ontology_g)
 
-    # TODO - this could also be defined as a constant or at the top of the preprocessing notebook
-    violations_query = """
-    SELECT ?violation ?p ?o WHERE {
-        ?violation a sh:ValidationResult .
-        }
+class ExemplarBuilder:
+    """
+    Groups validation results with the same edge-object pairs into exemplars and adds the exemplars to the ontology
+    graph, one validation result at a time, numbering the exemplars in the order of their first validation result.
+
+    Only the exemplars and the dictionaries of get_violation_report_exemplars are kept, not the validation results,
+    so the results can be streamed from a file that does not fit into memory.
+    """
+
+    def __init__(self, ontology_g, study_g=None, namespace_stats=None):
+        """
+        Args:
+            ontology_g (rdflib.Graph): The ontology graph the exemplars are added to.
+            study_g (rdflib.Graph, optional): The instance data graph, used to add the one hop locatoin of all sh_value objects.
+            namespace_stats (NamespaceStats, optional): Statistics of ontology_g, kept up to date with the exemplar triples added to it.
         """
-    validation_results = [row[0] for row in violation_report_g.query(violations_query)]  # type: ignore
+        self.ontology_g = ontology_g
+        self.study_g = study_g
+        self.namespace_stats = namespace_stats
+        self.exemplar_sets = {}
+        self.edge_count_dict = defaultdict(lambda: defaultdict(int))
+        self.focus_node_exemplar_dict = defaultdict(set)
+        self.exemplar_focus_node_dict = defaultdict(set)
+        self.violation_exemplar_dict = defaultdict(lambda: defaultdict(int))  # New dictionary to keep track of violation-exemplar pairs
+
+    def add(self, focus_node, shape, edge_object_pairs):
+        """Adds one validation result, creating its exemplar if no earlier result had the same edge-object pairs."""
+        key = frozenset(edge_object_pairs)
+        exemplar = self.exemplar_sets.get(key)
+        if exemplar is None:
+            exemplar = self.exemplar_sets[key] = exemplar_name(shape, len(self.exemplar_sets) + 1)
+        self.assign(focus_node, shape, exemplar)
+        process_edge_object_pairs(
+            self.ontology_g, self.study_g, SH, self.edge_count_dict, edge_object_pairs, exemplar, self.namespace_stats
+        )
+
+    def assign(self, focus_node, shape, exemplar):
+        """Records that a validation result of shape with focus_node is an instance of exemplar."""
+        self.focus_node_exemplar_dict[focus_node].add(exemplar)
+        self.exemplar_focus_node_dict[exemplar].add(focus_node)
+        self.violation_exemplar_dict[shape][
+            exemplar
+        ] += 1  # Updating the new dictionary to associate the violation with the exemplar and count
 
-    edge_count_dict = defaultdict(lambda: defaultdict(int))
-    focus_node_exemplar_dict = defaultdict(set)
-    exemplar_focus_node_dict = defaultdict(set)
-    violation_exemplar_dict = defaultdict(lambda: defaultdict(int))  # New dictionary to keep track of violation-exemplar pairs
+    def result(self):
+        """Returns the 5-tuple of get_violation_report_exemplars."""
+        return (
+            self.ontology_g,
+            self.edge_count_dict,
+            self.focus_node_exemplar_dict,
+            self.exemplar_focus_node_dict,
+            self.violation_exemplar_dict,
+        )
 
-    # TODO - can also be defined as constant or on top of preprocessing notebook
-    ignored_edges = {
-        dcterms.date,
-        sh.focusNode,
-        URIRef("http://rdfunit.aksw.org/ns/core#testCase"),
-    }
 
-    exemplar_sets = {}
+def collect_exemplars(validation_results):
+    """
+    Groups validation results with the same edge-object pairs into exemplars.
 
-    for validation_result in TQDMInstance(validation_results, desc="Processing violations"):
-        violations_query = f"""
-            SELECT ?s ?p ?o WHERE {{
-                <{validation_result}> ?p ?o.
-            }}
-        """
+    Args:
+        validation_results (Iterable[tuple]): (index, focus node, source shape, edge-object pairs) of the validation results,
+            in increasing index order.
 
-        edge_object_pairs = []
-        shape = ""
-        current_focus_node = None
-        for row in violation_report_g.query(violations_query):
-            _, p, o = row  # type: ignore
-            if p == sh.focusNode:
-                current_focus_node = o
-            if p == sh.sourceShape:
-                shape = o
-            elif p in ignored_edges:
-                continue
-            edge_object_pairs.append((p, o))
-
-        exemplar_name = exemplar_sets.get(frozenset(edge_object_pairs))
-        print(f"Exemplar name: {exemplar_name}")
-
-        if exemplar_name is None:
-            print(f"Creating new exemplar for {shape}")
-            # Use rdflib's split_uri to extract localname
-            try:
-                namespace, localname = split_uri(str(shape))
-            except ValueError as err:
-                raise ValueError(f"Could not split URI {shape}") from err
-
-            exemplar_name = URIRef(f"{ex}{localname}_exemplar_{len(exemplar_sets)+1}")
-            print(f"Exemplar name: {exemplar_name}")
-            exemplar_sets[frozenset(edge_object_pairs)] = exemplar_name
-
-        focus_node_exemplar_dict[current_focus_node].add(exemplar_name)
-        exemplar_focus_node_dict[exemplar_name].add(current_focus_node)
-        violation_exemplar_dict[shape][
-            exemplar_name
-        ] += 1  # Updating the new dictionary to associate the violation with the exemplar and count
+    Returns:
+        tuple: The exemplars as a list of (index of their first validation result, source shape, edge-object pairs), in
+        the order they were found, and the validation results as a list of (index, focus node, position of their exemplar).
+    """
+    exemplar_positions = {}
+    exemplars = []
+    assignments = []
+    for index, focus_node, shape, edge_object_pairs in validation_results:
+        key = frozenset(edge_object_pairs)
+        position = exemplar_positions.get(key)
+        if position is None:
+            position = exemplar_positions[key] = len(exemplars)
+            exemplars.append((index, shape, edge_object_pairs))
+        assignments.append((index, focus_node, position))
+    return exemplars, assignments
+
+
+# the violation report, ignored edges and shards of the running parallel extraction, inherited by the forked workers
+# instead of being pickled; the lock keeps two extractions from replacing each other's context
+_shard_context = None
+_shard_context_lock = threading.Lock()
+
+
+def _collect_shard_exemplars(shard):
+    if _shard_context is None:
+        raise RuntimeError("The shards are only collected by the workers of a running parallel extraction")
+    violation_report_g, ignored_edges, shards = _shard_context
+    return collect_exemplars(
+        (index, *read_validation_result(violation_report_g, validation_result, ignored_edges)) for index, validation_result in shards[shard]
+    )
 
-        process_edge_object_pairs(ontology_g, study_g, sh, edge_count_dict, edge_object_pairs, exemplar_name)
 
-    return (
-        ontology_g,
-        edge_count_dict,
-        focus_node_exemplar_dict,
-        exemplar_focus_node_dict,
-        violation_exemplar_dict,
+def shard_validation_results(violation_report_g, n_shards):
+    """
+    Splits the validation results of a violation report into shards by their source shape, so results that can share
+    an exemplar always end up in the same shard. Shapes are assigned largest first to the shard with the fewest results.
+
+    Returns:
+        List[List[Tuple[int, URIRef]]]: The (index, validation result) pairs of every shard, the index being the
+        position of the result in the serial iteration order.
+    """
+    validation_results = list(violation_report_g.subjects(RDF.type, SH.ValidationResult))
+    # results with several source shapes are sharded by the smallest one, which does not depend on the triple order
+    shard_keys = [
+        min((str(shape) for shape in violation_report_g.objects(result, SH.sourceShape)), default="") for result in validation_results
+    ]
+    sizes = Counter(shard_keys)
+    loads = [(0, shard) for shard in range(n_shards)]
+    shard_of = {}
+    for key, size in sorted(sizes.items(), key=lambda item: (-item[1], item[0])):
+        load, shard = heapq.heappop(loads)
+        shard_of[key] = shard
+        heapq.heappush(loads, (load + size, shard))
+    shards = [[] for _ in range(n_shards)]
+    for index, (validation_result, key) in enumerate(zip(validation_results, shard_keys, strict=True)):
+        shards[shard_of[key]].append((index, validation_result))
+    return shards
+
+
+def collect_exemplars_parallel(violation_report_g, ignored_edges, processes, progress=False):
+    """
+    Runs collect_exemplars on the shards of shard_validation_results in a pool of forked processes. Forking while other
+    threads hold locks can deadlock the workers, so call it from a process whose other threads are idle, such as an
+    exclusive stage of the preprocessing pipeline. Concurrent calls run one after the other.
+
+    Returns:
+        List[tuple]: The result of collect_exemplars for every shard.
+    """
+    global _shard_context
+    shards = shard_validation_results(violation_report_g, processes)
+    with _shard_context_lock:
+        _shard_context = (violation_report_g, ignored_edges, shards)
+        try:
+            with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("fork")) as executor:
+                shard_results = TQDMInstance(
+                    executor.map(_collect_shard_exemplars, range(len(shards))),
+                    total=len(shards),
+                    desc="Processing shards",
+                    disable=not progress,
+                )
+                return list(shard_results)
+        finally:
+            _shard_context = None
+
+
+def merge_shard_exemplars(builder, shard_results):
+    """
+    Adds the exemplars that collect_exemplars found per shard to builder, with the names, dictionaries and triples that
+    adding the validation results to builder one by one, in index order, would have given.
+
+    Args:
+        builder (ExemplarBuilder): The builder to add the exemplars to, without exemplars so far.
+        shard_results (List[tuple]): The result of collect_exemplars for every shard.
+    """
+    # exemplars are numbered in the order of their first validation result, as if the results were processed one by one
+    exemplars = sorted(
+        (first_index, shard, position, shape, edge_object_pairs)
+        for shard, (shard_exemplars, _) in enumerate(shard_results)
+        for position, (first_index, shape, edge_object_pairs) in enumerate(shard_exemplars)
     )
+    exemplar_names = {}
+    for number, (_, shard, position, shape, edge_object_pairs) in enumerate(exemplars, start=len(builder.exemplar_sets) + 1):
+        exemplar_names[shard, position] = builder.exemplar_sets[frozenset(edge_object_pairs)] = exemplar_name(shape, number)
+
+    occurrences = Counter()
+    shard_assignments = [
+        [(index, focus_node, shard, position) for index, focus_node, position in assignments]
+        for shard, (_, assignments) in enumerate(shard_results)
+    ]
+    for _, focus_node, shard, position in heapq.merge(*shard_assignments):
+        exemplar = exemplar_names[shard, position]
+        builder.assign(focus_node, shard_results[shard][0][position][1], exemplar)
+        occurrences[exemplar] += 1
+
+    # only the first validation result of an exemplar adds triples, the others only count its edge-object pairs
+    for _, shard, position, _, edge_object_pairs in exemplars:
+        exemplar = exemplar_names[shard, position]
+        process_edge_object_pairs(
+            builder.ontology_g, builder.study_g, SH, builder.edge_count_dict, edge_object_pairs, exemplar, builder.namespace_stats
+        )
+        for p, o in edge_object_pairs:
+            builder.edge_count_dict[exemplar][f"{p}__{o}"] += occurrences[exemplar] - 1
+
+
+def get_violation_report_exemplars(ontology_g, violation_report_g, study_g=None, namespace_stats=None, progress=False, processes=1):
+    """
+    Generates and returns violation report exemplars based on ontology and violation graphs.
 
+    This function generates exemplars for the ontology graph based on the violations
+    found in the violation report graph. It also counts edge-object pairs and keeps
+    track of focus nodes and their related exemplars.
+
+    Args:
+        ontology_g (rdflib.Graph): The ontology graph.
+        violation_report_g (rdflib.Graph): The graph containing violation reports.
+        study_g (rdflib.Graph, optional): The instance data graph, used to add the one hop locatoin of all sh_value objects.
+        namespace_stats (NamespaceStats, optional): Statistics of ontology_g, kept up to date with the exemplar triples added to it.
+        progress (bool): Whether to show a progress bar over the validation results.
+        processes (int): The number of processes that group the validation results into exemplars, sharded by source shape.
+            The result is the same for any number of processes. Requires the fork start method, otherwise the results
+            are grouped in this process.
+
+    Returns:
+        tuple: A 5-tuple containing the updated ontology graph, a dictionary of
+        edge counts, a dictionary mapping focus nodes to exemplars, a dictionary
+        mapping exemplars to focus nodes, and a dictionary counting the exemplars of every shape.
+
+    TODO:
+        - Instead of counting the edge-object pairs, consider counting the exemplar occurrences.
+        - Keep track of ignored edges as well.
+    """
+    bind_exemplar_namespaces(ontology_g)
+    bind_exemplar_namespaces(violation_report_g)
+    copy_namespaces(violation_report_g, ontology_g)
 
-def process_edge_object_pairs(ontology_g, study_g, sh, edge_count_dict, edge_object_pairs, exemplar_name):
+    builder = ExemplarBuilder(ontology_g, study_g, namespace_stats)
+    if processes > 1 and "fork" not in multiprocessing.get_all_start_methods():
+        _log.warning("The fork start method is not available, grouping the validation results in a single process")
+        processes = 1
+    if processes > 1:
+        merge_shard_exemplars(builder, collect_exemplars_parallel(violation_report_g, EXEMPLAR_IGNORED_EDGES, processes, progress))
+    else:
+        for focus_node, shape, edge_object_pairs in TQDMInstance(
+            iter_validation_results(violation_report_g), desc="Processing violations", disable=not progress
+        ):
+            builder.add(focus_node, shape, edge_object_pairs)
+    return builder.result()
+
+
+def process_edge_object_pairs(ontology_g, study_g, sh, edge_count_dict, edge_object_pairs, exemplar_name, namespace_stats=None):
     # prepare list of shacl values of violation reports, i.e., the objects for all triples  (focusnode, http://www.w3.org/ns/shacl#value, object)
     shacl_values = []
     for p, o in edge_object_pairs:
         po_str = f"{p}__{o}"
         if edge_count_dict[exemplar_name][po_str] == 0:
             if p == sh.sourceShape:
-                ontology_g.add((o, URIRef("http://customnamespace.com/hasExemplar"), exemplar_name))  # type: ignore
+                add_triple(ontology_g, (o, URIRef("http://customnamespace.com/hasExemplar"), exemplar_name), namespace_stats)
             else:
-                ontology_g.add((exemplar_name, p, o))  # type: ignore
-                print(f"Adding edge {exemplar_name} {p} {o}")
+                add_triple(ontology_g, (exemplar_name, p, o), namespace_stats)
                 if p == sh.value:
                     shacl_values.append(o)
                 # TODO create custom URI instead of object property
-            ontology_g.add((exemplar_name, RDF.type, sh.PropertyShape))
+            add_triple(ontology_g, (exemplar_name, RDF.type, sh.PropertyShape), namespace_stats)
         edge_count_dict[exemplar_name][po_str] += 1
 
     # add triples from study_g where the subject is a shacl value we have written to shacl_values, add its one hop neighbors to ontology_g
+    if study_g is None:
+        return
     for sh_value in shacl_values:
         for s, p, o in study_g.triples((sh_value, None, None)):
-            ontology_g.add((s, p, o))  # type: ignore
+            add_triple(ontology_g, (s, p, o), namespace_stats)
@@ -0,0 +1,108 @@
+"""This module implements the index of the node shape paths between the classes and the property shapes of the SHACL shapes."""
+# violation_paths.py
+from collections import defaultdict
+
+from rdflib import OWL, RDF, Graph, Namespace
+
+from bikg_app.routers.triple_store import TripleStore
+
+SH = Namespace("http://www.w3.org/ns/shacl#")
+
+
+def _unique(values) -> list:
+    return list(dict.fromkeys(values))
+
+
+def find_violation_paths(g: Graph | TripleStore):
+    """
+    Finds the (node shape, property shape, class) paths of the shapes graph with direct lookups in the graph's indexes,
+    the same rows as the SPARQL join
+
+        ?s1 a sh:NodeShape . ?s1 sh:property ?o1 . ?s1 sh:targetClass ?o2 . ?o1 a sh:PropertyShape . ?o2 a owl:Class .
+
+    Yields:
+        tuple: (node shape, property shape, class) terms.
+    """
+    for node_shape in _unique(g.subjects(RDF.type, SH.NodeShape)):
+        property_shapes = [o1 for o1 in _unique(g.objects(node_shape, SH.property)) if (o1, RDF.type, SH.PropertyShape) in g]
+        classes = [o2 for o2 in _unique(g.objects(node_shape, SH.targetClass)) if (o2, RDF.type, OWL.Class) in g]
+        for property_shape in property_shapes:
+            for class_ in classes:
+                yield node_shape, property_shape, class_
+
+
+class ViolationPathIndex:
+    """
+    The nodes that have to be visible to show the path from a class to the property shapes its violations come from,
+    and back, indexed in both directions so a single class or property shape is a dictionary lookup.
+    """
+
+    def __init__(self, paths):
+        """
+        Args:
+            paths (List[Tuple[str, str, str]]): The (node shape, property shape, class) paths as QNames.
+        """
+        self.paths = [tuple(path) for path in paths]
+        by_class = defaultdict(list)
+        by_property_shape = defaultdict(list)
+        for node_shape, property_shape, class_ in self.paths:
+            by_class[class_].append((node_shape, property_shape))
+            by_property_shape[property_shape].append((node_shape, class_))
+        self._by_class = dict(by_class)
+        self._by_property_shape = dict(by_property_shape)
+
+    @classmethod
+    def from_graph(cls, g: Graph | TripleStore, label):
+        """
+        Args:
+            g (Graph | TripleStore): The shapes graph.
+            label (Callable[[Node], str]): Turns the terms into the labels used by the client, usually their QNames.
+        """
+        return cls(
+            [(label(node_shape), label(property_shape), label(class_)) for node_shape, property_shape, class_ in find_violation_paths(g)]
+        )
+
+    def nodes_of_class(self, class_) -> dict:
+        """
+        Returns the node shapes and property shapes on the paths from class_, in the order the paths were found.
+
+        Raises:
+            KeyError: If no path starts at class_.
+        """
+        pairs = self._by_class.get(class_)
+        if pairs is None:
+            raise KeyError(class_)
+        return {
+            "nodes": _unique(node for pair in pairs for node in pair),
+            "nodeShapes": _unique(node_shape for node_shape, _ in pairs),
+            "propertyShapes": _unique(property_shape for _, property_shape in pairs),
+        }
+
+    def nodes_of_property_shape(self, property_shape) -> dict:
+        """
+        Returns the node shapes and classes on the paths to property_shape, in the order the paths were found.
+
+        Raises:
+            KeyError: If no path ends at property_shape.
+        """
+        pairs = self._by_property_shape.get(property_shape)
+        if pairs is None:
+            raise KeyError(property_shape)
+        return {
+            "nodes": _unique(node for pair in pairs for node in pair),
+            "nodeShapes": _unique(node_shape for node_shape, _ in pairs),
+            "classes": _unique(class_ for _, class_ in pairs),
+        }
+
+    def to_dict(self) -> dict:
+        """
+        Returns the two dictionaries of the /violation_path_nodes_dict response:
+        1. A dictionary with classes as keys and the node shapes and property shapes as values that need to be visible to show the path to the violations.
+        2. A dictionary with property shapes as keys and the node shapes and classes as values that need to be visible to show the path to the types.
+        """
+        return {
+            "class_property_d": {class_: self.nodes_of_class(class_)["nodes"] for class_ in self._by_class},
+            "property_class_d": {
+                property_shape: self.nodes_of_property_shape(property_shape)["nodes"] for property_shape in self._by_property_shape
+            },
+        }
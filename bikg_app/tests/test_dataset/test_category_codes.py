@@ -0,0 +1,54 @@
+# test_category_codes
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from bikg_app.routers.category_codes import CategoryCodes, row_positions
+
+
+class TestCategoryCodes(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        n_rows = 500
+        self.df = pd.DataFrame(
+            {
+                "rdf:type": rng.choice(["lotr:Hobbit", "lotr:Elf", "lotr:Dwarf", "lotr:Wizard"], n_rows),
+                # many categories with tied counts, so the order of ties is exercised beyond numpy's small-array sort
+                "lotr:home": rng.choice([f"lotr:place{i}" for i in range(60)], n_rows),
+                "focus_node": [f"lotr:node{i}" for i in range(n_rows)],
+                "lotr:age": rng.integers(0, 5, n_rows).astype(float),
+                "lotr:name": rng.choice(np.array(["Frodo", "Sam", None], dtype=object), n_rows),
+            },
+            index=[f"lotr:node{i}" for i in range(n_rows)],
+        )
+        self.columns = list(self.df.columns)
+        self.codes = CategoryCodes.from_df(self.df, self.columns)
+
+    def assert_matches_pandas(self, positions):
+        value_counts = self.codes.value_counts(positions)
+        selected_df = self.df.iloc[positions]
+        for column in self.columns:
+            expected = selected_df[column].value_counts().to_dict()
+            assert list(value_counts[column].items()) == list(expected.items()), column
+
+    def test_all_rows(self):
+        self.assert_matches_pandas(np.arange(len(self.df)))
+
+    def test_selections(self):
+        rng = np.random.default_rng(1)
+        for size in [0, 1, 17, 100, 400]:
+            self.assert_matches_pandas(rng.choice(len(self.df), size, replace=False))
+
+    def test_duplicate_positions_are_counted(self):
+        self.assert_matches_pandas(np.array([3, 3, 7, 3]))
+
+    def test_row_positions(self):
+        positions = row_positions(self.df.index, ["lotr:node5", "lotr:node1", "lotr:node5"])
+        assert positions.tolist() == [5, 1, 5]
+        with self.assertRaises(KeyError):
+            row_positions(self.df.index, ["lotr:node1", "lotr:Sauron"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+# test_chi_square
+import unittest
+
+import numpy as np
+from scipy.stats import chi2_contingency
+
+from bikg_app.routers.chi_square import chi_square_score, chi_square_scores
+
+
+def scipy_chi_square_score(selection_data, overall_data):
+    # the per-column computation /plot/bar used before the batched scorer
+    categories = set(list(selection_data.keys()) + list(overall_data.keys()))
+    observed = np.array(
+        [(selection_data.get(category, 1e-7) if selection_data.get(category, 1e-7) != 0 else 1e-7) for category in categories]
+    )
+    expected = np.array([(overall_data.get(category, 1e-7) if overall_data.get(category, 1e-7) != 0 else 1e-7) for category in categories])
+    chi2, _, _, _ = chi2_contingency([observed, expected])
+    return float(chi2)  # type: ignore
+
+
+class TestChiSquareScores(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        # columns with 1 category (no degree of freedom), 2 categories (Yates' correction) and many categories
+        self.n_categories = [1, 2, 2, 3, 8, 40, 1, 5]
+        self.offsets = np.concatenate([[0], np.cumsum(self.n_categories)])
+        self.overall = rng.integers(1, 50, self.offsets[-1])
+        self.selected = rng.integers(0, 2, self.offsets[-1]) * rng.integers(0, self.overall + 1)
+
+    def column_dicts(self, j):
+        start, stop = self.offsets[j], self.offsets[j + 1]
+        selected = {f"c{k}": int(self.selected[k]) for k in range(start, stop) if self.selected[k] > 0}
+        overall = {f"c{k}": int(self.overall[k]) for k in range(start, stop)}
+        return selected, overall
+
+    def test_matches_scipy(self):
+        scores = chi_square_scores(self.selected, self.overall, self.offsets)
+        assert len(scores) == len(self.n_categories)
+        for j, score in enumerate(scores):
+            expected = scipy_chi_square_score(*self.column_dicts(j))
+            np.testing.assert_allclose(score, expected, rtol=1e-9, atol=1e-12)
+
+    def test_empty_selection_matches_scipy(self):
+        scores = chi_square_scores(np.zeros_like(self.overall), self.overall, self.offsets)
+        for j, score in enumerate(scores):
+            np.testing.assert_allclose(score, scipy_chi_square_score({}, self.column_dicts(j)[1]), rtol=1e-9, atol=1e-12)
+
+    def test_empty_columns_score_zero(self):
+        scores = chi_square_scores(np.array([1, 2, 3]), np.array([4, 5, 6]), np.array([0, 0, 3, 3]))
+        assert scores[0] == 0.0
+        assert scores[2] == 0.0
+        np.testing.assert_allclose(scores[1], scipy_chi_square_score({"a": 1, "b": 2, "c": 3}, {"a": 4, "b": 5, "c": 6}), rtol=1e-9)
+
+    def test_single_score_matches_scipy(self):
+        selection_data = {"lotr:CharacterShape-hasHome": 3, "lotr:CharacterShape-hasAge": 0}
+        overall_data = {"lotr:CharacterShape-hasHome": 7, "lotr:CharacterShape-hasAge": 2, "lotr:RingShape-hasOwner": 1}
+        np.testing.assert_allclose(
+            chi_square_score(selection_data, overall_data), scipy_chi_square_score(selection_data, overall_data), rtol=1e-9
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+# test_dataset_manager
+import threading
+import unittest
+
+from bikg_app.routers.dataset import Dataset, DatasetManager
+
+
+class TestDatasetManager(unittest.TestCase):
+    def setUp(self):
+        self.calls = 0
+        self.release = threading.Event()
+        self.in_second_stage = threading.Event()
+
+    def loader(self, on_stage):
+        self.calls += 1
+        on_stage("first", 0, 2)
+        on_stage("second", 1, 2)
+        self.in_second_stage.set()
+        self.release.wait(5)
+        return Dataset()
+
+    def failing_loader(self, on_stage):
+        on_stage("first", 0, 2)
+        raise FileNotFoundError("study.csv")
+
+    def test_not_loaded_until_used(self):
+        manager = DatasetManager(loader=self.loader)
+        status = manager.status()
+        assert status["state"] == DatasetManager.NOT_LOADED
+        assert status["progress"] == 0.0
+        assert self.calls == 0
+
+    def test_get_loads_on_first_use(self):
+        self.release.set()
+        manager = DatasetManager(loader=self.loader)
+        dataset = manager.get()
+        assert isinstance(dataset, Dataset)
+        assert manager.get() is dataset
+        assert self.calls == 1
+        assert manager.status()["state"] == DatasetManager.READY
+        assert manager.status()["progress"] == 1.0
+
+    def test_background_load_reports_progress(self):
+        manager = DatasetManager(loader=self.loader)
+        manager.start_background_load()
+        manager.start_background_load()  # a second start must not load twice
+        assert self.in_second_stage.wait(5)
+        status = manager.status()
+        assert status["state"] == DatasetManager.LOADING
+        assert status["stage"] == "second"
+        assert status["progress"] == 0.5
+        self.release.set()
+        dataset = manager.get()
+        assert isinstance(dataset, Dataset)
+        assert self.calls == 1
+        assert manager.is_ready
+
+    def test_failed_load(self):
+        manager = DatasetManager(loader=self.failing_loader)
+        with self.assertRaises(RuntimeError):
+            manager.get()
+        status = manager.status()
+        assert status["state"] == DatasetManager.FAILED
+        assert "study.csv" in status["error"]
+
+
+if __name__ == "__main__":
+    unittest.main()
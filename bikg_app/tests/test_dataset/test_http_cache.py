@@ -0,0 +1,80 @@
+# test_http_cache
+import unittest
+
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from bikg_app.routers.dataset import Dataset
+from bikg_app.routers.http_cache import IMMUTABLE_CACHE_CONTROL, REVALIDATE_CACHE_CONTROL, cached_response, etag_matches
+
+
+class TestEtagMatches(unittest.TestCase):
+    def test_etag_matches(self):
+        assert etag_matches('"abc"', '"abc"')
+        assert etag_matches('"xyz", W/"abc"', '"abc"')
+        assert etag_matches("*", '"abc"')
+        assert not etag_matches('"abcd"', '"abc"')
+        assert not etag_matches(None, '"abc"')
+
+
+class TestCachedResponse(unittest.TestCase):
+    def setUp(self):
+        self.builds = 0
+        self.dataset = Dataset()
+        self.dataset.version = "v1"
+        app = FastAPI()
+
+        @app.get("/labels")
+        def get_labels(request: Request):
+            def build():
+                self.builds += 1
+                return {"lotr:Frodo", "lotr:Sam"} if self.builds == 1 else set()
+
+            return cached_response(request, self.dataset, "labels", build)
+
+        @app.get("/ontology")
+        def get_ontology(request: Request):
+            return cached_response(
+                request, self.dataset, "ontology", lambda: "@prefix lotr: <http://lotr.org/> .", media_type="text/turtle"
+            )
+
+        self.client = TestClient(app)
+
+    def test_built_once(self):
+        first = self.client.get("/labels")
+        second = self.client.get("/labels")
+        assert sorted(first.json()) == ["lotr:Frodo", "lotr:Sam"]
+        assert second.content == first.content
+        assert self.builds == 1
+
+    def test_not_modified(self):
+        etag = self.client.get("/labels").headers["etag"]
+        response = self.client.get("/labels", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["etag"] == etag
+        assert self.client.get("/labels", headers={"If-None-Match": '"other"'}).status_code == 200
+
+    def test_cache_control(self):
+        assert self.client.get("/labels").headers["cache-control"] == REVALIDATE_CACHE_CONTROL
+        assert self.client.get("/labels?v=v1").headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+        assert self.client.get("/labels?v=v0").headers["cache-control"] == REVALIDATE_CACHE_CONTROL
+        self.dataset.version = None
+        assert self.client.get("/labels").headers["cache-control"] == REVALIDATE_CACHE_CONTROL
+
+    def test_other_media_types(self):
+        response = self.client.get("/ontology")
+        assert response.text == "@prefix lotr: <http://lotr.org/> ."
+        assert response.headers["content-type"].startswith("text/turtle")
+
+    def test_new_dataset_gets_new_etag(self):
+        etag = self.client.get("/labels").headers["etag"]
+        self.dataset = Dataset()
+        self.dataset.version = "v2"
+        response = self.client.get("/labels", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.json() == []
+
+
+if __name__ == "__main__":
+    unittest.main()
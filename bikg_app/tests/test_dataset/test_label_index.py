@@ -0,0 +1,58 @@
+# test_label_index
+import random
+import unittest
+
+from bikg_app.routers.label_index import LabelIndex
+
+
+class TestLabelIndex(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(0)
+        prefixes = ["lotr:", "sh:", "ex:", "", "Lotr:"]
+        words = ["Frodo", "frodo", "Sam", "CharacterShape", "hasHome", "Ärger", "shire", "Expected value for lotr:hasHome"]
+        self.labels = [rng.choice(prefixes) + rng.choice(words) + str(rng.randrange(30)) for _ in range(500)]
+        self.index = LabelIndex(self.labels)
+
+    def expected(self, prefix="", contains=""):
+        return [
+            label
+            for label in sorted(set(self.labels), key=lambda label: (label.casefold(), label))
+            if label.casefold().startswith(prefix.casefold()) and contains.casefold() in label.casefold()
+        ]
+
+    def test_sorted_and_deduplicated(self):
+        assert self.index.labels == self.expected()
+        assert len(self.index) == len(set(self.labels))
+
+    def test_search(self):
+        for prefix, contains in [("lotr:", ""), ("LOTR:f", ""), ("", "home"), ("sh:", "shape1"), ("ex:", "ÄR"), ("zz", ""), ("", "zz")]:
+            labels, cursor = self.index.search(prefix=prefix, contains=contains)
+            assert labels == self.expected(prefix, contains)
+            assert cursor is None
+
+    def test_pagination(self):
+        for prefix, contains in [("lotr:", ""), ("", "o"), ("sh:", "a")]:
+            pages, cursor = [], None
+            while True:
+                labels, cursor = self.index.search(prefix=prefix, contains=contains, limit=7, cursor=cursor)
+                assert 0 < len(labels) <= 7
+                pages.extend(labels)
+                if cursor is None:
+                    break
+                assert cursor == labels[-1]
+            assert pages == self.expected(prefix, contains)
+
+    def test_limit_on_last_page(self):
+        expected = self.expected("lotr:frodo1")
+        labels, cursor = self.index.search(prefix="lotr:frodo1", limit=len(expected))
+        assert labels == expected
+        assert cursor is None
+
+    def test_edge_cases(self):
+        assert LabelIndex([]).search(prefix="lotr:") == ([], None)
+        assert self.index.search(contains="\x00") == ([], None)
+        assert self.index.search(cursor=self.index.labels[-1]) == ([], None)
+
+
+if __name__ == "__main__":
+    unittest.main()
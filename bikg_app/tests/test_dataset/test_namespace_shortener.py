@@ -0,0 +1,103 @@
+# test_namespace_shortener
+import unittest
+
+from rdflib import Graph, Literal, URIRef
+
+from bikg_app.routers.dataset import uri_to_qname
+from bikg_app.routers.namespace_shortener import NamespaceShortener
+from bikg_app.routers.routes import shorten_dict_uris
+
+LOTR = "http://example.org/lotr#"
+LOTR_SHAPES = "http://example.org/lotr#shapes/"
+
+
+def build_graph():
+    g = Graph()
+    g.bind("lotr", LOTR)
+    g.bind("shapes", LOTR_SHAPES)
+    g.bind("people", "http://example.org/people/")
+    return g
+
+
+IRIS = [
+    LOTR + "Frodo",
+    LOTR + "hasHome",
+    LOTR_SHAPES + "CharacterShape",
+    "http://example.org/people/sam",
+    "http://example.org/people/gaffer/hamfast",  # the bound namespace ends before rdflib's split
+    "http://example.org/places/Shire",  # no bound namespace
+    "http://example.org/places/Bree",
+    "http://www.w3.org/ns/shacl#Violation",
+    "http://www.w3.org/1999/02/22-rdf-syntax-ns#type",
+]
+
+
+class TestNamespaceShortener(unittest.TestCase):
+    def test_qname_matches_rdflib(self):
+        expected_graph = build_graph()
+        expected = [expected_graph.namespace_manager.qname(iri) for iri in IRIS]
+        shortener = NamespaceShortener.from_graph(build_graph())
+        assert [shortener.qname(URIRef(iri)) for iri in IRIS] == expected
+        # generated prefixes end up in the trie, so they are reused without asking rdflib again
+        assert shortener.qname("http://example.org/places/Mordor") == expected_graph.namespace_manager.qname(
+            "http://example.org/places/Mordor"
+        )
+
+    def test_qname_errors(self):
+        shortener = NamespaceShortener.from_graph(build_graph())
+        with self.assertRaises(ValueError):
+            shortener.qname("http://example.org/lotr#has space")
+        assert uri_to_qname(shortener, URIRef("http://example.org/lotr#has space")) == "http://example.org/lotr#has space"
+        assert uri_to_qname(shortener, Literal("Frodo")) == "Frodo"
+        without_fallback = NamespaceShortener([("lotr", LOTR)])
+        with self.assertRaises(ValueError):
+            without_fallback.qname("http://example.org/places/Shire")
+
+    def test_shorten_longest_prefix(self):
+        shortener = NamespaceShortener([("lotr", LOTR), ("shapes", LOTR_SHAPES)])
+        assert shortener.shorten(LOTR + "Frodo") == "lotr:Frodo"
+        assert shortener.shorten(LOTR_SHAPES + "CharacterShape") == "shapes:CharacterShape"
+        assert shortener.shorten(LOTR + "hasHome__" + LOTR + "Shire") == "lotr:hasHome__lotr:Shire"
+        assert shortener.shorten("http://example.org/places/Shire") == "http://example.org/places/Shire"
+
+    def test_shorten_dict_uris(self):
+        shortener = NamespaceShortener([("lotr", LOTR)])
+        d = {LOTR + "Frodo": {(LOTR + "hasHome", "EdgeNotPresent"): 2}, "other": [LOTR + "Sam", 3]}
+        assert shorten_dict_uris(d, shortener) == {"lotr:Frodo": {("lotr:hasHome", "EdgeNotPresent"): 2}, "other": ["lotr:Sam", 3]}
+
+    def test_expand(self):
+        shortener = NamespaceShortener.from_graph(build_graph())
+        for iri in IRIS:
+            assert shortener.expand(shortener.qname(iri)) == iri
+        assert shortener.expand("lotr:Sam") == LOTR + "Sam"
+        with self.assertRaises(ValueError):
+            shortener.expand("mordor:Sauron")
+        with self.assertRaises(ValueError):
+            shortener.expand("Sauron")
+
+    def test_bound_qname_and_memoize(self):
+        shortener = NamespaceShortener.from_graph(build_graph())
+        assert shortener.bound_qname(LOTR + "Frodo") == "lotr:Frodo"
+        # would need the fallback, which is not asked and binds nothing
+        assert shortener.bound_qname("http://example.org/places/Shire") is None
+        namespaces = shortener.namespaces()
+        assert shortener.bound_qname("http://example.org/places/Bree") is None
+        assert shortener.namespaces() == namespaces
+
+        assert shortener.qname(LOTR + "Frodo", memoize=False) == "lotr:Frodo"
+        assert shortener.shorten(LOTR + "Sam", memoize=False) == "lotr:Sam"
+        assert shortener.expand("lotr:Merry", memoize=False) == LOTR + "Merry"
+        assert shortener.stats()["memoized"] == 0
+
+    def test_stats(self):
+        shortener = NamespaceShortener([("lotr", LOTR)])
+        assert shortener.stats()["hit_rate"] == 0.0
+        for _ in range(4):
+            shortener.shorten(LOTR + "Frodo")
+        stats = shortener.stats()
+        assert (stats["hits"], stats["misses"], stats["memoized"]) == (3, 1, 1)
+        assert stats["hit_rate"] == 0.75
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+# test_namespace_stats
+import unittest
+
+import numpy as np
+import pandas as pd
+from rdflib import RDF, BNode, Graph, Literal, Namespace, URIRef
+
+from bikg_app.routers.category_codes import CategoryCodes
+from bikg_app.routers.namespace_shortener import NamespaceShortener
+from bikg_app.routers.namespace_stats import (
+    NamespaceStats,
+    add_triple,
+    qname_prefix_ids,
+    study_namespace_counts,
+    violation_namespace_counts,
+)
+
+LOTR = Namespace("http://example.org/lotr#")
+SH = Namespace("http://www.w3.org/ns/shacl#")
+EX = Namespace("http://example.com/exemplar#")
+
+
+def build_graph():
+    g = Graph()
+    g.bind("lotr", LOTR)
+    g.bind("sh", SH)
+    g.add((LOTR.Frodo, RDF.type, LOTR.Hobbit))
+    g.add((LOTR.Frodo, LOTR.hasHome, LOTR.Shire))
+    g.add((LOTR.Frodo, LOTR.name, Literal("Frodo")))
+    g.add((LOTR.CharacterShape, RDF.type, SH.NodeShape))
+    g.add((LOTR.CharacterShape, SH.property, BNode()))
+    g.add((URIRef("http://example.org/places/Bree"), LOTR.near, LOTR.Shire))
+    return g
+
+
+def reference_counts(g):
+    """The counts computed per triple, the way /namespaces used to intend them."""
+    nsm = g.namespace_manager
+    counts = {str(namespace): {"node_count": 0, "edge_count": 0} for _, namespace in g.namespaces()}
+
+    def namespace(term):
+        if not isinstance(term, URIRef):
+            return None
+        try:
+            return str(nsm.compute_qname(term, generate=False)[1])
+        except (KeyError, ValueError):
+            return None
+
+    for s, p, o in g:
+        for node in (s, o):
+            node_namespace = namespace(node)
+            if node_namespace is not None:
+                counts[node_namespace]["node_count"] += 1
+        edge_namespace = namespace(p)
+        if edge_namespace is not None:
+            counts[edge_namespace]["edge_count"] += 1
+    return {prefix: {"namespace": str(ns), **counts[str(ns)]} for prefix, ns in g.namespaces()}
+
+
+class TestNamespaceStats(unittest.TestCase):
+    def test_counts_match_reference(self):
+        g = build_graph()
+        assert NamespaceStats.from_graph(g).counts(NamespaceShortener.from_graph(g)) == reference_counts(g)
+
+    def test_from_triples(self):
+        iris = [None, str(LOTR.Frodo), str(LOTR.hasHome), str(LOTR.Shire), str(RDF.type)]
+        triples = np.array([[1, 2, 3], [1, 4, 3], [3, 2, 0]])
+        counts = NamespaceStats.from_triples(iris, triples).counts(NamespaceShortener([("lotr", str(LOTR)), ("rdf", str(RDF))]))
+        assert counts == {
+            "lotr": {"namespace": str(LOTR), "node_count": 5, "edge_count": 2},
+            "rdf": {"namespace": str(RDF), "node_count": 0, "edge_count": 1},
+        }
+
+    def test_incremental_updates(self):
+        g = build_graph()
+        stats = NamespaceStats.from_graph(g)
+        shortener = NamespaceShortener.from_graph(g)
+        stats.counts(shortener)
+        g.bind("ex", EX)
+        shortener = NamespaceShortener.from_graph(g)
+        for i in range(50):
+            add_triple(g, (EX[f"exemplar_{i % 7}"], RDF.type, SH.PropertyShape), stats)
+            add_triple(g, (LOTR.CharacterShape, URIRef("http://customnamespace.com/hasExemplar"), EX[f"exemplar_{i % 7}"]), stats)
+            add_triple(g, (EX[f"exemplar_{i % 7}"], LOTR.name, Literal(f"exemplar {i % 3}")), stats)
+        assert stats.counts(shortener) == reference_counts(g)
+        assert stats.counts(shortener) == NamespaceStats.from_graph(g).counts(shortener)
+
+    def test_qname_prefix_ids(self):
+        values = ["lotr:Frodo", "sh:Violation", "mordor:Sauron", "EdgeNotPresent", 1.0, "['lotr:Hobbit']"]
+        np.testing.assert_array_equal(qname_prefix_ids(values, ["sh", "lotr"]), [1, 0, -1, -1, -1, -1])
+        assert len(qname_prefix_ids([], ["lotr"])) == 0
+
+
+class TestBreakdowns(unittest.TestCase):
+    def setUp(self):
+        self.df = pd.DataFrame(
+            {
+                "rdf:type": ["['lotr:Hobbit']", "['lotr:Hobbit', 'lotr:Character']", "['sh:NodeShape']"],
+                "lotr:hasHome": ["lotr:Shire", "lotr:Shire", "EdgeNotPresent"],
+                "lotr:CharacterShape-hasHome": [1.0, 0.0, 2.0],
+            },
+            index=["lotr:Frodo", "lotr:Sam", "sh:shape1"],
+        )
+        self.violations = ["lotr:CharacterShape-hasHome", "sh:OtherShape"]
+
+    def test_study_namespace_counts(self):
+        codes = CategoryCodes.from_df(self.df, list(self.df.columns))
+        assert study_namespace_counts(self.df, codes, self.violations, ["lotr", "sh", "rdf"]) == {
+            "lotr": {"focus_node_count": 2, "property_count": 1, "value_count": 5},
+            "sh": {"focus_node_count": 1, "property_count": 0, "value_count": 1},
+            "rdf": {"focus_node_count": 0, "property_count": 1, "value_count": 0},
+        }
+
+    def test_violation_namespace_counts(self):
+        counts = {"lotr:CharacterShape-hasHome": 3.0, "sh:OtherShape": 0}
+        assert violation_namespace_counts(self.violations, counts, ["lotr", "sh", "rdf"]) == {
+            "lotr": {"shape_count": 1, "violation_count": 3},
+            "sh": {"shape_count": 1, "violation_count": 0},
+            "rdf": {"shape_count": 0, "violation_count": 0},
+        }
+
+
+if __name__ == "__main__":
+    unittest.main()
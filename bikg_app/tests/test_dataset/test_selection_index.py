@@ -0,0 +1,57 @@
+# test_selection_index
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from bikg_app.routers.selection_index import BitmapIndex
+
+
+class TestBitmapIndex(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        n_rows = 1000
+        self.df = pd.DataFrame(
+            {
+                "rdf:type": rng.choice(["lotr:Hobbit", "lotr:Elf", "lotr:Dwarf", "lotr:Wizard"], n_rows, p=[0.6, 0.3, 0.09, 0.01]),
+                "focus_node": [f"lotr:node{i}" for i in range(n_rows)],
+                "lotr:age": rng.integers(0, 5, n_rows).astype(float),
+                "lotr:CharacterShape-hasHome": rng.integers(0, 2, n_rows),
+                "lotr:CharacterShape-hasAge": (rng.random(n_rows) < 0.02).astype(int),
+            },
+            index=[f"lotr:node{i}" for i in range(n_rows)],
+        )
+        self.violations = ["lotr:CharacterShape-hasHome", "lotr:CharacterShape-hasAge"]
+        self.index = BitmapIndex.from_df(self.df, ["rdf:type", "focus_node", "lotr:age"], self.violations)
+
+    def assert_matches(self, rows, expected_mask):
+        np.testing.assert_array_equal(rows, np.flatnonzero(expected_mask.to_numpy()))
+
+    def test_categories_match_isin(self):
+        for column, categories in [
+            ("rdf:type", ["lotr:Hobbit"]),
+            ("rdf:type", ["lotr:Wizard", "lotr:Elf"]),
+            ("rdf:type", ["lotr:Dwarf", "lotr:Wizard"]),
+            ("focus_node", ["lotr:node3", "lotr:node999", "lotr:node0"]),
+            ("lotr:age", [0.0, 4.0]),
+            ("rdf:type", []),
+        ]:
+            rows = self.index.rows_with_categories(column, categories)
+            self.assert_matches(rows, self.df[column].isin(categories))
+
+    def test_unknown_category_is_ignored(self):
+        rows = self.index.rows_with_categories("rdf:type", ["lotr:Orc", "lotr:Dwarf"])
+        self.assert_matches(rows, self.df["rdf:type"].isin(["lotr:Dwarf"]))
+
+    def test_unknown_column_raises(self):
+        with self.assertRaises(KeyError):
+            self.index.rows_with_categories("lotr:name", ["Frodo"])
+
+    def test_any_violation_matches_pandas(self):
+        for columns in [self.violations, self.violations[1:], []]:
+            rows = self.index.rows_with_any_violation(columns)
+            self.assert_matches(rows, self.df[columns].gt(0).any(axis=1))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+# test_selection_store
+import unittest
+
+import numpy as np
+
+from bikg_app.routers.selection_store import (
+    SelectionStore,
+    decode_bitset,
+    decode_rle,
+    decode_selected_rows,
+    encode_bitset,
+    encode_rle,
+)
+
+
+class TestSelectionStore(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.store = SelectionStore(max_entries=2, ttl_seconds=10, clock=lambda: self.now)
+
+    def test_put_and_get(self):
+        selection_id = self.store.put([4, 1, 7])
+        positions = self.store.get(selection_id)
+        assert positions.tolist() == [4, 1, 7]
+        assert not positions.flags.writeable
+
+    def test_unknown_id_raises(self):
+        with self.assertRaises(KeyError):
+            self.store.get("missing")
+
+    def test_least_recently_used_is_evicted(self):
+        first = self.store.put([1])
+        second = self.store.put([2])
+        self.store.get(first)
+        third = self.store.put([3])
+        assert len(self.store) == 2
+        self.store.get(first)
+        self.store.get(third)
+        with self.assertRaises(KeyError):
+            self.store.get(second)
+
+    def test_entries_expire(self):
+        selection_id = self.store.put([1])
+        self.now = 9.0
+        self.store.get(selection_id)  # using a selection keeps it alive
+        self.now = 18.0
+        self.store.get(selection_id)
+        self.now = 28.0
+        with self.assertRaises(KeyError):
+            self.store.get(selection_id)
+        assert len(self.store) == 0
+
+
+class TestSelectionEncodings(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.n_rows = 1003
+        self.positions = np.flatnonzero(rng.random(self.n_rows) < 0.3)
+
+    def test_rle_round_trip(self):
+        runs = encode_rle(self.positions)
+        assert len(runs) % 2 == 0
+        np.testing.assert_array_equal(decode_rle(runs, self.n_rows), self.positions)
+        assert encode_rle([5, 3, 4, 9]) == [3, 3, 9, 1]
+        assert decode_rle([], self.n_rows).tolist() == []
+
+    def test_bitset_round_trip(self):
+        data = encode_bitset(self.positions, self.n_rows)
+        np.testing.assert_array_equal(decode_bitset(data, self.n_rows), self.positions)
+
+    def test_decode_selected_rows(self):
+        rle = {"encoding": "rle", "runs": encode_rle(self.positions)}
+        bitset = {"encoding": "bitset", "data": encode_bitset(self.positions, self.n_rows)}
+        for selected_rows in [rle, bitset]:
+            np.testing.assert_array_equal(decode_selected_rows(selected_rows, self.n_rows), self.positions)
+
+    def test_malformed_selections_raise(self):
+        for selected_rows in [
+            {"encoding": "rle", "runs": [1, 2, 3]},
+            {"encoding": "rle", "runs": [1000, 10]},
+            {"encoding": "rle", "runs": [-1, 1]},
+            {"encoding": "bitset", "data": "not base64!"},
+            {"encoding": "bitset", "data": encode_bitset([1], 8)},
+            {"encoding": "gzip"},
+            [1, 2, 3],
+        ]:
+            with self.assertRaises(ValueError):
+                decode_selected_rows(selected_rows, self.n_rows)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,170 @@
+# test_snapshot
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from bikg_app.routers import snapshot
+from bikg_app.routers.dataset import EXEMPLAR_MAPS, Dataset, dataset_from_snapshot, dataset_to_snapshot, load_dataset
+from bikg_app.routers.snapshot import (
+    SnapshotMismatchError,
+    StringTable,
+    decode_string_table,
+    describe_sources,
+    encode_json_table,
+    encode_string_table,
+    read_snapshot,
+    write_snapshot,
+)
+
+
+class TestStringTable(unittest.TestCase):
+    def test_round_trip(self):
+        strings = ["lotr:Frodo", "", "http://example.org/ü#x", "EdgeNotPresent"]
+        data, offsets = encode_string_table(strings)
+        assert decode_string_table(data, offsets) == strings
+        assert decode_string_table(data, offsets, [3, 0]) == ["EdgeNotPresent", "lotr:Frodo"]
+
+    def test_empty(self):
+        data, offsets = encode_string_table([])
+        assert decode_string_table(data, offsets) == []
+
+    def test_lazy_table(self):
+        values = ["lotr:Frodo", 1.0, 3, ["lotr:Character"]]
+        table = StringTable(*encode_json_table(values), decode=json.loads)
+        assert len(table) == 4
+        assert table[1] == 1.0
+        assert isinstance(table[1], float)
+        assert table[-1] == ["lotr:Character"]
+        assert list(table) == values
+        assert table[1:3].tolist() == [1.0, 3]
+        assert list(table[2:2]) == []
+        with self.assertRaises(IndexError):
+            table[4]
+
+
+class TestSnapshotFile(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.source = os.path.join(self.tmp_dir, "study.csv")
+        with open(self.source, "w", encoding="utf-8") as f:
+            f.write("a,b\n1,2\n")
+        self.path = os.path.join(self.tmp_dir, "dataset.bikgsnap")
+        self.arrays = {
+            "codes": np.array([0, 1, 1, 2], dtype=np.int32),
+            "coordinates": np.arange(6, dtype=np.float64).reshape(3, 2),
+            "empty": np.zeros(0, dtype=np.int64),
+        }
+        self.objects = {"violations_list": ["lotr:CharacterShape-hasHome"], "count": np.int64(3)}
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_round_trip(self):
+        write_snapshot(self.path, self.arrays, self.objects, describe_sources([self.source]))
+        arrays, objects = read_snapshot(self.path, [self.source])
+        for name, array in self.arrays.items():
+            np.testing.assert_array_equal(arrays[name], array)
+            assert arrays[name].dtype == array.dtype
+        assert not arrays["codes"].flags.writeable
+        assert objects == {"violations_list": ["lotr:CharacterShape-hasHome"], "count": 3}
+
+    def test_touched_but_unchanged_source_is_accepted(self):
+        write_snapshot(self.path, self.arrays, self.objects, describe_sources([self.source]))
+        stat = os.stat(self.source)
+        os.utime(self.source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        read_snapshot(self.path, [self.source])
+
+    def test_changed_source_is_rejected(self):
+        write_snapshot(self.path, self.arrays, self.objects, describe_sources([self.source]))
+        with open(self.source, "w", encoding="utf-8") as f:
+            f.write("a,b\n1,3\n")
+        with self.assertRaises(SnapshotMismatchError):
+            read_snapshot(self.path, [self.source])
+
+    def test_other_sources_are_rejected(self):
+        write_snapshot(self.path, self.arrays, self.objects, describe_sources([self.source]))
+        with self.assertRaises(SnapshotMismatchError):
+            read_snapshot(self.path, [self.source, self.path])
+
+    def test_other_format_version_is_rejected(self):
+        write_snapshot(self.path, self.arrays, self.objects, describe_sources([self.source]))
+        original_version = snapshot.SNAPSHOT_FORMAT_VERSION
+        snapshot.SNAPSHOT_FORMAT_VERSION = original_version + 1
+        try:
+            with self.assertRaises(SnapshotMismatchError):
+                read_snapshot(self.path, [self.source])
+        finally:
+            snapshot.SNAPSHOT_FORMAT_VERSION = original_version
+
+
+class TestDatasetSnapshot(unittest.TestCase):
+    def test_dataset_round_trip(self):
+        loaded = load_dataset(use_snapshot=False)
+        arrays, objects = dataset_to_snapshot(loaded)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "dataset.bikgsnap")
+            write_snapshot(path, arrays, objects, describe_sources([]))
+            mapped_arrays, mapped_objects = read_snapshot(path, [])
+            restored = Dataset()
+            dataset_from_snapshot(restored, mapped_arrays, mapped_objects)
+
+            pd.testing.assert_frame_equal(restored.df, loaded.df)
+            assert restored.overall_value_counts == loaded.overall_value_counts
+            assert restored.overall_violation_value_counts == loaded.overall_violation_value_counts
+            assert restored.type_violation_dict == loaded.type_violation_dict
+            assert restored.focus_node_ids.tolist() == loaded.focus_node_ids.tolist()
+            for name in EXEMPLAR_MAPS:
+                restored_map, loaded_map = getattr(restored, name), getattr(loaded, name)
+                assert restored_map.to_dict(restored.terms.qname) == loaded_map.to_dict(loaded.terms.qname)
+                assert restored_map.to_dict(restored.terms.shortened) == loaded_map.to_dict(loaded.terms.shortened)
+            assert restored.node_count_dict == loaded.node_count_dict
+            assert restored.subclass_edges == loaded.subclass_edges
+            assert restored.types_only_in_csv == loaded.types_only_in_csv
+            assert restored.node_labels.labels == loaded.node_labels.labels
+            assert restored.edge_labels.labels == loaded.edge_labels.labels
+            assert restored.violation_paths.to_dict() == loaded.violation_paths.to_dict()
+            assert restored.namespace_stats.counts(restored.shortener) == loaded.namespace_stats.counts(loaded.shortener)
+            assert restored.ontology_tree is not None
+            assert loaded.ontology_tree is not None
+            assert restored.ontology_tree.to_dict() == loaded.ontology_tree.to_dict()
+            assert restored.ttl_data == loaded.ttl_data
+            assert sorted(restored.g.namespaces()) == sorted(loaded.g.namespaces())
+            assert len(restored.g) == len(loaded.g)
+            assert set(restored.g) == set(loaded.g)
+
+            # the indexes are mapped from the snapshot, not rebuilt
+            for term_id in range(len(loaded.terms)):
+                term = loaded.terms.term(term_id)
+                assert term in restored.terms
+                assert restored.terms.id(term) == term_id
+                assert restored.terms.term(term_id) == term
+            assert restored.terms.add_qnames(loaded.df.index[:5].tolist()).tolist() == loaded.focus_node_ids[:5].tolist()
+            positions = np.arange(0, len(loaded.df), 3)
+            assert restored.category_codes.value_counts(positions) == loaded.category_codes.value_counts(positions)
+            for column in loaded.filtered_columns:
+                categories = loaded.df[column].dropna().unique().tolist()[:3]
+                selected = restored.selection_index.rows_with_categories(column, categories)
+                assert selected.tolist() == loaded.selection_index.rows_with_categories(column, categories).tolist()
+            selected = restored.selection_index.rows_with_any_violation(loaded.violations_list)
+            assert selected.tolist() == loaded.selection_index.rows_with_any_violation(loaded.violations_list).tolist()
+            assert restored.study_records.to_json() == loaded.study_records.to_json()
+            assert list(restored.study_records.iter_ndjson(7)) == list(loaded.study_records.iter_ndjson(7))
+            assert restored.study_records.list_columns.keys() == loaded.study_records.list_columns.keys()
+            for column, list_column in loaded.study_records.list_columns.items():
+                restored_column = restored.study_records.list_columns[column]
+                assert [restored_column.row(i) for i in range(len(restored_column))] == [
+                    list_column.row(i) for i in range(len(list_column))
+                ]
+            triple = ("http://example.org/a", "http://example.org/p", "http://example.org/b")
+            restored.namespace_stats.add(triple)
+            loaded.namespace_stats.add(triple)
+            assert restored.namespace_stats.counts(restored.shortener) == loaded.namespace_stats.counts(loaded.shortener)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+# test_study_arrow
+import unittest
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from bikg_app.routers.study_arrow import study_table_to_arrow
+from bikg_app.routers.study_records import StudyRecords
+
+
+class TestStudyArrow(unittest.TestCase):
+    def setUp(self):
+        self.df = pd.DataFrame(
+            {
+                "focus_node": ["lotr:Frodo", "lotr:Sam", "lotr:Shire"],
+                "lotr:CharacterShape-hasHome": [1.0, 0.0, 0.0],
+                "rdf:type": ["['lotr:Character']", "['lotr:Character', 'lotr:Hobbit']", "['lotr:Region']"],
+                "lotr:hasAncestry": ["lotr:Hobbit", "lotr:Hobbit", "EdgeNotPresent"],
+                "x": [0.25, 0.5, 0.75],
+            },
+            index=["lotr:Frodo", "lotr:Sam", "lotr:Shire"],
+        )
+        records = StudyRecords.from_df(self.df)
+        self.table = pa.ipc.open_stream(study_table_to_arrow(self.df, records.list_columns)).read_all()
+
+    def test_schema(self):
+        schema = self.table.schema
+        assert schema.names == list(self.df.columns)
+        assert pa.types.is_dictionary(schema.field("focus_node").type)
+        assert pa.types.is_dictionary(schema.field("lotr:hasAncestry").type)
+        assert pa.types.is_list(schema.field("rdf:type").type)
+        assert pa.types.is_dictionary(schema.field("rdf:type").type.value_type)
+        assert schema.field("x").type == pa.float64()
+
+    def test_values(self):
+        assert self.table.column("rdf:type").to_pylist() == [["lotr:Character"], ["lotr:Character", "lotr:Hobbit"], ["lotr:Region"]]
+        assert self.table.column("lotr:hasAncestry").to_pylist() == self.df["lotr:hasAncestry"].tolist()
+        assert self.table.column("lotr:CharacterShape-hasHome").to_pylist() == self.df["lotr:CharacterShape-hasHome"].tolist()
+        np.testing.assert_array_equal(self.table.column("x").to_numpy(), self.df["x"].to_numpy())
+
+    def test_non_string_objects_are_rejected(self):
+        df = pd.DataFrame({"mixed": ["lotr:Frodo", 3]})
+        with self.assertRaises(ValueError):
+            study_table_to_arrow(df, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+# test_study_records
+import json
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from bikg_app.routers.dataset import STUDY_CSV_FILE_PATH
+from bikg_app.routers.study_records import StudyRecords, parse_list_cell
+
+
+def pandas_records(df):
+    # the per-request parsing /file/study did before the records were prepared at load time
+    parsed_df = df.copy()
+    for column in parsed_df.columns:
+        parsed_df[column] = parsed_df[column].apply(parse_list_cell)
+    return json.loads(parsed_df.to_json(orient="records"))
+
+
+class TestStudyRecords(unittest.TestCase):
+    def setUp(self):
+        self.df = pd.DataFrame(
+            {
+                "focus_node": ["lotr:Frodo", "lotr:Sam", "lotr:Shire"],
+                "rdf:type": ["['lotr:Character']", "['lotr:Character', 'lotr:Hobbit']", "['lotr:Region']"],
+                "lotr:hasHome": ["['lotr:Shire']", "lotr:Shire", "EdgeNotPresent"],
+                "lotr:age": [50, 38, 7],
+                "x": [0.25, np.nan, 0.97849387],
+            },
+            index=["lotr:Frodo", "lotr:Sam", "lotr:Shire"],
+        )
+
+    def test_matches_pandas_records(self):
+        records = StudyRecords.from_df(self.df)
+        assert json.loads(records.to_json()) == pandas_records(self.df)
+
+    def test_ndjson(self):
+        records = StudyRecords.from_df(self.df)
+        chunks = list(records.iter_ndjson(chunk_rows=2))
+        assert len(chunks) == 2
+        lines = b"".join(chunks).decode("utf-8").splitlines()
+        assert [json.loads(line) for line in lines] == pandas_records(self.df)
+
+    def test_list_columns(self):
+        records = StudyRecords.from_df(self.df)
+        # only columns whose cells are all lists get an offset-array form
+        assert list(records.list_columns) == ["rdf:type"]
+        types = records.list_columns["rdf:type"]
+        assert len(types) == 3
+        assert types.offsets.tolist() == [0, 1, 3, 4]
+        assert types.row(1) == ["lotr:Character", "lotr:Hobbit"]
+
+    def test_study_table(self):
+        df = pd.read_csv(STUDY_CSV_FILE_PATH, index_col=0).replace(np.nan, "nan", regex=True)
+        assert json.loads(StudyRecords.from_df(df).to_json()) == pandas_records(df)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+# test_study_schema
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from bikg_app.routers.study_schema import (
+    EMBEDDING,
+    FOCUS_NODE,
+    MISSING_VALUE,
+    PREDICATE,
+    TYPE_LIST,
+    VIOLATION_COUNT,
+    apply_schema,
+    category_labels,
+    column_roles,
+)
+
+
+class TestStudySchema(unittest.TestCase):
+    def setUp(self):
+        self.df = pd.DataFrame(
+            {
+                "focus_node": ["lotr:Frodo", "lotr:Sam", "lotr:Shire"],
+                "lotr:CharacterShape-hasHome": [1.0, 0.0, 0.0],
+                "lotr:RegionShape-isInContinent": [0.0, 300.0, 2.0],
+                "rdf:type": ["['lotr:Character']", "['lotr:Character']", "['lotr:Region']"],
+                "lotr:hasAncestry": ["lotr:Hobbit", np.nan, "lotr:Dwarf"],
+                "lotr:age": [50.0, np.nan, 38.0],
+                "x": [0.25, 0.5, 0.75],
+                "y": [1.0, 2.0, 3.0],
+            },
+            index=["lotr:Frodo", "lotr:Sam", "lotr:Shire"],
+        )
+        self.violations_list = ["lotr:CharacterShape-hasHome", "lotr:RegionShape-isInContinent"]
+
+    def test_column_roles(self):
+        roles = column_roles(self.df.columns, self.violations_list)
+        assert roles == {
+            "focus_node": FOCUS_NODE,
+            "lotr:CharacterShape-hasHome": VIOLATION_COUNT,
+            "lotr:RegionShape-isInContinent": VIOLATION_COUNT,
+            "rdf:type": TYPE_LIST,
+            "lotr:hasAncestry": PREDICATE,
+            "lotr:age": PREDICATE,
+            "x": EMBEDDING,
+            "y": EMBEDDING,
+        }
+
+    def test_apply_schema(self):
+        df = apply_schema(self.df, column_roles(self.df.columns, self.violations_list))
+        assert list(df.columns) == list(self.df.columns)
+        assert list(df.index) == list(self.df.index)
+        assert df["lotr:CharacterShape-hasHome"].dtype == np.uint8
+        assert df["lotr:RegionShape-isInContinent"].dtype == np.uint16
+        assert df["x"].dtype == np.float32
+        assert df["y"].dtype == np.float32
+        assert df["focus_node"].dtype == object
+        # numeric predicate columns keep their dtype and their missing cells
+        assert df["lotr:age"].dtype == np.float64
+        assert df["lotr:age"].isna().tolist() == [False, True, False]
+
+        # categories in the order they first appear, missing cells as their own category
+        ancestry = df["lotr:hasAncestry"]
+        assert isinstance(ancestry.dtype, pd.CategoricalDtype)
+        assert ancestry.cat.categories.tolist() == ["lotr:Hobbit", "lotr:Dwarf", MISSING_VALUE]
+        assert ancestry.tolist() == ["lotr:Hobbit", MISSING_VALUE, "lotr:Dwarf"]
+        assert df["rdf:type"].cat.categories.tolist() == ["['lotr:Character']", "['lotr:Region']"]
+
+    def test_invalid_counts(self):
+        self.df["lotr:CharacterShape-hasHome"] = [1.0, 0.5, 0.0]
+        with self.assertRaises(ValueError):
+            apply_schema(self.df, column_roles(self.df.columns, self.violations_list))
+
+    def test_category_labels(self):
+        df = apply_schema(self.df, column_roles(self.df.columns, self.violations_list))
+        counts = df["lotr:CharacterShape-hasHome"].value_counts()
+        labels = category_labels(counts.index, counts.index.dtype)
+        assert labels == [0.0, 1.0]
+        assert all(isinstance(label, float) for label in labels)
+        assert category_labels(["lotr:Hobbit"], df["lotr:hasAncestry"].dtype) == ["lotr:Hobbit"]
+
+
+if __name__ == "__main__":
+    unittest.main()
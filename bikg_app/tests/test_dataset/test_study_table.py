@@ -0,0 +1,95 @@
+# test_study_table
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from bikg_app.routers import dataset
+from bikg_app.routers.dataset import STUDY_CSV_FILE_PATH, VIOLATIONS_FILE_PATH
+from bikg_app.routers.study_table import read_study_table, write_study_table
+
+
+class TestStudyTable(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, "study.parquet")
+        self.df = pd.DataFrame(
+            {
+                "focus_node": ["lotr:Frodo", "lotr:Sam", "lotr:Shire"],
+                "lotr:CharacterShape-hasHome": [1.0, 300.0, 0.0],
+                "rdf:type": [["lotr:Character"], ["lotr:Character", "lotr:Hobbit"], ["lotr:Region"]],
+                "lotr:hasAncestry": ["lotr:Hobbit", "lotr:Hobbit", np.nan],
+                "x": [0.25, 0.5, 0.75],
+            },
+            index=["lotr:Frodo", "lotr:Sam", "lotr:Shire"],
+        )
+        self.violation_list = ["lotr:CharacterShape-hasHome", "lotr:RegionShape-isInContinent"]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_typed_columns(self):
+        write_study_table(self.df, self.violation_list, self.path)
+        schema = pq.read_schema(self.path)
+        # focus_node is stored once, not again as the index
+        assert schema.names == list(self.df.columns)
+        assert str(schema.field("lotr:CharacterShape-hasHome").type) == "uint16"
+        assert str(schema.field("rdf:type").type) == "list<item: dictionary<values=string, indices=int32, ordered=0>>"
+        assert str(schema.field("lotr:hasAncestry").type) == "dictionary<values=string, indices=int32, ordered=0>"
+
+        study_df = read_study_table(self.path)
+        assert list(study_df.index) == list(self.df.index)
+        assert list(study_df.columns) == list(self.df.columns)
+        assert study_df["lotr:CharacterShape-hasHome"].tolist() == [1, 300, 0]
+        assert study_df["rdf:type"].tolist() == self.df["rdf:type"].tolist()
+        assert isinstance(study_df["lotr:hasAncestry"].dtype, pd.CategoricalDtype)
+        assert study_df["lotr:hasAncestry"].isna().tolist() == [False, False, True]
+        assert study_df["x"].tolist() == [0.25, 0.5, 0.75]
+
+    def test_column_pruning(self):
+        write_study_table(self.df, self.violation_list, self.path)
+        study_df = read_study_table(self.path, columns=["rdf:type"])
+        assert list(study_df.columns) == ["rdf:type"]
+        assert list(study_df.index) == list(self.df.index)
+
+    def test_list_strings(self):
+        df = pd.read_csv(STUDY_CSV_FILE_PATH, index_col=0)
+        with open(VIOLATIONS_FILE_PATH, encoding="utf-8") as f:
+            violation_list = json.load(f)
+        write_study_table(df, violation_list, self.path)
+        study_df = read_study_table(self.path)
+        assert all(str(study_df[column].dtype) == "uint8" for column in violation_list)
+        assert study_df.loc["lotr:Thengel", "rdf:type"] == ["lotr:Character"]
+        list_df = read_study_table(self.path, list_strings=True)
+        assert list(list_df.index) == list(df.index)
+        assert list(list_df.columns) == list(df.columns)
+        for column in df.columns:
+            assert list_df[column].astype(df[column].dtype).tolist() == df[column].tolist()
+
+    def test_invalid_counts(self):
+        for count in [-1.0, 0.5, np.nan]:
+            self.df["lotr:CharacterShape-hasHome"] = [1.0, count, 0.0]
+            with self.assertRaises(ValueError):
+                write_study_table(self.df, self.violation_list, self.path)
+
+    def test_dataset_prefers_newer_parquet(self):
+        csv_path = os.path.join(self.tmp_dir, "study.csv")
+        self.df.to_csv(csv_path)
+        with mock.patch.object(dataset, "STUDY_CSV_FILE_PATH", csv_path), mock.patch.object(dataset, "STUDY_PARQUET_FILE_PATH", self.path):
+            assert dataset.study_table_path() == csv_path
+            write_study_table(self.df, self.violation_list, self.path)
+            os.utime(csv_path, (0, 0))
+            assert dataset.study_table_path() == self.path
+            os.utime(csv_path, None)
+            os.utime(self.path, (0, 0))
+            assert dataset.study_table_path() == csv_path
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,125 @@
+# test_term_dictionary
+import unittest
+
+from rdflib import BNode, Literal, URIRef
+
+from bikg_app.routers.namespace_shortener import NamespaceShortener
+from bikg_app.routers.snapshot import StringTable, encode_string_table
+from bikg_app.routers.term_dictionary import TermDictionary, TermMap, search_order
+
+LOTR = "http://example.org/lotr#"
+EX = "http://example.com/exemplar#"
+
+
+class TestTermDictionary(unittest.TestCase):
+    def setUp(self):
+        self.shortener = NamespaceShortener([("lotr", LOTR), ("ex", EX)])
+        self.terms = TermDictionary(self.shortener)
+
+    def test_ids(self):
+        frodo = self.terms.add(LOTR + "Frodo")
+        # an IRI has one id whether it comes as a str or as a URIRef, literals and blank nodes are terms of their own
+        assert self.terms.add(URIRef(LOTR + "Frodo")) == frodo
+        name = self.terms.add(Literal(LOTR + "Frodo"))
+        node = self.terms.add(BNode("b0"))
+        assert len({frodo, name, node}) == 3
+        assert len(self.terms) == 3
+        assert self.terms.add_many([LOTR + "Sam", LOTR + "Frodo"]).tolist() == [3, frodo]
+        assert self.terms.id(URIRef(LOTR + "Sam")) == 3
+        assert URIRef(LOTR + "Sam") in self.terms
+        with self.assertRaises(KeyError):
+            self.terms.id(LOTR + "Sauron")
+        assert self.terms.term(frodo) == LOTR + "Frodo"
+        assert type(self.terms.term(frodo)) is str
+        assert self.terms.rdf_term(frodo) == URIRef(LOTR + "Frodo")
+        assert self.terms.rdf_term(name) == Literal(LOTR + "Frodo")
+
+    def test_labels(self):
+        ids = self.terms.add_many([LOTR + "Frodo", LOTR + "has space", Literal("Frodo"), LOTR + "hasHome__" + LOTR + "Shire"])
+        assert self.terms.qnames(ids[:3]) == ["lotr:Frodo", LOTR + "has space", "Frodo"]
+        assert self.terms.shortened(ids[3]) == "lotr:hasHome__lotr:Shire"
+        # cached alongside the terms, the shortener does not memoize them a second time
+        assert self.terms.qname(ids[0]) is self.terms.qname(ids[0])
+        assert self.shortener.stats()["memoized"] == 0
+
+    def test_add_qnames(self):
+        sam = self.terms.add(LOTR + "Sam")
+        qnames = ["lotr:Frodo", "lotr:Sam", "mordor:Sauron", "lotr:Frodo"]
+        ids = self.terms.add_qnames(qnames)
+        assert ids[1] == sam
+        assert ids[0] == ids[3]
+        assert self.terms.term(ids[0]) == LOTR + "Frodo"
+        assert self.terms.qname(ids[0]) is qnames[0]
+        # a QName without a bound prefix is a name, its own QName, and never equal to an IRI
+        assert self.terms.qname(ids[2]) == "mordor:Sauron"
+        assert "mordor:Sauron" not in self.terms
+        assert self.terms.add_qnames(["mordor:Sauron"]).tolist() == [ids[2]]
+        assert self.terms.qnames(ids) == qnames
+
+    def test_strings_round_trip(self):
+        ids = self.terms.add_many([LOTR + "Frodo", Literal("50", datatype=URIRef("http://www.w3.org/2001/XMLSchema#integer"))])
+        name = self.terms.add_qnames(["mordor:Sauron"])[0]
+        self.terms.qname(ids[0])
+        kinds, strings, qnames = self.terms.to_strings()
+        restored = TermDictionary.from_strings(kinds, strings, qnames, self.shortener)
+        assert [restored.term(term_id) for term_id in range(len(restored))] == [
+            self.terms.term(term_id) for term_id in range(len(self.terms))
+        ]
+        assert restored.id(LOTR + "Frodo") == ids[0]
+        assert restored.qname(name) == "mordor:Sauron"
+        assert restored.to_strings()[2] == qnames
+
+    def test_tables_round_trip(self):
+        ids = self.terms.add_many([LOTR + "Sam", Literal("Frodo"), LOTR + "Frodo", BNode("b0")])
+        name = self.terms.add_qnames(["mordor:Sauron"])[0]
+        self.terms.qname(ids[2])
+        kinds, strings, qnames = self.terms.to_strings()
+        restored = TermDictionary.from_tables(
+            kinds,
+            StringTable(*encode_string_table(strings)),
+            StringTable(*encode_string_table([qname or "" for qname in qnames])),
+            [qname is not None for qname in qnames],
+            search_order(kinds, strings),
+            self.shortener,
+        )
+        # looked up by binary search, nothing is decoded before it is used
+        assert restored.id(LOTR + "Frodo") == ids[2]
+        assert restored.id(Literal("Frodo")) == ids[1]
+        assert restored.add(BNode("b0")) == ids[3]
+        assert Literal(LOTR + "Frodo") not in restored
+        assert restored.add_qnames(["lotr:Sam", "mordor:Sauron"]).tolist() == [ids[0], name]
+        assert restored.rdf_term(ids[1]) == Literal("Frodo")
+        assert restored.qname(ids[2]) == "lotr:Frodo"
+        sauron = restored.add(LOTR + "Sauron")
+        assert sauron == len(self.terms)
+        assert restored.id(URIRef(LOTR + "Sauron")) == sauron
+        assert restored.to_strings()[1] == [*strings, LOTR + "Sauron"]
+
+
+class TestTermMap(unittest.TestCase):
+    def setUp(self):
+        self.terms = TermDictionary(NamespaceShortener([("lotr", LOTR), ("ex", EX)]))
+
+    def test_lists(self):
+        d = {LOTR + "Frodo": [EX + "e1", EX + "e2"], LOTR + "Sam": [], LOTR + "Merry": [EX + "e1"]}
+        term_map = TermMap.from_dict(d, self.terms)
+        assert len(term_map) == 3
+        assert term_map.counts is None
+        assert term_map.offsets.tolist() == [0, 2, 2, 3]
+        assert term_map.to_dict(self.terms.term) == d
+        assert term_map.to_dict(self.terms.qname) == {"lotr:Frodo": ["ex:e1", "ex:e2"], "lotr:Sam": [], "lotr:Merry": ["ex:e1"]}
+
+    def test_counts(self):
+        d = {EX + "e1": {LOTR + "hasHome__" + LOTR + "Shire": 2, "http://www.w3.org/ns/shacl#resultMessage__Expected value": 1}}
+        term_map = TermMap.from_dict(d, self.terms)
+        assert term_map.counts is not None
+        assert term_map.counts.tolist() == [2, 1]
+        assert term_map.to_dict(self.terms.term) == d
+        assert term_map.to_dict(self.terms.shortened) == {
+            "ex:e1": {"lotr:hasHome__lotr:Shire": 2, "http://www.w3.org/ns/shacl#resultMessage__Expected value": 1}
+        }
+        assert TermMap.from_dict({}, self.terms).to_dict(self.terms.qname) == {}
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+# test_triple_store
+import itertools
+import unittest
+from collections import Counter
+
+from rdflib import OWL, RDF, RDFS, BNode, Graph, Literal, URIRef
+
+from bikg_app.routers.term_dictionary import TermDictionary
+from bikg_app.routers.triple_store import TripleStore
+from bikg_app.routers.violation_paths import find_violation_paths
+from bikg_app.tests.test_dataset.test_violation_paths import LOTR, build_graph, reference_paths
+
+
+def build_ontology():
+    g = build_graph()
+    g.add((LOTR.Hobbit, RDFS.subClassOf, LOTR.Character))
+    g.add((LOTR.Elf, RDFS.subClassOf, LOTR.Character))
+    g.add((LOTR.Frodo, LOTR.age, Literal(50)))
+    g.add((LOTR.Frodo, RDFS.label, Literal("Frodo", lang="en")))
+    return g
+
+
+class TestTripleStore(unittest.TestCase):
+    def setUp(self):
+        self.g = build_ontology()
+        self.store = TripleStore.from_graph(self.g, TermDictionary())
+
+    def test_patterns_match_rdflib(self):
+        assert len(self.store) == len(self.g)  # type: ignore
+        assert set(self.store) == set(self.g)
+        # every pattern of bound and unbound terms, including a term the store does not know
+        terms = [None, LOTR.CharacterShape, RDF.type, OWL.Class, LOTR.Elf, Literal(50), URIRef("http://example.org/unknown")]
+        for pattern in itertools.product(terms, repeat=3):
+            assert sorted(self.store.triples(pattern)) == sorted(self.g.triples(pattern)), pattern
+
+    def test_dataset_patterns(self):
+        assert sorted(self.store.subject_objects(RDFS.subClassOf)) == sorted(self.g.subject_objects(RDFS.subClassOf))
+        assert Counter(self.store.subjects(RDF.type, OWL.Class)) == Counter(self.g.subjects(RDF.type, OWL.Class))
+        assert Counter(self.store.objects(LOTR.CharacterShape, None, unique=True)) == Counter(set(self.g.objects(LOTR.CharacterShape)))
+        assert Counter(self.store.predicates()) == Counter(self.g.predicates())
+        assert (LOTR.Hobbit, RDF.type, OWL.Class) in self.store
+        assert (LOTR.Hobbit, RDF.type, LOTR.Elf) not in self.store
+        # the NodeShape, sh:property and sh:targetClass lookups of the violation paths
+        paths = list(find_violation_paths(self.store))
+        assert len(paths) == len(set(paths))
+        assert set(paths) == reference_paths(self.g)
+
+    def test_match_ids(self):
+        terms = self.store.terms
+        matches = self.store.match(p=terms.id(RDFS.subClassOf))
+        assert matches.shape == (3, 2)
+        assert set(matches[2].tolist()) == {terms.id(LOTR.Character)}
+        # sorted by the term ids of the permutation, so every pattern is a contiguous range of it
+        assert self.store.spo[0].tolist() == sorted(self.store.spo[0].tolist())
+        assert self.store.match(s=-1).shape == (3, 0)
+
+    def test_order_does_not_depend_on_the_graph(self):
+        # the same triples added in reverse order get the same ids, so the matches come in the same order
+        reversed_g = Graph()
+        for triple in reversed(list(self.g)):
+            reversed_g.add(triple)
+        store = TripleStore.from_graph(reversed_g, TermDictionary())
+        assert list(store) == list(self.store)
+        assert list(store.subject_objects(RDFS.subClassOf)) == list(self.store.subject_objects(RDFS.subClassOf))
+
+    def test_duplicates_and_blank_nodes(self):
+        terms = TermDictionary()
+        node = BNode()
+        ids = terms.add_many([LOTR.Frodo, LOTR.knows, node])
+        store = TripleStore.from_triples(terms, [ids, ids])
+        assert len(store) == 1
+        assert list(store) == [(LOTR.Frodo, LOTR.knows, node)]
+        assert TripleStore.from_triples(terms, []).match().shape == (3, 0)
+
+    def test_namespaces(self):
+        bindings = [(prefix, str(namespace)) for prefix, namespace in self.g.namespaces()]
+        assert self.store.namespaces() == bindings
+        # an IRI without a bound namespace gets a generated prefix, which is bound from then on
+        prefix, namespace, name = self.store.namespace_manager.compute_qname("http://example.org/places/Shire")
+        assert self.store.namespaces() == [*bindings, (prefix, str(namespace))]
+
+
+if __name__ == "__main__":
+    unittest.main()
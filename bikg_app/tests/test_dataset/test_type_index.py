@@ -0,0 +1,72 @@
+# test_type_index
+import ast
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from bikg_app.routers.dataset import build_type_node_count_dict, build_type_violation_dict
+from bikg_app.routers.type_index import TypeIndex
+
+
+class TestTypeIndex(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        types = [f"lotr:Type{i}" for i in range(30)]
+        cells = []
+        for _ in range(400):
+            listed = rng.choice(types, rng.integers(0, 4)).tolist()  # empty lists and repeated types included
+            cells.append(str(listed))
+        self.violations = ["lotr:CharacterShape-hasHome", "lotr:CharacterShape-hasAge"]
+        self.df = pd.DataFrame(
+            {
+                "rdf:type": cells,
+                "lotr:CharacterShape-hasHome": rng.integers(0, 3, len(cells)).astype(float),
+                "lotr:CharacterShape-hasAge": (rng.random(len(cells)) < 0.05).astype(float),
+            }
+        )
+        self.original = self.df.copy()
+        self.exploded = self.df.assign(**{"rdf:type": self.df["rdf:type"].apply(ast.literal_eval)}).explode("rdf:type")
+        self.index = TypeIndex.from_column(self.df["rdf:type"])
+
+    def test_types_in_order_of_appearance(self):
+        assert self.index.types == self.exploded["rdf:type"].dropna().unique().tolist()
+
+    def test_rows_of(self):
+        for type_ in self.index.types:
+            expected = np.asarray(self.exploded.index[self.exploded["rdf:type"] == type_])
+            np.testing.assert_array_equal(self.index.rows_of(type_), expected)
+        assert len(self.index.rows_of("lotr:Orc")) == 0
+        assert "lotr:Type0" in self.index
+        assert "lotr:Orc" not in self.index
+
+    def test_read_only(self):
+        with self.assertRaises(ValueError):
+            self.index.rows[0] = 1
+        with self.assertRaises(ValueError):
+            self.index.offsets[0] = 1
+
+    def test_type_count_dict_matches_value_counts(self):
+        expected = self.exploded["rdf:type"].value_counts().to_dict()
+        assert list(build_type_node_count_dict(self.index).items()) == list(expected.items())
+
+    def test_type_violation_dict(self):
+        expected = {}
+        for rdf_type in self.exploded["rdf:type"].dropna().unique():
+            counts = {}
+            for violation in self.violations:
+                count = int(self.exploded[self.exploded["rdf:type"] == rdf_type][violation].sum())
+                if count > 0:
+                    counts[violation] = count
+            if counts:
+                expected[rdf_type] = counts
+        assert build_type_violation_dict(self.index, self.df, self.violations) == expected
+        pd.testing.assert_frame_equal(self.df, self.original)
+
+    def test_missing_column(self):
+        assert build_type_node_count_dict(None) == {}
+        assert build_type_violation_dict(None, self.df, self.violations) == {}
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+# test_violation_paths
+import unittest
+
+from rdflib import OWL, RDF, BNode, Graph, Namespace
+
+from bikg_app.routers.violation_paths import ViolationPathIndex, find_violation_paths
+
+LOTR = Namespace("http://example.org/lotr#")
+SH = Namespace("http://www.w3.org/ns/shacl#")
+
+
+def build_graph():
+    g = Graph()
+    g.bind("lotr", LOTR)
+    g.bind("sh", SH)
+    for class_ in (LOTR.Hobbit, LOTR.Elf):
+        g.add((class_, RDF.type, OWL.Class))
+    g.add((LOTR.CharacterShape, RDF.type, SH.NodeShape))
+    g.add((LOTR.CharacterShape, SH.targetClass, LOTR.Hobbit))
+    g.add((LOTR.CharacterShape, SH.targetClass, LOTR.Elf))
+    g.add((LOTR.CharacterShape, SH.targetClass, LOTR.NotAClass))
+    for property_shape in (LOTR.hasHomeShape, LOTR.nameShape):
+        g.add((property_shape, RDF.type, SH.PropertyShape))
+        g.add((LOTR.CharacterShape, SH.property, property_shape))
+    g.add((LOTR.CharacterShape, SH.property, BNode()))
+    g.add((LOTR.ElfShape, RDF.type, SH.NodeShape))
+    g.add((LOTR.ElfShape, SH.targetClass, LOTR.Elf))
+    g.add((LOTR.ElfShape, SH.property, LOTR.nameShape))
+    # no target class, so no path
+    g.add((LOTR.RingShape, RDF.type, SH.NodeShape))
+    g.add((LOTR.RingShape, SH.property, LOTR.hasHomeShape))
+    return g
+
+
+def reference_paths(g):
+    """The rows of the SPARQL query /violation_path_nodes_dict used to run per request."""
+    query = """
+    SELECT ?s1 ?o1 ?o2 WHERE {
+        ?s1 a sh:NodeShape .
+        ?s1 sh:property ?o1 .
+        ?s1 sh:targetClass ?o2 .
+        ?o1 a sh:PropertyShape .
+        ?o2 a owl:Class .
+    }
+    """
+    return {tuple(row) for row in g.query(query, initNs={"sh": SH, "owl": OWL})}
+
+
+def label(term):
+    return str(term).replace(str(LOTR), "lotr:")
+
+
+class TestViolationPaths(unittest.TestCase):
+    def setUp(self):
+        self.g = build_graph()
+        self.index = ViolationPathIndex.from_graph(self.g, label)
+
+    def test_paths_match_sparql(self):
+        paths = list(find_violation_paths(self.g))
+        assert len(paths) == len(set(paths))
+        assert set(paths) == reference_paths(self.g)
+
+    def test_to_dict(self):
+        d = self.index.to_dict()
+        assert {k: set(v) for k, v in d["class_property_d"].items()} == {
+            "lotr:Hobbit": {"lotr:CharacterShape", "lotr:hasHomeShape", "lotr:nameShape"},
+            "lotr:Elf": {"lotr:CharacterShape", "lotr:hasHomeShape", "lotr:nameShape", "lotr:ElfShape"},
+        }
+        assert {k: set(v) for k, v in d["property_class_d"].items()} == {
+            "lotr:hasHomeShape": {"lotr:CharacterShape", "lotr:Hobbit", "lotr:Elf"},
+            "lotr:nameShape": {"lotr:CharacterShape", "lotr:Hobbit", "lotr:Elf", "lotr:ElfShape"},
+        }
+        for nodes in list(d["class_property_d"].values()) + list(d["property_class_d"].values()):
+            assert len(nodes) == len(set(nodes))
+
+    def test_point_lookups(self):
+        hobbit = self.index.nodes_of_class("lotr:Hobbit")
+        assert hobbit["nodeShapes"] == ["lotr:CharacterShape"]
+        assert set(hobbit["propertyShapes"]) == {"lotr:hasHomeShape", "lotr:nameShape"}
+        assert hobbit["nodes"] == self.index.to_dict()["class_property_d"]["lotr:Hobbit"]
+        name = self.index.nodes_of_property_shape("lotr:nameShape")
+        assert set(name["nodeShapes"]) == {"lotr:CharacterShape", "lotr:ElfShape"}
+        assert set(name["classes"]) == {"lotr:Hobbit", "lotr:Elf"}
+        with self.assertRaises(KeyError):
+            self.index.nodes_of_class("lotr:NotAClass")
+        with self.assertRaises(KeyError):
+            self.index.nodes_of_property_shape("lotr:CharacterShape")
+
+    def test_round_trip(self):
+        restored = ViolationPathIndex([list(path) for path in self.index.paths])
+        assert restored.to_dict() == self.index.to_dict()
+
+
+if __name__ == "__main__":
+    unittest.main()
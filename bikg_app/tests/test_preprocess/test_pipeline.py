@@ -0,0 +1,225 @@
+# test_pipeline
+import importlib.util
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from rdflib import RDF, BNode, Graph, Literal, URIRef
+
+from bikg_app.preprocess import DEFAULT_PARAMS, STAGES, Pipeline, Stage, run_preprocessing
+from bikg_app.preprocess.stages import aggregate_edges, parse_graph, skolemize_blank_nodes
+from bikg_app.routers.incremental import EMPTY_EDGE_STRING, artifact_paths
+from bikg_app.routers.utils import get_violation_report_exemplars, load_lists_dict, load_nested_counts_dict_json
+
+TTL_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "ttl")
+SOURCES = {
+    "study": os.path.join(TTL_DIR, "study.ttl"),
+    "violations": os.path.join(TTL_DIR, "violation_report.ttl"),
+    "ontology": os.path.join(TTL_DIR, "omics_model.ttl"),
+}
+LOTR = "http://example.org/lotr#"
+
+
+class TestPipeline(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.source = os.path.join(self.tmp_dir, "source.txt")
+        with open(self.source, "w", encoding="utf-8") as f:
+            f.write("a b c")
+        self.calls = []
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def stages(self):
+        def read(path):
+            self.calls.append("read")
+            with open(path, encoding="utf-8") as f:
+                return f.read().split()
+
+        def count(words, minimum):
+            self.calls.append("count")
+            return len([word for word in words if len(word) >= minimum])
+
+        def upper(words, processes):
+            self.calls.append("upper")
+            return [word.upper() for word in words]
+
+        def export(value, paths):
+            with open(paths["violation_list"], "w", encoding="utf-8") as f:
+                json.dump(value, f)
+
+        return [
+            Stage("read", read, sources={"path": "text"}),
+            Stage("count", count, inputs={"words": "read"}, params=("minimum",)),
+            Stage("upper", upper, inputs={"words": "read"}, options=("processes",), export=export, artifacts=("violation_list",)),
+        ]
+
+    def run_pipeline(self, targets=None, **params):
+        pipeline = Pipeline(
+            self.stages(), {"text": self.source}, {"minimum": 1, "processes": 1, **params}, os.path.join(self.tmp_dir, "cache")
+        )
+        return pipeline, pipeline.run(targets or ["count", "upper"])
+
+    def test_skips_unchanged_stages(self):
+        _, summary = self.run_pipeline()
+        assert sorted(self.calls) == ["count", "read", "upper"]
+        assert summary["ran"][0] == "read"
+        self.calls.clear()
+        pipeline, summary = self.run_pipeline()
+        assert self.calls == []
+        assert sorted(summary["loaded"]) == ["count", "upper"]
+        assert pipeline.load("count") == 3
+        assert pipeline.load("upper") == ["A", "B", "C"]
+
+        # options are not part of the key, params are, and only the stages that read them run again
+        self.run_pipeline(processes=4)
+        assert self.calls == []
+        _, summary = self.run_pipeline(minimum=2)
+        assert self.calls == ["count"]
+        assert sorted(summary["loaded"]) == ["read", "upper"]
+
+        self.calls.clear()
+        with open(self.source, "w", encoding="utf-8") as f:
+            f.write("a bb")
+        pipeline, _ = self.run_pipeline()
+        assert sorted(self.calls) == ["count", "read", "upper"]
+        assert pipeline.load("count") == 2
+        with self.assertRaises(KeyError):
+            Pipeline(self.stages(), {"text": self.source}, {"minimum": 9, "processes": 1}, pipeline.cache.directory).load("count")
+
+    def test_exports_once(self):
+        output_dir = os.path.join(self.tmp_dir, "output")
+        pipeline = Pipeline(
+            self.stages(), {"text": self.source}, {"minimum": 1, "processes": 1}, os.path.join(self.tmp_dir, "cache"), output_dir
+        )
+        assert pipeline.run()["exported"] == ["upper"]
+        with open(artifact_paths(output_dir)["violation_list"], encoding="utf-8") as f:
+            assert json.load(f) == ["A", "B", "C"]
+        self.calls.clear()
+        summary = pipeline.run()
+        assert summary["up_to_date"] == ["upper"]
+        assert not summary["loaded"]
+        assert self.calls == []
+        os.remove(artifact_paths(output_dir)["violation_list"])
+        assert pipeline.run()["exported"] == ["upper"]
+
+    def test_independent_stages_run_concurrently(self):
+        barrier = threading.Barrier(2, timeout=10)
+
+        def wait(words):
+            # both stages have to be running at the same time to pass the barrier
+            barrier.wait()
+            return len(words)
+
+        stages = [
+            Stage("read", lambda path: ["a"], sources={"path": "text"}),
+            Stage("left", wait, inputs={"words": "read"}),
+            Stage("right", wait, inputs={"words": "read"}),
+        ]
+        pipeline = Pipeline(stages, {"text": self.source}, {}, os.path.join(self.tmp_dir, "cache"), max_workers=2)
+        assert sorted(pipeline.run(["left", "right"])["ran"]) == ["left", "read", "right"]
+
+    def test_exclusive_stage_runs_alone_on_the_main_thread(self):
+        threads_before = threading.active_count()
+        finished = []
+
+        def slow(words):
+            threading.Event().wait(0.2)
+            finished.append("slow")
+            return len(words)
+
+        def fork(words):
+            # the other stage has finished and the pool's threads are gone, as a fork requires
+            finished.append((threading.current_thread() is threading.main_thread(), threading.active_count(), list(finished)))
+            return words
+
+        stages = [
+            Stage("read", lambda path: ["a"], sources={"path": "text"}),
+            Stage("slow", slow, inputs={"words": "read"}),
+            Stage("fork", fork, inputs={"words": "read"}, exclusive=True),
+            Stage("after", lambda words: len(words), inputs={"words": "fork"}),
+        ]
+        pipeline = Pipeline(stages, {"text": self.source}, {}, os.path.join(self.tmp_dir, "cache"), max_workers=2)
+        assert sorted(pipeline.run(["slow", "after"])["ran"]) == ["after", "fork", "read", "slow"]
+        assert finished[1] == (True, threads_before, ["slow"])
+
+    def test_failing_stage_is_not_cached(self):
+        def fail(words):
+            raise ValueError("broken")
+
+        stages = [Stage("read", lambda path: ["a"], sources={"path": "text"}), Stage("fail", fail, inputs={"words": "read"})]
+        pipeline = Pipeline(stages, {"text": self.source}, {}, os.path.join(self.tmp_dir, "cache"))
+        with self.assertRaises(ValueError):
+            pipeline.run(["fail"])
+        assert ("fail", pipeline.key("fail")) not in pipeline.cache
+        assert ("read", pipeline.key("read")) in pipeline.cache
+
+
+class TestPreprocessingStages(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_exemplars_and_study_table(self):
+        output_dir = os.path.join(self.tmp_dir, "output")
+        summary = run_preprocessing(SOURCES, output_dir, targets=["exemplars", "abbreviate"], max_workers=4)
+        assert summary["exported"] == ["exemplars"]
+        assert set(summary["ran"]) == {stage.name for stage in STAGES} - {"embedding"}
+
+        paths = artifact_paths(output_dir)
+        expected = get_violation_report_exemplars(Graph(), Graph().parse(SOURCES["violations"], format="ttl"))
+        edge_count_dict = load_nested_counts_dict_json(paths["edge_count_dict"])
+        assert sorted(map(sorted, edge_count_dict.values())) == sorted(map(sorted, expected[1].values()))
+        assert set(load_lists_dict(paths["focus_node_exemplar_dict"])) == {str(focus_node) for focus_node in expected[2]}
+
+        pipeline = Pipeline(STAGES, SOURCES, DEFAULT_PARAMS, os.path.join(output_dir, ".preprocess_cache"), output_dir)
+        study_df, violation_list = pipeline.load("abbreviate")
+        assert set(violation_list) == {column for column in study_df.columns if column.startswith("lotr:") and "Shape-" in column}
+        assert study_df.loc["lotr:FrodoBaggins", "focus_node"] == "lotr:FrodoBaggins"
+        assert study_df.loc["lotr:FrodoBaggins", "rdf:type"] == ["lotr:Character"]
+        assert study_df.loc["lotr:FrodoBaggins", "lotr:hasAncestry"] == "lotr:Hobbits"
+        assert sorted(study_df.loc["lotr:Aragorn", "lotr:hasHome"]) == ["lotr:MinasTirith", "lotr:Rivendell"]
+        assert study_df.loc["lotr:FrodoBaggins", "lotr:isInRegion"] == EMPTY_EDGE_STRING
+        assert study_df[violation_list].sum().sum() == len(
+            set(Graph().parse(SOURCES["violations"]).subjects(RDF.type, URIRef("http://www.w3.org/ns/shacl#ValidationResult")))
+        )
+
+        summary = run_preprocessing(SOURCES, output_dir, targets=["exemplars", "abbreviate"])
+        assert summary["ran"] == []
+        assert summary["up_to_date"] == ["exemplars"]
+        assert summary["loaded"] == ["abbreviate"]
+
+    def test_aggregate_edges(self):
+        agg_edges_dict = aggregate_edges(parse_graph(SOURCES["ontology"], DEFAULT_PARAMS["prefixes"]))
+        assert agg_edges_dict[f"{LOTR}Character"] == {f"{LOTR}hasAncestry", f"{LOTR}hasHome"}
+        assert agg_edges_dict[f"{LOTR}Region"] == {f"{LOTR}isInContinent"}
+
+    def test_skolemize_blank_nodes(self):
+        g = Graph()
+        first, second = BNode(), BNode()
+        g.add((first, RDF.value, second))
+        g.add((second, RDF.value, Literal(1)))
+        named_g = skolemize_blank_nodes(g, "http://example.org/bnode/")
+        assert len(named_g) == 2  # type: ignore
+        assert not any(isinstance(term, BNode) for triple in named_g for term in triple)
+        first_name = named_g.value(predicate=RDF.value, object=Literal(1), any=False)
+        assert (None, RDF.value, first_name) in named_g
+        assert str(first_name).startswith("http://example.org/bnode/")
+        assert set(skolemize_blank_nodes(g, "http://example.org/bnode/")) == set(named_g)
+
+    @unittest.skipUnless(importlib.util.find_spec("umap"), "umap-learn is not installed")
+    def test_embedding(self):
+        output_dir = os.path.join(self.tmp_dir, "output")
+        run_preprocessing(SOURCES, output_dir)
+        with open(artifact_paths(output_dir)["violation_list"], encoding="utf-8") as f:
+            assert json.load(f)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+# test_tabularize
+import unittest
+
+from rdflib import RDF, Graph, Literal, URIRef
+
+from bikg_app.preprocess.tabularize import create_study_dataframe, violation_count_dataframe
+from bikg_app.routers.incremental import EMPTY_EDGE_STRING
+
+EX = "http://example.org/"
+TYPE = str(RDF.type)
+
+
+def uri(name):
+    return URIRef(f"{EX}{name}")
+
+
+class TestCreateStudyDataframe(unittest.TestCase):
+    def setUp(self):
+        self.g = Graph()
+        for node in ["frodo", "sam", "gandalf"]:
+            self.g.add((uri(node), RDF.type, uri("Character")))
+        self.g.add((uri("frodo"), uri("hasHome"), uri("Shire")))
+        self.g.add((uri("sam"), uri("hasHome"), uri("Shire")))
+        self.g.add((uri("sam"), uri("hasHome"), uri("Gondor")))
+        self.g.add((uri("frodo"), uri("age"), Literal(50)))
+        # not a focus node, its edges are skipped
+        self.g.add((uri("Shire"), uri("isInRegion"), uri("Eriador")))
+        self.violation_counts = {f"{EX}frodo": {f"{EX}S1": 2}, f"{EX}sam": {f"{EX}S2": 1, f"{EX}S1": 1}, f"{EX}gandalf": {f"{EX}S2": 3}}
+        self.agg_edges_dict = {f"{EX}Character": {f"{EX}hasHome"}}
+
+    def test_cells(self):
+        study_df = create_study_dataframe(self.g, self.violation_counts, self.agg_edges_dict)
+        assert list(study_df.index) == [f"{EX}frodo", f"{EX}sam", f"{EX}gandalf"]
+        assert list(study_df.columns[:3]) == ["focus_node", f"{EX}S1", f"{EX}S2"]
+        assert set(study_df.columns[3:]) == {TYPE, f"{EX}hasHome", f"{EX}age"}
+        assert (study_df["focus_node"] == study_df.index).all()
+        assert study_df[f"{EX}S1"].tolist() == [2, 1, 0]
+        assert study_df[f"{EX}S2"].tolist() == [0, 1, 3]
+
+        # a column with a multi-valued cell holds lists in every row, rdf:type always does
+        assert study_df.loc[f"{EX}frodo", f"{EX}hasHome"] == [f"{EX}Shire"]
+        assert sorted(study_df.loc[f"{EX}sam", f"{EX}hasHome"]) == [f"{EX}Gondor", f"{EX}Shire"]
+        assert study_df.loc[f"{EX}gandalf", f"{EX}hasHome"] == [EMPTY_EDGE_STRING]
+        assert study_df[TYPE].tolist() == [[f"{EX}Character"]] * 3
+        assert study_df[f"{EX}age"].tolist() == ["50", EMPTY_EDGE_STRING, EMPTY_EDGE_STRING]
+        assert f"{EX}isInRegion" not in study_df.columns
+
+    def test_not_allowed_edges_are_logged(self):
+        with self.assertLogs("bikg_app.preprocess.tabularize", level="INFO") as logs:
+            create_study_dataframe(self.g, self.violation_counts, self.agg_edges_dict)
+        assert "3 allowed and 4 not allowed edges, skipped 1 triples" in logs.output[0]
+
+    def test_errors(self):
+        self.g.add((uri("frodo"), uri("nickname"), Literal("")))
+        with self.assertRaises(ValueError):
+            create_study_dataframe(self.g, self.violation_counts, self.agg_edges_dict)
+        self.g.remove((uri("frodo"), uri("nickname"), Literal("")))
+        self.g.remove((uri("gandalf"), RDF.type, uri("Character")))
+        self.g.add((uri("gandalf"), uri("age"), Literal(2019)))
+        with self.assertRaises(ValueError):
+            create_study_dataframe(self.g, self.violation_counts, self.agg_edges_dict)
+
+    def test_empty(self):
+        study_df = create_study_dataframe(Graph(), {}, {})
+        assert study_df.empty
+        assert list(study_df.columns) == ["focus_node"]
+        assert violation_count_dataframe({}).shape == (0, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,13 +1,19 @@
 """
 This module defines some unit tests for the get_violation_report_exemplars function.
 """
+import os
 import unittest
 from collections import defaultdict
 
-from rdflib import Graph, Namespace, URIRef
+from rdflib import RDF, Graph, Namespace, URIRef
 from rdflib.compare import graph_diff, isomorphic, to_isomorphic
 
-from bikg_app.routers.utils import get_violation_report_exemplars
+from bikg_app.routers.utils import SH, get_violation_report_exemplars, shard_validation_results
+
+
+def po(p, o):
+    """The key of an edge-object pair in the edge count dictionary."""
+    return f"{p}__{o}"
 
 
 def print_graph_human_readable(graph):
@@ -29,11 +35,12 @@ class TestGetViolationReportExemplars(unittest.TestCase):
     SH = Namespace("http://www.w3.org/ns/shacl#")
     RDFS = Namespace("http://www.w3.org/1999/02/22-rdf-syntax-ns#")
     RUT = Namespace("http://rdfunit.aksw.org/ns/core#")
+    EX = Namespace("http://example.com/exemplar#")
 
-    shape1_exemplar_1 = URIRef("http://www.w3.org/ns/shacl#shape1_exemplar_1")
-    shape1_exemplar_2 = URIRef("http://www.w3.org/ns/shacl#shape1_exemplar_2")
-    shape2_exemplar_3 = URIRef("http://www.w3.org/ns/shacl#shape2_exemplar_3")
-    shape2_exemplar_4 = URIRef("http://www.w3.org/ns/shacl#shape2_exemplar_4")
+    shape1_exemplar_1 = URIRef(EX.shape1_exemplar_1)
+    shape1_exemplar_2 = URIRef(EX.shape1_exemplar_2)
+    shape2_exemplar_3 = URIRef(EX.shape2_exemplar_3)
+    shape2_exemplar_4 = URIRef(EX.shape2_exemplar_4)
     shape1 = URIRef(SH.shape1)
     shape2 = URIRef(SH.shape2)
     edge1 = URIRef(SH.edge1)
@@ -53,7 +60,7 @@ class TestGetViolationReportExemplars(unittest.TestCase):
     fn5 = URIRef(SH.fn5)
     fn6 = URIRef(SH.fn6)
 
-    base_dir = "bikg_app/bikg_app/tests/test_cases_exemplar_violations/"
+    base_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "test_cases_exemplar_violations", "")
 
     test_cases = [
         # test case for one exemplar and only one occurrence of the violation, now including focus node as well
@@ -65,11 +72,11 @@ class TestGetViolationReportExemplars(unittest.TestCase):
                 lambda: defaultdict(int),
                 {
                     shape1_exemplar_1: {
-                        (RDFS.type, SH.ValidationResult): 1,
-                        (RDFS.type, RUT.TestCaseResult): 1,
-                        (SH.sourceShape, shape1): 1,
-                        (edge1, object1): 1,
-                        (edge2, object2): 1,
+                        po(RDFS.type, SH.ValidationResult): 1,
+                        po(RDFS.type, RUT.TestCaseResult): 1,
+                        po(SH.sourceShape, shape1): 1,
+                        po(edge1, object1): 1,
+                        po(edge2, object2): 1,
                     }
                 },
             ),
@@ -85,17 +92,17 @@ class TestGetViolationReportExemplars(unittest.TestCase):
                 lambda: defaultdict(int),
                 {
                     shape1_exemplar_1: {
-                        (RDFS.type, SH.ValidationResult): 2,
-                        (RDFS.type, RUT.TestCaseResult): 2,
-                        (SH.sourceShape, shape1): 2,
-                        (edge1, object1): 2,
-                        (edge2, object2): 2,
+                        po(RDFS.type, SH.ValidationResult): 2,
+                        po(RDFS.type, RUT.TestCaseResult): 2,
+                        po(SH.sourceShape, shape1): 2,
+                        po(edge1, object1): 2,
+                        po(edge2, object2): 2,
                     },
                     shape1_exemplar_2: {
-                        (RDFS.type, SH.ValidationResult): 1,
-                        (RDFS.type, RUT.TestCaseResult): 1,
-                        (SH.sourceShape, shape1): 1,
-                        (edge1, object1): 1,
+                        po(RDFS.type, SH.ValidationResult): 1,
+                        po(RDFS.type, RUT.TestCaseResult): 1,
+                        po(SH.sourceShape, shape1): 1,
+                        po(edge1, object1): 1,
                     },
                 },
             ),  # Missing comma was added here
@@ -121,11 +128,11 @@ class TestGetViolationReportExemplars(unittest.TestCase):
                 lambda: defaultdict(int),
                 {
                     shape1_exemplar_1: {
-                        (RDFS.type, SH.ValidationResult): 2,
-                        (RDFS.type, RUT.TestCaseResult): 2,
-                        (SH.sourceShape, shape1): 2,
-                        (edge1, object1): 2,
-                        (edge2, object2): 2,
+                        po(RDFS.type, SH.ValidationResult): 2,
+                        po(RDFS.type, RUT.TestCaseResult): 2,
+                        po(SH.sourceShape, shape1): 2,
+                        po(edge1, object1): 2,
+                        po(edge2, object2): 2,
                     }
                 },
             ),
@@ -144,33 +151,33 @@ class TestGetViolationReportExemplars(unittest.TestCase):
                 lambda: defaultdict(int),
                 {
                     shape1_exemplar_1: {
-                        (RDFS.type, SH.ValidationResult): 1,
-                        (RDFS.type, RUT.TestCaseResult): 1,
-                        (SH.sourceShape, shape1): 1,
-                        (edge1, object1): 1,
-                        (edge2, object2): 1,
+                        po(RDFS.type, SH.ValidationResult): 1,
+                        po(RDFS.type, RUT.TestCaseResult): 1,
+                        po(SH.sourceShape, shape1): 1,
+                        po(edge1, object1): 1,
+                        po(edge2, object2): 1,
                     },
                     shape1_exemplar_2: {
-                        (RDFS.type, SH.ValidationResult): 2,
-                        (RDFS.type, RUT.TestCaseResult): 2,
-                        (SH.sourceShape, shape1): 2,
-                        (edge1, object1): 2,
-                        (edge2, object2): 2,
-                        (edge3, object3): 2,
+                        po(RDFS.type, SH.ValidationResult): 2,
+                        po(RDFS.type, RUT.TestCaseResult): 2,
+                        po(SH.sourceShape, shape1): 2,
+                        po(edge1, object1): 2,
+                        po(edge2, object2): 2,
+                        po(edge3, object3): 2,
                     },
                     shape2_exemplar_3: {
-                        (RDFS.type, SH.ValidationResult): 1,
-                        (RDFS.type, RUT.TestCaseResult): 1,
-                        (SH.sourceShape, shape2): 1,
-                        (edge1, object1): 1,
-                        (edge4, object4): 1,
+                        po(RDFS.type, SH.ValidationResult): 1,
+                        po(RDFS.type, RUT.TestCaseResult): 1,
+                        po(SH.sourceShape, shape2): 1,
+                        po(edge1, object1): 1,
+                        po(edge4, object4): 1,
                     },
                     shape2_exemplar_4: {
-                        (RDFS.type, SH.ValidationResult): 2,
-                        (RDFS.type, RUT.TestCaseResult): 2,
-                        (SH.sourceShape, shape2): 2,
-                        (edge1, object1): 2,
-                        (edge5, object5): 2,
+                        po(RDFS.type, SH.ValidationResult): 2,
+                        po(RDFS.type, RUT.TestCaseResult): 2,
+                        po(SH.sourceShape, shape2): 2,
+                        po(edge1, object1): 2,
+                        po(edge5, object5): 2,
                     },
                 },
             ),
@@ -204,18 +211,18 @@ class TestGetViolationReportExemplars(unittest.TestCase):
                 lambda: defaultdict(int),
                 {
                     shape1_exemplar_1: {
-                        (RDFS.type, SH.ValidationResult): 1,
-                        (RDFS.type, RUT.TestCaseResult): 1,
-                        (SH.sourceShape, shape1): 1,
-                        (edge1, object1): 1,
-                        (edge2, object2): 1,
+                        po(RDFS.type, SH.ValidationResult): 1,
+                        po(RDFS.type, RUT.TestCaseResult): 1,
+                        po(SH.sourceShape, shape1): 1,
+                        po(edge1, object1): 1,
+                        po(edge2, object2): 1,
                     },
                     shape1_exemplar_2: {
-                        (RDFS.type, SH.ValidationResult): 1,
-                        (RDFS.type, RUT.TestCaseResult): 1,
-                        (SH.sourceShape, shape1): 1,
-                        (edge3, object3): 1,
-                        (edge4, object4): 1,
+                        po(RDFS.type, SH.ValidationResult): 1,
+                        po(RDFS.type, RUT.TestCaseResult): 1,
+                        po(SH.sourceShape, shape1): 1,
+                        po(edge3, object3): 1,
+                        po(edge4, object4): 1,
                     },
                 },
             ),
@@ -306,5 +313,58 @@ class TestGetViolationReportExemplars(unittest.TestCase):
                 assert exemplar_focus_node_dict == expected_exemplar_focus_node_dict
 
 
+def build_violation_report(n_results=300):
+    """A violation report with several shapes whose results share exemplars in an interleaved order."""
+    sh = TestGetViolationReportExemplars.SH
+    g = Graph()
+    for i in range(n_results):
+        result = URIRef(f"http://example.org/result{i}")
+        g.add((result, RDF.type, sh.ValidationResult))
+        g.add((result, sh.sourceShape, sh[f"shape{i % 7}"]))
+        g.add((result, sh.focusNode, URIRef(f"http://example.org/fn{i % 41}")))
+        g.add((result, sh.value, URIRef(f"http://example.org/value{(i * 13) % 5}")))
+        g.add((result, sh[f"edge{i % 3}"], sh[f"object{(i * 7) % 4}"]))
+    return g
+
+
+class TestParallelViolationReportExemplars(unittest.TestCase):
+    def run_exemplars(self, violation_report_g, processes):
+        study_g = Graph()
+        study_g.add((URIRef("http://example.org/value1"), URIRef("http://example.org/locatedIn"), URIRef("http://example.org/lab")))
+        return get_violation_report_exemplars(Graph(), violation_report_g, study_g, processes=processes)
+
+    def assert_same_result(self, serial, parallel):
+        assert isomorphic(serial[0], parallel[0])
+        for expected, actual in zip(serial[1:], parallel[1:], strict=True):
+            assert actual == expected
+            # same insertion order, so the serialized dictionaries are identical as well
+            assert [(key, list(value)) for key, value in actual.items()] == [(key, list(value)) for key, value in expected.items()]
+
+    def test_parallel_matches_serial(self):
+        violation_report_g = build_violation_report()
+        serial = self.run_exemplars(violation_report_g, processes=1)
+        for processes in (2, 3, 8):
+            with self.subTest(processes=processes):
+                self.assert_same_result(serial, self.run_exemplars(violation_report_g, processes=processes))
+
+    def test_parallel_test_cases(self):
+        for test_case in TestGetViolationReportExemplars.test_cases:
+            with self.subTest(test_case=test_case["violation_report_file"]):
+                violation_report_g = Graph()
+                violation_report_g.parse(test_case["violation_report_file"], format="ttl")
+                _, edge_count_dict, focus_node_exemplar_dict, exemplar_focus_node_dict, _ = self.run_exemplars(violation_report_g, 4)
+                assert edge_count_dict == test_case["expected_edge_count_dict"]
+                assert focus_node_exemplar_dict == test_case["expected_focus_node_exemplar_dict"]
+                assert exemplar_focus_node_dict == test_case["expected_exemplar_focus_node_dict"]
+
+    def test_shards_keep_shapes_together(self):
+        violation_report_g = build_violation_report()
+        shards = shard_validation_results(violation_report_g, 3)
+        indices = sorted(index for shard in shards for index, _ in shard)
+        assert indices == list(range(300))
+        shard_shapes = [{str(next(violation_report_g.objects(result, SH.sourceShape))) for _, result in shard} for shard in shards]
+        assert sum(len(shapes) for shapes in shard_shapes) == 7
+
+
 if __name__ == "__main__":
     unittest.main(verbosity=2)
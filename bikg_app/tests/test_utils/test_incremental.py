@@ -0,0 +1,228 @@
+# test_incremental
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import pandas as pd
+from rdflib import RDF, Graph, Literal, Namespace, URIRef
+
+from bikg_app.routers.incremental import (
+    EMPTY_EDGE_STRING,
+    ExemplarArtifacts,
+    ReportResults,
+    artifact_paths,
+    embed_rows,
+    qname_label,
+    update_artifacts,
+)
+from bikg_app.routers.report_stream import ViolationReportStream, stream_violation_report
+from bikg_app.routers.utils import SH, save_lists_dict, save_nested_counts_dict_json
+
+EXO = Namespace("http://example.org/")
+
+
+def build_report(indices, focus_nodes=41):
+    """Validation results like build_violation_report's, with a fresh result IRI per run as SHACL engines generate them."""
+    g = Graph()
+    g.bind("sh", SH)
+    g.bind("exo", EXO)
+    for run, i in enumerate(indices):
+        result = EXO[f"run{len(indices)}_result{run}"]
+        g.add((result, RDF.type, SH.ValidationResult))
+        g.add((result, SH.sourceShape, SH[f"shape{i % 7}"]))
+        g.add((result, SH.focusNode, EXO[f"fn{i % focus_nodes}"]))
+        g.add((result, SH.value, EXO[f"value{(i * 13) % 5}"]))
+        g.add((result, SH[f"edge{i % 3}"], SH[f"object{(i * 7) % 4}"]))
+    return g
+
+
+def build_study(focus_nodes=60):
+    g = Graph()
+    g.bind("exo", EXO)
+    for n in range(focus_nodes):
+        g.add((EXO[f"fn{n}"], RDF.type, EXO.Character))
+        g.add((EXO[f"fn{n}"], EXO.home, EXO[f"home{n % 3}"]))
+        if n % 2:
+            g.add((EXO[f"fn{n}"], EXO.friend, EXO[f"fn{n - 1}"]))
+            g.add((EXO[f"fn{n}"], EXO.friend, EXO[f"fn{(n + 1) % focus_nodes}"]))
+    g.add((EXO.value1, EXO.locatedIn, EXO.lab))
+    return g
+
+
+class TestIncrementalUpdate(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.study_g = build_study()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write_report(self, name, g):
+        path = os.path.join(self.tmp_dir, name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.writelines(sorted(g.serialize(format="nt").splitlines(keepends=True)))
+        report = ViolationReportStream(path)
+        report.namespaces.update({"sh": str(SH), "exo": str(EXO)})
+        return report
+
+    def full_run(self, report, output_dir):
+        """Writes the artifacts of a full run of preprocess.ipynb over report, with an embedding by row number."""
+        paths = artifact_paths(output_dir)
+        for path in paths.values():
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        ontology_g, *dicts, counts, violation_list = stream_violation_report(report, Graph(), self.study_g)
+        label = qname_label(report.namespaces.items())
+        study_df = pd.DataFrame(counts).T.fillna(0)
+        study_df.index = [label(focus_node) for focus_node in study_df.index]
+        study_df.columns = [label(shape) for shape in study_df.columns]
+        study_df.insert(0, "focus_node", study_df.index)
+        study_df["exo:home"] = [label(str(self.study_g.value(URIRef(focus_node), EXO.home))) for focus_node in counts]
+        study_df["x"] = [n / len(study_df) for n in range(len(study_df))]
+        study_df["y"] = [1 - n / len(study_df) for n in range(len(study_df))]
+        study_df.to_csv(paths["study_csv"])
+        with open(paths["violation_list"], "w", encoding="utf-8") as f:
+            json.dump([label(shape) for shape in violation_list], f)
+        ontology_g.serialize(destination=paths["ontology_ttl"], format="ttl")
+        edge_count_dict, focus_node_exemplar_dict, exemplar_focus_node_dict, violation_exemplar_dict = dicts
+        save_nested_counts_dict_json(edge_count_dict, paths["edge_count_dict"])
+        save_lists_dict(focus_node_exemplar_dict, paths["focus_node_exemplar_dict"])
+        save_lists_dict(exemplar_focus_node_dict, paths["exemplar_focus_node_dict"])
+        save_nested_counts_dict_json(violation_exemplar_dict, paths["violation_exemplar_dict"])
+        return paths
+
+    def canonical(self, paths):
+        """The artifacts with the exemplars replaced by their edge-object pairs, which do not depend on the numbering."""
+        artifacts = ExemplarArtifacts.load(paths)
+        key = {exemplar: tuple(sorted(counts)) for exemplar, counts in artifacts.edge_count_dict.items()}
+        term = {URIRef(exemplar): Literal(" ".join(pairs)) for exemplar, pairs in key.items()}
+        study_df = pd.read_csv(paths["study_csv"], index_col=0)
+        with open(paths["violation_list"], encoding="utf-8") as f:
+            violation_list = json.load(f)
+        return {
+            "edge_count_dict": {key[exemplar]: dict(counts) for exemplar, counts in artifacts.edge_count_dict.items()},
+            "focus_node_exemplar_dict": {
+                focus_node: {key[exemplar] for exemplar in exemplars}
+                for focus_node, exemplars in artifacts.focus_node_exemplar_dict.items()
+            },
+            "exemplar_focus_node_dict": {
+                key[exemplar]: set(focus_nodes) for exemplar, focus_nodes in artifacts.exemplar_focus_node_dict.items()
+            },
+            "violation_exemplar_dict": {
+                shape: {key[exemplar]: n for exemplar, n in counts.items()} for shape, counts in artifacts.violation_exemplar_dict.items()
+            },
+            "graph": {tuple(term.get(node, node) for node in triple) for triple in artifacts.ontology_g},
+            "violation_list": set(violation_list),
+            "counts": study_df[violation_list].sort_index().sort_index(axis=1),
+        }
+
+    def assert_same_as_full_run(self, paths, new_report):
+        expected = self.canonical(self.full_run(new_report, os.path.join(self.tmp_dir, "expected")))
+        actual = self.canonical(paths)
+        pd.testing.assert_frame_equal(actual.pop("counts"), expected.pop("counts"))
+        for name in expected:
+            with self.subTest(artifact=name):
+                assert actual[name] == expected[name]
+
+    def test_matches_full_run(self):
+        previous = self.write_report("previous.nt", build_report(range(300)))
+        paths = self.full_run(previous, os.path.join(self.tmp_dir, "output"))
+        before = ExemplarArtifacts.load(paths)
+        before_df = pd.read_csv(paths["study_csv"], index_col=0)
+
+        # the results of fn0 to fn22 come and go, those of fn23 to fn40 stay the same
+        new = self.write_report("new.nt", build_report(range(20, 310)))
+        changes = update_artifacts(paths, previous, new, self.study_g)
+        self.assert_same_as_full_run(paths, new)
+        assert changes["added_results"]
+        assert changes["removed_results"]
+
+        after = ExemplarArtifacts.load(paths)
+        for key, exemplar in after.exemplars.items():
+            if key in before.exemplars:
+                assert exemplar == before.exemplars[key]
+            else:
+                assert exemplar in changes["created_exemplars"]
+        assert set(changes["deleted_exemplars"]) == set(before.exemplars.values()) - set(after.exemplars.values())
+        assert after.next_number == before.next_number + len(changes["created_exemplars"])
+
+        after_df = pd.read_csv(paths["study_csv"], index_col=0)
+        untouched = [row for row in after_df.index if row not in changes["touched"]]
+        assert untouched
+        pd.testing.assert_frame_equal(after_df.loc[untouched, ["x", "y"]], before_df.loc[untouched, ["x", "y"]])
+        assert after_df[["x", "y"]].notna().to_numpy().all()
+
+    def test_new_focus_nodes(self):
+        previous = self.write_report("previous.nt", build_report(range(100)))
+        paths = self.full_run(previous, os.path.join(self.tmp_dir, "output"))
+        new = self.write_report("new.nt", build_report(range(100), focus_nodes=50))
+        with self.assertRaises(ValueError):
+            update_artifacts(paths, previous, new)
+        changes = update_artifacts(paths, previous, new, self.study_g)
+        self.assert_same_as_full_run(paths, new)
+
+        study_df = pd.read_csv(paths["study_csv"], index_col=0)
+        assert set(changes["added"]) == {f"exo:fn{n}" for n in range(41, 50)}
+        assert study_df.loc["exo:fn41", "focus_node"] == "exo:fn41"
+        assert study_df.loc["exo:fn41", "exo:home"] == "exo:home2"
+        assert study_df.loc["exo:fn41", "rdf:type"] == "['exo:Character']"
+        assert study_df.loc["exo:fn40", "rdf:type"] == f"['{EMPTY_EDGE_STRING}']"
+        # a second friend turns the column into a list column for every row
+        assert study_df.loc["exo:fn41", "exo:friend"] == "['exo:fn40', 'exo:fn42']"
+        assert study_df.loc["exo:fn42", "exo:friend"] == f"['{EMPTY_EDGE_STRING}']"
+        assert study_df.loc["exo:fn0", "exo:friend"] == f"['{EMPTY_EDGE_STRING}']"
+
+    def test_unchanged_report(self):
+        previous = self.write_report("previous.nt", build_report(range(200)))
+        paths = self.full_run(previous, os.path.join(self.tmp_dir, "output"))
+        with open(paths["study_csv"], encoding="utf-8") as f:
+            study_csv = f.read()
+        changes = update_artifacts(paths, previous, self.write_report("new.nt", build_report(range(200))))
+        assert changes["added_results"] == changes["removed_results"] == 0
+        assert not changes["touched"]
+        assert not changes["created_exemplars"]
+        with open(paths["study_csv"], encoding="utf-8") as f:
+            assert f.read() == study_csv
+
+    def test_wrong_previous_report(self):
+        previous = self.write_report("previous.nt", build_report(range(100)))
+        paths = self.full_run(previous, os.path.join(self.tmp_dir, "output"))
+        with open(paths["study_csv"], encoding="utf-8") as f:
+            study_csv = f.read()
+        other = self.write_report("other.nt", build_report(range(100, 150)))
+        with self.assertRaises(ValueError):
+            update_artifacts(paths, other, previous)
+        with open(paths["study_csv"], encoding="utf-8") as f:
+            assert f.read() == study_csv
+
+
+class TestEmbedRows(unittest.TestCase):
+    def test_nearest_rows(self):
+        study_df = pd.DataFrame(
+            {
+                "a": [0.0, 0.0, 1.0, 1.0, 0.0],
+                "b": [0.0, 1.0, 1.0, 1.0, 1.0],
+                "x": [0.0, 0.2, 0.8, 0.5, 0.0],
+                "y": [1.0, 0.4, 0.6, 0.5, 0.0],
+            },
+            index=["r0", "r1", "r2", "r3", "r4"],
+        )
+        assert embed_rows(study_df, ["a", "b"], ["r3", "r4"], n_neighbors=2)
+        # r3 equals r2 and differs from r1 and r0 by one and two columns, r4 equals r1 and ties between r0 and r2
+        assert list(study_df.loc["r3", ["x", "y"]]) == [0.5, 0.5]
+        assert list(study_df.loc["r4", ["x", "y"]]) == [0.1, 0.7]
+        assert not embed_rows(study_df, ["a", "b"], list(study_df.index))
+
+    def test_report_results(self):
+        results = ReportResults(
+            (subject, list(build_report(range(14)).predicate_objects(subject)))
+            for subject in build_report(range(14)).subjects(RDF.type, SH.ValidationResult)
+        )
+        assert sum(results.results.values()) == sum(results.violations.values()) == 14
+        assert set(results.shapes) == {str(SH[f"shape{i}"]) for i in range(7)}
+        assert len(results.pairs) == len({key for _, _, key in results.results})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,185 @@
+# test_report_stream
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from rdflib import RDF, BNode, Graph, Literal, URIRef
+from rdflib.compare import isomorphic
+
+from bikg_app.routers.report_stream import (
+    ViolationReportStream,
+    count_violations,
+    iter_ntriples,
+    iter_subject_groups,
+    iter_turtle_lines,
+    stream_violation_report,
+)
+from bikg_app.routers.utils import SH, get_violation_report_exemplars
+from bikg_app.tests.test_utils.test_get_violation_report_exemplars import TestGetViolationReportExemplars, build_violation_report
+
+TTL_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "ttl")
+
+TURTLE = """@prefix sh: <http://www.w3.org/ns/shacl#> .
+PREFIX lotr: <http://example.org/lotr#>
+@prefix xsd: <http://www.w3.org/2001/XMLSchema#> .
+
+# a comment
+lotr:v1 a sh:ValidationResult, lotr:Result ;
+    sh:focusNode lotr:Frodo ;   # trailing comment
+    sh:resultMessage "Expected \\"Shire\\" # not a comment"@en ;
+    sh:value "3"^^xsd:integer, 4, 2.5, 1e3, true ;
+    lotr:ref <http://example.org/other#x.y>, _:b1 ;
+    .
+_:b1 lotr:name 'Bag End' .
+lotr:v2 a sh:ValidationResult ; sh:focusNode lotr:Sam ; lotr:path lotr:has.dot .
+"""
+
+
+def as_graph(triples):
+    g = Graph()
+    for triple in triples:
+        g.add(triple)
+    return g
+
+
+class TestReportParsers(unittest.TestCase):
+    def test_turtle_subset_matches_rdflib(self):
+        namespaces = {}
+        triples = list(iter_turtle_lines(TURTLE.splitlines(keepends=True), namespaces))
+        assert isomorphic(as_graph(triples), Graph().parse(data=TURTLE, format="turtle"))
+        assert namespaces["lotr"] == "http://example.org/lotr#"
+        bnodes = {o for _, _, o in triples if isinstance(o, BNode)} | {s for s, _, _ in triples if isinstance(s, BNode)}
+        assert len(bnodes) == 1
+
+    def test_turtle_files_match_rdflib(self):
+        for name in sorted(os.listdir(TTL_DIR)):
+            if name.endswith(".ttl"):
+                with self.subTest(name=name):
+                    path = os.path.join(TTL_DIR, name)
+                    triples = list(ViolationReportStream(path).triples())
+                    assert isomorphic(as_graph(triples), Graph().parse(path, format="turtle"))
+
+    def test_unsupported_turtle(self):
+        for document in (
+            "@prefix sh: <http://www.w3.org/ns/shacl#> .\n[] a sh:ValidationResult .\n",
+            '<http://example.org/s> <http://example.org/p> """multi\nline""" .\n',
+            "<http://example.org/s> <http://example.org/p> ( 1 2 ) .\n",
+            "<http://example.org/s> lotr:p <http://example.org/o> .\n",
+            "<http://example.org/s> <http://example.org/p> <http://example.org/o>\n",
+        ):
+            with self.subTest(document=document), self.assertRaises(ValueError):
+                list(iter_turtle_lines(document.splitlines(keepends=True)))
+
+    def test_ntriples(self):
+        g = Graph().parse(data=TURTLE, format="turtle")
+        lines = g.serialize(format="nt").splitlines(keepends=True)
+        assert isomorphic(as_graph(iter_ntriples(lines)), g)
+        with self.assertRaises(ValueError):
+            list(iter_ntriples(["<http://example.org/s> <http://example.org/p> .\n"]))
+
+    def test_subject_groups(self):
+        s1, s2, p, q = URIRef("s1"), URIRef("s2"), URIRef("p"), URIRef("q")
+        triples = [(s1, p, Literal(1)), (s1, q, Literal(2)), (s1, p, Literal(3)), (s1, p, Literal(1)), (s2, p, Literal(4))]
+        assert list(iter_subject_groups(triples)) == [
+            (s1, [(p, Literal(1)), (p, Literal(3)), (q, Literal(2))]),
+            (s2, [(p, Literal(4))]),
+        ]
+
+    def test_subject_groups_are_lazy(self):
+        def triples():
+            for i in range(3):
+                yield URIRef(f"s{i}"), RDF.type, SH.ValidationResult
+            raise AssertionError("read past the second subject")
+
+        groups = iter_subject_groups(triples())
+        assert next(groups)[0] == URIRef("s0")
+        assert next(groups)[0] == URIRef("s1")
+
+    def test_subject_groups_reject_unsorted_subjects(self):
+        s1, s2, p = URIRef("s1"), URIRef("s2"), URIRef("p")
+        for triples in ([(s1, p, Literal(1)), (s2, p, Literal(2)), (s1, p, Literal(3))], [(s2, p, Literal(2)), (s1, p, Literal(1))]):
+            with self.subTest(triples=triples), self.assertRaisesRegex(ValueError, "not sorted"):
+                list(iter_subject_groups(triples, sorted_subjects=True))
+        # in the order of `LC_ALL=C sort`: "<s10> " before "<s1> ", and "_:b1 " before "_:b10 "
+        subjects = [URIRef("s10"), s1, s2, BNode("b1"), BNode("b10")]
+        lines = [f"{s.n3()} {p.n3()} {Literal(1).n3()} .\n" for s in subjects]
+        assert sorted(lines) == lines
+        assert [s for s, _ in iter_subject_groups([(s, p, Literal(1)) for s in subjects], sorted_subjects=True)] == subjects
+
+
+class TestStreamViolationReport(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def assert_same_exemplars(self, violation_report_g, report):
+        expected = get_violation_report_exemplars(Graph(), violation_report_g)
+        streamed = stream_violation_report(report, Graph())
+        assert isomorphic(expected[0], streamed[0])
+        for expected_dict, streamed_dict in zip(expected[1:], streamed[1:5], strict=True):
+            assert [(key, list(value)) for key, value in streamed_dict.items()] == [
+                (key, list(value)) for key, value in expected_dict.items()
+            ]
+        return streamed
+
+    def test_matches_graph_exemplars(self):
+        paths = [test_case["violation_report_file"] for test_case in TestGetViolationReportExemplars.test_cases]
+        for path in [*paths, os.path.join(TTL_DIR, "violation_report.ttl")]:
+            with self.subTest(path=path):
+                self.assert_same_exemplars(Graph().parse(path, format="turtle"), ViolationReportStream(path))
+
+    def test_sorted_ntriples_match_graph_exemplars(self):
+        path = os.path.join(self.tmp_dir, "report.nt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.writelines(sorted(build_violation_report().serialize(format="nt").splitlines(keepends=True)))
+        # parsed in the same order, so the exemplars are numbered the same way
+        self.assert_same_exemplars(Graph().parse(path, format="nt"), ViolationReportStream(path))
+
+    def write_ntriples(self, lines):
+        path = os.path.join(self.tmp_dir, "report.nt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.writelines(lines)
+        return ViolationReportStream(path)
+
+    def test_shuffled_ntriples_raise(self):
+        lines = (
+            Graph().parse(os.path.join(TTL_DIR, "violation_report.ttl"), format="turtle").serialize(format="nt").splitlines(keepends=True)
+        )
+        random.Random(0).shuffle(lines)
+        report = self.write_ntriples(lines)
+        # depending on the shuffle the first symptom is a subject out of order or a result cut short by one
+        with self.assertRaisesRegex(ValueError, "not sorted|not consecutive"):
+            stream_violation_report(report, Graph())
+        # sorted by line the same triples can be streamed
+        stream_violation_report(self.write_ntriples(sorted(lines)), Graph())
+
+    def test_incomplete_validation_results_raise(self):
+        result = URIRef("http://example.org/lotr#v1")
+        for missing in (SH.focusNode, SH.sourceShape):
+            with self.subTest(missing=missing):
+                g = Graph()
+                g.add((result, RDF.type, SH.ValidationResult))
+                for predicate in {SH.focusNode, SH.sourceShape} - {missing}:
+                    g.add((result, predicate, URIRef("http://example.org/lotr#x")))
+                report = self.write_ntriples(g.serialize(format="nt").splitlines(keepends=True))
+                with self.assertRaisesRegex(ValueError, f"has no {missing.n3()}"):
+                    stream_violation_report(report, Graph())
+
+    def test_counts(self):
+        path = os.path.join(TTL_DIR, "violation_report.ttl")
+        report = ViolationReportStream(path)
+        *_, focus_node_counts, violation_list = stream_violation_report(report, Graph())
+        g = Graph().parse(path, format="turtle")
+        expected_counts, expected_list = count_violations((subject, list(g.predicate_objects(subject))) for subject in set(g.subjects()))
+        assert focus_node_counts == expected_counts
+        assert set(violation_list) == set(expected_list)
+        assert sum(sum(counts.values()) for counts in focus_node_counts.values()) == len(set(g.subjects(SH.focusNode)))
+        assert report.namespaces["sh"] == str(SH)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,35 @@
+import argparse
+import json
+import logging
+import time
+
+from rdflib import Graph
+
+from bikg_app.routers.incremental import artifact_paths, update_artifacts
+from bikg_app.routers.report_stream import ViolationReportStream
+
+# Updates the artifacts of preprocess.ipynb for a new violation report instead of running the notebook again, only the
+# validation results that differ from the previous report are processed and only the rows they touch are embedded again.
+# Run it from the repository root: `python -m bikg_app.update_artifacts previous.ttl new.ttl --study bikg_app/ttl/study.ttl`
+# The reports are read one subject at a time, so N-Triples (.nt) reports must be sorted by line first, e.g. `LC_ALL=C sort -o report.nt report.nt`.
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Update the preprocessed artifacts for a new violation report.")
+    parser.add_argument("previous_report", help="The violation report the artifacts were made from, Turtle or sorted N-Triples.")
+    parser.add_argument("report", help="The new violation report, Turtle or sorted N-Triples.")
+    parser.add_argument("--output-dir", default="bikg_app", help="The directory with the json, csv and ttl artifacts.")
+    parser.add_argument("--study", help="The instance data, needed for focus nodes without a row in the study table.")
+    parser.add_argument("--n-neighbors", type=int, default=5, help="The number of rows a touched row is placed between.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    start = time.perf_counter()
+    study_g = Graph().parse(args.study, format="ttl") if args.study else None
+    changes = update_artifacts(
+        artifact_paths(args.output_dir),
+        ViolationReportStream(args.previous_report),
+        ViolationReportStream(args.report),
+        study_g,
+        n_neighbors=args.n_neighbors,
+    )
+    print(json.dumps(changes, indent=2))
+    print(f"Updated {args.output_dir} in {time.perf_counter() - start:.2f}s")
@@ -1,14 +1,42 @@
 // api.tsx
+let datasetVersion: Promise<string | null> | null = null;
+
+/**
+ * Resolves to the version of the loaded dataset, null while it is still loading. The version is fetched once per page load.
+ */
+function fetchDatasetVersion(): Promise<string | null> {
+  if (datasetVersion === null) {
+    datasetVersion = fetch(`/api/bikg/dataset/status`)
+      .then((response) => (response.ok ? response.json() : null))
+      .then((status) => status?.version ?? null)
+      .catch(() => null);
+  }
+  return datasetVersion;
+}
+
+/**
+ * Appends ?v=<dataset version> to an endpoint whose response only changes with the dataset. The server lets the browser
+ * keep such responses without revalidating them, unversioned requests are revalidated every time.
+ */
+async function versioned(endpoint: string) {
+  const version = await fetchDatasetVersion();
+  if (version === null) {
+    // ask again on the next request, the dataset may have finished loading by then
+    datasetVersion = null;
+    return endpoint;
+  }
+  return `${endpoint}${endpoint.includes('?') ? '&' : '?'}v=${encodeURIComponent(version)}`;
+}
 export async function fetchCSVFile() {
   const endpoint = `/api/bikg/file/study`;
-  const response = await fetch(endpoint);
+  const response = await fetch(await versioned(endpoint));
   const data = await response.json();
   return data;
 }
 
 export async function fetchViolationPathNodesDict() {
   const endpoint = `/api/bikg/violation_path_nodes_dict`;
-  const response = await fetch(endpoint);
+  const response = await fetch(await versioned(endpoint));
   const data = await response.json();
   return data;
 }
@@ -100,14 +128,14 @@ export async function fetchJSONFile(file_path) {
 
 export async function fetchViolationList() {
   const endpoint = `/api/bikg/violation_list`;
-  const response = await fetch(endpoint);
+  const response = await fetch(await versioned(endpoint));
   const data = await response.text();
   return data;
 }
 
 export async function fetchOntology() {
   const endpoint = `/api/bikg/file/ontology`;
-  const response = await fetch(endpoint);
+  const response = await fetch(await versioned(endpoint));
   const data = await response.text();
   return data;
 }
@@ -128,63 +156,63 @@ export async function fetchOriginalViolationReport() {
 
 export async function fetchEdgeCountDict() {
   const endpoint = `/api/bikg/file/edge_count_dict`;
-  const response = await fetch(endpoint);
+  const response = await fetch(await versioned(endpoint));
   const data = await response.json();
   return data;
 }
 
 export async function fetchFocusNodeExemplarDict() {
   const endpoint = `/api/bikg/file/focus_node_exemplar_dict`;
-  const response = await fetch(endpoint);
+  const response = await fetch(await versioned(endpoint));
   const data = await response.json();
   return data;
 }
 
 export async function fetchExemplarFocusNodeDict() {
   const endpoint = `/api/bikg/file/exemplar_focus_node_dict`;
-  const response = await fetch(endpoint);
+  const response = await fetch(await versioned(endpoint));
   const data = await response.json();
   return data;
 }
 
 export async function fetchNamespaces() {
   const endpoint = `/api/bikg/namespaces`;
-  const response = await fetch(endpoint);
+  const response = await fetch(await versioned(endpoint));
   const data = await response.json();
   return data;
 }
 
 export async function fetchClasses() {
   const endpoint = `/api/bikg/owl:Class`;
-  const response = await fetch(endpoint);
+  const response = await fetch(await versioned(endpoint));
   const data = await response.json();
   return data;
 }
 
 export async function fetchSubClassOfTriples() {
   const endpoint = `/api/bikg/sub-class-of`;
-  const response = await fetch(endpoint);
+  const response = await fetch(await versioned(endpoint));
   const data = await response.json();
   return data;
 }
 
 export async function fetchOntologyTree() {
   const endpoint = `/api/bikg/get_ontology_tree`;
-  const response = await fetch(endpoint);
+  const response = await fetch(await versioned(endpoint));
   const data = await response.json();
   return data;
 }
 
 export async function fetchNodeFocusNodeCountDict() {
   const endpoint = `/api/bikg/get_node_count_dict`;
-  const response = await fetch(endpoint);
+  const response = await fetch(await versioned(endpoint));
   const data = await response.json();
   return data;
 }
 
 export async function fetchViolationExemplarDict() {
   const endpoint = `/api/bikg/get_violation_exemplar_dict`;
-  const response = await fetch(endpoint);
+  const response = await fetch(await versioned(endpoint));
   const data = await response.json();
   return data;
 }
@@ -198,13 +226,28 @@ export async function fetchTypeViolationDict() {
 
 export async function fetchNodeLabelSet() {
   const endpoint = `/api/bikg/get_node_label_set`;
-  const response = await fetch(endpoint);
+  const response = await fetch(await versioned(endpoint));
   const data = await response.json();
   return data;
 }
 
 export async function fetchEdgeLabelSet() {
   const endpoint = `/api/bikg/get_edge_label_set`;
+  const response = await fetch(await versioned(endpoint));
+  const data = await response.json();
+  return data;
+}
+
+/**
+ * Fetches one page of the node or edge labels that start with prefix and contain contains (both ignoring case).
+ * Pass the returned nextCursor as cursor to get the next page, it is null on the last one.
+ */
+export async function fetchLabelPage(kind: 'node' | 'edge', prefix = '', contains = '', limit = 100, cursor: string | null = null) {
+  const params = new URLSearchParams({ prefix, contains, limit: String(limit) });
+  if (cursor !== null) {
+    params.set('cursor', cursor);
+  }
+  const endpoint = `/api/bikg/get_${kind}_label_set?${params.toString()}`;
   const response = await fetch(endpoint);
   const data = await response.json();
   return data;